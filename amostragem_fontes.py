@@ -0,0 +1,138 @@
+"""
+Amostragem de Fontes com Leitura Limitada
+
+Usado por SistemaCompleto (obter_amostra_gcpjs, testar_fonte) e pelo
+ProcessadorMultiplasFontes (amostra da fonte principal sem escopo), que liam a
+planilha inteira para ficar com as primeiras linhas.
+
+FUNCIONAMENTO:
+- amostrar_coluna() lê só a coluna pedida, em blocos pequenos (ler_coluna_em_blocos
+  de importacao_escopo), e para a leitura assim que junta a quantidade pedida de
+  valores preenchidos: o custo depende do limite, não do tamanho do arquivo
+- amostrar_gcpjs() faz o mesmo devolvendo a forma canônica (canonizar_gcpjs):
+  uma leitura parcial não sabe o dtype que a coluna inteira teria no pandas
+  (um vazio transforma 123 em 123.0), então quem compara a amostra com a fonte
+  precisa canonizar os dois lados
+- indexar_por_gcpj() é o outro lado: a fonte lida inteira, indexada pela mesma
+  forma canônica
+- ler_cabecalho() lê apenas a primeira linha
+- contar_registros() não interpreta as linhas: no Excel usa a dimensão gravada na
+  aba (só percorre as linhas se a planilha não a tiver); no CSV conta as quebras de
+  linha em blocos binários (linhas físicas, sem considerar quebras entre aspas)
+
+USO:
+    gcpjs = amostrar_gcpjs(caminho, 'GCPJ', 50, aba='Sheet1')
+    valores = indexar_por_gcpj(df_fonte, 'GCPJ')['UF'].reindex(gcpjs)
+    colunas = ler_cabecalho(caminho, aba='Sheet1')
+    registros = contar_registros(caminho, aba='Sheet1')
+"""
+
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from importacao_escopo import canonizar_gcpjs, ler_coluna_em_blocos
+
+# Linhas lidas por bloco na amostragem (a leitura para no primeiro bloco suficiente)
+TAMANHO_BLOCO_AMOSTRA = 1000
+
+# Bytes por leitura na contagem de linhas de CSV
+TAMANHO_BLOCO_CONTAGEM = 1024 * 1024
+
+
+def _extensao(caminho):
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao not in ('.csv', '.xlsx', '.xlsm'):
+        raise ValueError('Formato não suportado. Use Excel (.xlsx) ou CSV (.csv)')
+    return extensao
+
+
+def _aba(wb, aba):
+    if aba is None:
+        return wb.worksheets[0]
+    if aba not in wb.sheetnames:
+        raise ValueError(f'Aba "{aba}" não encontrada no arquivo')
+    return wb[aba]
+
+
+def amostrar_coluna(caminho, coluna, limite, aba=None, tamanho_bloco=TAMANHO_BLOCO_AMOSTRA):
+    """Primeiros `limite` valores preenchidos da coluna, como texto
+
+    Levanta ValueError se a coluna não existir ou o formato não for suportado.
+    """
+    amostra = []
+    if limite <= 0:
+        return amostra
+
+    # Sair do laço fecha o gerador (e a planilha): o resto do arquivo não é lido
+    for bloco in ler_coluna_em_blocos(caminho, coluna, aba, tamanho_bloco=tamanho_bloco):
+        valores = bloco.dropna().astype(str).str.strip()
+        amostra.extend(valores[valores != ''].head(limite - len(amostra)).tolist())
+        if len(amostra) >= limite:
+            break
+    return amostra
+
+
+def amostrar_gcpjs(caminho, coluna, limite, aba=None, tamanho_bloco=TAMANHO_BLOCO_AMOSTRA):
+    """Primeiros `limite` GCPJs válidos da coluna, na forma canônica (canonizar_gcpjs)
+
+    CSV é lido com a inferência de tipos do pandas, como na leitura completa da fonte.
+    """
+    amostra = []
+    if limite <= 0:
+        return amostra
+
+    for bloco in ler_coluna_em_blocos(caminho, coluna, aba, tamanho_bloco=tamanho_bloco, dtype=None):
+        canonicos = [gcpj for gcpj in canonizar_gcpjs(bloco) if gcpj is not None]
+        amostra.extend(canonicos[:limite - len(amostra)])
+        if len(amostra) >= limite:
+            break
+    return amostra
+
+
+def indexar_por_gcpj(df, coluna_gcpj):
+    """DataFrame indexado pelo GCPJ canônico da coluna; linhas sem GCPJ válido ficam de fora"""
+    chaves = canonizar_gcpjs(df[coluna_gcpj])
+    validas = pd.notna(chaves)
+    return df[validas].set_axis(chaves[validas], axis=0)
+
+
+def ler_cabecalho(caminho, aba=None):
+    """Nomes das colunas (primeira linha) da fonte"""
+    if _extensao(caminho) == '.csv':
+        return pd.read_csv(caminho, nrows=0).columns.tolist()
+
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        cabecalho = next(_aba(wb, aba).iter_rows(max_row=1, values_only=True), ())
+        return [valor for valor in cabecalho if valor is not None]
+    finally:
+        wb.close()
+
+
+def contar_registros(caminho, aba=None):
+    """Quantidade de linhas de dados (sem o cabeçalho), sem interpretar o conteúdo"""
+    if _extensao(caminho) == '.csv':
+        quebras = 0
+        ultimo = b''
+        with open(caminho, 'rb') as f:
+            while True:
+                bloco = f.read(TAMANHO_BLOCO_CONTAGEM)
+                if not bloco:
+                    break
+                quebras += bloco.count(b'\n')
+                ultimo = bloco[-1:]
+        linhas = quebras + (1 if ultimo and ultimo != b'\n' else 0)
+        return max(linhas - 1, 0)
+
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        ws = _aba(wb, aba)
+        linhas = ws.max_row
+        if linhas is None:
+            # Planilha sem dimensão gravada: percorre só a primeira coluna
+            linhas = sum(1 for _ in ws.iter_rows(max_col=1, values_only=True))
+        return max(linhas - 1, 0)
+    finally:
+        wb.close()
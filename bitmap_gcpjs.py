@@ -0,0 +1,250 @@
+"""
+Conjuntos de GCPJs Codificados em Bitmaps Comprimidos
+
+Usado pelo ControleQualidade para guardar a lista completa de GCPJs ausentes por
+(execução, coluna) sem truncamento e sem o custo de listas JSON.
+
+FUNCIONAMENTO:
+- Cada GCPJ recebe um índice inteiro estável na tabela dicionario_gcpj; o mesmo
+  GCPJ tem o mesmo índice em todas as execuções, então conjuntos de execuções
+  diferentes podem ser comparados diretamente
+- Novos índices são alocados a partir de MAX(indice) com a escrita do banco já
+  reservada (BEGIN IMMEDIATE), então threads e processos não repetem índices
+- Um BitmapGcpjs guarda os índices ordenados e é serializado no estilo roaring:
+  os índices são agrupados pelos 16 bits altos e cada grupo vira um container
+  de array (uint16, até 4096 itens) ou de bitmap (8 KB), o que for menor
+- União, interseção e diferença são feitas sobre os índices ordenados (numpy);
+  para muitas operações sobre o mesmo universo (comparação de execuções) os
+  bitmaps podem ser abertos direto em vetores densos de bits, onde XOR/AND são
+  operações lineares sem ordenação
+
+USO:
+    dicionario = DicionarioGcpj()
+    bitmap = BitmapGcpjs(dicionario.indexar(conn, gcpjs_ausentes))
+    blob = bitmap.serializar()
+    ...
+    ausentes = BitmapGcpjs.desserializar(blob) | outro_bitmap
+    gcpjs = dicionario.traduzir(conn, ausentes)
+"""
+
+import struct
+import threading
+
+import numpy as np
+
+# Limite de itens para um container de array (acima disso o bitmap de 8 KB é menor)
+LIMITE_CONTAINER_ARRAY = 4096
+
+TIPO_ARRAY = 0
+TIPO_BITMAP = 1
+
+_CABECALHO = struct.Struct('<I')
+_CABECALHO_CONTAINER = struct.Struct('<HBI')
+
+
+class BitmapGcpjs:
+    """Conjunto imutável de índices de GCPJ com serialização comprimida"""
+
+    __slots__ = ('indices',)
+
+    def __init__(self, indices=()):
+        indices = np.asarray(indices, dtype=np.uint32)
+        self.indices = np.unique(indices)
+
+    @classmethod
+    def _de_ordenados(cls, indices):
+        bitmap = cls.__new__(cls)
+        bitmap.indices = indices
+        return bitmap
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __contains__(self, indice):
+        posicao = np.searchsorted(self.indices, indice)
+        return posicao < len(self.indices) and self.indices[posicao] == indice
+
+    def __iter__(self):
+        return iter(self.indices.tolist())
+
+    def __eq__(self, outro):
+        return isinstance(outro, BitmapGcpjs) and np.array_equal(self.indices, outro.indices)
+
+    def __or__(self, outro):
+        return self._de_ordenados(np.union1d(self.indices, outro.indices))
+
+    def __and__(self, outro):
+        return self._de_ordenados(np.intersect1d(self.indices, outro.indices, assume_unique=True))
+
+    def __sub__(self, outro):
+        return self._de_ordenados(np.setdiff1d(self.indices, outro.indices, assume_unique=True))
+
+    def __xor__(self, outro):
+        return self._de_ordenados(np.setxor1d(self.indices, outro.indices, assume_unique=True))
+
+    def fatia(self, inicio, fim):
+        """Sub-bitmap com os índices nas posições [inicio, fim) (para paginação)"""
+        return self._de_ordenados(self.indices[inicio:fim])
+
+    def __repr__(self):
+        return f"BitmapGcpjs({len(self)} GCPJs)"
+
+    @classmethod
+    def uniao(cls, bitmaps):
+        """União de vários bitmaps de uma vez"""
+        bitmaps = list(bitmaps)
+        if not bitmaps:
+            return cls()
+        return cls._de_ordenados(np.unique(np.concatenate([b.indices for b in bitmaps])))
+
+    def para_denso(self, tamanho):
+        """Vetor booleano denso de 'tamanho' posições com os índices do bitmap ligados"""
+        denso = np.zeros(tamanho, dtype=bool)
+        denso[self.indices] = True
+        return denso
+
+    @classmethod
+    def de_denso(cls, denso):
+        """Bitmap com as posições ligadas de um vetor booleano denso"""
+        return cls._de_ordenados(np.flatnonzero(denso).astype(np.uint32))
+
+    def serializar(self):
+        """Serializa no formato de containers (array ou bitmap) por 16 bits altos"""
+        partes = []
+        altos = (self.indices >> 16).astype(np.uint16)
+        baixos = (self.indices & 0xFFFF).astype(np.uint16)
+        chaves, inicios = np.unique(altos, return_index=True)
+        fins = np.append(inicios[1:], len(self.indices))
+
+        partes.append(_CABECALHO.pack(len(chaves)))
+        for chave, inicio, fim in zip(chaves.tolist(), inicios.tolist(), fins.tolist()):
+            valores = baixos[inicio:fim]
+            cardinalidade = fim - inicio
+
+            if cardinalidade <= LIMITE_CONTAINER_ARRAY:
+                partes.append(_CABECALHO_CONTAINER.pack(chave, TIPO_ARRAY, cardinalidade))
+                partes.append(valores.astype('<u2').tobytes())
+            else:
+                bits = np.zeros(1 << 16, dtype=np.uint8)
+                bits[valores] = 1
+                partes.append(_CABECALHO_CONTAINER.pack(chave, TIPO_BITMAP, cardinalidade))
+                partes.append(np.packbits(bits, bitorder='little').tobytes())
+
+        return b''.join(partes)
+
+    @staticmethod
+    def _containers(dados):
+        # Gera (chave, tipo, payload) de cada container serializado
+        dados = memoryview(dados)
+        (total_containers,) = _CABECALHO.unpack_from(dados, 0)
+        posicao = _CABECALHO.size
+
+        for _ in range(total_containers):
+            chave, tipo, cardinalidade = _CABECALHO_CONTAINER.unpack_from(dados, posicao)
+            posicao += _CABECALHO_CONTAINER.size
+            tamanho = cardinalidade * 2 if tipo == TIPO_ARRAY else (1 << 16) // 8
+            yield chave, tipo, dados[posicao:posicao + tamanho]
+            posicao += tamanho
+
+    @staticmethod
+    def desserializar_denso(dados, tamanho):
+        """Abre o bitmap serializado direto em um vetor booleano denso (sem ordenar índices)"""
+        denso = np.zeros(tamanho, dtype=bool)
+        if not dados:
+            return denso
+
+        for chave, tipo, payload in BitmapGcpjs._containers(dados):
+            base = chave << 16
+            if tipo == TIPO_ARRAY:
+                denso[base + np.frombuffer(payload, dtype='<u2').astype(np.int64)] = True
+            else:
+                bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8), bitorder='little')
+                fim = min(base + len(bits), tamanho)
+                denso[base:fim] = bits[:fim - base].astype(bool)
+        return denso
+
+    @classmethod
+    def desserializar(cls, dados):
+        """Reconstrói o bitmap a partir do formato gerado por serializar()"""
+        if not dados:
+            return cls()
+
+        blocos = []
+        for chave, tipo, payload in cls._containers(dados):
+            if tipo == TIPO_ARRAY:
+                valores = np.frombuffer(payload, dtype='<u2')
+            else:
+                bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8), bitorder='little')
+                valores = np.flatnonzero(bits)
+            blocos.append((np.uint32(chave) << 16) | valores.astype(np.uint32))
+
+        if not blocos:
+            return cls()
+        return cls._de_ordenados(np.concatenate(blocos))
+
+
+class DicionarioGcpj:
+    """Dicionário estável GCPJ -> índice guardado na tabela dicionario_gcpj
+
+    A cópia em memória é compartilhada entre as threads e protegida por um lock.
+    """
+
+    def __init__(self):
+        self._indices = {}
+        self._gcpjs = []
+        self._lock = threading.Lock()
+
+    def _sincronizar(self, conn):
+        # Uma transação desfeita (desta ou de outra conexão) pode ter deixado em
+        # memória índices que o banco não tem: o último conhecido precisa conferir
+        if self._gcpjs:
+            ultimo = conn.execute(
+                "SELECT gcpj FROM dicionario_gcpj WHERE indice = ?", (len(self._gcpjs) - 1,)
+            ).fetchone()
+            if ultimo is None or ultimo[0] != self._gcpjs[-1]:
+                self._indices.clear()
+                self._gcpjs.clear()
+
+        # A tabela só recebe inserções, então basta ler o que ainda não está em memória
+        novos = conn.execute(
+            "SELECT indice, gcpj FROM dicionario_gcpj WHERE indice >= ? ORDER BY indice",
+            (len(self._gcpjs),)
+        ).fetchall()
+        for indice, gcpj in novos:
+            self._indices[gcpj] = indice
+            self._gcpjs.append(gcpj)
+
+    def indexar(self, conn, gcpjs):
+        """Retorna os índices dos GCPJs, cadastrando os que ainda não existem
+
+        Sem transação aberta, reserva a escrita com BEGIN IMMEDIATE antes de ler
+        MAX(indice); o commit continua com quem chamou. A reserva vem antes do lock
+        para que uma thread esperando o banco não bloqueie quem já está escrevendo.
+        """
+        gcpjs = [str(g) for g in gcpjs]
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+
+        with self._lock:
+            self._sincronizar(conn)
+
+            faltantes = list(dict.fromkeys(g for g in gcpjs if g not in self._indices))
+            if faltantes:
+                (maior,) = conn.execute("SELECT MAX(indice) FROM dicionario_gcpj").fetchone()
+                proximo = 0 if maior is None else maior + 1
+                conn.executemany(
+                    "INSERT INTO dicionario_gcpj (indice, gcpj) VALUES (?, ?)",
+                    [(proximo + i, g) for i, g in enumerate(faltantes)]
+                )
+                # Depois de _sincronizar a cópia em memória vai até o MAX lido acima
+                for i, gcpj in enumerate(faltantes):
+                    self._indices[gcpj] = proximo + i
+                    self._gcpjs.append(gcpj)
+
+            return np.fromiter((self._indices[g] for g in gcpjs), dtype=np.uint32, count=len(gcpjs))
+
+    def traduzir(self, conn, bitmap):
+        """Retorna a lista de GCPJs de um bitmap, na ordem dos índices"""
+        with self._lock:
+            self._sincronizar(conn)
+            return [self._gcpjs[i] for i in bitmap]
@@ -0,0 +1,102 @@
+"""
+Cache Colunar das Fontes de Dados
+
+Evita reler planilhas grandes inteiras quando só algumas colunas são necessárias
+(por exemplo, para avaliar critérios de escopo).
+
+FUNCIONAMENTO:
+- Na primeira leitura a fonte (Excel/CSV) é convertida em um arquivo pickle por
+  coluna dentro de .cache_fontes/<chave da fonte>/, com um manifesto JSON que
+  guarda a assinatura do arquivo de origem (caminho, tamanho e data de modificação)
+- Leituras seguintes carregam apenas as colunas pedidas
+- Se o arquivo de origem mudar, a assinatura muda e a fonte é convertida de novo
+
+USO:
+    cache = CacheColunarFontes(base_path)
+    df = cache.carregar_colunas(caminho, 'excel', 'Sheet1', ['GCPJ', 'UF'])
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+import pandas as pd
+
+DIRETORIO_CACHE_FONTES = ".cache_fontes"
+VERSAO_CACHE_FONTES = 1
+
+
+def assinatura_arquivo(caminho, aba=None):
+    """Assinatura que muda sempre que o arquivo de origem (ou a aba lida) muda"""
+    info = os.stat(caminho)
+    return f"{os.path.abspath(caminho)}|{aba}|{info.st_size}|{info.st_mtime_ns}|v{VERSAO_CACHE_FONTES}"
+
+
+class CacheColunarFontes:
+    """Cache em disco de fontes de dados, uma coluna por arquivo"""
+
+    def __init__(self, base_path, diretorio=DIRETORIO_CACHE_FONTES):
+        self.diretorio = os.path.join(base_path, diretorio)
+
+    def _diretorio_fonte(self, caminho, aba):
+        chave = hashlib.sha1(f"{os.path.abspath(caminho)}|{aba}".encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.diretorio, chave)
+
+    def _ler_manifesto(self, diretorio_fonte):
+        try:
+            with open(os.path.join(diretorio_fonte, 'manifesto.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _converter(self, caminho, tipo, aba, diretorio_fonte, assinatura):
+        if tipo == 'excel':
+            df = pd.read_excel(caminho, sheet_name=aba)
+        elif tipo == 'csv':
+            df = pd.read_csv(caminho)
+        else:
+            raise ValueError(f"Tipo de fonte não suportado: {tipo}")
+
+        # Grava em diretório temporário e troca de uma vez
+        temporario = diretorio_fonte + '.tmp'
+        shutil.rmtree(temporario, ignore_errors=True)
+        os.makedirs(temporario)
+
+        colunas = [str(coluna) for coluna in df.columns]
+        for posicao, coluna in enumerate(df.columns):
+            with open(os.path.join(temporario, f"{posicao}.pkl"), 'wb') as f:
+                pickle.dump(df[coluna].reset_index(drop=True), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        manifesto = {'assinatura': assinatura, 'colunas': colunas, 'registros': len(df)}
+        with open(os.path.join(temporario, 'manifesto.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f, ensure_ascii=False)
+
+        shutil.rmtree(diretorio_fonte, ignore_errors=True)
+        os.replace(temporario, diretorio_fonte)
+        return manifesto
+
+    def obter_manifesto(self, caminho, tipo, aba=None):
+        """Garante o cache atualizado da fonte e retorna o manifesto (assinatura, colunas, registros)"""
+        assinatura = assinatura_arquivo(caminho, aba)
+        diretorio_fonte = self._diretorio_fonte(caminho, aba)
+
+        manifesto = self._ler_manifesto(diretorio_fonte)
+        if manifesto is None or manifesto.get('assinatura') != assinatura:
+            manifesto = self._converter(caminho, tipo, aba, diretorio_fonte, assinatura)
+        return manifesto
+
+    def carregar_colunas(self, caminho, tipo, aba=None, colunas=None):
+        """Carrega só as colunas pedidas da fonte (todas se colunas=None)"""
+        manifesto = self.obter_manifesto(caminho, tipo, aba)
+        diretorio_fonte = self._diretorio_fonte(caminho, aba)
+
+        disponiveis = manifesto['colunas']
+        pedidas = disponiveis if colunas is None else [c for c in disponiveis if c in set(colunas)]
+
+        dados = {}
+        for coluna in pedidas:
+            with open(os.path.join(diretorio_fonte, f"{disponiveis.index(coluna)}.pkl"), 'rb') as f:
+                dados[coluna] = pickle.load(f)
+        return pd.DataFrame(dados, index=pd.RangeIndex(manifesto['registros']))
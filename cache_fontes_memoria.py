@@ -0,0 +1,158 @@
+"""
+Cache em Memória das Fontes Carregadas
+
+Usado pelo ProcessadorMultiplasFontes de interface_gestao_fontes e pelo
+SistemaCompleto de interface_gestao_corrigida (fontes_carregadas) no lugar de um
+dict sem limite, que nunca percebia a troca da planilha e nunca liberava memória.
+
+FUNCIONAMENTO:
+- A chave (chave_fonte) reúne o id, a aba e a coluna GCPJ da fonte: a mesma fonte
+  recadastrada com outra aba ou outra coluna é outra entrada
+- Cada fonte carregada fica associada à assinatura do arquivo de origem: tamanho,
+  data de modificação (mtime) e um hash amostral (início e fim do arquivo)
+- Em todo acesso a assinatura é conferida: tamanho/mtime diferentes invalidam na
+  hora; com tamanho e mtime iguais, o hash amostral pega arquivos substituídos
+  preservando a data (cópias com metadados) sem reler a planilha inteira
+- O tamanho de cada DataFrame é estimado com memory_usage(deep=True); ao passar do
+  orçamento, as fontes usadas há mais tempo são descartadas (LRU)
+- Um DataFrame maior que o orçamento inteiro é devolvido mas não fica em cache
+- Contadores de acertos, faltas, invalidações e descartes ajudam a dimensionar o
+  orçamento dos workers (estatisticas())
+
+USO:
+    cache = CacheFontesMemoria(limite_memoria_mb=1024)
+    df = cache.obter(chave_fonte(fonte_id, aba, coluna_gcpj), caminho,
+                     lambda: pd.read_excel(caminho, sheet_name=aba))
+    cache.invalidar_fonte(fonte_id)  # fonte removida
+    cache.estatisticas()
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+LIMITE_MEMORIA_FONTES_MB = 1024
+
+# Bytes lidos do início e do fim do arquivo para o hash amostral
+TAMANHO_AMOSTRA_HASH = 64 * 1024
+
+
+def assinatura_fonte(caminho, verificar_conteudo=True):
+    """(tamanho, mtime_ns, hash amostral) do arquivo de origem"""
+    info = os.stat(caminho)
+    amostra = None
+    if verificar_conteudo:
+        sha1 = hashlib.sha1()
+        with open(caminho, 'rb') as f:
+            sha1.update(f.read(TAMANHO_AMOSTRA_HASH))
+            if info.st_size > TAMANHO_AMOSTRA_HASH:
+                f.seek(max(info.st_size - TAMANHO_AMOSTRA_HASH, TAMANHO_AMOSTRA_HASH))
+                sha1.update(f.read())
+        amostra = sha1.hexdigest()
+    return info.st_size, info.st_mtime_ns, amostra
+
+
+def chave_fonte(fonte_id, aba, coluna_gcpj):
+    """Chave do cache de uma fonte: (id, aba, coluna GCPJ); aba vazia (CSV, NaN) vira None"""
+    return (
+        int(fonte_id),
+        aba if isinstance(aba, str) else None,
+        coluna_gcpj if isinstance(coluna_gcpj, str) else None
+    )
+
+
+def tamanho_dataframe(df):
+    """Bytes ocupados pelo DataFrame, incluindo o conteúdo das strings"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class CacheFontesMemoria:
+    """Cache LRU de DataFrames das fontes, limitado por memória e validado pelo arquivo"""
+
+    def __init__(self, limite_memoria_mb=LIMITE_MEMORIA_FONTES_MB, verificar_conteudo=True):
+        self.limite_bytes = int(limite_memoria_mb * 1024 * 1024)
+        self.verificar_conteudo = verificar_conteudo
+        self._entradas = OrderedDict()  # chave -> (df, assinatura, bytes)
+        self._bytes_em_uso = 0
+        self._trava = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.invalidacoes = 0
+        self.descartes = 0
+        self.nao_armazenados = 0
+
+    def __contains__(self, chave):
+        with self._trava:
+            return chave in self._entradas
+
+    def __len__(self):
+        with self._trava:
+            return len(self._entradas)
+
+    def _remover(self, chave):
+        _, _, tamanho = self._entradas.pop(chave)
+        self._bytes_em_uso -= tamanho
+
+    def obter(self, chave, caminho, carregar):
+        """DataFrame da fonte: do cache se o arquivo não mudou, senão carregar()"""
+        assinatura = assinatura_fonte(caminho, self.verificar_conteudo)
+
+        with self._trava:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                if entrada[1] == assinatura:
+                    self._entradas.move_to_end(chave)
+                    self.acertos += 1
+                    return entrada[0]
+                self._remover(chave)
+                self.invalidacoes += 1
+            self.faltas += 1
+
+        # Leitura fora da trava: outras fontes continuam acessíveis enquanto esta carrega
+        df = carregar()
+        self.guardar(chave, df, assinatura)
+        return df
+
+    def guardar(self, chave, df, assinatura):
+        tamanho = tamanho_dataframe(df)
+        with self._trava:
+            if chave in self._entradas:
+                self._remover(chave)
+            if tamanho > self.limite_bytes:
+                self.nao_armazenados += 1
+                return
+            while self._entradas and self._bytes_em_uso + tamanho > self.limite_bytes:
+                self._remover(next(iter(self._entradas)))
+                self.descartes += 1
+            self._entradas[chave] = (df, assinatura, tamanho)
+            self._bytes_em_uso += tamanho
+
+    def invalidar(self, chave=None):
+        """Descarta uma fonte (ou todas, sem chave)"""
+        with self._trava:
+            chaves = list(self._entradas) if chave is None else [chave] if chave in self._entradas else []
+            for c in chaves:
+                self._remover(c)
+
+    def invalidar_fonte(self, fonte_id):
+        """Descarta todas as entradas de uma fonte (qualquer aba ou coluna GCPJ)"""
+        with self._trava:
+            for chave in [c for c in self._entradas if isinstance(c, tuple) and c[0] == int(fonte_id)]:
+                self._remover(chave)
+
+    def estatisticas(self):
+        """Contadores e ocupação atual do cache"""
+        with self._trava:
+            consultas = self.acertos + self.faltas
+            return {
+                'entradas': len(self._entradas),
+                'memoria_mb': round(self._bytes_em_uso / (1024 * 1024), 2),
+                'limite_mb': round(self.limite_bytes / (1024 * 1024), 2),
+                'acertos': self.acertos,
+                'faltas': self.faltas,
+                'invalidacoes': self.invalidacoes,
+                'descartes': self.descartes,
+                'nao_armazenados': self.nao_armazenados,
+                'taxa_acerto': round(self.acertos / consultas * 100, 1) if consultas else 0.0
+            }
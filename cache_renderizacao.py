@@ -0,0 +1,161 @@
+"""
+Cache de Renderização das Páginas com ETag
+
+Usado pelas páginas do SistemaCompleto (dashboard, fontes e qualidade), que montam
+HTML grande a cada requisição mesmo quando nada mudou desde o último diagnóstico.
+
+FUNCIONAMENTO:
+- Cada página declara de quais versões de dados depende ('execucao', 'fontes',
+  'escopo'); a chave do cache é (rota, query string, versões)
+- A resposta leva ETag (hash da chave) e Last-Modified (última alteração dos
+  dados); o navegador revalida com If-None-Match / If-Modified-Since e recebe 304
+  sem que a página seja montada
+- Páginas e fragmentos de HTML (partes compartilhadas entre variações da mesma
+  página) ficam em caches LRU limitados
+- Só respostas 200 entram no cache; páginas de erro são sempre montadas de novo
+- O ETag inclui a geração do código (hash dos módulos .py da aplicação): é o mesmo
+  em todos os workers do gunicorn e entre reinícios, e muda quando o HTML muda
+- As versões ficam na tabela versoes_dados; quem altera fontes ou escopo chama
+  registrar_alteracao() na própria transação, e ler_versoes_dados() junta a elas
+  a última execução
+
+USO:
+    with conexao(db_path) as conn:
+        ...  # altera as fontes
+        registrar_alteracao(conn, 'fontes')
+        conn.commit()
+
+    cache_paginas = CachePaginas(sistema.obter_versoes_dados)
+
+    @app.route('/')
+    @cache_paginas.pagina('execucao', 'fontes', 'escopo')
+    def dashboard():
+        ...
+"""
+
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import make_response, request
+
+LIMITE_PAGINAS_EM_CACHE = 64
+LIMITE_FRAGMENTOS_EM_CACHE = 256
+
+DIRETORIO_APLICACAO = os.path.dirname(os.path.abspath(__file__))
+
+
+def geracao_codigo(diretorio=DIRETORIO_APLICACAO):
+    """Hash dos módulos .py do diretório: identifica a versão do código que monta o HTML"""
+    hash_codigo = hashlib.sha1()
+    for caminho in sorted(glob.glob(os.path.join(diretorio, '*.py'))):
+        hash_codigo.update(os.path.basename(caminho).encode('utf-8'))
+        with open(caminho, 'rb') as arquivo:
+            hash_codigo.update(arquivo.read())
+    return hash_codigo.hexdigest()[:8]
+
+
+def registrar_alteracao(conn, nome):
+    """Incrementa a versão de 'fontes' ou 'escopo' (na transação de quem alterou os dados)"""
+    conn.execute(
+        "UPDATE versoes_dados SET versao = versao + 1, atualizado_em = ? WHERE nome = ?",
+        (datetime.now().isoformat(), nome)
+    )
+
+
+def ler_versoes_dados(conn):
+    """Versões que invalidam o cache das páginas: última execução, fontes e escopo"""
+    execucao = conn.execute("SELECT id, timestamp FROM execucoes ORDER BY id DESC LIMIT 1").fetchone()
+    versoes = conn.execute("SELECT nome, versao, atualizado_em FROM versoes_dados").fetchall()
+
+    alteracoes = [atualizado_em for _, _, atualizado_em in versoes if atualizado_em]
+    if execucao is not None:
+        alteracoes.append(execucao[1])
+
+    resultado = {nome: versao for nome, versao, _ in versoes}
+    resultado['execucao'] = execucao[0] if execucao is not None else 0
+    # Horário local sem fuso (isoformat) convertido para UTC, como exige o Last-Modified
+    resultado['atualizado_em'] = (
+        datetime.fromisoformat(max(alteracoes)).astimezone(timezone.utc) if alteracoes else None
+    )
+    return resultado
+
+
+class CachePaginas:
+    """Cache LRU de páginas e fragmentos HTML com validação por versão dos dados"""
+
+    def __init__(self, obter_versoes, limite_paginas=LIMITE_PAGINAS_EM_CACHE,
+                 limite_fragmentos=LIMITE_FRAGMENTOS_EM_CACHE, geracao=None):
+        # obter_versoes() -> dict com as versões por nome e 'atualizado_em' (datetime ou None)
+        self.obter_versoes = obter_versoes
+        self.limite_paginas = limite_paginas
+        self.limite_fragmentos = limite_fragmentos
+        self._paginas = OrderedDict()
+        self._fragmentos = OrderedDict()
+        self._trava = threading.Lock()
+        # Igual em todos os workers; um HTML novo após atualização invalida os ETags antigos
+        self._geracao = geracao if geracao is not None else geracao_codigo()
+
+    def _buscar(self, cache, chave):
+        with self._trava:
+            valor = cache.get(chave)
+            if valor is not None:
+                cache.move_to_end(chave)
+            return valor
+
+    def _guardar(self, cache, limite, chave, valor):
+        with self._trava:
+            cache[chave] = valor
+            cache.move_to_end(chave)
+            while len(cache) > limite:
+                cache.popitem(last=False)
+
+    def fragmento(self, chave, gerar):
+        """HTML de um fragmento: do cache se a chave já foi montada, senão gerar()"""
+        html = self._buscar(self._fragmentos, chave)
+        if html is None:
+            html = gerar()
+            self._guardar(self._fragmentos, self.limite_fragmentos, chave, html)
+        return html
+
+    def pagina(self, *dependencias):
+        """Decorador de rota: serve a página do cache e responde 304 na revalidação"""
+        def decorador(view):
+            @wraps(view)
+            def envolvida(*args, **kwargs):
+                versoes = self.obter_versoes()
+                chave = (
+                    request.endpoint,
+                    request.query_string.decode('utf-8', 'replace'),
+                    tuple(versoes.get(nome) for nome in dependencias)
+                )
+                etag = hashlib.sha1(f"{self._geracao}|{chave!r}".encode('utf-8')).hexdigest()
+                ultima_alteracao = versoes.get('atualizado_em')
+
+                def preparar(resposta):
+                    resposta.set_etag(etag)
+                    if ultima_alteracao is not None:
+                        resposta.last_modified = ultima_alteracao
+                    # O navegador guarda a página, mas sempre revalida
+                    resposta.cache_control.no_cache = True
+                    return resposta
+
+                if etag in request.if_none_match:
+                    return preparar(make_response('', 304))
+
+                html = self._buscar(self._paginas, chave)
+                if html is None:
+                    resposta = make_response(view(*args, **kwargs))
+                    if resposta.status_code != 200:
+                        return resposta
+                    html = resposta.get_data()
+                    self._guardar(self._paginas, self.limite_paginas, chave, html)
+
+                resposta = preparar(make_response(html))
+                return resposta.make_conditional(request)
+            return envolvida
+        return decorador
@@ -0,0 +1,105 @@
+"""
+Gerenciamento de Conexões SQLite Compartilhado
+
+Usado por MasterDatabaseManager, SistemaCompleto e ControleQualidade para
+evitar abrir e fechar uma conexão a cada chamada de método.
+
+FUNCIONAMENTO:
+- Cada thread mantém uma conexão persistente por arquivo de banco
+- Na criação a conexão recebe os PRAGMAs de desempenho (WAL, synchronous=NORMAL,
+  mmap e cache) e um cache de statements preparados maior que o padrão
+- O context manager conexao() entrega a conexão da thread e desfaz a transação
+  pendente se o bloco terminar com exceção; o commit continua explícito
+
+USO:
+    with conexao(self.db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(...)
+        conn.commit()
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# PRAGMAs aplicados a toda conexão nova
+PRAGMAS_CONEXAO = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,  # 256 MB
+    'cache_size': -64 * 1024,  # valores negativos são em KiB (64 MB)
+    'temp_store': 'MEMORY'
+}
+
+# Quantidade de statements preparados mantidos por conexão (padrão do sqlite3 é 128)
+STATEMENTS_EM_CACHE = 512
+
+
+class PoolConexoes:
+    """Mantém uma conexão SQLite por thread e por arquivo de banco"""
+
+    def __init__(self, pragmas=None, statements_em_cache=STATEMENTS_EM_CACHE):
+        self.pragmas = dict(PRAGMAS_CONEXAO if pragmas is None else pragmas)
+        self.statements_em_cache = statements_em_cache
+        self._local = threading.local()
+
+    def _conexoes_thread(self):
+        conexoes = getattr(self._local, 'conexoes', None)
+        if conexoes is None:
+            conexoes = {}
+            self._local.conexoes = conexoes
+        return conexoes
+
+    def _abrir(self, db_path):
+        conn = sqlite3.connect(db_path, cached_statements=self.statements_em_cache)
+        for nome, valor in self.pragmas.items():
+            conn.execute(f"PRAGMA {nome} = {valor}")
+        return conn
+
+    def obter(self, db_path):
+        """Retorna a conexão persistente da thread atual para o banco informado"""
+        chave = os.path.abspath(db_path)
+        conexoes = self._conexoes_thread()
+
+        conn = conexoes.get(chave)
+        if conn is None:
+            conn = self._abrir(db_path)
+            conexoes[chave] = conn
+        return conn
+
+    def fechar(self, db_path=None):
+        """Fecha as conexões da thread atual (todas ou apenas a do banco informado)"""
+        conexoes = self._conexoes_thread()
+        chaves = list(conexoes) if db_path is None else [os.path.abspath(db_path)]
+
+        for chave in chaves:
+            conn = conexoes.pop(chave, None)
+            if conn is not None:
+                conn.close()
+
+
+# Pool global compartilhado pelos sistemas
+pool_conexoes = PoolConexoes()
+
+
+def obter_conexao(db_path):
+    """Atalho para a conexão persistente da thread atual"""
+    return pool_conexoes.obter(db_path)
+
+
+@contextmanager
+def conexao(db_path):
+    """Entrega a conexão persistente e desfaz a transação aberta em caso de erro"""
+    conn = pool_conexoes.obter(db_path)
+    try:
+        yield conn
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def fechar_conexoes(db_path=None):
+    """Fecha as conexões persistentes da thread atual"""
+    pool_conexoes.fechar(db_path)
@@ -14,6 +14,30 @@ CARACTERÍSTICAS:
 ✅ Identifica motivos específicos de falha por coluna
 ✅ Exporta para Excel com múltiplas abas
 
+RESULTADO EM COLUNAS:
+- gerar_diagnostico_completo() devolve um ResultadoDiagnosticoGCPJ em vez de uma
+  lista de dicionários: um array por campo (GCPJ, posição na fonte primária,
+  máscara de bits de disponibilidade, chave alternativa usada na secundária) e a
+  fonte de cada coluna como código pequeno
+- A fonte primária é analisada em blocos, de forma vetorizada; só as colunas
+  mapeadas são lidas dos arquivos
+- As chaves alternativas da fonte secundária (gerar_chaves_gcpj) viram um índice
+  pandas consultado bloco a bloco, na mesma ordem de tentativa
+- O dicionário verboso de um GCPJ (detalhes_fonte com prévias dos valores) só é
+  montado sob demanda: resultados[i] ou iteração
+
+EXECUÇÃO PARALELA (só linha de comando):
+- executar_diagnostico_por_gcpj distribui os blocos de bases grandes em um pool
+  de processos criado por fork depois da carga: fontes, índice secundário e máscaras de preenchimento são
+  herdados somente leitura (copy-on-write), nada disso é serializado
+- Os blocos são faixas contíguas da base primária e voltam em ordem (imap): o
+  resultado juntado é o mesmo da execução em um processo só
+- Sem fork disponível (Windows), com base pequena ou fora da thread principal, a
+  análise roda no próprio processo
+- As interfaces web chamam com processos=1 (o padrão): fork de um processo com
+  várias threads pode travar o filho, e os processos do pool ficariam fora do
+  orçamento de memória do ExecutorTarefas
+
 USO:
     # Análise completa de todos os registros
     resultados, resumo = executar_diagnostico_por_gcpj()
@@ -29,13 +53,250 @@ USO:
 import pandas as pd
 import os
 import logging
+import multiprocessing
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import numpy as np
 
+from diagnostico_empacotado import empacotar_disponibilidade, desempacotar_disponibilidade, popcount
+from progresso_execucao import PROGRESSO_NULO
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Arquivos de entrada (relativos ao base_path)
+ARQUIVO_TEMPLATE = "template-banco-bradesco-sa.xlsx"
+ARQUIVO_FONTE_PRIMARIA = "cópia-MOYA E LARA_BASE GCPJ ATIVOS - 07_04_2025.xlsx"
+ARQUIVO_FONTE_SECUNDARIA = "4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx"
+
+# Registros da fonte primária analisados por vez (limita a memória temporária)
+TAMANHO_BLOCO_ANALISE = 50_000
+
+# Processos da análise paralela e tamanho mínimo da base para compensar o fork
+PROCESSOS_ANALISE = os.cpu_count() or 1
+MINIMO_REGISTROS_PARALELO = 4 * TAMANHO_BLOCO_ANALISE
+
+# Caracteres mantidos na prévia dos valores do formato verboso
+TAMANHO_PREVIA_VALOR = 50
+
+# GCPJs ausentes listados na prévia de cada coluna (resumo_por_coluna)
+LIMITE_PREVIA_AUSENTES = 100
+
+FONTE_NENHUMA = 0
+FONTE_CONSTANTE = 1
+FONTE_PRIMARIA = 2
+FONTE_SECUNDARIA = 3
+FONTES_DIAGNOSTICO = ['Nenhuma', 'Constante', 'Primária', 'Secundária (via GCPJ)']
+
+
+def previa_valor(valor):
+    """Texto do valor truncado para exibição"""
+    texto = str(valor)
+    return texto[:TAMANHO_PREVIA_VALOR] + "..." if len(texto) > TAMANHO_PREVIA_VALOR else texto
+
+
+def chaves_alternativas(gcpjs):
+    """Chaves de gerar_chaves_gcpj para um array de GCPJs normalizados
+
+    Retorna uma lista de arrays alinhados a gcpjs, um por tentativa e na mesma
+    ordem (None onde a chave não existe para aquele GCPJ).
+    """
+    serie = pd.Series(gcpjs, dtype=object)
+    validos = (serie.notna() & (serie != '')).to_numpy()
+    resto = serie.str[2:].fillna('')
+    prefixo = serie.str[:2]
+    de_antigo = validos & prefixo.isin(['16', '13']).to_numpy()
+    de_novo = validos & prefixo.isin(['22', '24']).to_numpy()
+    longos = validos & (serie.str.len() > 2).to_numpy()
+
+    return [
+        np.where(validos, serie.to_numpy(), None),
+        np.where(longos, resto.to_numpy(), None),
+        np.where(de_antigo, ('22' + resto).to_numpy(), np.where(de_novo, ('16' + resto).to_numpy(), None)),
+        np.where(de_antigo, ('24' + resto).to_numpy(), None)
+    ]
+
+
+def localizar_chaves(indice, alternativas):
+    """Posição no índice da primeira chave alternativa encontrada por GCPJ (-1 = nenhuma)"""
+    posicoes = np.full(len(alternativas[0]), -1, dtype=np.int64)
+    for chaves in alternativas:
+        pendentes = np.flatnonzero(posicoes < 0)
+        if len(pendentes) == 0:
+            break
+        posicoes[pendentes] = indice.get_indexer(chaves[pendentes])
+    return posicoes
+
+
+# Diagnóstico em análise: definido antes do fork do pool e herdado pelos processos
+_ANALISE_COMPARTILHADA = None
+
+
+def _analisar_bloco_compartilhado(inicio):
+    diagnostico, colunas, codigos_fonte, secundarios_preenchidos = _ANALISE_COMPARTILHADA
+    bloco = diagnostico.primary_df.iloc[inicio:inicio + TAMANHO_BLOCO_ANALISE]
+    return diagnostico.analisar_bloco(bloco, inicio, colunas, codigos_fonte, secundarios_preenchidos)
+
+
+class ResultadoDiagnosticoGCPJ:
+    """Resultado do diagnóstico por GCPJ em colunas (um array por campo)
+
+    Agregados saem direto dos arrays; resultados[i] monta o dicionário verboso do
+    formato antigo, lendo as prévias dos valores nas fontes do diagnóstico.
+    """
+
+    def __init__(self, diagnostico, colunas, codigos_fonte, gcpjs, posicoes, mascaras, chaves_usadas):
+        self.diagnostico = diagnostico
+        self.colunas = list(colunas)
+        self.fontes = FONTES_DIAGNOSTICO
+        self.codigos_fonte = np.asarray(codigos_fonte, dtype=np.uint8)
+        self.gcpjs = gcpjs
+        self.posicoes = posicoes
+        self.mascaras = mascaras
+        self.chaves_usadas = chaves_usadas
+
+    # ---------- Agregados (sem materializar dicionários) ----------
+
+    def __len__(self):
+        return len(self.gcpjs)
+
+    def colunas_preenchidas(self):
+        """Quantidade de colunas disponíveis por GCPJ (popcount das máscaras)"""
+        return popcount(self.mascaras)
+
+    def taxas_completude(self):
+        """Taxa de completude (%) por GCPJ, sobre as colunas do template"""
+        total_template = len(self.diagnostico.template_columns)
+        if not total_template:
+            return np.zeros(len(self), dtype=float)
+        return (self.colunas_preenchidas() / total_template) * 100
+
+    def taxa_media(self):
+        """Taxa média de completude da execução"""
+        return float(self.taxas_completude().mean()) if len(self) else 0.0
+
+    def disponivel_coluna(self, j):
+        """Vetor booleano de disponibilidade da coluna j em todos os GCPJs"""
+        return ((self.mascaras[:, j // 64] >> np.uint64(j % 64)) & np.uint64(1)).astype(bool)
+
+    def preenchidos_por_coluna(self):
+        """Quantidade de GCPJs com dado disponível em cada coluna"""
+        return np.array([int(self.disponivel_coluna(j).sum()) for j in range(len(self.colunas))], dtype=np.int64)
+
+    def completude_por_coluna(self):
+        """Completude agregada por coluna (formato de calcular_completude_por_coluna)"""
+        total_registros = len(self)
+        completude = {}
+        for j, coluna in enumerate(self.colunas):
+            disponivel = self.disponivel_coluna(j)
+            preenchidos = int(disponivel.sum())
+            gcpjs_ausentes = self.gcpjs[~disponivel].tolist()
+            completude[coluna] = {
+                'fonte': self.fontes[self.codigos_fonte[j]],
+                'taxa_completude': round((preenchidos / total_registros * 100) if total_registros > 0 else 0, 2),
+                'registros_preenchidos': preenchidos,
+                'registros_ausentes': len(gcpjs_ausentes),
+                'gcpjs_ausentes': gcpjs_ausentes
+            }
+        return completude
+
+    def resumo_por_coluna(self, limite_previa=LIMITE_PREVIA_AUSENTES):
+        """Completude de cada coluna sem a lista inteira de ausentes
+
+        Gera (coluna, resumo, disponivel): resumo no formato de completude_por_coluna
+        com só os primeiros limite_previa ausentes em 'gcpjs_ausentes'; disponivel é o
+        vetor booleano da coluna, para quem precisa do conjunto completo (bitmaps).
+        """
+        total_registros = len(self)
+        for j, coluna in enumerate(self.colunas):
+            disponivel = self.disponivel_coluna(j)
+            preenchidos = int(disponivel.sum())
+            previa = self.gcpjs[np.flatnonzero(~disponivel)[:limite_previa]].tolist()
+            yield coluna, {
+                'fonte': self.fontes[self.codigos_fonte[j]],
+                'taxa_completude': round((preenchidos / total_registros * 100) if total_registros > 0 else 0, 2),
+                'registros_preenchidos': preenchidos,
+                'registros_ausentes': total_registros - preenchidos,
+                'gcpjs_ausentes': previa
+            }, disponivel
+
+    # ---------- Formato verboso sob demanda ----------
+
+    def chave_usada(self, i):
+        """Chave alternativa com que o GCPJ foi encontrado na fonte secundária (ou None)"""
+        posicao = self.chaves_usadas[i]
+        return None if posicao < 0 else self.diagnostico.chaves_secundarias[posicao]
+
+    def resultado_gcpj(self, i):
+        """Monta o dicionário verboso de um GCPJ (mesmo formato do diagnóstico linha a linha)"""
+        diagnostico = self.diagnostico
+        gcpj = self.gcpjs[i]
+        disponiveis = desempacotar_disponibilidade(self.mascaras[i:i + 1], len(self.colunas))[0]
+        linha_primaria = diagnostico.primary_df.iloc[self.posicoes[i]]
+        chave = self.chave_usada(i)
+        linha_secundaria = None
+        if chave is not None:
+            linha_secundaria = diagnostico.secondary_df.iloc[diagnostico.linhas_secundarias[self.chaves_usadas[i]]]
+
+        detalhes_fonte = {}
+        for j, coluna in enumerate(self.colunas):
+            codigo = self.codigos_fonte[j]
+            disponivel = bool(disponiveis[j])
+
+            if codigo == FONTE_PRIMARIA:
+                source_col = diagnostico.column_mappings[coluna]
+                detalhes = {'fonte': self.fontes[codigo], 'coluna_origem': source_col}
+                if disponivel:
+                    detalhes['valor'] = previa_valor(linha_primaria[source_col])
+                    detalhes['disponivel'] = True
+                else:
+                    detalhes['disponivel'] = False
+                    detalhes['motivo'] = 'Dado não encontrado ou vazio na fonte primária'
+            elif codigo == FONTE_CONSTANTE:
+                detalhes = {
+                    'fonte': self.fontes[codigo],
+                    'valor': diagnostico.constant_values[coluna],
+                    'disponivel': True
+                }
+            elif codigo == FONTE_SECUNDARIA:
+                source_col = diagnostico.secondary_mappings[coluna]
+                detalhes = {'fonte': self.fontes[codigo], 'coluna_origem': source_col}
+                if disponivel:
+                    detalhes['valor'] = previa_valor(linha_secundaria[source_col])
+                    detalhes['chave_gcpj_usada'] = chave
+                    detalhes['disponivel'] = True
+                else:
+                    detalhes['disponivel'] = False
+                    detalhes['motivo'] = 'GCPJ não encontrado na fonte secundária ou dado vazio'
+                    detalhes['chaves_tentadas'] = diagnostico.gerar_chaves_gcpj(gcpj)
+            else:
+                detalhes = {
+                    'fonte': self.fontes[codigo],
+                    'disponivel': False,
+                    'motivo': 'Sem mapeamento definido - reservada para fases futuras'
+                }
+            detalhes_fonte[coluna] = detalhes
+
+        disponivel_por_coluna = dict(zip(self.colunas, disponiveis))
+        return {
+            'GCPJ': gcpj,
+            'colunas_disponiveis': sorted(c for c, d in disponivel_por_coluna.items() if d),
+            'colunas_faltantes': sorted(c for c in diagnostico.template_columns if not disponivel_por_coluna.get(c, False)),
+            'detalhes_fonte': detalhes_fonte,
+            'taxa_completude': (int(disponiveis.sum()) / len(diagnostico.template_columns)) * 100,
+            'indice_original': diagnostico.primary_df.index[self.posicoes[i]]
+        }
+
+    def __getitem__(self, i):
+        return self.resultado_gcpj(range(len(self))[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.resultado_gcpj(i)
+
+
 class DiagnosticoCompletudePorGCPJ:
     def __init__(self, base_path="C:/desenvolvimento/migration_app"):
         self.base_path = base_path
@@ -68,23 +329,33 @@ class DiagnosticoCompletudePorGCPJ:
             'OPERAÇÃO': 'PROCADV_CONTRATO'
         }
         
+    def arquivos_entrada(self):
+        """Caminhos do template e das fontes primária e secundária"""
+        return [
+            os.path.join(self.base_path, ARQUIVO_TEMPLATE),
+            os.path.join(self.base_path, ARQUIVO_FONTE_PRIMARIA),
+            os.path.join(self.base_path, ARQUIVO_FONTE_SECUNDARIA)
+        ]
+        
     def carregar_dados(self):
         """Carrega os arquivos de dados"""
+        template_path, primary_path, secondary_path = self.arquivos_entrada()
         try:
             # Template
-            template_path = os.path.join(self.base_path, "template-banco-bradesco-sa.xlsx")
             self.template_df = pd.read_excel(template_path, sheet_name='Sheet')
             self.template_columns = list(self.template_df.columns)
             logger.info(f"Template carregado: {len(self.template_columns)} colunas")
             
+            # Fontes: só a coluna GCPJ e as colunas mapeadas
+            colunas_primarias = {'GCPJ'} | set(self.column_mappings.values())
+            colunas_secundarias = {'GCPJ'} | set(self.secondary_mappings.values())
+            
             # Fonte Primária
-            primary_path = os.path.join(self.base_path, "cópia-MOYA E LARA_BASE GCPJ ATIVOS - 07_04_2025.xlsx")
-            self.primary_df = pd.read_excel(primary_path)
+            self.primary_df = pd.read_excel(primary_path, usecols=lambda coluna: coluna in colunas_primarias)
             logger.info(f"Fonte primária carregada: {len(self.primary_df)} registros, {len(self.primary_df.columns)} colunas")
             
             # Fonte Secundária
-            secondary_path = os.path.join(self.base_path, "4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx")
-            self.secondary_df = pd.read_excel(secondary_path)
+            self.secondary_df = pd.read_excel(secondary_path, usecols=lambda coluna: coluna in colunas_secundarias)
             logger.info(f"Fonte secundária carregada: {len(self.secondary_df)} registros, {len(self.secondary_df.columns)} colunas")
             
             return True
@@ -103,6 +374,12 @@ class DiagnosticoCompletudePorGCPJ:
         else:
             return str(gcpj_value).strip()
     
+    def normalizar_serie_gcpj(self, serie):
+        """normalizar_gcpj de uma coluna inteira, aplicado só aos valores distintos"""
+        codigos, distintos = pd.factorize(serie)
+        normalizados = np.array([self.normalizar_gcpj(v) for v in distintos] + [None], dtype=object)
+        return normalizados[codigos]  # código -1 (vazio) aponta para o None final
+    
     def gerar_chaves_gcpj(self, gcpj_value):
         """Gera chaves alternativas para mapeamento GCPJ"""
         if not gcpj_value:
@@ -128,146 +405,156 @@ class DiagnosticoCompletudePorGCPJ:
             
         return keys
     
-    def criar_mapeamento_secundario(self):
-        """Cria mapeamento da fonte secundária por GCPJ"""
-        mapeamento = {}
-        
-        for idx, row in self.secondary_df.iterrows():
-            if 'GCPJ' in row and pd.notna(row['GCPJ']):
-                gcpj_normalizado = self.normalizar_gcpj(row['GCPJ'])
-                if gcpj_normalizado:
-                    chaves = self.gerar_chaves_gcpj(gcpj_normalizado)
-                    
-                    # Dados disponíveis para esse GCPJ
-                    dados_disponiveis = {}
-                    for template_col, source_col in self.secondary_mappings.items():
-                        if source_col in row and pd.notna(row[source_col]):
-                            dados_disponiveis[template_col] = row[source_col]
-                    
-                    # Adicionar para todas as chaves
-                    for chave in chaves:
-                        mapeamento[chave] = dados_disponiveis
-        
-        logger.info(f"Mapeamento secundário criado com {len(mapeamento)} chaves")
-        return mapeamento
+    def indexar_fonte_secundaria(self):
+        """Índice das chaves GCPJ (e alternativas) da fonte secundária
+        
+        Define chaves_secundarias (pd.Index) e linhas_secundarias (linha da fonte de
+        cada chave). Uma chave gerada por mais de uma linha fica com a última.
+        """
+        if 'GCPJ' in self.secondary_df.columns:
+            gcpjs = self.normalizar_serie_gcpj(self.secondary_df['GCPJ'])
+        else:
+            gcpjs = np.array([], dtype=object)
+        
+        alternativas = chaves_alternativas(gcpjs)
+        linhas = np.arange(len(gcpjs))
+        tabela = pd.DataFrame({
+            'chave': np.concatenate(alternativas),
+            'linha': np.tile(linhas, len(alternativas)),
+            'ordem': np.concatenate([linhas * len(alternativas) + k for k in range(len(alternativas))])
+        })
+        tabela = tabela[tabela['chave'].notna()].sort_values('ordem', kind='stable')
+        tabela = tabela.drop_duplicates('chave', keep='last')
+        
+        self.chaves_secundarias = pd.Index(tabela['chave'].to_numpy(dtype=object))
+        self.linhas_secundarias = tabela['linha'].to_numpy(dtype=np.int64)
+        logger.info(f"Mapeamento secundário criado com {len(self.chaves_secundarias)} chaves")
     
-    def analisar_registro_gcpj(self, row_primaria, mapeamento_secundario):
-        """Analisa completude de um registro específico por GCPJ"""
-        gcpj_value = self.normalizar_gcpj(row_primaria.get('GCPJ'))
-        if not gcpj_value:
-            return None
-        
-        resultado = {
-            'GCPJ': gcpj_value,
-            'colunas_disponiveis': [],
-            'colunas_faltantes': [],
-            'detalhes_fonte': {},
-            'taxa_completude': 0
-        }
-        
-        colunas_preenchidas = set()
-        
-        # 1. Verificar colunas da fonte primária
-        for template_col, source_col in self.column_mappings.items():
-            if source_col in row_primaria and pd.notna(row_primaria[source_col]):
-                colunas_preenchidas.add(template_col)
-                resultado['detalhes_fonte'][template_col] = {
-                    'fonte': 'Primária',
-                    'coluna_origem': source_col,
-                    'valor': str(row_primaria[source_col])[:50] + "..." if len(str(row_primaria[source_col])) > 50 else str(row_primaria[source_col]),
-                    'disponivel': True
-                }
-            else:
-                resultado['detalhes_fonte'][template_col] = {
-                    'fonte': 'Primária',
-                    'coluna_origem': source_col,
-                    'disponivel': False,
-                    'motivo': 'Dado não encontrado ou vazio na fonte primária'
-                }
-        
-        # 2. Verificar colunas constantes
-        for template_col, valor_constante in self.constant_values.items():
-            colunas_preenchidas.add(template_col)
-            resultado['detalhes_fonte'][template_col] = {
-                'fonte': 'Constante',
-                'valor': valor_constante,
-                'disponivel': True
-            }
-        
-        # 3. Verificar correspondência na fonte secundária
-        chaves_gcpj = self.gerar_chaves_gcpj(gcpj_value)
-        dados_secundarios = None
-        
-        for chave in chaves_gcpj:
-            if chave in mapeamento_secundario:
-                dados_secundarios = mapeamento_secundario[chave]
-                break
-        
-        for template_col, source_col in self.secondary_mappings.items():
-            if dados_secundarios and template_col in dados_secundarios:
-                colunas_preenchidas.add(template_col)
-                resultado['detalhes_fonte'][template_col] = {
-                    'fonte': 'Secundária (via GCPJ)',
-                    'coluna_origem': source_col,
-                    'valor': str(dados_secundarios[template_col])[:50] + "..." if len(str(dados_secundarios[template_col])) > 50 else str(dados_secundarios[template_col]),
-                    'chave_gcpj_usada': next((k for k in chaves_gcpj if k in mapeamento_secundario), None),
-                    'disponivel': True
-                }
+    def colunas_diagnostico(self):
+        """Colunas do resultado (ordem de detalhes_fonte) e código da fonte de cada uma"""
+        fontes = {}
+        for template_col in self.column_mappings:
+            fontes[template_col] = FONTE_PRIMARIA
+        for template_col in self.constant_values:
+            fontes[template_col] = FONTE_CONSTANTE
+        for template_col in self.secondary_mappings:
+            fontes[template_col] = FONTE_SECUNDARIA
+        for template_col in self.template_columns:
+            fontes.setdefault(template_col, FONTE_NENHUMA)
+        return list(fontes), list(fontes.values())
+    
+    def analisar_bloco(self, bloco, inicio, colunas, codigos_fonte, secundarios_preenchidos):
+        """Analisa um bloco da fonte primária; retorna (gcpjs, posições, máscaras, chaves usadas)"""
+        if 'GCPJ' in bloco.columns:
+            gcpjs = self.normalizar_serie_gcpj(bloco['GCPJ'])
+        else:
+            gcpjs = np.full(len(bloco), None, dtype=object)
+        validos = pd.notna(gcpjs) & (gcpjs != '')
+        gcpjs = gcpjs[validos]
+        
+        chaves_usadas = localizar_chaves(self.chaves_secundarias, chaves_alternativas(gcpjs))
+        encontrados = chaves_usadas >= 0
+        linhas = self.linhas_secundarias[chaves_usadas[encontrados]]
+        
+        disponiveis = np.zeros((len(gcpjs), len(colunas)), dtype=bool)
+        for j, (coluna, codigo) in enumerate(zip(colunas, codigos_fonte)):
+            if codigo == FONTE_PRIMARIA:
+                source_col = self.column_mappings[coluna]
+                if source_col in bloco.columns:
+                    disponiveis[:, j] = bloco[source_col].notna().to_numpy()[validos]
+            elif codigo == FONTE_CONSTANTE:
+                disponiveis[:, j] = True
+            elif codigo == FONTE_SECUNDARIA:
+                disponiveis[encontrados, j] = secundarios_preenchidos[coluna][linhas]
+        
+        posicoes = inicio + np.flatnonzero(validos)
+        return gcpjs, posicoes, empacotar_disponibilidade(disponiveis), chaves_usadas.astype(np.int32)
+    
+    @contextmanager
+    def mapeador_blocos(self, processos, contexto_analise):
+        """map() dos blocos: pool de processos por fork ou o próprio processo
+        
+        O contexto da análise fica em _ANALISE_COMPARTILHADA antes do fork, então os
+        processos o herdam sem serialização. Sair do bloco with (inclusive por
+        cancelamento) encerra o pool. Fora da thread principal o fork não é seguro
+        e a análise fica no próprio processo.
+        """
+        global _ANALISE_COMPARTILHADA
+        if processos > 1 and threading.current_thread() is not threading.main_thread():
+            logger.warning("Análise paralela pedida fora da thread principal; executando em um processo")
+            processos = 1
+        
+        _ANALISE_COMPARTILHADA = contexto_analise
+        try:
+            if processos > 1 and 'fork' in multiprocessing.get_all_start_methods():
+                # Tabela hash do índice montada antes do fork, para ser compartilhada
+                self.chaves_secundarias.get_indexer(self.chaves_secundarias[:1])
+                with multiprocessing.get_context('fork').Pool(processos) as pool:
+                    yield pool.imap
             else:
-                resultado['detalhes_fonte'][template_col] = {
-                    'fonte': 'Secundária (via GCPJ)',
-                    'coluna_origem': source_col,
-                    'disponivel': False,
-                    'motivo': 'GCPJ não encontrado na fonte secundária ou dado vazio',
-                    'chaves_tentadas': chaves_gcpj
-                }
-        
-        # 4. Identificar colunas do template que ficarão vazias
-        colunas_template_set = set(self.template_columns)
-        colunas_mapeadas = set(self.column_mappings.keys()) | set(self.secondary_mappings.keys()) | set(self.constant_values.keys())
-        colunas_sem_mapeamento = colunas_template_set - colunas_mapeadas
-        
-        # Adicionar colunas sem mapeamento
-        for col in colunas_sem_mapeamento:
-            resultado['detalhes_fonte'][col] = {
-                'fonte': 'Nenhuma',
-                'disponivel': False,
-                'motivo': 'Sem mapeamento definido - reservada para fases futuras'
-            }
-        
-        # 5. Calcular listas finais
-        resultado['colunas_disponiveis'] = sorted(list(colunas_preenchidas))
-        resultado['colunas_faltantes'] = sorted([col for col in self.template_columns if col not in colunas_preenchidas])
-        resultado['taxa_completude'] = (len(colunas_preenchidas) / len(self.template_columns)) * 100
-        
-        return resultado
+                yield map
+        finally:
+            _ANALISE_COMPARTILHADA = None
     
-    def gerar_diagnostico_completo(self, progresso_a_cada=1000):
-        """Gera diagnóstico completo por GCPJ - SEMPRE processa TODOS os registros"""
+    def gerar_diagnostico_completo(self, progresso_a_cada=1000, progresso=PROGRESSO_NULO, processos=1):
+        """Gera diagnóstico completo por GCPJ - SEMPRE processa TODOS os registros
+        
+        Retorna um ResultadoDiagnosticoGCPJ (ou None se os dados não carregarem).
+        progresso (ver progresso_execucao) recebe o avanço bloco a bloco e
+        interrompe a análise com ExecucaoCancelada se o operador cancelar.
+        processos=1 (padrão) executa no próprio processo; None usa PROCESSOS_ANALISE
+        em bases a partir de MINIMO_REGISTROS_PARALELO registros (linha de comando).
+        """
         logger.info("Iniciando diagnóstico de completude por GCPJ...")
         
+        progresso.fase('Carregando dados')
         if not self.carregar_dados():
             return None
         
-        # Criar mapeamento da fonte secundária
-        mapeamento_secundario = self.criar_mapeamento_secundario()
+        # Indexar a fonte secundária pelas chaves GCPJ
+        progresso.fase('Mapeando fonte secundária')
+        self.indexar_fonte_secundaria()
+        
+        colunas, codigos_fonte = self.colunas_diagnostico()
+        secundarios_preenchidos = {}
+        for template_col, source_col in self.secondary_mappings.items():
+            if source_col in self.secondary_df.columns:
+                secundarios_preenchidos[template_col] = self.secondary_df[source_col].notna().to_numpy()
+            else:
+                secundarios_preenchidos[template_col] = np.zeros(len(self.secondary_df), dtype=bool)
         
-        # Analisar TODOS os registros da fonte primária
-        resultados = []
+        # Analisar TODOS os registros da fonte primária, em blocos
         total_registros = len(self.primary_df)
         logger.info(f"Total de registros a processar: {total_registros:,}")
+        progresso.fase('Analisando registros', total=total_registros)
+        
+        inicios = range(0, total_registros, TAMANHO_BLOCO_ANALISE)
+        if processos is None:
+            processos = PROCESSOS_ANALISE if total_registros >= MINIMO_REGISTROS_PARALELO else 1
+        processos = max(1, min(processos, len(inicios)))
+        if processos > 1:
+            logger.info(f"Análise em {processos} processos ({len(inicios)} blocos)")
+        
+        partes = []
+        contexto_analise = (self, colunas, codigos_fonte, secundarios_preenchidos)
+        with self.mapeador_blocos(processos, contexto_analise) as mapear:
+            for inicio, parte in zip(inicios, mapear(_analisar_bloco_compartilhado, inicios)):
+                partes.append(parte)
+                
+                fim = min(inicio + TAMANHO_BLOCO_ANALISE, total_registros)
+                if fim // progresso_a_cada > inicio // progresso_a_cada:
+                    logger.info(f"Processando registro {fim:,} de {total_registros:,} ({fim / total_registros * 100:.1f}%)")
+                progresso.avancar(fim - inicio)
+        
+        if partes:
+            gcpjs, posicoes, mascaras, chaves_usadas = (np.concatenate(campo) for campo in zip(*partes))
+        else:
+            gcpjs = np.array([], dtype=object)
+            posicoes = np.array([], dtype=np.int64)
+            mascaras = empacotar_disponibilidade(np.zeros((0, len(colunas)), dtype=bool))
+            chaves_usadas = np.array([], dtype=np.int32)
         
-        for idx, row in self.primary_df.iterrows():
-            # Mostrar progresso a cada N registros
-            if (idx + 1) % progresso_a_cada == 0:
-                percentual = ((idx + 1) / total_registros) * 100
-                logger.info(f"Processando registro {idx + 1:,} de {total_registros:,} ({percentual:.1f}%)")
-            
-            resultado = self.analisar_registro_gcpj(row, mapeamento_secundario)
-            if resultado:
-                resultado['indice_original'] = idx
-                resultados.append(resultado)
-        
+        resultados = ResultadoDiagnosticoGCPJ(self, colunas, codigos_fonte, gcpjs, posicoes, mascaras, chaves_usadas)
         logger.info(f"✅ Diagnóstico concluído para {len(resultados):,} registros ({total_registros:,} processados)")
         return resultados
     
@@ -278,33 +565,30 @@ class DiagnosticoCompletudePorGCPJ:
         
         # Estatísticas gerais
         total_registros = len(resultados)
-        taxas_completude = [r['taxa_completude'] for r in resultados]
-        taxa_media = sum(taxas_completude) / len(taxas_completude)
+        taxas_completude = resultados.taxas_completude()
+        taxa_media = resultados.taxa_media()
         
         # Distribuição por faixas de completude
         faixas = {
-            '90-100%': sum(1 for t in taxas_completude if t >= 90),
-            '70-89%': sum(1 for t in taxas_completude if 70 <= t < 90),
-            '50-69%': sum(1 for t in taxas_completude if 50 <= t < 70),
-            '0-49%': sum(1 for t in taxas_completude if t < 50)
+            '90-100%': int((taxas_completude >= 90).sum()),
+            '70-89%': int(((taxas_completude >= 70) & (taxas_completude < 90)).sum()),
+            '50-69%': int(((taxas_completude >= 50) & (taxas_completude < 70)).sum()),
+            '0-49%': int((taxas_completude < 50).sum())
         }
         
-        # Colunas mais problemáticas
-        contador_faltantes = {}
-        for resultado in resultados:
-            for col in resultado['colunas_faltantes']:
-                contador_faltantes[col] = contador_faltantes.get(col, 0) + 1
+        # Faltantes por coluna (contagem direto das máscaras)
+        faltantes = dict(zip(resultados.colunas, total_registros - resultados.preenchidos_por_coluna()))
         
+        # Colunas mais problemáticas
+        contador_faltantes = {col: int(faltantes[col]) for col in sorted(self.template_columns) if faltantes[col] > 0}
         colunas_mais_problematicas = sorted(contador_faltantes.items(), key=lambda x: x[1], reverse=True)[:10]
         
         # Problemas por fonte
         problemas_por_fonte = {'Primária': 0, 'Secundária (via GCPJ)': 0, 'Nenhuma': 0}
-        for resultado in resultados:
-            for col, detalhes in resultado['detalhes_fonte'].items():
-                if not detalhes.get('disponivel', False):
-                    fonte = detalhes.get('fonte', 'Desconhecida')
-                    if fonte in problemas_por_fonte:
-                        problemas_por_fonte[fonte] += 1
+        for coluna, codigo in zip(resultados.colunas, resultados.codigos_fonte):
+            fonte = resultados.fontes[codigo]
+            if fonte in problemas_por_fonte:
+                problemas_por_fonte[fonte] += int(faltantes[coluna])
         
         resumo = {
             'total_registros': total_registros,
@@ -324,19 +608,20 @@ class DiagnosticoCompletudePorGCPJ:
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        # Filtrar registros conforme tipo solicitado
+        # Filtrar registros conforme tipo solicitado (só os escolhidos viram dicionário)
         if tipo == 'problematicos':
             # Ordenar por menor taxa de completude
-            resultados_filtrados = sorted(resultados, key=lambda x: x['taxa_completude'])[:limite]
+            posicoes = np.argsort(resultados.taxas_completude(), kind='stable')[:limite]
             sufixo = f"problematicos_top{limite}"
         elif tipo == 'completos':
             # Ordenar por maior taxa de completude
-            resultados_filtrados = sorted(resultados, key=lambda x: x['taxa_completude'], reverse=True)[:limite]
+            posicoes = np.argsort(-resultados.taxas_completude(), kind='stable')[:limite]
             sufixo = f"completos_top{limite}"
         else:
             # Todos os registros
-            resultados_filtrados = resultados[:limite]
+            posicoes = range(min(limite, len(resultados)))
             sufixo = f"todos_top{limite}"
+        resultados_filtrados = (resultados[int(i)] for i in posicoes)
         
         # Preparar dados para Excel
         dados_resumo = []
@@ -412,7 +697,8 @@ class DiagnosticoCompletudePorGCPJ:
 
 
 # Função principal para executar o diagnóstico
-def executar_diagnostico_por_gcpj(tipo_relatorio='problematicos', limite_relatorio=50, progresso_a_cada=1000):
+def executar_diagnostico_por_gcpj(tipo_relatorio='problematicos', limite_relatorio=50, progresso_a_cada=1000,
+                                  processos=None):
     """
     Função principal para executar o diagnóstico por GCPJ
     
@@ -420,6 +706,7 @@ def executar_diagnostico_por_gcpj(tipo_relatorio='problematicos', limite_relator
         tipo_relatorio: 'problematicos', 'completos' ou 'todos'
         limite_relatorio: Quantos registros incluir no relatório Excel
         progresso_a_cada: A cada quantos registros mostrar progresso
+        processos: Processos da análise (None = automático pelo tamanho da base)
     """
     diagnostico = DiagnosticoCompletudePorGCPJ()
     
@@ -430,7 +717,7 @@ def executar_diagnostico_por_gcpj(tipo_relatorio='problematicos', limite_relator
     print(f"📋 Processamento: TODOS os registros da base primária")
     
     # Gerar diagnóstico para TODOS os registros
-    resultados = diagnostico.gerar_diagnostico_completo(progresso_a_cada)
+    resultados = diagnostico.gerar_diagnostico_completo(progresso_a_cada, processos=processos)
     
     if resultados:
         # Gerar resumo
@@ -0,0 +1,244 @@
+"""
+Diagnóstico de Completude em Forma Empacotada
+
+Usado pelo SistemaCompleto no lugar da lista de dicionários por GCPJ
+(colunas_disponiveis, colunas_faltantes e detalhes_por_coluna).
+
+FUNCIONAMENTO:
+- A disponibilidade de cada GCPJ fica em uma máscara de bits: a coluna j do
+  template é o bit j%64 da palavra j//64 (uma única palavra uint64 até 64 colunas)
+- A fonte vencedora de cada célula fica em uma matriz de inteiros pequenos com
+  índices para a lista de fontes (0 = 'Nenhuma', 1 = 'Constante')
+- Taxas de completude vêm do popcount das máscaras
+- O formato verboso (dicionário por GCPJ) só é montado sob demanda, para drill-down
+
+USO:
+    diagnostico = DiagnosticoEmpacotado(gcpjs, colunas, tipos_colunas, fontes,
+                                        disponiveis, matriz_fontes)
+    diagnostico.taxas_completude()
+    diagnostico[0]  # dicionário verboso do primeiro GCPJ
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+FONTE_NENHUMA = 0
+FONTE_CONSTANTE = 1
+FONTES_FIXAS = ['Nenhuma', 'Constante']
+
+TIPO_CONSTANTE = 'constante'
+TIPO_MAPEADA = 'mapeada'
+TIPO_SEM_MAPEAMENTO = 'sem_mapeamento'
+
+MOTIVO_SEM_MAPEAMENTO = "Sem mapeamento definido"
+
+# Quantidade de bits 1 em cada valor de byte
+_POPCOUNT_BYTE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def dtype_matriz_fontes(total_fontes):
+    """Menor inteiro sem sinal que comporta os índices de fonte"""
+    return np.uint8 if total_fontes <= 256 else np.uint16
+
+
+def empacotar_disponibilidade(disponiveis):
+    """Converte a matriz booleana (GCPJs x colunas) em máscaras uint64 por GCPJ"""
+    disponiveis = np.asarray(disponiveis, dtype=bool)
+    total_gcpjs, total_colunas = disponiveis.shape
+    palavras = max(1, -(-total_colunas // 64))
+
+    bits = np.zeros((total_gcpjs, palavras * 64), dtype=bool)
+    bits[:, :total_colunas] = disponiveis
+    return np.packbits(bits, axis=1, bitorder='little').view('<u8')
+
+
+def desempacotar_disponibilidade(mascaras, total_colunas):
+    """Converte as máscaras uint64 de volta na matriz booleana (GCPJs x colunas)"""
+    bytes_mascaras = np.ascontiguousarray(mascaras, dtype='<u8').view(np.uint8)
+    bits = np.unpackbits(bytes_mascaras, axis=1, bitorder='little')
+    return bits[:, :total_colunas].astype(bool)
+
+
+def popcount(mascaras):
+    """Quantidade de bits ligados por linha de máscaras uint64"""
+    bytes_mascaras = np.ascontiguousarray(mascaras, dtype='<u8').view(np.uint8)
+    return _POPCOUNT_BYTE[bytes_mascaras].sum(axis=1, dtype=np.int64)
+
+
+class DiagnosticoEmpacotado:
+    """Resultado de um diagnóstico de completude com disponibilidade em bits"""
+
+    def __init__(self, gcpjs, colunas, tipos_colunas, fontes, disponiveis, matriz_fontes):
+        self.gcpjs = [str(g) for g in gcpjs]
+        self.colunas = list(colunas)
+        self.tipos_colunas = list(tipos_colunas)
+        self.fontes = list(fontes)
+        self.mascaras = empacotar_disponibilidade(disponiveis)
+        self.matriz_fontes = np.asarray(matriz_fontes, dtype=dtype_matriz_fontes(len(self.fontes)))
+        self._posicao_coluna = {coluna: j for j, coluna in enumerate(self.colunas)}
+
+    # ---------- Agregados (sem materializar dicionários) ----------
+
+    def __len__(self):
+        return len(self.gcpjs)
+
+    def colunas_preenchidas(self):
+        """Quantidade de colunas disponíveis por GCPJ (popcount das máscaras)"""
+        return popcount(self.mascaras)
+
+    def taxas_completude(self):
+        """Taxa de completude (%) por GCPJ"""
+        if not self.colunas:
+            return np.zeros(len(self), dtype=float)
+        return self.colunas_preenchidas() * 100.0 / len(self.colunas)
+
+    def taxa_media(self):
+        """Taxa média de completude da execução"""
+        return float(self.taxas_completude().mean()) if len(self) else 0.0
+
+    def disponibilidade(self):
+        """Matriz booleana GCPJs x colunas"""
+        return desempacotar_disponibilidade(self.mascaras, len(self.colunas))
+
+    def preenchidos_por_coluna(self):
+        """Quantidade de GCPJs com dado disponível em cada coluna"""
+        return self.disponibilidade().sum(axis=0)
+
+    def contagens_coluna_fonte(self):
+        """Lista (coluna, fonte, preenchidos, faltantes) de cada par coluna x fonte presente"""
+        total_fontes = len(self.fontes)
+        total_colunas = len(self.colunas)
+        disponiveis = self.disponibilidade()
+
+        # Código único por célula: coluna * fontes + fonte
+        codigos = np.arange(total_colunas) * total_fontes + self.matriz_fontes.astype(np.int64)
+        tamanho = total_colunas * total_fontes
+        preenchidos = np.bincount(codigos[disponiveis], minlength=tamanho)
+        faltantes = np.bincount(codigos[~disponiveis], minlength=tamanho)
+
+        contagens = []
+        for codigo in np.flatnonzero(preenchidos + faltantes):
+            j, f = divmod(int(codigo), total_fontes)
+            contagens.append((self.colunas[j], self.fontes[f], int(preenchidos[codigo]), int(faltantes[codigo])))
+        return contagens
+
+    # ---------- Formato verboso sob demanda ----------
+
+    def _motivo_falta(self, i, j):
+        if self.tipos_colunas[j] == TIPO_SEM_MAPEAMENTO:
+            return MOTIVO_SEM_MAPEAMENTO
+        return f"GCPJ {self.gcpjs[i]} não encontrado nas fontes ou dado vazio"
+
+    def resultado_gcpj(self, i):
+        """Monta o dicionário verboso de um GCPJ (mesmo formato do diagnóstico antigo)"""
+        disponiveis = desempacotar_disponibilidade(self.mascaras[i:i + 1], len(self.colunas))[0]
+        resultado = {
+            'gcpj': self.gcpjs[i],
+            'colunas_disponiveis': [],
+            'colunas_faltantes': [],
+            'detalhes_por_coluna': {},
+            'taxa_completude': (int(disponiveis.sum()) / len(self.colunas)) * 100 if self.colunas else 0
+        }
+
+        for j, coluna in enumerate(self.colunas):
+            disponivel = bool(disponiveis[j])
+            if disponivel:
+                resultado['colunas_disponiveis'].append(coluna)
+            else:
+                resultado['colunas_faltantes'].append(coluna)
+
+            resultado['detalhes_por_coluna'][coluna] = {
+                'disponivel': disponivel,
+                'fonte': self.fontes[self.matriz_fontes[i, j]],
+                'motivo_falta': None if disponivel else self._motivo_falta(i, j)
+            }
+
+        return resultado
+
+    def __getitem__(self, i):
+        return self.resultado_gcpj(range(len(self))[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.resultado_gcpj(i)
+
+    def _posicoes_faltantes(self, j):
+        bits_coluna = (self.mascaras[:, j // 64] >> np.uint64(j % 64)) & np.uint64(1)
+        return np.flatnonzero(bits_coluna == 0)
+
+    def total_faltantes_coluna(self, coluna):
+        """Quantidade de GCPJs sem dado em uma coluna"""
+        j = self._posicao_coluna.get(coluna)
+        return 0 if j is None else len(self._posicoes_faltantes(j))
+
+    def iterar_faltantes_coluna(self, coluna):
+        """Gera (gcpj, fonte, motivo_falta) dos GCPJs sem dado na coluna, em ordem de GCPJ
+
+        Nada além dos índices das posições é materializado (para exportação em streaming).
+        """
+        j = self._posicao_coluna.get(coluna)
+        if j is None:
+            return
+
+        posicoes = self._posicoes_faltantes(j)
+        ordem = sorted(range(len(posicoes)), key=lambda k: self.gcpjs[posicoes[k]])
+        for k in ordem:
+            i = posicoes[k]
+            yield self.gcpjs[i], self.fontes[self.matriz_fontes[i, j]], self._motivo_falta(i, j)
+
+    def faltantes_coluna(self, coluna):
+        """GCPJs sem dado em uma coluna (gcpj, disponivel, fonte, motivo_falta), ordenados por GCPJ"""
+        j = self._posicao_coluna.get(coluna)
+        if j is None:
+            return pd.DataFrame(columns=['gcpj', 'disponivel', 'fonte', 'motivo_falta'])
+
+        posicoes = self._posicoes_faltantes(j)
+        gcpjs = [self.gcpjs[i] for i in posicoes]
+
+        if self.tipos_colunas[j] == TIPO_SEM_MAPEAMENTO:
+            motivos = [MOTIVO_SEM_MAPEAMENTO] * len(gcpjs)
+        else:
+            motivos = [f"GCPJ {gcpj} não encontrado nas fontes ou dado vazio" for gcpj in gcpjs]
+
+        df = pd.DataFrame({
+            'gcpj': gcpjs,
+            'disponivel': 0,
+            'fonte': [self.fontes[f] for f in self.matriz_fontes[posicoes, j]],
+            'motivo_falta': motivos
+        })
+        return df.sort_values('gcpj', kind='stable').reset_index(drop=True)
+
+    # ---------- Serialização para o banco ----------
+
+    def serializar(self):
+        """Retorna os campos da tabela diagnostico_empacotado"""
+        return {
+            'gcpjs': json.dumps(self.gcpjs),
+            'colunas': json.dumps(self.colunas),
+            'tipos_colunas': json.dumps(self.tipos_colunas),
+            'fontes': json.dumps(self.fontes),
+            'mascaras': self.mascaras.tobytes(),
+            'matriz_fontes': self.matriz_fontes.tobytes()
+        }
+
+    @classmethod
+    def desserializar(cls, gcpjs, colunas, tipos_colunas, fontes, mascaras, matriz_fontes):
+        """Reconstrói o diagnóstico a partir de uma linha de diagnostico_empacotado"""
+        diagnostico = cls.__new__(cls)
+        diagnostico.gcpjs = json.loads(gcpjs)
+        diagnostico.colunas = json.loads(colunas)
+        diagnostico.tipos_colunas = json.loads(tipos_colunas)
+        diagnostico.fontes = json.loads(fontes)
+
+        total_gcpjs = len(diagnostico.gcpjs)
+        total_colunas = len(diagnostico.colunas)
+        palavras = max(1, -(-total_colunas // 64))
+
+        diagnostico.mascaras = np.frombuffer(mascaras, dtype='<u8').reshape(total_gcpjs, palavras)
+        diagnostico.matriz_fontes = np.frombuffer(
+            matriz_fontes, dtype=dtype_matriz_fontes(len(diagnostico.fontes))
+        ).reshape(total_gcpjs, total_colunas)
+        diagnostico._posicao_coluna = {coluna: j for j, coluna in enumerate(diagnostico.colunas)}
+        return diagnostico
@@ -0,0 +1,413 @@
+"""
+Executor Local de Tarefas Longas (Diagnósticos)
+
+Usado pelas rotas /api/executar_diagnostico do SistemaCompleto e do
+ControleQualidade, que antes rodavam o diagnóstico dentro do worker do Flask:
+dois cliques simultâneos disparavam dois diagnósticos completos. A migração da
+gestão de fontes usa executar(), que roda na própria requisição.
+
+FUNCIONAMENTO:
+- submeter() devolve o id da tarefa imediatamente; a execução acontece em um pool
+  de threads do processo
+- O estado fica em tarefas_execucao no banco da interface, que é o que os workers
+  do gunicorn compartilham; todas as decisões abaixo são tomadas dentro de uma
+  transação BEGIN IMMEDIATE, então dois workers não decidem ao mesmo tempo
+- Deduplicação: uma tarefa com a mesma chave ainda na fila ou executando (em
+  qualquer worker) é reaproveitada em vez de criar outra (a chave descreve as
+  entradas, por exemplo as versões de fontes e escopo)
+- Vaga: a tarefa só passa a 'executando' quando há menos de max_concorrentes
+  tarefas executando e a soma das estimativas de memória (MB) cabe no orçamento,
+  contando as de todos os workers; uma tarefa maior que o orçamento inteiro roda
+  sozinha
+- O id da tarefa é o id do Progresso (progresso_execucao), que serve também de
+  token de cancelamento: o motor verifica em progresso.avancar()/fase(). O
+  cancelamento pedido em outro worker vira cancelamento_solicitado no banco
+- Sinal de vida: uma thread do processo grava a cada INTERVALO_SINAL segundos o
+  progresso das tarefas locais (lido pelo SSE e pela API dos outros workers) e
+  traz os pedidos de cancelamento. Tarefa ativa sem sinal há LIMITE_SEM_SINAL
+  segundos pertencia a um worker que morreu e é marcada como 'interrompido'
+- O resultado (JSON) de tarefas concluídas sobrevive a um reinício; na criação do
+  executor (no mestre do gunicorn, com preload_app) as tarefas que estavam na
+  fila ou executando são marcadas como 'interrompido'
+
+USO:
+    executor = ExecutorTarefas(db_path, painel_progresso, max_concorrentes=1)
+    tarefa_id, reaproveitada = executor.submeter(
+        'diagnostico', lambda progresso: {'total': ...}, chave='diagnostico:v3', memoria_mb=512
+    )
+    executor.obter(tarefa_id)    # estado, resultado, erro e progresso ao vivo
+    executor.cancelar(tarefa_id)
+    resposta_eventos(executor, execucao_id=tarefa_id)  # SSE, de qualquer worker
+
+    resultado = executor.executar('migracao', funcao)  # na thread da requisição
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from conexao_sqlite import conexao, fechar_conexoes
+from progresso_execucao import (
+    ExecucaoCancelada, ESTADO_NA_FILA, ESTADO_EXECUTANDO, ESTADO_CONCLUIDO,
+    ESTADO_CANCELADO, ESTADO_ERRO, ESTADOS_ATIVOS, INTERVALO_KEEP_ALIVE, formatar_evento
+)
+
+logger = logging.getLogger(__name__)
+
+ESTADO_INTERROMPIDO = 'interrompido'
+
+MAX_TAREFAS_CONCORRENTES = 1
+ORCAMENTO_MEMORIA_MB = 2048
+
+# Tarefas listadas por listar()
+LIMITE_LISTAGEM_TAREFAS = 20
+
+# Intervalo do sinal de vida, da espera por vaga e da leitura do banco pelo SSE (segundos)
+INTERVALO_SINAL = 1.0
+
+# Tarefa ativa sem sinal de vida há mais que isto pertencia a um worker que morreu
+LIMITE_SEM_SINAL = 60
+
+CAMPOS_TAREFA = '''id, tipo, chave, estado, criada_em, iniciada_em, finalizada_em,
+                   resultado, erro, progresso, atualizada_em'''
+
+
+class ExecutorTarefas:
+    """Fila de tarefas com limite de concorrência, orçamento de memória e estado no banco"""
+
+    def __init__(self, db_path, painel, max_concorrentes=MAX_TAREFAS_CONCORRENTES,
+                 orcamento_memoria_mb=ORCAMENTO_MEMORIA_MB):
+        # A tabela tarefas_execucao vem das migrações do banco da interface
+        self.db_path = db_path
+        self.painel = painel
+        self.max_concorrentes = max_concorrentes
+        self.orcamento_memoria_mb = orcamento_memoria_mb
+        self._pool = ThreadPoolExecutor(max_workers=max_concorrentes, thread_name_prefix='tarefa')
+        self._locais = {}  # id -> Progresso das tarefas ativas deste processo
+        self._sinal = None  # thread do sinal de vida (só existe com tarefas locais)
+        self._trava = threading.Lock()
+        self.marcar_interrompidas()
+
+    def marcar_interrompidas(self):
+        """Tarefas ativas no banco pertenciam a um processo anterior que terminou"""
+        with conexao(self.db_path) as conn:
+            conn.execute('''
+                UPDATE tarefas_execucao SET estado = ?, finalizada_em = ?
+                WHERE estado IN (?, ?)
+            ''', (ESTADO_INTERROMPIDO, datetime.now().isoformat(), ESTADO_NA_FILA, ESTADO_EXECUTANDO))
+            conn.commit()
+
+    @contextmanager
+    def _transacao(self):
+        """Transação de escrita reservada: os workers decidem um de cada vez"""
+        with conexao(self.db_path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.commit()
+
+    @staticmethod
+    def _limite_sinal():
+        return (datetime.now() - timedelta(seconds=LIMITE_SEM_SINAL)).isoformat()
+
+    def _marcar_sem_sinal(self, conn):
+        """Tarefas ativas cujo worker parou de dar sinal de vida viram 'interrompido'"""
+        conn.execute('''
+            UPDATE tarefas_execucao SET estado = ?, finalizada_em = ?
+            WHERE estado IN (?, ?) AND (atualizada_em IS NULL OR atualizada_em < ?)
+        ''', (ESTADO_INTERROMPIDO, datetime.now().isoformat(),
+              ESTADO_NA_FILA, ESTADO_EXECUTANDO, self._limite_sinal()))
+
+    def _atualizar(self, tarefa_id, **campos):
+        atribuicoes = ', '.join(f"{nome} = ?" for nome in campos)
+        with conexao(self.db_path) as conn:
+            conn.execute(f"UPDATE tarefas_execucao SET {atribuicoes} WHERE id = ?",
+                         (*campos.values(), tarefa_id))
+            conn.commit()
+
+    def _registrar(self, tipo, chave, memoria_mb):
+        """Cria a tarefa na fila ou devolve a ativa com a mesma chave: (id, reaproveitada, progresso)"""
+        memoria_mb = min(memoria_mb, self.orcamento_memoria_mb)
+        with self._trava:
+            with self._transacao() as conn:
+                self._marcar_sem_sinal(conn)
+                if chave is not None:
+                    existente = conn.execute('''
+                        SELECT id FROM tarefas_execucao
+                        WHERE chave = ? AND estado IN (?, ?)
+                        ORDER BY criada_em DESC LIMIT 1
+                    ''', (chave, ESTADO_NA_FILA, ESTADO_EXECUTANDO)).fetchone()
+                    if existente is not None:
+                        return existente[0], True, None
+
+                progresso = self.painel.iniciar(tipo, na_fila=True)
+                agora = datetime.now().isoformat()
+                conn.execute('''
+                    INSERT INTO tarefas_execucao
+                    (id, tipo, chave, estado, criada_em, memoria_mb, atualizada_em)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (progresso.id, tipo, chave, ESTADO_NA_FILA, agora, memoria_mb, agora))
+
+            self._locais[progresso.id] = progresso
+            self._garantir_sinal()
+        return progresso.id, False, progresso
+
+    def submeter(self, tipo, funcao, chave=None, memoria_mb=0):
+        """Enfileira funcao(progresso) -> dict; retorna (tarefa_id, reaproveitada)"""
+        tarefa_id, reaproveitada, progresso = self._registrar(tipo, chave, memoria_mb)
+        if not reaproveitada:
+            self._pool.submit(self._executar, progresso, funcao, memoria_mb)
+        return tarefa_id, reaproveitada
+
+    def executar(self, tipo, funcao, memoria_mb=0):
+        """Roda funcao(progresso) na thread atual e devolve o retorno (que não é persistido)
+
+        A execução ocupa uma vaga, aparece para os outros workers e pode ser
+        cancelada de qualquer um deles; ExecucaoCancelada e erros são relançados.
+        """
+        _, _, progresso = self._registrar(tipo, None, memoria_mb)
+        return self._rodar(progresso, funcao, memoria_mb, guardar_resultado=False)
+
+    def _executar(self, progresso, funcao, memoria_mb):
+        """Corpo das tarefas do pool: o desfecho fica no banco e no painel"""
+        try:
+            self._rodar(progresso, funcao, memoria_mb, guardar_resultado=True)
+        except ExecucaoCancelada:
+            pass
+        except Exception:
+            logger.exception(f"Erro na tarefa {progresso.id} ({progresso.tipo})")
+
+    def _rodar(self, progresso, funcao, memoria_mb, guardar_resultado):
+        try:
+            self._reservar_vaga(progresso, memoria_mb)
+            resultado = funcao(progresso)
+            self._finalizar(progresso, ESTADO_CONCLUIDO, 'Execução concluída',
+                            resultado=resultado if guardar_resultado else None)
+            return resultado
+        except ExecucaoCancelada:
+            with self._trava:
+                if progresso.ativo:
+                    self._finalizar(progresso, ESTADO_CANCELADO, 'Execução cancelada pelo operador')
+            raise
+        except Exception as e:
+            self._finalizar(progresso, ESTADO_ERRO, str(e), erro=str(e))
+            raise
+        finally:
+            with self._trava:
+                self._locais.pop(progresso.id, None)
+
+    def _reservar_vaga(self, progresso, memoria_mb):
+        """Espera a vaga entre as tarefas executando em todos os workers e marca 'executando'"""
+        memoria_mb = min(memoria_mb, self.orcamento_memoria_mb)
+        while True:
+            progresso.verificar_cancelamento()
+            # Sob a trava: não corre com o cancelamento de uma tarefa ainda na fila
+            with self._trava:
+                with self._transacao() as conn:
+                    estado, = conn.execute("SELECT estado FROM tarefas_execucao WHERE id = ?",
+                                           (progresso.id,)).fetchone()
+                    if estado != ESTADO_NA_FILA:
+                        # Cancelada (ou dada como interrompida) por outro worker enquanto esperava
+                        raise ExecucaoCancelada(f"Execução {progresso.id} saiu da fila ({estado})")
+
+                    executando, em_uso_mb = conn.execute('''
+                        SELECT COUNT(*), COALESCE(SUM(memoria_mb), 0)
+                        FROM tarefas_execucao WHERE estado = ?
+                    ''', (ESTADO_EXECUTANDO,)).fetchone()
+                    vaga = executando < self.max_concorrentes and em_uso_mb + memoria_mb <= self.orcamento_memoria_mb
+                    if vaga:
+                        agora = datetime.now().isoformat()
+                        conn.execute('''
+                            UPDATE tarefas_execucao SET estado = ?, iniciada_em = ?, atualizada_em = ?
+                            WHERE id = ?
+                        ''', (ESTADO_EXECUTANDO, agora, agora, progresso.id))
+                if vaga:
+                    progresso.comecar()
+                    return
+            time.sleep(INTERVALO_SINAL)
+
+    def _finalizar(self, progresso, estado, mensagem, resultado=None, erro=None):
+        # O banco é atualizado antes do evento 'fim': quem reage ao evento já encontra o resultado
+        self._atualizar(
+            progresso.id, estado=estado, finalizada_em=datetime.now().isoformat(),
+            resultado=json.dumps(resultado, ensure_ascii=False, default=str) if resultado is not None else None,
+            erro=erro
+        )
+        progresso.encerrar(estado, mensagem)
+
+    def _garantir_sinal(self):
+        # Chamado sob a trava; a thread nasce no worker (threads não atravessam o fork)
+        if self._sinal is None:
+            self._sinal = threading.Thread(target=self._emitir_sinais, name='tarefas-sinal', daemon=True)
+            self._sinal.start()
+
+    def _emitir_sinais(self):
+        """Grava o progresso das tarefas locais e aplica os cancelamentos pedidos no banco"""
+        try:
+            while True:
+                time.sleep(INTERVALO_SINAL)
+                with self._trava:
+                    locais = list(self._locais.values())
+                    if not locais:
+                        self._sinal = None
+                        return
+                try:
+                    self._sinalizar(locais)
+                except sqlite3.Error as e:
+                    logger.warning(f"Falha ao gravar o sinal de vida das tarefas: {e}")
+        finally:
+            fechar_conexoes()
+
+    def _sinalizar(self, locais):
+        agora = datetime.now().isoformat()
+        ids = [progresso.id for progresso in locais]
+        with conexao(self.db_path) as conn:
+            conn.executemany('''
+                UPDATE tarefas_execucao SET atualizada_em = ?, progresso = ?
+                WHERE id = ? AND estado IN (?, ?)
+            ''', [(agora, json.dumps(progresso.instantaneo(), ensure_ascii=False), progresso.id,
+                   ESTADO_NA_FILA, ESTADO_EXECUTANDO) for progresso in locais])
+            pedidos = conn.execute(f'''
+                SELECT id, estado FROM tarefas_execucao
+                WHERE id IN ({', '.join('?' * len(ids))})
+                  AND (cancelamento_solicitado = 1 OR estado = ?)
+            ''', (*ids, ESTADO_CANCELADO)).fetchall()
+            conn.commit()
+
+        for tarefa_id, estado in pedidos:
+            with self._trava:
+                progresso = self._locais.get(tarefa_id)
+                if progresso is None or not progresso.ativo:
+                    continue
+                if estado == ESTADO_CANCELADO:
+                    # Cancelada na fila por outro worker
+                    progresso.encerrar(ESTADO_CANCELADO, 'Execução cancelada antes de começar')
+                else:
+                    progresso.cancelar()
+
+    def _montar(self, linha):
+        (tarefa_id, tipo, chave, estado, criada_em, iniciada_em, finalizada_em,
+         resultado, erro, progresso_gravado, atualizada_em) = linha
+        if estado in ESTADOS_ATIVOS and (atualizada_em or '') < self._limite_sinal():
+            # Worker morto; o banco é corrigido na próxima submissão ou cancelamento
+            estado = ESTADO_INTERROMPIDO
+        tarefa = {
+            'id': tarefa_id,
+            'tipo': tipo,
+            'chave': chave,
+            'estado': estado,
+            'criada_em': criada_em,
+            'iniciada_em': iniciada_em,
+            'finalizada_em': finalizada_em,
+            'resultado': json.loads(resultado) if resultado else None,
+            'erro': erro,
+            'progresso': None
+        }
+        progresso = self.painel.obter(tarefa_id)
+        if progresso is not None:
+            tarefa['progresso'] = progresso.instantaneo()
+        elif estado in ESTADOS_ATIVOS and progresso_gravado:
+            # Tarefa de outro worker: último progresso gravado pelo sinal de vida
+            tarefa['progresso'] = json.loads(progresso_gravado)
+        return tarefa
+
+    def obter(self, tarefa_id):
+        """Estado da tarefa (dict) ou None se o id não existe"""
+        with conexao(self.db_path) as conn:
+            linha = conn.execute(f"SELECT {CAMPOS_TAREFA} FROM tarefas_execucao WHERE id = ?",
+                                 (tarefa_id,)).fetchone()
+        return self._montar(linha) if linha else None
+
+    def listar(self, tipo=None, limite=LIMITE_LISTAGEM_TAREFAS):
+        """Tarefas mais recentes primeiro"""
+        with conexao(self.db_path) as conn:
+            linhas = conn.execute(f'''
+                SELECT {CAMPOS_TAREFA}
+                FROM tarefas_execucao
+                WHERE ? IS NULL OR tipo = ?
+                ORDER BY criada_em DESC LIMIT ?
+            ''', (tipo, tipo, limite)).fetchall()
+        return [self._montar(linha) for linha in linhas]
+
+    def listar_progresso(self, tipo=None):
+        """Progresso das tarefas recentes de todos os workers (formato de PainelProgresso.listar)"""
+        return [tarefa['progresso'] for tarefa in self.listar(tipo) if tarefa['progresso'] is not None]
+
+    def _ativa(self, tipo):
+        """Tarefa na fila ou executando mais recente do tipo, em qualquer worker"""
+        with conexao(self.db_path) as conn:
+            linha = conn.execute(f'''
+                SELECT {CAMPOS_TAREFA} FROM tarefas_execucao
+                WHERE estado IN (?, ?) AND (? IS NULL OR tipo = ?) AND atualizada_em >= ?
+                ORDER BY criada_em DESC LIMIT 1
+            ''', (ESTADO_NA_FILA, ESTADO_EXECUTANDO, tipo, tipo, self._limite_sinal())).fetchone()
+        return self._montar(linha) if linha else None
+
+    def cancelar(self, tarefa_id):
+        """Cancela a tarefa na fila ou em execução, em qualquer worker; False se não está ativa"""
+        with self._trava:
+            with self._transacao() as conn:
+                self._marcar_sem_sinal(conn)
+                linha = conn.execute("SELECT estado FROM tarefas_execucao WHERE id = ?", (tarefa_id,)).fetchone()
+                if linha is None or linha[0] not in ESTADOS_ATIVOS:
+                    return False
+                if linha[0] == ESTADO_NA_FILA:
+                    # Ainda não começou: sai da fila na hora (o worker só descarta depois)
+                    conn.execute('''
+                        UPDATE tarefas_execucao SET estado = ?, finalizada_em = ? WHERE id = ?
+                    ''', (ESTADO_CANCELADO, datetime.now().isoformat(), tarefa_id))
+                else:
+                    # O worker dono aplica no próximo sinal de vida (ou já aqui, se for este)
+                    conn.execute("UPDATE tarefas_execucao SET cancelamento_solicitado = 1 WHERE id = ?",
+                                 (tarefa_id,))
+
+            progresso = self._locais.get(tarefa_id)
+            if progresso is not None:
+                if linha[0] == ESTADO_NA_FILA:
+                    progresso.encerrar(ESTADO_CANCELADO, 'Execução cancelada antes de começar')
+                else:
+                    progresso.cancelar()
+        return True
+
+    def eventos(self, execucao_id=None, tipo=None, keep_alive=INTERVALO_KEEP_ALIVE):
+        """Fluxo SSE (mesma interface de PainelProgresso.eventos) para tarefas de qualquer worker
+
+        Tarefa deste processo: eventos do painel, a cada mudança. Tarefa de outro
+        worker: o progresso gravado pelo sinal de vida, lido a cada INTERVALO_SINAL.
+        """
+        enviado = None
+        ocioso = 0.0
+        while True:
+            progresso = self.painel.obter(execucao_id) if execucao_id else self.painel.ativa(tipo)
+            if progresso is not None:
+                yield from self.painel.eventos(execucao_id=progresso.id, keep_alive=keep_alive)
+                return
+
+            tarefa = self.obter(execucao_id) if execucao_id else self._ativa(tipo)
+            if tarefa is None and execucao_id:
+                yield formatar_evento('fim', {'id': execucao_id, 'estado': 'desconhecido'})
+                return
+
+            if tarefa is not None:
+                # A partir daqui acompanha esta tarefa
+                execucao_id = tarefa['id']
+                dados = dict(tarefa['progresso'] or {'id': tarefa['id'], 'tipo': tarefa['tipo']})
+                dados['estado'] = tarefa['estado']
+                if tarefa['estado'] not in ESTADOS_ATIVOS:
+                    dados['mensagem'] = tarefa['erro'] or dados.get('mensagem', '')
+                    yield formatar_evento('fim', dados)
+                    return
+                if dados != enviado:
+                    enviado = dados
+                    ocioso = 0.0
+                    yield formatar_evento('progresso', dados)
+
+            if ocioso >= keep_alive:
+                ocioso = 0.0
+                yield ': keep-alive\n\n'
+            time.sleep(INTERVALO_SINAL)
+            ocioso += INTERVALO_SINAL
@@ -0,0 +1,118 @@
+"""
+Exportação de Listas em Streaming (CSV e XLSX)
+
+Usado pelas rotas de exportação de escopo e de GCPJs ausentes no lugar de montar
+um DataFrame e um workbook inteiros em BytesIO.
+
+FUNCIONAMENTO:
+- As linhas chegam de um iterador (cursor do banco, bitmap traduzido...), sem
+  materializar a lista completa
+- CSV é gerado em blocos e enviado enquanto o cursor é lido: o primeiro byte sai
+  imediatamente e a memória não depende da quantidade de linhas
+- XLSX é escrito com o openpyxl em modo write_only (linhas vão direto para disco)
+  em um SpooledTemporaryFile, que fica em memória só enquanto for pequeno, e
+  depois é enviado em blocos. O formato zip só pode ser enviado depois de fechado,
+  então o XLSX não tem o primeiro byte imediato, mas a memória continua constante
+
+USO:
+    linhas = conn.execute("SELECT gcpj, motivo FROM escopo_gcpj")
+    return resposta_exportacao(linhas, ['gcpj', 'motivo'], 'escopo_gcpj', formato='csv')
+"""
+
+import csv
+import io
+import itertools
+import tempfile
+from datetime import datetime
+from urllib.parse import quote
+
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+
+FORMATOS_EXPORTACAO = ('xlsx', 'csv')
+
+MIMETYPES_EXPORTACAO = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8'
+}
+
+# Tamanho dos blocos enviados ao cliente
+TAMANHO_BLOCO_ENVIO = 64 * 1024
+
+# Acima disso o arquivo XLSX temporário sai da memória para o disco
+LIMITE_MEMORIA_XLSX = 8 * 1024 * 1024
+
+# O Excel limita o nome da aba a 31 caracteres
+TAMANHO_MAXIMO_ABA = 31
+
+
+def espiar_linhas(linhas):
+    """Retorna (tem_linhas, iterador equivalente) sem perder a primeira linha"""
+    linhas = iter(linhas)
+    primeira = next(linhas, None)
+    if primeira is None:
+        return False, iter(())
+    return True, itertools.chain([primeira], linhas)
+
+
+def gerar_csv(linhas, cabecalho):
+    """Gera o CSV em blocos de bytes (UTF-8 com BOM, para o Excel reconhecer acentos)"""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=';')
+    buffer.write('\ufeff')
+    escritor.writerow(cabecalho)
+
+    for linha in linhas:
+        escritor.writerow(linha)
+        if buffer.tell() >= TAMANHO_BLOCO_ENVIO:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def escrever_xlsx(linhas, cabecalho, nome_aba='Dados'):
+    """Escreve o XLSX em modo write_only em um arquivo temporário; retorna (arquivo, tamanho)"""
+    workbook = Workbook(write_only=True)
+    planilha = workbook.create_sheet(title=nome_aba[:TAMANHO_MAXIMO_ABA])
+    planilha.append(list(cabecalho))
+    for linha in linhas:
+        planilha.append(list(linha))
+
+    arquivo = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_XLSX)
+    workbook.save(arquivo)
+    tamanho = arquivo.tell()
+    arquivo.seek(0)
+    return arquivo, tamanho
+
+
+def enviar_arquivo(arquivo):
+    """Envia um arquivo temporário em blocos e o fecha ao final"""
+    try:
+        while True:
+            bloco = arquivo.read(TAMANHO_BLOCO_ENVIO)
+            if not bloco:
+                break
+            yield bloco
+    finally:
+        arquivo.close()
+
+
+def resposta_exportacao(linhas, cabecalho, nome_base, formato='xlsx', nome_aba='Dados'):
+    """Resposta Flask em streaming com as linhas no formato pedido ('xlsx' ou 'csv')"""
+    if formato not in FORMATOS_EXPORTACAO:
+        raise ValueError(f"Formato de exportação não suportado: {formato}")
+
+    nome_arquivo = f'{nome_base}_{datetime.now().strftime("%Y%m%d_%H%M")}.{formato}'
+    headers = {'Content-Disposition': f"attachment; filename*=UTF-8''{quote(nome_arquivo)}"}
+
+    if formato == 'csv':
+        corpo = stream_with_context(gerar_csv(linhas, cabecalho))
+    else:
+        arquivo, tamanho = escrever_xlsx(linhas, cabecalho, nome_aba)
+        headers['Content-Length'] = str(tamanho)
+        corpo = enviar_arquivo(arquivo)
+
+    return Response(corpo, mimetype=MIMETYPES_EXPORTACAO[formato], headers=headers)
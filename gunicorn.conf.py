@@ -0,0 +1,53 @@
+"""
+Configuração do gunicorn para as interfaces de gestão
+
+A aplicação é importada uma vez no processo mestre (preload_app) e as fontes
+ativas são carregadas antes do fork, então o worker já sobe com elas (e, se houver
+mais de um, todos as compartilham por copy-on-write; ver pre_carregamento_fontes).
+
+FUNCIONAMENTO:
+- when_ready roda no mestre depois da importação e antes do fork: chama
+  pre_carregar_fontes() do módulo da aplicação (se existir) e preparar_fork()
+- Workers gthread: os fluxos SSE de progresso e o executor de diagnósticos usam
+  threads, então cada worker atende várias requisições ao mesmo tempo
+- Vários workers: deduplicação, vaga (concorrência e orçamento de memória),
+  cancelamento e progresso das tarefas passam pela tabela tarefas_execucao
+  (ExecutorTarefas), então o SSE, a consulta e o cancelamento podem cair em
+  qualquer worker. O ExecutorTarefas é criado no mestre (preload_app), que marca
+  como 'interrompido' o que ficou ativo de uma execução anterior
+- O ETag das páginas vem do hash do código (CachePaginas), igual em todos os workers
+
+USO:
+    gunicorn -c gunicorn.conf.py interface_gestao_fontes:app
+    MIGRATION_APP_THREADS=32 gunicorn -c gunicorn.conf.py interface_gestao_corrigida:app
+"""
+
+import os
+import sys
+
+bind = os.environ.get('MIGRATION_APP_BIND', '0.0.0.0:5002')
+workers = int(os.environ.get('MIGRATION_APP_WORKERS', '4'))
+worker_class = 'gthread'
+threads = int(os.environ.get('MIGRATION_APP_THREADS', '16'))
+
+# Fontes carregadas uma vez no mestre e herdadas pelos workers; também garante que os
+# executores de tarefas são criados uma única vez, antes do fork
+preload_app = True
+
+# Diagnósticos longos respondem 202 na hora; o timeout cobre uploads e exportações
+timeout = int(os.environ.get('MIGRATION_APP_TIMEOUT', '120'))
+
+
+def when_ready(server):
+    from pre_carregamento_fontes import preparar_fork
+
+    nome_modulo = server.app.app_uri.split(':')[0]
+    modulo = sys.modules.get(nome_modulo)
+    pre_carregar_fontes = getattr(modulo, 'pre_carregar_fontes', None)
+    if pre_carregar_fontes is not None:
+        estatisticas = pre_carregar_fontes()
+        server.log.info(
+            f"Fontes pré-carregadas em {nome_modulo}: {estatisticas['entradas']} "
+            f"({estatisticas['memoria_mb']} MB)"
+        )
+    preparar_fork()
@@ -0,0 +1,209 @@
+"""
+Importação em Massa de GCPJs para o Escopo
+
+Usado por SistemaCompleto (escopo_gcpj) e MasterDatabaseManager (gcpj_escopo)
+no lugar do INSERT OR IGNORE executado GCPJ a GCPJ.
+
+FUNCIONAMENTO:
+- O arquivo enviado é lido em blocos, apenas a coluna de GCPJ (CSV via pandas em
+  chunks, Excel via openpyxl em modo read_only)
+- Cada bloco é normalizado de forma vetorizada sobre os valores distintos do
+  bloco: só dígitos, sem o '.0' que o Excel acrescenta a números, e no mínimo
+  6 dígitos
+- Os GCPJs válidos são deduplicados em memória, gravados ordenados em uma tabela
+  temporária e entram no escopo com um único INSERT OR IGNORE ... SELECT
+
+USO:
+    with conexao(self.db_path) as conn:
+        resumo = importar_arquivo_escopo(conn, 'escopo_gcpj', 'motivo', caminho, 'GCPJ',
+                                         aba='Sheet1', motivo='Upload de arquivo')
+        conn.commit()
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+TAMANHO_BLOCO_LEITURA = 100_000
+TAMANHO_MINIMO_GCPJ = 6
+
+
+def _normalizar_distintos(serie):
+    # Retorna (código do distinto por linha, -1 = vazio; distintos normalizados; válidos por distinto)
+    codigos, distintos = pd.factorize(pd.Series(serie, dtype=object))
+    textos = pd.Series(distintos, dtype=object).astype(str).str.strip()
+
+    # Caminho rápido para valores que já são só dígitos
+    normalizados = textos.copy()
+    a_limpar = ~textos.str.isdigit()
+    if a_limpar.any():
+        # Números vindos do Excel chegam como '123456.0'; só esse formato perde o
+        # final, separadores ('1.600.000.000', '1600-000') só perdem os não dígitos
+        normalizados[a_limpar] = (
+            textos[a_limpar]
+            .str.replace(r'^(\d+)\.0+$', r'\1', regex=True)
+            .str.replace(r'\D', '', regex=True)
+        )
+
+    validos_distintos = (normalizados.str.len() >= TAMANHO_MINIMO_GCPJ).to_numpy()
+    return codigos, normalizados.to_numpy(), validos_distintos
+
+
+def normalizar_gcpjs(serie):
+    """Normaliza um bloco de GCPJs; retorna (válidos, quantidade de inválidos)
+
+    Os válidos mantêm uma entrada por linha (com repetições) para a contagem de
+    duplicados. O trabalho de texto é feito só sobre os valores distintos.
+    """
+    codigos, normalizados, validos_distintos = _normalizar_distintos(serie)
+    codigos = codigos[codigos >= 0]  # -1 = vazio
+    validos_linhas = validos_distintos[codigos]
+
+    validos = normalizados[codigos[validos_linhas]]
+    return validos, int((~validos_linhas).sum())
+
+
+def canonizar_gcpjs(serie):
+    """Forma canônica do GCPJ de cada linha, alinhada à entrada (None se vazio ou inválido)"""
+    codigos, normalizados, validos_distintos = _normalizar_distintos(serie)
+    canonicos = np.where(validos_distintos, normalizados, None)
+    return np.append(canonicos, None)[codigos]  # código -1 aponta para o None final
+
+
+def ler_coluna_em_blocos(caminho, coluna, aba=None, tamanho_bloco=TAMANHO_BLOCO_LEITURA, dtype=str):
+    """Lê apenas a coluna informada do arquivo, em blocos (pd.Series)
+
+    Para Excel usa a aba informada ou, se ela não existir, a primeira. dtype vale
+    para CSV (None = inferência do pandas, como em read_csv).
+    Levanta ValueError se a coluna não existir ou o formato não for suportado.
+    """
+    extensao = os.path.splitext(caminho)[1].lower()
+
+    if extensao == '.csv':
+        cabecalho = pd.read_csv(caminho, nrows=0).columns
+        if coluna not in cabecalho:
+            raise ValueError(f'Coluna "{coluna}" não encontrada no arquivo')
+
+        for bloco in pd.read_csv(caminho, usecols=[coluna], dtype=dtype, chunksize=tamanho_bloco):
+            yield bloco[coluna]
+
+    elif extensao in ('.xlsx', '.xlsm'):
+        wb = load_workbook(caminho, read_only=True, data_only=True)
+        try:
+            ws = wb[aba] if aba in wb.sheetnames else wb.worksheets[0]
+            linhas = ws.iter_rows(values_only=True)
+
+            cabecalho = next(linhas, ())
+            if coluna not in cabecalho:
+                raise ValueError(f'Coluna "{coluna}" não encontrada no arquivo')
+            posicao = cabecalho.index(coluna)
+
+            linhas = ws.iter_rows(min_row=2, min_col=posicao + 1, max_col=posicao + 1, values_only=True)
+            bloco = []
+            for (valor,) in linhas:
+                bloco.append(valor)
+                if len(bloco) >= tamanho_bloco:
+                    yield pd.Series(bloco, dtype=object)
+                    bloco = []
+            if bloco:
+                yield pd.Series(bloco, dtype=object)
+        finally:
+            wb.close()
+
+    else:
+        raise ValueError('Formato não suportado. Use Excel (.xlsx) ou CSV (.csv)')
+
+
+def _carregar_no_escopo(conn, tabela, coluna_motivo, gcpjs_unicos, motivo):
+    """Grava os GCPJs (já únicos) na tabela temporária e transfere os novos para o escopo"""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS importacao_gcpj (gcpj TEXT)")
+    conn.execute("DELETE FROM temp.importacao_gcpj")
+
+    # Ordenados, para que o índice único do escopo seja percorrido sequencialmente
+    conn.executemany(
+        "INSERT INTO temp.importacao_gcpj (gcpj) VALUES (?)",
+        ((gcpj,) for gcpj in sorted(gcpjs_unicos))
+    )
+
+    # Nomes de tabela/coluna vêm do código (não do usuário)
+    cursor = conn.execute(f'''
+        INSERT OR IGNORE INTO {tabela} (gcpj, {coluna_motivo}, data_inclusao)
+        SELECT gcpj, ?, ? FROM temp.importacao_gcpj
+    ''', (motivo, datetime.now().isoformat()))
+    inseridos = cursor.rowcount
+
+    conn.execute("DELETE FROM temp.importacao_gcpj")
+    return inseridos
+
+
+def atualizar_escopo_gcpjs(conn, tabela, coluna_motivo, gcpjs, motivo, extras=None):
+    """Upsert em massa: insere GCPJs novos e reativa os existentes
+
+    'extras' são colunas adicionais gravadas nos novos e atualizadas nos
+    existentes (por exemplo, o critério que incluiu o GCPJ). Retorna
+    (inseridos, atualizados).
+    """
+    extras = extras or {}
+    unicos = pd.unique(pd.Series(list(gcpjs), dtype=object))
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS importacao_gcpj (gcpj TEXT)")
+    conn.execute("DELETE FROM temp.importacao_gcpj")
+    conn.executemany(
+        "INSERT INTO temp.importacao_gcpj (gcpj) VALUES (?)",
+        ((gcpj,) for gcpj in sorted(unicos))
+    )
+
+    antes = conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+    colunas = ', '.join(['gcpj', coluna_motivo, 'data_inclusao', *extras])
+    marcadores = ', '.join(['?'] * (2 + len(extras)))
+    atualizacoes = ', '.join(['ativo = 1', *[f"{coluna} = excluded.{coluna}" for coluna in extras]])
+
+    # "WHERE true" evita a ambiguidade do ON CONFLICT após SELECT no SQLite
+    conn.execute(f'''
+        INSERT INTO {tabela} ({colunas})
+        SELECT gcpj, {marcadores} FROM temp.importacao_gcpj WHERE true
+        ON CONFLICT(gcpj) DO UPDATE SET {atualizacoes}
+    ''', (motivo, datetime.now().isoformat(), *extras.values()))
+
+    inseridos = conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0] - antes
+    conn.execute("DELETE FROM temp.importacao_gcpj")
+    return inseridos, len(unicos) - inseridos
+
+
+def carregar_gcpjs_escopo(conn, tabela, coluna_motivo, gcpjs, motivo):
+    """Insere no escopo uma lista de GCPJs já normalizados; retorna quantos eram novos"""
+    unicos = pd.unique(pd.Series(list(gcpjs), dtype=object))
+    return _carregar_no_escopo(conn, tabela, coluna_motivo, unicos, motivo)
+
+
+def importar_arquivo_escopo(conn, tabela, coluna_motivo, caminho, coluna, aba=None, motivo="Upload de arquivo"):
+    """Importa a coluna de GCPJs de um arquivo para o escopo
+
+    Retorna o resumo: lidos, invalidos, duplicados (no arquivo ou já no escopo),
+    adicionados e processados (válidos). O commit fica com quem chama.
+    """
+    lidos = invalidos = validos = 0
+    unicos_blocos = []
+
+    for bloco in ler_coluna_em_blocos(caminho, coluna, aba):
+        lidos += len(bloco)
+        gcpjs, invalidos_bloco = normalizar_gcpjs(bloco)
+        invalidos += invalidos_bloco
+        validos += len(gcpjs)
+        unicos_blocos.append(pd.unique(gcpjs))
+
+    unicos = pd.unique(np.concatenate(unicos_blocos)) if unicos_blocos else np.array([], dtype=object)
+    adicionados = _carregar_no_escopo(conn, tabela, coluna_motivo, unicos, motivo)
+
+    return {
+        'lidos': lidos,
+        'processados': validos,
+        'invalidos': invalidos,
+        'duplicados_arquivo': validos - len(unicos),
+        'ja_no_escopo': len(unicos) - adicionados,
+        'duplicados': validos - adicionados,
+        'adicionados': adicionados
+    }
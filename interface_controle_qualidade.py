@@ -18,20 +18,50 @@ Acesse: http://localhost:5001
 
 from flask import Flask, render_template, request, jsonify, send_file
 import pandas as pd
+import numpy as np
 import os
 import json
+import hashlib
 from datetime import datetime
-import sqlite3
-from io import BytesIO
+from conexao_sqlite import conexao
+from migracoes_schema import aplicar_migracoes
+from bitmap_gcpjs import BitmapGcpjs, DicionarioGcpj
+from exportacao_streaming import resposta_exportacao
+from paginacao_gcpjs import paginar_lista_ordenada, TAMANHO_PAGINA_GCPJS, LIMITE_PAGINA_GCPJS
+from progresso_execucao import PainelProgresso, ExecucaoCancelada, PROGRESSO_NULO, resposta_eventos
+from executor_tarefas import ExecutorTarefas
 import base64
-from collections import defaultdict
+import threading
+from collections import OrderedDict, defaultdict
+from urllib.parse import quote
 
 app = Flask(__name__)
 
+# Quantidade de comparações entre execuções mantidas em memória
+LIMITE_CACHE_COMPARACOES = 16
+
+# Quantidade de listas ordenadas de GCPJs ausentes mantidas em memória
+LIMITE_CACHE_LISTAS = 32
+
+# GCPJs ausentes guardados em JSON como prévia de cada coluna (a lista completa fica no bitmap)
+LIMITE_PREVIA_AUSENTES = 100
+
+# Diagnósticos simultâneos e orçamento de memória do executor de tarefas
+MAX_DIAGNOSTICOS_CONCORRENTES = 1
+ORCAMENTO_MEMORIA_DIAGNOSTICOS_MB = 2048
+
+# Uma planilha carregada no pandas ocupa várias vezes o tamanho do arquivo
+FATOR_MEMORIA_FONTES = 8
+
 class ControleQualidade:
     def __init__(self, base_path="C:/desenvolvimento/migration_app"):
         self.base_path = base_path
         self.db_path = os.path.join(base_path, "qualidade.db")
+        self.dicionario_gcpj = DicionarioGcpj()
+        # Caches LRU compartilhados pelas threads do servidor
+        self._cache_comparacoes = OrderedDict()
+        self._cache_listas = OrderedDict()
+        self._trava_caches = threading.Lock()
         self.init_database()
         
         # Mapeamentos do config.py
@@ -64,66 +94,73 @@ class ControleQualidade:
     
     def init_database(self):
         """Inicializa banco de dados SQLite para histórico"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Tabela para histórico de execuções
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS execucoes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                versao TEXT NOT NULL,
-                total_registros INTEGER,
-                total_colunas INTEGER,
-                taxa_completude_media REAL,
-                observacoes TEXT
-            )
-        ''')
-        
-        # Tabela para completude por coluna
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS completude_colunas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                execucao_id INTEGER,
-                coluna TEXT NOT NULL,
-                fonte TEXT NOT NULL,
-                taxa_completude REAL,
-                registros_preenchidos INTEGER,
-                registros_ausentes INTEGER,
-                gcpjs_ausentes TEXT,
-                FOREIGN KEY (execucao_id) REFERENCES execucoes (id)
-            )
-        ''')
-        
-        # Tabela para GCPJs problemáticos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS gcpjs_problematicos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                execucao_id INTEGER,
-                gcpj TEXT NOT NULL,
-                taxa_completude REAL,
-                colunas_faltantes TEXT,
-                total_problemas INTEGER,
-                FOREIGN KEY (execucao_id) REFERENCES execucoes (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-    
-    def executar_diagnostico_completo(self):
-        """Executa diagnóstico completo e salva no banco"""
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
+        
+            # Tabela para histórico de execuções
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS execucoes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    versao TEXT NOT NULL,
+                    total_registros INTEGER,
+                    total_colunas INTEGER,
+                    taxa_completude_media REAL,
+                    observacoes TEXT
+                )
+            ''')
+        
+            # Tabela para completude por coluna
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS completude_colunas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    execucao_id INTEGER,
+                    coluna TEXT NOT NULL,
+                    fonte TEXT NOT NULL,
+                    taxa_completude REAL,
+                    registros_preenchidos INTEGER,
+                    registros_ausentes INTEGER,
+                    gcpjs_ausentes TEXT,
+                    FOREIGN KEY (execucao_id) REFERENCES execucoes (id)
+                )
+            ''')
+        
+            # Tabela para GCPJs problemáticos
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS gcpjs_problematicos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    execucao_id INTEGER,
+                    gcpj TEXT NOT NULL,
+                    taxa_completude REAL,
+                    colunas_faltantes TEXT,
+                    total_problemas INTEGER,
+                    FOREIGN KEY (execucao_id) REFERENCES execucoes (id)
+                )
+            ''')
+        
+            conn.commit()
+
+            # Aplicar migrações de schema pendentes (índices etc.)
+            aplicar_migracoes(conn, 'qualidade')
+    
+    def executar_diagnostico_completo(self, progresso=PROGRESSO_NULO):
+        """Executa diagnóstico completo e salva no banco
+        
+        O cancelamento pelo operador (ExecucaoCancelada) é propagado a quem chamou.
+        """
         try:
             # Tentar importar o módulo de diagnóstico
             from diagnostico_completude_por_gcpj import DiagnosticoCompletudePorGCPJ
             
             diagnostico = DiagnosticoCompletudePorGCPJ(self.base_path)
-            resultados = diagnostico.gerar_diagnostico_completo()
+            # Roda na thread do ExecutorTarefas: sem pool de processos (fork com threads)
+            resultados = diagnostico.gerar_diagnostico_completo(progresso=progresso, processos=1)
             
             if not resultados:
                 return None
             
             # Salvar execução no banco
+            progresso.fase('Salvando resultados')
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             execucao_id = self.salvar_execucao(timestamp, resultados)
             
@@ -138,10 +175,36 @@ class ControleQualidade:
             execucao_id = self.salvar_execucao(timestamp, resultados)
             
             return execucao_id, resultados
+        except ExecucaoCancelada:
+            raise
         except Exception as e:
             print(f"❌ Erro ao executar diagnóstico: {str(e)}")
             return None
     
+    def arquivos_diagnostico(self):
+        """(caminho, tamanho, mtime) dos arquivos lidos pelo diagnóstico"""
+        try:
+            from diagnostico_completude_por_gcpj import DiagnosticoCompletudePorGCPJ
+        except ImportError:
+            return []
+        
+        arquivos = []
+        for caminho in DiagnosticoCompletudePorGCPJ(self.base_path).arquivos_entrada():
+            if os.path.exists(caminho):
+                estado = os.stat(caminho)
+                arquivos.append((caminho, estado.st_size, estado.st_mtime_ns))
+        return arquivos
+    
+    def chave_diagnostico(self):
+        """Chave de deduplicação: diagnósticos sobre os mesmos arquivos são idênticos"""
+        assinatura = '|'.join(f"{c}:{t}:{m}" for c, t, m in self.arquivos_diagnostico())
+        return f"diagnostico:{hashlib.sha1(assinatura.encode('utf-8')).hexdigest()}"
+    
+    def estimar_memoria_diagnostico_mb(self):
+        """Estimativa de memória do diagnóstico a partir do tamanho dos arquivos"""
+        total_bytes = sum(tamanho for _, tamanho, _ in self.arquivos_diagnostico())
+        return total_bytes * FATOR_MEMORIA_FONTES / (1024 * 1024)
+    
     def gerar_dados_simulados(self):
         """Gera dados simulados para demonstração"""
         import random
@@ -213,54 +276,91 @@ class ControleQualidade:
         return resultados
     
     def salvar_execucao(self, timestamp, resultados):
-        """Salva execução no banco de dados"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Salva execução no banco de dados
         
-        # Calcular estatísticas gerais
-        total_registros = len(resultados)
-        taxa_media = sum(r['taxa_completude'] for r in resultados) / len(resultados)
-        total_colunas = len(resultados[0]['detalhes_fonte']) if resultados else 0
+        resultados é o ResultadoDiagnosticoGCPJ do diagnóstico (agregados lidos dos
+        arrays) ou uma lista de dicionários no mesmo formato verboso (dados simulados).
+        """
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
         
-        # Inserir execução
-        cursor.execute('''
-            INSERT INTO execucoes (timestamp, versao, total_registros, total_colunas, taxa_completude_media, observacoes)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (timestamp, "1.0", total_registros, total_colunas, taxa_media, "Execução automática"))
+            # Calcular estatísticas gerais
+            total_registros = len(resultados)
+            if hasattr(resultados, 'taxas_completude'):
+                taxas = resultados.taxas_completude()
+                gcpjs = resultados.gcpjs
+                total_colunas = len(resultados.colunas)
+            else:
+                taxas = np.array([r['taxa_completude'] for r in resultados], dtype=float)
+                gcpjs = [r['GCPJ'] for r in resultados]
+                total_colunas = len(resultados[0]['detalhes_fonte']) if resultados else 0
+            taxa_media = float(taxas.mean())
         
-        execucao_id = cursor.lastrowid
+            # Inserir execução
+            cursor.execute('''
+                INSERT INTO execucoes (timestamp, versao, total_registros, total_colunas, taxa_completude_media, observacoes)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (timestamp, "1.0", total_registros, total_colunas, taxa_media, "Execução automática"))
         
-        # Calcular completude por coluna
-        completude_por_coluna = self.calcular_completude_por_coluna(resultados)
+            execucao_id = cursor.lastrowid
         
-        for coluna, dados in completude_por_coluna.items():
-            gcpjs_ausentes = json.dumps(dados['gcpjs_ausentes'][:100])  # Limitar a 100 para não sobrecarregar
-            
+            # Conjunto de GCPJs avaliados (base para comparar execuções); cada GCPJ é
+            # indexado uma vez e os ausentes de cada coluna são um recorte dos índices
+            indices = self.dicionario_gcpj.indexar(conn, gcpjs)
+            escopo = BitmapGcpjs(indices)
             cursor.execute('''
-                INSERT INTO completude_colunas 
-                (execucao_id, coluna, fonte, taxa_completude, registros_preenchidos, registros_ausentes, gcpjs_ausentes)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (execucao_id, coluna, dados['fonte'], dados['taxa_completude'], 
-                  dados['registros_preenchidos'], dados['registros_ausentes'], gcpjs_ausentes))
+                INSERT INTO bitmap_execucoes (execucao_id, cardinalidade, bitmap)
+                VALUES (?, ?, ?)
+            ''', (execucao_id, len(escopo), escopo.serializar()))
         
-        # Salvar GCPJs mais problemáticos (top 100)
-        gcpjs_problematicos = sorted(resultados, key=lambda x: x['taxa_completude'])[:100]
+            for coluna, dados, disponivel in self.resumir_completude_por_coluna(resultados):
+                # Conjunto completo de ausentes vai para o bitmap; o JSON fica só como prévia
+                ausentes = BitmapGcpjs(indices[~disponivel])
+                cursor.execute('''
+                    INSERT INTO bitmap_ausentes (execucao_id, coluna, cardinalidade, bitmap)
+                    VALUES (?, ?, ?, ?)
+                ''', (execucao_id, coluna, len(ausentes), ausentes.serializar()))
+            
+                gcpjs_ausentes = json.dumps(dados['gcpjs_ausentes'][:LIMITE_PREVIA_AUSENTES])
+            
+                cursor.execute('''
+                    INSERT INTO completude_colunas 
+                    (execucao_id, coluna, fonte, taxa_completude, registros_preenchidos, registros_ausentes, gcpjs_ausentes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (execucao_id, coluna, dados['fonte'], dados['taxa_completude'], 
+                      dados['registros_preenchidos'], dados['registros_ausentes'], gcpjs_ausentes))
         
-        for resultado in gcpjs_problematicos:
-            cursor.execute('''
-                INSERT INTO gcpjs_problematicos 
-                (execucao_id, gcpj, taxa_completude, colunas_faltantes, total_problemas)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (execucao_id, resultado['GCPJ'], resultado['taxa_completude'],
-                  json.dumps(resultado['colunas_faltantes']), len(resultado['colunas_faltantes'])))
+            # Salvar GCPJs mais problemáticos (top 100; só estes viram dicionário)
+            for posicao in np.argsort(taxas, kind='stable')[:100]:
+                resultado = resultados[int(posicao)]
+                cursor.execute('''
+                    INSERT INTO gcpjs_problematicos 
+                    (execucao_id, gcpj, taxa_completude, colunas_faltantes, total_problemas)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (execucao_id, resultado['GCPJ'], resultado['taxa_completude'],
+                      json.dumps(resultado['colunas_faltantes']), len(resultado['colunas_faltantes'])))
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
         return execucao_id
     
+    def resumir_completude_por_coluna(self, resultados):
+        """(coluna, resumo, disponivel) por coluna; ver ResultadoDiagnosticoGCPJ.resumo_por_coluna"""
+        if hasattr(resultados, 'resumo_por_coluna'):
+            yield from resultados.resumo_por_coluna()
+            return
+        
+        # Lista de dicionários (dados simulados): pequena, vale a agregação verbosa
+        for coluna, dados in self.calcular_completude_por_coluna(resultados).items():
+            ausentes = set(dados['gcpjs_ausentes'])
+            disponivel = np.array([r['GCPJ'] not in ausentes for r in resultados], dtype=bool)
+            yield coluna, dados, disponivel
+    
     def calcular_completude_por_coluna(self, resultados):
         """Calcula completude agregada por coluna"""
+        if hasattr(resultados, 'completude_por_coluna'):
+            return resultados.completude_por_coluna()
+        
         completude = {}
         
         # Obter todas as colunas do template
@@ -301,55 +401,246 @@ class ControleQualidade:
     
     def obter_historico_execucoes(self):
         """Obtém histórico de execuções"""
-        conn = sqlite3.connect(self.db_path)
+        with conexao(self.db_path) as conn:
         
-        df = pd.read_sql_query('''
-            SELECT id, timestamp, versao, total_registros, total_colunas, 
-                   taxa_completude_media, observacoes
-            FROM execucoes 
-            ORDER BY timestamp DESC
-        ''', conn)
+            df = pd.read_sql_query('''
+                SELECT id, timestamp, versao, total_registros, total_colunas, 
+                       taxa_completude_media, observacoes
+                FROM execucoes 
+                ORDER BY timestamp DESC
+            ''', conn)
         
-        conn.close()
         return df
     
-    def obter_completude_atual(self, execucao_id=None):
-        """Obtém completude da última ou específica execução"""
-        conn = sqlite3.connect(self.db_path)
+    def obter_completude_atual(self, execucao_id=None, incluir_gcpjs=False):
+        """Obtém completude da última ou específica execução
+        
+        A lista JSON de GCPJs ausentes só é lida com incluir_gcpjs=True; dashboard e
+        comparação usam apenas os totais já consolidados por coluna.
+        """
+        with conexao(self.db_path) as conn:
+        
+            if execucao_id:
+                where_clause = f"WHERE execucao_id = {execucao_id}"
+            else:
+                where_clause = f"WHERE execucao_id = (SELECT MAX(id) FROM execucoes)"
+        
+            coluna_gcpjs = ", gcpjs_ausentes" if incluir_gcpjs else ""
         
+            df = pd.read_sql_query(f'''
+                SELECT coluna, fonte, taxa_completude, registros_preenchidos, 
+                       registros_ausentes{coluna_gcpjs}
+                FROM completude_colunas 
+                {where_clause}
+                ORDER BY taxa_completude DESC
+            ''', conn)
+        
+        return df
+    
+    def _resolver_execucao(self, conn, execucao_id=None):
         if execucao_id:
-            where_clause = f"WHERE execucao_id = {execucao_id}"
+            return execucao_id
+        return conn.execute("SELECT MAX(id) FROM execucoes").fetchone()[0]
+    
+    def obter_bitmap_ausentes(self, coluna, execucao_id=None):
+        """Obtém o bitmap de GCPJs ausentes de uma coluna (None se a execução não tiver bitmaps)"""
+        with conexao(self.db_path) as conn:
+            execucao_id = self._resolver_execucao(conn, execucao_id)
+            resultado = conn.execute('''
+                SELECT bitmap FROM bitmap_ausentes WHERE execucao_id = ? AND coluna = ?
+            ''', (execucao_id, coluna)).fetchone()
+        
+        return BitmapGcpjs.desserializar(resultado[0]) if resultado else None
+    
+    def obter_bitmap_escopo(self, execucao_id=None):
+        """Obtém o bitmap dos GCPJs avaliados em uma execução"""
+        with conexao(self.db_path) as conn:
+            execucao_id = self._resolver_execucao(conn, execucao_id)
+            resultado = conn.execute(
+                "SELECT bitmap FROM bitmap_execucoes WHERE execucao_id = ?", (execucao_id,)
+            ).fetchone()
+        
+        return BitmapGcpjs.desserializar(resultado[0]) if resultado else None
+    
+    def traduzir_bitmap(self, bitmap):
+        """Converte um bitmap de índices na lista de GCPJs"""
+        with conexao(self.db_path) as conn:
+            return self.dicionario_gcpj.traduzir(conn, bitmap)
+    
+    def obter_gcpjs_ausentes_em_colunas(self, colunas, execucao_id=None):
+        """GCPJs sem dados em pelo menos uma das colunas informadas"""
+        bitmaps = [self.obter_bitmap_ausentes(coluna, execucao_id) for coluna in colunas]
+        return self.traduzir_bitmap(BitmapGcpjs.uniao(b for b in bitmaps if b is not None))
+    
+    def comparar_gcpjs_ausentes(self, coluna, execucao1, execucao2):
+        """Diferença dos GCPJs ausentes de uma coluna entre duas execuções
+        
+        'resolvidos' estavam ausentes na primeira e não estão na segunda; 'novos'
+        passaram a faltar na segunda; 'persistentes' faltam nas duas.
+        """
+        ausentes1 = self.obter_bitmap_ausentes(coluna, execucao1) or BitmapGcpjs()
+        ausentes2 = self.obter_bitmap_ausentes(coluna, execucao2) or BitmapGcpjs()
+        
+        return {
+            'resolvidos': self.traduzir_bitmap(ausentes1 - ausentes2),
+            'novos': self.traduzir_bitmap(ausentes2 - ausentes1),
+            'persistentes': self.traduzir_bitmap(ausentes1 & ausentes2)
+        }
+    
+    def carregar_bitmaps_execucao(self, execucao_id, tamanho):
+        """Carrega escopo e ausentes de todas as colunas de uma execução como vetores densos"""
+        with conexao(self.db_path) as conn:
+            escopo = conn.execute(
+                "SELECT bitmap FROM bitmap_execucoes WHERE execucao_id = ?", (execucao_id,)
+            ).fetchone()
+            ausentes = conn.execute(
+                "SELECT coluna, bitmap FROM bitmap_ausentes WHERE execucao_id = ?", (execucao_id,)
+            ).fetchall()
+        
+        if escopo is None:
+            return None, {}
+        return (BitmapGcpjs.desserializar_denso(escopo[0], tamanho),
+                {coluna: BitmapGcpjs.desserializar_denso(bitmap, tamanho) for coluna, bitmap in ausentes})
+    
+    def _buscar_cache(self, cache, chave):
+        with self._trava_caches:
+            valor = cache.get(chave)
+            if valor is not None:
+                cache.move_to_end(chave)
+            return valor
+    
+    def _guardar_cache(self, cache, limite, chave, valor):
+        with self._trava_caches:
+            cache[chave] = valor
+            cache.move_to_end(chave)
+            while len(cache) > limite:
+                cache.popitem(last=False)
+    
+    def calcular_diferenca_execucoes(self, execucao1, execucao2):
+        """Compara duas execuções coluna a coluna
+        
+        Para cada coluna presente nas duas execuções retorna as taxas, a diferença e
+        os bitmaps dos GCPJs que ganharam (ausentes antes, preenchidos depois) ou
+        perderam a coluna. Só entram GCPJs avaliados nas duas execuções. Execuções
+        não mudam depois de salvas, então o resultado fica em cache.
+        """
+        chave = (execucao1, execucao2)
+        resultado = self._buscar_cache(self._cache_comparacoes, chave)
+        if resultado is not None:
+            return resultado
+        
+        completude1 = self.obter_completude_atual(execucao1)
+        completude2 = self.obter_completude_atual(execucao2)
+        comparacao = pd.merge(
+            completude1[['coluna', 'taxa_completude']],
+            completude2[['coluna', 'taxa_completude']],
+            on='coluna',
+            suffixes=('_exec1', '_exec2')
+        )
+        comparacao['diferenca'] = comparacao['taxa_completude_exec2'] - comparacao['taxa_completude_exec1']
+        comparacao = comparacao.sort_values('diferenca', ascending=False)
+        
+        # Todos os índices cabem no tamanho atual do dicionário
+        with conexao(self.db_path) as conn:
+            maior_indice = conn.execute("SELECT MAX(indice) FROM dicionario_gcpj").fetchone()[0]
+        tamanho = (maior_indice or 0) + 1
+        
+        escopo1, ausentes1 = self.carregar_bitmaps_execucao(execucao1, tamanho)
+        escopo2, ausentes2 = self.carregar_bitmaps_execucao(execucao2, tamanho)
+        comuns = escopo1 & escopo2 if escopo1 is not None and escopo2 is not None else None
+        
+        colunas = []
+        for _, row in comparacao.iterrows():
+            coluna = row['coluna']
+            ganhos = perdas = None
+            
+            if comuns is not None and coluna in ausentes1 and coluna in ausentes2:
+                # GCPJs que mudaram de estado na coluna: XOR dos ausentes, restrito aos comuns
+                mudancas = (ausentes1[coluna] ^ ausentes2[coluna]) & comuns
+                ganhos = BitmapGcpjs.de_denso(mudancas & ausentes1[coluna])
+                perdas = BitmapGcpjs.de_denso(mudancas & ausentes2[coluna])
+            
+            colunas.append({
+                'coluna': coluna,
+                'taxa_exec1': float(row['taxa_completude_exec1']),
+                'taxa_exec2': float(row['taxa_completude_exec2']),
+                'diferenca': float(row['diferenca']),
+                'ganhos': ganhos,
+                'perdas': perdas
+            })
+        
+        resultado = {
+            'gcpjs_comparaveis': int(comuns.sum()) if comuns is not None else None,
+            'colunas': colunas
+        }
+        
+        self._guardar_cache(self._cache_comparacoes, LIMITE_CACHE_COMPARACOES, chave, resultado)
+        return resultado
+    
+    def paginar_gcpjs(self, bitmap, pagina=1, por_pagina=100):
+        """Traduz apenas a página pedida de um bitmap de GCPJs"""
+        por_pagina = max(por_pagina, 1)
+        inicio = (max(pagina, 1) - 1) * por_pagina
+        return self.traduzir_bitmap(bitmap.fatia(inicio, inicio + por_pagina))
+    
+    def obter_colunas_fonte(self, fonte, execucao_id=None):
+        """Colunas de uma execução cujo dado vem da fonte informada"""
+        with conexao(self.db_path) as conn:
+            execucao_id = self._resolver_execucao(conn, execucao_id)
+            linhas = conn.execute(
+                "SELECT coluna FROM completude_colunas WHERE execucao_id = ? AND fonte = ?",
+                (execucao_id, fonte)
+            ).fetchall()
+        return [linha[0] for linha in linhas]
+    
+    def obter_lista_ausentes_ordenada(self, colunas, execucao_id=None):
+        """GCPJs ausentes em pelo menos uma das colunas, como array ordenado
+        
+        Execuções não mudam depois de salvas, então a lista ordenada fica em cache e
+        serve de índice para a paginação por cursor e a busca por prefixo.
+        """
+        with conexao(self.db_path) as conn:
+            execucao_id = self._resolver_execucao(conn, execucao_id)
+        
+        chave = (execucao_id, tuple(sorted(set(colunas))))
+        lista = self._buscar_cache(self._cache_listas, chave)
+        if lista is not None:
+            return lista
+        
+        bitmaps = [self.obter_bitmap_ausentes(coluna, execucao_id) for coluna in chave[1]]
+        if any(bitmap is not None for bitmap in bitmaps):
+            gcpjs = self.traduzir_bitmap(BitmapGcpjs.uniao(b for b in bitmaps if b is not None))
         else:
-            where_clause = f"WHERE execucao_id = (SELECT MAX(id) FROM execucoes)"
+            gcpjs = set()
+            for coluna in chave[1]:
+                gcpjs.update(self.obter_gcpjs_sem_dados(coluna, execucao_id))
         
-        df = pd.read_sql_query(f'''
-            SELECT coluna, fonte, taxa_completude, registros_preenchidos, 
-                   registros_ausentes, gcpjs_ausentes
-            FROM completude_colunas 
-            {where_clause}
-            ORDER BY taxa_completude DESC
-        ''', conn)
+        lista = np.sort(np.array(list(gcpjs), dtype=str))
         
-        conn.close()
-        return df
+        self._guardar_cache(self._cache_listas, LIMITE_CACHE_LISTAS, chave, lista)
+        return lista
     
     def obter_gcpjs_sem_dados(self, coluna, execucao_id=None):
         """Obtém lista de GCPJs sem dados para uma coluna específica"""
-        conn = sqlite3.connect(self.db_path)
+        bitmap = self.obter_bitmap_ausentes(coluna, execucao_id)
+        if bitmap is not None:
+            return self.traduzir_bitmap(bitmap)
         
-        if execucao_id:
-            where_clause = f"WHERE execucao_id = {execucao_id} AND coluna = ?"
-        else:
-            where_clause = f"WHERE execucao_id = (SELECT MAX(id) FROM execucoes) AND coluna = ?"
+        # Execuções anteriores aos bitmaps só têm a prévia em JSON
+        with conexao(self.db_path) as conn:
+        
+            if execucao_id:
+                where_clause = f"WHERE execucao_id = {execucao_id} AND coluna = ?"
+            else:
+                where_clause = f"WHERE execucao_id = (SELECT MAX(id) FROM execucoes) AND coluna = ?"
         
-        cursor = conn.cursor()
-        cursor.execute(f'''
-            SELECT gcpjs_ausentes FROM completude_colunas 
-            {where_clause}
-        ''', (coluna,))
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT gcpjs_ausentes FROM completude_colunas 
+                {where_clause}
+            ''', (coluna,))
         
-        resultado = cursor.fetchone()
-        conn.close()
+            resultado = cursor.fetchone()
         
         if resultado and resultado[0]:
             return json.loads(resultado[0])
@@ -358,6 +649,16 @@ class ControleQualidade:
 # Instância global do controle
 controle = ControleQualidade()
 
+# Progresso das execuções longas (diagnóstico), publicado via SSE
+painel_progresso = PainelProgresso()
+
+# Diagnósticos rodam fora do worker do Flask, com deduplicação e limite de concorrência
+executor_diagnosticos = ExecutorTarefas(
+    controle.db_path, painel_progresso,
+    max_concorrentes=MAX_DIAGNOSTICOS_CONCORRENTES,
+    orcamento_memoria_mb=ORCAMENTO_MEMORIA_DIAGNOSTICOS_MB
+)
+
 @app.route('/')
 def dashboard():
     """Dashboard principal"""
@@ -396,7 +697,17 @@ def dashboard():
         <button class="btn" onclick="executarDiagnostico()">🚀 Executar Novo Diagnóstico</button>
         <button class="btn" onclick="verHistorico()">📊 Ver Histórico</button>
     </div>
-    
+
+    <div class="header" id="painel-progresso" style="display: none;">
+        <h3>⏳ Diagnóstico em Andamento</h3>
+        <p><strong id="progresso-fase">Iniciando</strong> <span id="progresso-contagem"></span></p>
+        <div class="progress-bar">
+            <div class="progress-fill high" id="progresso-barra" style="width: 0%"></div>
+        </div>
+        <p id="progresso-taxa"></p>
+        <button class="btn" id="btn-cancelar" onclick="cancelarExecucao()">⛔ Cancelar</button>
+    </div>
+
     <div class="cards">
         <div class="card">
             <h3>📊 Última Execução</h3>
@@ -445,42 +756,146 @@ def dashboard():
     <script>
         let colunaAtual = '';
         
+        let execucaoAtual = null;
+        let fluxoProgresso = null;
+
+        function formatarSegundos(segundos) {
+            if (segundos === null || segundos === undefined) return '-';
+            const min = Math.floor(segundos / 60);
+            const seg = Math.round(segundos % 60);
+            return min > 0 ? `${min}min ${seg}s` : `${seg}s`;
+        }
+
+        function mostrarProgresso(dados) {
+            execucaoAtual = dados.id;
+            document.getElementById('progresso-fase').textContent = dados.fase;
+            document.getElementById('progresso-contagem').textContent = dados.total
+                ? `${dados.feitos.toLocaleString()} de ${dados.total.toLocaleString()} ${dados.unidade} (${dados.percentual}%)`
+                : '';
+            document.getElementById('progresso-barra').style.width = (dados.percentual || 0) + '%';
+            document.getElementById('progresso-taxa').textContent =
+                `${dados.por_segundo.toLocaleString()} ${dados.unidade}/s · ETA ${formatarSegundos(dados.eta_segundos)} · decorrido ${formatarSegundos(dados.decorrido_segundos)}`
+                + (dados.cancelamento_solicitado ? ' · cancelando...' : '');
+        }
+
+        function acompanharTarefa(tarefaId) {
+            execucaoAtual = tarefaId;
+            document.querySelector('button').textContent = '⏳ Executando...';
+            document.getElementById('painel-progresso').style.display = 'block';
+
+            fluxoProgresso = new EventSource(`/api/progresso/${tarefaId}/eventos`);
+            fluxoProgresso.addEventListener('progresso', e => mostrarProgresso(JSON.parse(e.data)));
+            fluxoProgresso.addEventListener('fim', e => {
+                fluxoProgresso.close();
+                // O resultado fica persistido na tarefa
+                fetch(`/api/tarefas/${tarefaId}`)
+                    .then(response => response.json())
+                    .then(data => {
+                        const tarefa = data.tarefa || {};
+                        if (tarefa.estado === 'concluido') {
+                            alert(tarefa.resultado.message);
+                            location.reload();
+                        } else {
+                            alert(tarefa.estado === 'cancelado' ? 'Diagnóstico cancelado.' : 'Erro: ' + (tarefa.erro || data.error));
+                            encerrarProgresso();
+                        }
+                    });
+            });
+        }
+
+        function encerrarProgresso() {
+            if (fluxoProgresso) fluxoProgresso.close();
+            document.getElementById('painel-progresso').style.display = 'none';
+            document.getElementById('btn-cancelar').disabled = false;
+            document.querySelector('button').textContent = '🚀 Executar Novo Diagnóstico';
+            execucaoAtual = null;
+        }
+
+        function cancelarExecucao() {
+            if (execucaoAtual && confirm('Cancelar a execução em andamento?')) {
+                fetch(`/api/tarefas/${execucaoAtual}/cancelar`, { method: 'POST' });
+                document.getElementById('btn-cancelar').disabled = true;
+            }
+        }
+
         function executarDiagnostico() {
             if (confirm('Executar novo diagnóstico? Isso pode levar alguns minutos.')) {
-                document.querySelector('button').textContent = '⏳ Executando...';
                 fetch('/api/executar_diagnostico', { method: 'POST' })
                     .then(response => response.json())
                     .then(data => {
                         if (data.success) {
-                            alert(data.message);
-                            location.reload();
+                            acompanharTarefa(data.tarefa_id);
                         } else {
                             alert('Erro: ' + data.error);
                         }
                     })
-                    .catch(error => {
-                        alert('Erro de conexão: ' + error);
-                        document.querySelector('button').textContent = '🚀 Executar Novo Diagnóstico';
-                    });
+                    .catch(error => alert('Erro de conexão: ' + error));
             }
         }
+
+        // Ao abrir a página, retoma o acompanhamento de um diagnóstico já em andamento
+        fetch('/api/tarefas?tipo=diagnostico')
+            .then(response => response.json())
+            .then(data => {
+                const ativa = (data.tarefas || []).find(t => t.estado === 'na_fila' || t.estado === 'executando');
+                if (ativa) acompanharTarefa(ativa.id);
+            });
         
         function verGCPJsAusentes(coluna) {
             colunaAtual = coluna;
-            fetch(`/api/gcpjs_ausentes/${coluna}`)
+            document.getElementById('modal-title').textContent = `GCPJs sem dados para: ${coluna}`;
+            document.getElementById('modal-content').innerHTML = `
+                <p><strong>Total ausentes:</strong> <span id="total-ausentes">-</span>
+                   &nbsp; <strong>Taxa de falha:</strong> <span id="taxa-falha">-</span></p>
+                <p>
+                    <input type="text" id="busca-ausentes" placeholder="Buscar por prefixo..." oninput="recarregarAusentes()"
+                           style="padding: 8px; background: #1a1a1a; color: white; border: 1px solid #4a5568;">
+                    <select id="ordem-ausentes" onchange="recarregarAusentes()" style="padding: 8px; background: #1a1a1a; color: white;">
+                        <option value="asc">GCPJ crescente</option>
+                        <option value="desc">GCPJ decrescente</option>
+                    </select>
+                    <span id="total-filtrado"></span>
+                </p>
+                <textarea id="lista-ausentes" style="width: 100%; height: 300px; background: #1a1a1a; color: white; border: 1px solid #4a5568; padding: 10px;" readonly></textarea>
+                <button class="btn" id="mais-ausentes" onclick="carregarAusentes()" style="display: none;">Carregar mais</button>
+            `;
+            document.getElementById('modal').style.display = 'block';
+            recarregarAusentes();
+        }
+
+        let cursorAusentes = null;
+        let requisicaoAusentes = 0;
+
+        function recarregarAusentes() {
+            cursorAusentes = null;
+            document.getElementById('lista-ausentes').value = '';
+            carregarAusentes();
+        }
+
+        function carregarAusentes() {
+            const params = new URLSearchParams({
+                busca: document.getElementById('busca-ausentes').value,
+                ordem: document.getElementById('ordem-ausentes').value
+            });
+            if (cursorAusentes) params.set('apos', cursorAusentes);
+
+            // Respostas de buscas já substituídas são descartadas
+            const requisicao = ++requisicaoAusentes;
+            fetch(`/api/gcpjs_ausentes/${encodeURIComponent(colunaAtual)}?${params}`)
                 .then(response => response.json())
                 .then(data => {
+                    if (requisicao !== requisicaoAusentes) return;
                     const totalRegistros = ''' + str(len(completude) if len(completude) > 0 else 414) + ''';
                     const taxaFalha = totalRegistros > 0 ? ((data.total_ausentes / totalRegistros) * 100).toFixed(2) : 0;
-                    
-                    document.getElementById('modal-title').textContent = `GCPJs sem dados para: ${coluna}`;
-                    document.getElementById('modal-content').innerHTML = `
-                        <p><strong>Total ausentes:</strong> ${data.total_ausentes.toLocaleString()}</p>
-                        <p><strong>Taxa de falha:</strong> ${taxaFalha}%</p>
-                        <textarea style="width: 100%; height: 300px; background: #1a1a1a; color: white; border: 1px solid #4a5568; padding: 10px;" readonly>${data.gcpjs.join('\\n')}</textarea>
-                        ${data.limitado ? '<p><em>⚠️ Mostrando primeiros 1000 registros</em></p>' : ''}
-                    `;
-                    document.getElementById('modal').style.display = 'block';
+
+                    document.getElementById('total-ausentes').textContent = data.total_ausentes.toLocaleString();
+                    document.getElementById('taxa-falha').textContent = taxaFalha + '%';
+                    document.getElementById('total-filtrado').textContent = `${data.total_filtrado.toLocaleString()} encontrados`;
+
+                    const lista = document.getElementById('lista-ausentes');
+                    lista.value += (lista.value && data.gcpjs.length ? '\\n' : '') + data.gcpjs.join('\\n');
+                    cursorAusentes = data.proximo;
+                    document.getElementById('mais-ausentes').style.display = data.proximo ? 'inline-block' : 'none';
                 })
                 .catch(error => {
                     alert('Erro ao carregar GCPJs: ' + error);
@@ -508,80 +923,137 @@ def dashboard():
     
     return template_html
 
+def tarefa_diagnostico(progresso):
+    """Tarefa do executor: roda o diagnóstico e devolve o resumo (persistido em JSON)"""
+    execucao = controle.executar_diagnostico_completo(progresso)
+    if execucao is None:
+        raise ValueError('Falha ao executar o diagnóstico (ver log)')
+    
+    execucao_id, resultados = execucao
+    return {
+        'execucao_id': execucao_id,
+        'total_registros': len(resultados),
+        'message': f'Diagnóstico executado com sucesso. {len(resultados)} registros processados.'
+    }
+
 @app.route('/api/executar_diagnostico', methods=['POST'])
 def api_executar_diagnostico():
-    """API para executar novo diagnóstico"""
+    """API para enfileirar novo diagnóstico (responde na hora com o id da tarefa)"""
     try:
-        execucao_id, resultados = controle.executar_diagnostico_completo()
+        tarefa_id, reaproveitada = executor_diagnosticos.submeter(
+            'diagnostico', tarefa_diagnostico,
+            chave=controle.chave_diagnostico(),
+            memoria_mb=controle.estimar_memoria_diagnostico_mb()
+        )
         
         return jsonify({
             'success': True,
-            'execucao_id': execucao_id,
-            'total_registros': len(resultados),
-            'message': f'Diagnóstico executado com sucesso. {len(resultados)} registros processados.'
-        })
+            'tarefa_id': tarefa_id,
+            'reaproveitada': reaproveitada,
+            'tarefa': executor_diagnosticos.obter(tarefa_id)
+        }), 202
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/api/tarefas')
+def api_listar_tarefas():
+    """API com as tarefas recentes do executor (mais recentes primeiro)"""
+    return jsonify({'tarefas': executor_diagnosticos.listar(tipo=request.args.get('tipo'))})
+
+@app.route('/api/tarefas/<tarefa_id>')
+def api_obter_tarefa(tarefa_id):
+    """API com estado, resultado e progresso de uma tarefa (inclusive de antes de um reinício)"""
+    tarefa = executor_diagnosticos.obter(tarefa_id)
+    if tarefa is None:
+        return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
+    return jsonify({'success': True, 'tarefa': tarefa})
+
+@app.route('/api/progresso')
+def api_listar_progresso():
+    """API com o estado das execuções recentes (mais recentes primeiro)"""
+    return jsonify({'execucoes': executor_diagnosticos.listar_progresso()})
+
+@app.route('/api/progresso/eventos')
+@app.route('/api/progresso/<execucao_id>/eventos')
+def api_eventos_progresso(execucao_id=None):
+    """Fluxo SSE com fase, feitos/total, taxa e ETA da execução"""
+    return resposta_eventos(executor_diagnosticos, execucao_id=execucao_id, tipo=request.args.get('tipo'))
+
+@app.route('/api/tarefas/<tarefa_id>/cancelar', methods=['POST'])
+@app.route('/api/progresso/<tarefa_id>/cancelar', methods=['POST'])
+def api_cancelar_execucao(tarefa_id):
+    """API para cancelar uma tarefa na fila ou em execução"""
+    if not executor_diagnosticos.cancelar(tarefa_id):
+        return jsonify({'success': False, 'error': 'Tarefa não encontrada ou já encerrada'}), 404
+    return jsonify({'success': True})
+
 @app.route('/api/completude/<int:execucao_id>')
 def api_completude_execucao(execucao_id):
     """API para obter completude de execução específica"""
-    completude = controle.obter_completude_atual(execucao_id)
+    completude = controle.obter_completude_atual(execucao_id, incluir_gcpjs=True)
     return jsonify(completude.to_dict('records'))
 
+@app.route('/api/gcpjs_ausentes')
 @app.route('/api/gcpjs_ausentes/<coluna>')
 @app.route('/api/gcpjs_ausentes/<coluna>/<int:execucao_id>')
-def api_gcpjs_ausentes(coluna, execucao_id=None):
-    """API para obter GCPJs ausentes para uma coluna"""
-    gcpjs = controle.obter_gcpjs_sem_dados(coluna, execucao_id)
+def api_gcpjs_ausentes(coluna=None, execucao_id=None):
+    """API paginada de GCPJs ausentes
+    
+    Parâmetros: coluna (na rota ou repetido na query), fonte (todas as colunas da
+    fonte), execucao_id, busca (prefixo), ordem ('asc' ou 'desc'), apos (cursor
+    devolvido em 'proximo') e limite.
+    """
+    if execucao_id is None:
+        execucao_id = request.args.get('execucao_id', type=int)
+    
+    colunas = [coluna] if coluna else request.args.getlist('coluna')
+    fonte = request.args.get('fonte')
+    if fonte:
+        colunas += controle.obter_colunas_fonte(fonte, execucao_id)
+    if not colunas:
+        return jsonify({'error': 'Informe a coluna ou a fonte'}), 400
+    
+    limite = min(max(request.args.get('limite', TAMANHO_PAGINA_GCPJS, type=int), 1), LIMITE_PAGINA_GCPJS)
+    lista = controle.obter_lista_ausentes_ordenada(colunas, execucao_id)
+    pagina = paginar_lista_ordenada(
+        lista,
+        busca=request.args.get('busca', '').strip(),
+        apos=request.args.get('apos'),
+        limite=limite,
+        decrescente=request.args.get('ordem') == 'desc'
+    )
     
     return jsonify({
         'coluna': coluna,
-        'total_ausentes': len(gcpjs),
-        'gcpjs': gcpjs[:1000],  # Limitar retorno
-        'limitado': len(gcpjs) > 1000
+        'colunas': sorted(set(colunas)),
+        'total_ausentes': len(lista),
+        'total_filtrado': pagina['total'],
+        'gcpjs': pagina['gcpjs'],
+        'proximo': pagina['proximo'],
+        'limitado': pagina['proximo'] is not None
     })
 
 @app.route('/exportar_gcpjs/<coluna>')
 @app.route('/exportar_gcpjs/<coluna>/<int:execucao_id>')
 def exportar_gcpjs(coluna, execucao_id=None):
-    """Exporta lista de GCPJs ausentes para Excel"""
-    gcpjs = controle.obter_gcpjs_sem_dados(coluna, execucao_id)
-    
-    # Criar DataFrame
-    df = pd.DataFrame({'GCPJ': gcpjs})
-    
-    # Salvar em Excel
-    output = BytesIO()
-    df.to_excel(output, index=False, sheet_name=f'GCPJs_Ausentes_{coluna}')
-    output.seek(0)
-    
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=f'gcpjs_ausentes_{coluna}_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    """Exporta lista de GCPJs ausentes em streaming (?formato=xlsx ou csv)"""
+    gcpjs = controle.obter_lista_ausentes_ordenada([coluna], execucao_id)
+    
+    return resposta_exportacao(
+        ((gcpj,) for gcpj in gcpjs.tolist()),
+        ['GCPJ'],
+        f'gcpjs_ausentes_{coluna}',
+        formato=request.args.get('formato', 'xlsx'),
+        nome_aba=f'GCPJs_Ausentes_{coluna}'
     )
 
 @app.route('/comparar/<int:execucao1>/<int:execucao2>')
 def comparar_execucoes(execucao1, execucao2):
     """Compara duas execuções"""
-    completude1 = controle.obter_completude_atual(execucao1)
-    completude2 = controle.obter_completude_atual(execucao2)
-    
-    # Fazer merge para comparação
-    comparacao = pd.merge(
-        completude1[['coluna', 'taxa_completude']],
-        completude2[['coluna', 'taxa_completude']],
-        on='coluna',
-        suffixes=('_exec1', '_exec2')
-    )
-    
-    comparacao['diferenca'] = comparacao['taxa_completude_exec2'] - comparacao['taxa_completude_exec1']
-    comparacao = comparacao.sort_values('diferenca', ascending=False)
+    diferenca = controle.calcular_diferenca_execucoes(execucao1, execucao2)
     
     # Template inline para comparação
     template_html = f'''
@@ -613,19 +1085,23 @@ def comparar_execucoes(execucao1, execucao2):
                 <th>Execução {execucao1} (%)</th>
                 <th>Execução {execucao2} (%)</th>
                 <th>Diferença</th>
+                <th>GCPJs que ganharam</th>
+                <th>GCPJs que perderam</th>
             </tr>
         </thead>
         <tbody>
             {''.join([f'''
                 <tr>
                     <td>{row['coluna']}</td>
-                    <td>{row['taxa_completude_exec1']:.2f}%</td>
-                    <td>{row['taxa_completude_exec2']:.2f}%</td>
+                    <td>{row['taxa_exec1']:.2f}%</td>
+                    <td>{row['taxa_exec2']:.2f}%</td>
                     <td class="{'positive' if row['diferenca'] > 0 else 'negative' if row['diferenca'] < 0 else 'neutral'}">
                         {'+' if row['diferenca'] > 0 else ''}{row['diferenca']:.2f}%
                     </td>
+                    <td class="positive">{f"<a style='color: inherit' href='/api/comparar/{execucao1}/{execucao2}?coluna={quote(row['coluna'], safe='')}&tipo=ganhos'>{len(row['ganhos'])}</a>" if row['ganhos'] is not None else '-'}</td>
+                    <td class="negative">{f"<a style='color: inherit' href='/api/comparar/{execucao1}/{execucao2}?coluna={quote(row['coluna'], safe='')}&tipo=perdas'>{len(row['perdas'])}</a>" if row['perdas'] is not None else '-'}</td>
                 </tr>
-            ''' for _, row in comparacao.iterrows()])}
+            ''' for row in diferenca['colunas']])}
         </tbody>
     </table>
 </body>
@@ -634,6 +1110,46 @@ def comparar_execucoes(execucao1, execucao2):
     
     return template_html
 
+@app.route('/api/comparar/<int:execucao1>/<int:execucao2>')
+def api_comparar_execucoes(execucao1, execucao2):
+    """API de comparação: deltas por coluna ou, com ?coluna=&tipo=, página de GCPJs que mudaram"""
+    diferenca = controle.calcular_diferenca_execucoes(execucao1, execucao2)
+    coluna = request.args.get('coluna')
+    
+    if not coluna:
+        return jsonify({
+            'execucao1': execucao1,
+            'execucao2': execucao2,
+            'gcpjs_comparaveis': diferenca['gcpjs_comparaveis'],
+            'colunas': [{
+                'coluna': row['coluna'],
+                'taxa_exec1': row['taxa_exec1'],
+                'taxa_exec2': row['taxa_exec2'],
+                'diferenca': round(row['diferenca'], 2),
+                'total_ganhos': len(row['ganhos']) if row['ganhos'] is not None else None,
+                'total_perdas': len(row['perdas']) if row['perdas'] is not None else None
+            } for row in diferenca['colunas']]
+        })
+    
+    tipo = request.args.get('tipo', 'ganhos')
+    pagina = request.args.get('pagina', 1, type=int)
+    por_pagina = min(max(request.args.get('por_pagina', 100, type=int), 1), 1000)
+    
+    linha = next((row for row in diferenca['colunas'] if row['coluna'] == coluna), None)
+    if linha is None or tipo not in ('ganhos', 'perdas'):
+        return jsonify({'error': 'Coluna ou tipo inválido'}), 404
+    if linha[tipo] is None:
+        return jsonify({'error': 'Execuções sem bitmaps de GCPJs para comparação'}), 404
+    
+    return jsonify({
+        'coluna': coluna,
+        'tipo': tipo,
+        'pagina': pagina,
+        'por_pagina': por_pagina,
+        'total': len(linha[tipo]),
+        'gcpjs': controle.paginar_gcpjs(linha[tipo], pagina, por_pagina)
+    })
+
 if __name__ == '__main__':
     # Garantir que a pasta existe
     os.makedirs(os.path.dirname(controle.db_path), exist_ok=True)
@@ -64,21 +64,48 @@ Acesse: http://localhost:5003
 
 from flask import Flask, request, jsonify, send_file, render_template_string
 import pandas as pd
+import numpy as np
 import os
 import json
 import tempfile
 from datetime import datetime
-import sqlite3
-from io import BytesIO
+from conexao_sqlite import conexao, obter_conexao
+from migracoes_schema import aplicar_migracoes
+from importacao_escopo import carregar_gcpjs_escopo, importar_arquivo_escopo, canonizar_gcpjs
+from exportacao_streaming import resposta_exportacao, espiar_linhas
+from cache_renderizacao import CachePaginas, registrar_alteracao, ler_versoes_dados
+from progresso_execucao import PainelProgresso, PROGRESSO_NULO, resposta_eventos
+from executor_tarefas import ExecutorTarefas
+from cache_fontes_memoria import CacheFontesMemoria, LIMITE_MEMORIA_FONTES_MB, chave_fonte
+from pre_carregamento_fontes import pre_carregar
+from amostragem_fontes import amostrar_coluna, amostrar_gcpjs, ler_cabecalho, contar_registros
+from diagnostico_empacotado import (
+    DiagnosticoEmpacotado, dtype_matriz_fontes, FONTES_FIXAS, FONTE_CONSTANTE,
+    TIPO_CONSTANTE, TIPO_MAPEADA, TIPO_SEM_MAPEAMENTO
+)
 import traceback
 import logging
 
 app = Flask(__name__)
 
+# Tamanho padrão e máximo das páginas da listagem do escopo
+TAMANHO_PAGINA_ESCOPO = 50
+LIMITE_PAGINA_ESCOPO = 1000
+
+# Diagnósticos simultâneos e orçamento de memória do executor de tarefas
+MAX_DIAGNOSTICOS_CONCORRENTES = 1
+ORCAMENTO_MEMORIA_DIAGNOSTICOS_MB = 2048
+
+# Uma planilha carregada no pandas ocupa várias vezes o tamanho do arquivo
+FATOR_MEMORIA_FONTES = 8
+
 class SistemaCompleto:
-    def __init__(self, base_path="C:/desenvolvimento/migration_app"):
+    def __init__(self, base_path="C:/desenvolvimento/migration_app", limite_memoria_fontes_mb=LIMITE_MEMORIA_FONTES_MB):
         self.base_path = base_path
         self.db_path = os.path.join(base_path, "sistema_completo.db")
+        self._diagnostico_em_cache = None  # (execucao_id, DiagnosticoEmpacotado)
+        # Fontes por id entre diagnósticos (pré-carregadas antes do fork no gunicorn)
+        self.fontes_carregadas = CacheFontesMemoria(limite_memoria_fontes_mb)
         self.setup_logging()
         self.init_database()
         
@@ -94,129 +121,163 @@ class SistemaCompleto:
         """Inicializar banco SQLite"""
         self.logger.info("Inicializando banco de dados...")
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Tabela de fontes
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fontes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome TEXT UNIQUE NOT NULL,
-                tipo TEXT NOT NULL,
-                caminho TEXT NOT NULL,
-                aba TEXT NOT NULL,
-                coluna_gcpj TEXT NOT NULL,
-                ativa BOOLEAN DEFAULT 1,
-                prioridade INTEGER DEFAULT 5,
-                data_criacao TEXT
-            )
-        ''')
-        
-        # Tabela de escopo GCPJ
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS escopo_gcpj (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                gcpj TEXT UNIQUE NOT NULL,
-                ativo BOOLEAN DEFAULT 1,
-                motivo TEXT,
-                data_inclusao TEXT
-            )
-        ''')
-        
-        # Tabela de execuções
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS execucoes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                tipo TEXT NOT NULL,
-                registros_processados INTEGER,
-                arquivo_resultado TEXT,
-                observacoes TEXT
-            )
-        ''')
-        
-        # Tabela para diagnóstico de completude
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS diagnostico_completude (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                gcpj TEXT NOT NULL,
-                coluna_template TEXT NOT NULL,
-                disponivel BOOLEAN NOT NULL,
-                fonte TEXT,
-                motivo_falta TEXT,
-                execucao_id INTEGER,
-                timestamp TEXT
-            )
-        ''')
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
+        
+            # Tabela de fontes
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fontes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome TEXT UNIQUE NOT NULL,
+                    tipo TEXT NOT NULL,
+                    caminho TEXT NOT NULL,
+                    aba TEXT NOT NULL,
+                    coluna_gcpj TEXT NOT NULL,
+                    ativa BOOLEAN DEFAULT 1,
+                    prioridade INTEGER DEFAULT 5,
+                    data_criacao TEXT
+                )
+            ''')
+        
+            # Tabela de escopo GCPJ
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS escopo_gcpj (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    gcpj TEXT UNIQUE NOT NULL,
+                    ativo BOOLEAN DEFAULT 1,
+                    motivo TEXT,
+                    data_inclusao TEXT
+                )
+            ''')
+        
+            # Tabela de execuções
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS execucoes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    registros_processados INTEGER,
+                    arquivo_resultado TEXT,
+                    observacoes TEXT
+                )
+            ''')
+        
+            # Tabela para diagnóstico de completude
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS diagnostico_completude (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    gcpj TEXT NOT NULL,
+                    coluna_template TEXT NOT NULL,
+                    disponivel BOOLEAN NOT NULL,
+                    fonte TEXT,
+                    motivo_falta TEXT,
+                    execucao_id INTEGER,
+                    timestamp TEXT
+                )
+            ''')
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+
+            # Aplicar migrações de schema pendentes (índices etc.)
+            aplicar_migracoes(conn, 'sistema_completo')
         
         # Inserir dados básicos se necessário
         self.inserir_dados_basicos()
         
     def inserir_dados_basicos(self):
         """Inserir fontes básicas se não existirem"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
         
-        # Verificar se já existem fontes
-        cursor.execute("SELECT COUNT(*) FROM fontes")
-        if cursor.fetchone()[0] == 0:
-            self.logger.info("Inserindo fontes básicas...")
+            # Verificar se já existem fontes
+            cursor.execute("SELECT COUNT(*) FROM fontes")
+            if cursor.fetchone()[0] == 0:
+                self.logger.info("Inserindo fontes básicas...")
             
-            fontes_basicas = [
-                ("Fonte Principal GCPJ", "excel", "cópia-MOYA E LARA_BASE GCPJ ATIVOS - 07_04_2025.xlsx", "Sheet1", "GCPJ", 1, 1),
-                ("Base Ativa Escritório", "excel", "4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx", "Sheet1", "GCPJ", 1, 2),
-                ("Template Bradesco", "excel", "template-banco-bradesco-sa.xlsx", "Sheet", "CÓD. INTERNO", 1, 3)
-            ]
+                fontes_basicas = [
+                    ("Fonte Principal GCPJ", "excel", "cópia-MOYA E LARA_BASE GCPJ ATIVOS - 07_04_2025.xlsx", "Sheet1", "GCPJ", 1, 1),
+                    ("Base Ativa Escritório", "excel", "4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx", "Sheet1", "GCPJ", 1, 2),
+                    ("Template Bradesco", "excel", "template-banco-bradesco-sa.xlsx", "Sheet", "CÓD. INTERNO", 1, 3)
+                ]
             
-            for fonte in fontes_basicas:
-                cursor.execute('''
-                    INSERT INTO fontes (nome, tipo, caminho, aba, coluna_gcpj, ativa, prioridade)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', fonte)
-        
-        conn.commit()
-        conn.close()
-        
+                for fonte in fontes_basicas:
+                    cursor.execute('''
+                        INSERT INTO fontes (nome, tipo, caminho, aba, coluna_gcpj, ativa, prioridade)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', fonte)
+                self.registrar_alteracao(conn, 'fontes')
+        
+            conn.commit()
+    
+    def registrar_alteracao(self, conn, nome):
+        """Incrementa a versão de 'fontes' ou 'escopo' (na transação de quem alterou os dados)"""
+        registrar_alteracao(conn, nome)
+    
+    def obter_versoes_dados(self):
+        """Versões que invalidam o cache das páginas: última execução, fontes e escopo"""
+        with conexao(self.db_path) as conn:
+            return ler_versoes_dados(conn)
+        
+    def chave_diagnostico(self):
+        """Chave de deduplicação: diagnósticos com as mesmas fontes e escopo são idênticos"""
+        versoes = self.obter_versoes_dados()
+        return f"diagnostico:fontes={versoes.get('fontes', 0)}:escopo={versoes.get('escopo', 0)}"
+    
+    def estimar_memoria_diagnostico_mb(self):
+        """Estimativa de memória do diagnóstico a partir do tamanho dos arquivos das fontes"""
+        total_bytes = 0
+        for caminho in self.obter_fontes()['caminho']:
+            caminho = os.path.join(self.base_path, caminho)
+            if os.path.exists(caminho):
+                total_bytes += os.path.getsize(caminho)
+        return total_bytes * FATOR_MEMORIA_FONTES / (1024 * 1024)
+    
     def obter_fontes(self):
         """Obter todas as fontes"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query("SELECT * FROM fontes WHERE ativa = 1 ORDER BY prioridade", conn)
-        conn.close()
+        with conexao(self.db_path) as conn:
+            df = pd.read_sql_query("SELECT * FROM fontes WHERE ativa = 1 ORDER BY prioridade", conn)
         return df
+    
+    def carregar_fonte(self, fonte):
+        """DataFrame da fonte, reaproveitado do cache enquanto o arquivo não muda"""
+        caminho = os.path.join(self.base_path, fonte['caminho'])
+        chave = chave_fonte(fonte['id'], fonte['aba'], fonte['coluna_gcpj'])
+        return self.fontes_carregadas.obter(chave, caminho, lambda: self._ler_fonte(fonte, caminho))
+    
+    def _ler_fonte(self, fonte, caminho):
+        if fonte['tipo'] == 'excel':
+            return pd.read_excel(caminho, sheet_name=fonte['aba'])
+        return pd.read_csv(caminho)
         
     def adicionar_fonte(self, dados):
         """Adicionar nova fonte"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO fontes (nome, tipo, caminho, aba, coluna_gcpj, prioridade, data_criacao)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            dados['nome'],
-            dados['tipo'],
-            dados['caminho'],
-            dados['aba'],
-            dados['coluna_gcpj'],
-            dados['prioridade'],
-            datetime.now().isoformat()
-        ))
-        
-        fonte_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
+        
+            cursor.execute('''
+                INSERT INTO fontes (nome, tipo, caminho, aba, coluna_gcpj, prioridade, data_criacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                dados['nome'],
+                dados['tipo'],
+                dados['caminho'],
+                dados['aba'],
+                dados['coluna_gcpj'],
+                dados['prioridade'],
+                datetime.now().isoformat()
+            ))
+        
+            fonte_id = cursor.lastrowid
+            self.registrar_alteracao(conn, 'fontes')
+            conn.commit()
         
         self.logger.info(f"Fonte '{dados['nome']}' adicionada com ID {fonte_id}")
         return fonte_id
         
     def testar_fonte(self, fonte_id):
         """Testar conectividade de uma fonte"""
-        conn = sqlite3.connect(self.db_path)
-        fonte = pd.read_sql_query("SELECT * FROM fontes WHERE id = ?", conn, params=(fonte_id,))
-        conn.close()
+        with conexao(self.db_path) as conn:
+            fonte = pd.read_sql_query("SELECT * FROM fontes WHERE id = ?", conn, params=(fonte_id,))
         
         if fonte.empty:
             raise Exception("Fonte não encontrada")
@@ -227,59 +288,124 @@ class SistemaCompleto:
         if not os.path.exists(caminho_completo):
             raise Exception(f"Arquivo não encontrado: {fonte_info['caminho']}")
             
-        if fonte_info['tipo'] == 'excel':
-            df = pd.read_excel(caminho_completo, sheet_name=fonte_info['aba'])
-        else:
-            df = pd.read_csv(caminho_completo)
+        # Só cabeçalho, contagem e primeiras linhas: o teste não lê a planilha inteira
+        aba = fonte_info['aba'] if fonte_info['tipo'] == 'excel' else None
+        colunas = ler_cabecalho(caminho_completo, aba)
             
-        if fonte_info['coluna_gcpj'] not in df.columns:
+        if fonte_info['coluna_gcpj'] not in colunas:
             raise Exception(f"Coluna GCPJ '{fonte_info['coluna_gcpj']}' não encontrada")
             
         return {
-            'registros': len(df),
-            'colunas': df.columns.tolist(),
-            'amostra_gcpj': df[fonte_info['coluna_gcpj']].head(5).tolist()
+            'registros': contar_registros(caminho_completo, aba),
+            'colunas': colunas,
+            'amostra_gcpj': amostrar_coluna(caminho_completo, fonte_info['coluna_gcpj'], 5, aba=aba)
         }
         
     def obter_escopo(self):
         """Obter GCPJs do escopo"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query("SELECT * FROM escopo_gcpj WHERE ativo = 1 ORDER BY id DESC", conn)
-        conn.close()
+        with conexao(self.db_path) as conn:
+            df = pd.read_sql_query("SELECT * FROM escopo_gcpj WHERE ativo = 1 ORDER BY id DESC", conn)
         return df
         
-    def adicionar_gcpjs_escopo(self, gcpjs, motivo):
-        """Adicionar GCPJs ao escopo"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def iterar_escopo(self):
+        """Gera (gcpj, motivo, data_inclusao) do escopo ativo direto do cursor"""
+        with conexao(self.db_path) as conn:
+            cursor = conn.execute(
+                "SELECT gcpj, motivo, data_inclusao FROM escopo_gcpj WHERE ativo = 1 ORDER BY id DESC"
+            )
+            try:
+                yield from cursor
+            finally:
+                cursor.close()
+    
+    def _filtro_escopo(self, busca=None):
+        # Busca por prefixo como faixa do índice (ativo, gcpj)
+        condicoes, parametros = ["ativo = 1"], []
+        if busca:
+            condicoes.append("gcpj >= ? AND gcpj < ?")
+            parametros += [busca, busca + '\uffff']
+        return condicoes, parametros
+    
+    def contar_escopo(self, busca=None):
+        """Quantidade de GCPJs ativos no escopo (opcionalmente com o prefixo informado)"""
+        condicoes, parametros = self._filtro_escopo(busca)
+        with conexao(self.db_path) as conn:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM escopo_gcpj WHERE {' AND '.join(condicoes)}", parametros
+            ).fetchone()[0]
+    
+    def obter_pagina_escopo(self, busca=None, ordem='recentes', apos=None, limite=TAMANHO_PAGINA_ESCOPO):
+        """Página do escopo por cursor (keyset)
         
-        adicionados = 0
-        timestamp = datetime.now().isoformat()
+        ordem 'recentes' segue o id decrescente e 'gcpj' o GCPJ crescente; 'apos' é
+        o cursor devolvido na página anterior (id ou GCPJ do último item).
+        """
+        condicoes, parametros = self._filtro_escopo(busca)
+        if ordem == 'gcpj':
+            ordenacao = "gcpj ASC"
+            if apos:
+                condicoes.append("gcpj > ?")
+                parametros.append(str(apos))
+        else:
+            ordenacao = "id DESC"
+            if apos:
+                condicoes.append("id < ?")
+                parametros.append(int(apos))
+        
+        with conexao(self.db_path) as conn:
+            linhas = conn.execute(f'''
+                SELECT id, gcpj, motivo, data_inclusao FROM escopo_gcpj
+                WHERE {' AND '.join(condicoes)}
+                ORDER BY {ordenacao}
+                LIMIT ?
+            ''', parametros + [limite + 1]).fetchall()
+        
+        itens = [
+            {'id': id_, 'gcpj': gcpj, 'motivo': motivo, 'data_inclusao': data_inclusao}
+            for id_, gcpj, motivo, data_inclusao in linhas[:limite]
+        ]
+        proximo = None
+        if len(linhas) > limite:
+            proximo = itens[-1]['gcpj'] if ordem == 'gcpj' else itens[-1]['id']
+        return {'itens': itens, 'proximo': proximo}
         
-        for gcpj in gcpjs:
-            try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO escopo_gcpj (gcpj, motivo, data_inclusao)
-                    VALUES (?, ?, ?)
-                ''', (str(gcpj).strip(), motivo, timestamp))
-                
-                if cursor.rowcount > 0:
-                    adicionados += 1
-                    
-            except Exception as e:
-                self.logger.warning(f"Erro ao adicionar GCPJ {gcpj}: {e}")
-                
-        conn.commit()
-        conn.close()
+    def adicionar_gcpjs_escopo(self, gcpjs, motivo):
+        """Adicionar GCPJs ao escopo"""
+        with conexao(self.db_path) as conn:
+            adicionados = carregar_gcpjs_escopo(
+                conn, 'escopo_gcpj', 'motivo', [str(gcpj).strip() for gcpj in gcpjs], motivo
+            )
+            self.registrar_alteracao(conn, 'escopo')
+            conn.commit()
         
         self.logger.info(f"Adicionados {adicionados} GCPJs ao escopo")
         return adicionados
+    
+    def importar_escopo_arquivo(self, caminho, coluna_gcpj, aba=None, motivo="Upload de arquivo"):
+        """Importar a coluna de GCPJs de um arquivo (Excel/CSV) para o escopo em massa"""
+        with conexao(self.db_path) as conn:
+            resumo = importar_arquivo_escopo(
+                conn, 'escopo_gcpj', 'motivo', caminho, coluna_gcpj, aba=aba, motivo=motivo
+            )
+            self.registrar_alteracao(conn, 'escopo')
+            conn.commit()
+        
+        self.logger.info(
+            f"Escopo importado: {resumo['adicionados']} adicionados, "
+            f"{resumo['duplicados']} duplicados, {resumo['invalidos']} inválidos"
+        )
+        return resumo
         
-    def executar_diagnostico_completude(self):
-        """Executar diagnóstico de completude por GCPJ - FUNCIONALIDADE PRINCIPAL"""
+    def executar_diagnostico_completude(self, progresso=PROGRESSO_NULO):
+        """Executar diagnóstico de completude por GCPJ - FUNCIONALIDADE PRINCIPAL
+        
+        progresso recebe as fases e o avanço (ver progresso_execucao) e permite
+        cancelar a execução entre as etapas.
+        """
         self.logger.info("=== INICIANDO DIAGNÓSTICO DE COMPLETUDE POR GCPJ ===")
         
         # Obter escopo de GCPJs
+        progresso.fase('Carregando escopo')
         escopo_df = self.obter_escopo()
         if escopo_df.empty:
             self.logger.warning("Nenhum GCPJ no escopo. Usando amostra da fonte principal.")
@@ -292,8 +418,10 @@ class SistemaCompleto:
         # Carregar dados das fontes
         fontes = self.obter_fontes()
         dados_fontes = {}
+        progresso.fase('Carregando fontes', total=len(fontes), unidade='fontes')
         
         for _, fonte in fontes.iterrows():
+            progresso.verificar_cancelamento()
             try:
                 caminho = os.path.join(self.base_path, fonte['caminho'])
                 self.logger.info(f"Tentando carregar fonte '{fonte['nome']}' do caminho: {caminho}")
@@ -301,20 +429,12 @@ class SistemaCompleto:
                     self.logger.error(f"Arquivo não encontrado: {caminho}")
                     continue
 
-                if fonte['tipo'] == 'excel':
-                    try:
-                        df = pd.read_excel(caminho, sheet_name=fonte['aba'])
-                        self.logger.info(f"Fonte '{fonte['nome']}' carregada com sucesso da aba '{fonte['aba']}'. Registros: {len(df)}")
-                    except Exception as e:
-                        self.logger.error(f"Erro ao carregar aba '{fonte['aba']}' da fonte '{fonte['nome']}': {e}")
-                        continue
-                else:
-                    try:
-                        df = pd.read_csv(caminho)
-                        self.logger.info(f"Fonte '{fonte['nome']}' carregada com sucesso. Registros: {len(df)}")
-                    except Exception as e:
-                        self.logger.error(f"Erro ao carregar CSV '{fonte['nome']}': {e}")
-                        continue
+                try:
+                    df = self.carregar_fonte(fonte)
+                    self.logger.info(f"Fonte '{fonte['nome']}' carregada com sucesso. Registros: {len(df)}")
+                except Exception as e:
+                    self.logger.error(f"Erro ao carregar fonte '{fonte['nome']}' ({fonte['tipo']}, aba '{fonte['aba']}'): {e}")
+                    continue
 
                 dados_fontes[fonte['id']] = {
                     'nome': fonte['nome'],
@@ -325,6 +445,7 @@ class SistemaCompleto:
 
             except Exception as e:
                 self.logger.error(f"Erro GENÉRICO ao carregar fonte {fonte['nome']}: {e}")
+            progresso.avancar()
         
         # Definir mapeamentos (baseado no config.py original)
         mapeamentos = {
@@ -351,6 +472,7 @@ class SistemaCompleto:
         }
         
         # Carregar template para obter todas as colunas
+        progresso.fase('Carregando template')
         try:
             template_path = os.path.join(self.base_path, "template-banco-bradesco-sa.xlsx")
             template_df = pd.read_excel(template_path, sheet_name='Sheet')
@@ -360,138 +482,386 @@ class SistemaCompleto:
             self.logger.warning(f"Erro ao carregar template: {e}. Usando colunas dos mapeamentos.")
             todas_colunas_template = list(mapeamentos.keys()) + list(valores_constantes.keys())
         
-        # Executar diagnóstico para cada GCPJ
-        resultados = []
-        
-        for i, gcpj in enumerate(escopo_gcpjs):
-            if i % 100 == 0:
-                self.logger.info(f"Processando GCPJ {i+1}/{len(escopo_gcpjs)}: {gcpj}")
-                
-            resultado_gcpj = {
-                'gcpj': gcpj,
-                'colunas_disponiveis': [],
-                'colunas_faltantes': [],
-                'detalhes_por_coluna': {},
-                'taxa_completude': 0
-            }
-            
-            colunas_preenchidas = 0
-            
-            # Verificar cada coluna do template
-            for coluna_template in todas_colunas_template:
-                disponivel = False
-                fonte_origem = "Nenhuma"
-                motivo_falta = "Sem mapeamento definido"
-                
-                # 1. Verificar se é valor constante
-                if coluna_template in valores_constantes:
-                    disponivel = True
-                    fonte_origem = "Constante"
-                    
-                # 2. Verificar se tem mapeamento
-                elif coluna_template in mapeamentos:
-                    coluna_origem = mapeamentos[coluna_template]
-                    
-                    # Procurar nas fontes por ordem de prioridade
-                    for fonte_id, dados_fonte in sorted(dados_fontes.items(), key=lambda x: x[1]['prioridade']):
-                        df_fonte = dados_fonte['df']
-                        coluna_gcpj_fonte = dados_fonte['coluna_gcpj']
-                        
-                        # Verificar se fonte tem a coluna origem e o GCPJ
-                        if coluna_origem in df_fonte.columns and coluna_gcpj_fonte in df_fonte.columns:
-                            # Procurar o GCPJ específico
-                            registro = df_fonte[df_fonte[coluna_gcpj_fonte].astype(str) == str(gcpj)]
-                            
-                            if not registro.empty and pd.notna(registro.iloc[0][coluna_origem]):
-                                disponivel = True
-                                fonte_origem = dados_fonte['nome']
-                                break
-                    
-                    if not disponivel:
-                        motivo_falta = f"GCPJ {gcpj} não encontrado nas fontes ou dado vazio"
-                
-                # Registrar resultado
-                if disponivel:
-                    resultado_gcpj['colunas_disponiveis'].append(coluna_template)
-                    colunas_preenchidas += 1
-                else:
-                    resultado_gcpj['colunas_faltantes'].append(coluna_template)
-                
-                resultado_gcpj['detalhes_por_coluna'][coluna_template] = {
-                    'disponivel': disponivel,
-                    'fonte': fonte_origem,
-                    'motivo_falta': motivo_falta if not disponivel else None
-                }
-            
-            # Calcular taxa de completude
-            resultado_gcpj['taxa_completude'] = (colunas_preenchidas / len(todas_colunas_template)) * 100
-            resultados.append(resultado_gcpj)
+        # Executar diagnóstico já na forma empacotada (máscara de bits por GCPJ)
+        resultados = self.calcular_diagnostico_empacotado(
+            escopo_gcpjs, todas_colunas_template, mapeamentos, valores_constantes, dados_fontes,
+            progresso=progresso
+        )
         
-        # Salvar resultados no banco
+        # Salvar resultados no banco (último ponto de cancelamento)
+        progresso.fase('Salvando resultados')
         self.salvar_diagnostico_bd(resultados)
         
-:start_line:433
--------
-self.logger.info(f"=== DIAGNÓSTICO CONCLUÍDO: {len(resultados)} GCPJs processados ===")
+        self.logger.info(f"=== DIAGNÓSTICO CONCLUÍDO: {len(resultados)} GCPJs processados ===")
         # Log dos primeiros 5 resultados (ou todos se forem menos de 5)
         num_resultados = min(5, len(resultados))
         for i in range(num_resultados):
             self.logger.info(f"Resultado {i+1}: {resultados[i]}")
 
         return resultados
+    
+    def calcular_diagnostico_empacotado(self, escopo_gcpjs, colunas_template, mapeamentos,
+                                        valores_constantes, dados_fontes, progresso=PROGRESSO_NULO):
+        """Calcular a disponibilidade GCPJ x coluna de forma vetorizada
+        
+        Mantém a regra do diagnóstico por GCPJ: constantes sempre disponíveis e,
+        para colunas mapeadas, a primeira fonte (por prioridade) cujo primeiro
+        registro do GCPJ tem o dado preenchido.
+        """
+        chaves_escopo = pd.Index([str(gcpj) for gcpj in escopo_gcpjs])
+        total_gcpjs = len(chaves_escopo)
+        fontes_ordenadas = sorted(dados_fontes.values(), key=lambda dados: dados['prioridade'])
+        nomes_fontes = FONTES_FIXAS + [dados['nome'] for dados in fontes_ordenadas]
+        
+        # Linha do primeiro registro de cada GCPJ do escopo em cada fonte (-1 se ausente)
+        linhas_fontes = []
+        for dados_fonte in fontes_ordenadas:
+            df_fonte = dados_fonte['df']
+            coluna_gcpj_fonte = dados_fonte['coluna_gcpj']
+            
+            if coluna_gcpj_fonte not in df_fonte.columns:
+                linhas_fontes.append(None)
+                continue
+            
+            # Forma canônica, a mesma do escopo importado e da amostra (123.0 -> '123')
+            chaves_fonte = pd.Series(canonizar_gcpjs(df_fonte[coluna_gcpj_fonte]), dtype=object)
+            primeiros = np.flatnonzero(~chaves_fonte.duplicated().to_numpy())
+            posicoes = pd.Index(chaves_fonte.to_numpy()[primeiros]).get_indexer(chaves_escopo)
+            
+            linhas = np.full(total_gcpjs, -1, dtype=np.int64)
+            encontrados = posicoes >= 0
+            linhas[encontrados] = primeiros[posicoes[encontrados]]
+            linhas_fontes.append(linhas)
+        
+        disponiveis = np.zeros((total_gcpjs, len(colunas_template)), dtype=bool)
+        matriz_fontes = np.zeros((total_gcpjs, len(colunas_template)), dtype=dtype_matriz_fontes(len(nomes_fontes)))
+        tipos_colunas = []
+        
+        # Cada coluna avalia todos os GCPJs: o avanço é medido em células
+        progresso.fase('Calculando disponibilidade', total=total_gcpjs * len(colunas_template), unidade='células')
+        
+        for j, coluna_template in enumerate(colunas_template):
+            # 1. Valor constante
+            if coluna_template in valores_constantes:
+                tipos_colunas.append(TIPO_CONSTANTE)
+                disponiveis[:, j] = True
+                matriz_fontes[:, j] = FONTE_CONSTANTE
+            
+            # 2. Coluna mapeada: procurar nas fontes por ordem de prioridade
+            elif coluna_template in mapeamentos:
+                tipos_colunas.append(TIPO_MAPEADA)
+                coluna_origem = mapeamentos[coluna_template]
+                pendentes = np.ones(total_gcpjs, dtype=bool)
+                
+                for indice_fonte, (dados_fonte, linhas) in enumerate(zip(fontes_ordenadas, linhas_fontes)):
+                    df_fonte = dados_fonte['df']
+                    if linhas is None or coluna_origem not in df_fonte.columns:
+                        continue
+                    
+                    preenchidos = df_fonte[coluna_origem].notna().to_numpy()
+                    candidatos = pendentes & (linhas >= 0)
+                    achados = np.zeros(total_gcpjs, dtype=bool)
+                    achados[candidatos] = preenchidos[linhas[candidatos]]
+                    
+                    disponiveis[achados, j] = True
+                    matriz_fontes[achados, j] = len(FONTES_FIXAS) + indice_fonte
+                    pendentes &= ~achados
+            
+            # 3. Sem mapeamento definido
+            else:
+                tipos_colunas.append(TIPO_SEM_MAPEAMENTO)
+            
+            progresso.avancar(total_gcpjs)
+        
+        return DiagnosticoEmpacotado(
+            chaves_escopo, colunas_template, tipos_colunas, nomes_fontes, disponiveis, matriz_fontes
+        )
         
     def salvar_diagnostico_bd(self, resultados):
-        """Salvar resultados do diagnóstico no banco"""
-        conn = sqlite3.connect(self.db_path)
+        """Salvar diagnóstico empacotado no banco"""
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
+        
+            # Criar execução
+            timestamp = datetime.now().isoformat()
+            cursor.execute('''
+                INSERT INTO execucoes (timestamp, tipo, registros_processados, observacoes)
+                VALUES (?, ?, ?, ?)
+            ''', (timestamp, 'diagnostico_completude', len(resultados), 'Diagnóstico de completude por GCPJ'))
+        
+            execucao_id = cursor.lastrowid
+        
+            # Salvar máscaras de disponibilidade e matriz de fontes
+            dados = resultados.serializar()
+            cursor.execute('''
+                INSERT INTO diagnostico_empacotado
+                (execucao_id, timestamp, gcpjs, colunas, tipos_colunas, fontes, mascaras, matriz_fontes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                execucao_id,
+                timestamp,
+                dados['gcpjs'],
+                dados['colunas'],
+                dados['tipos_colunas'],
+                dados['fontes'],
+                dados['mascaras'],
+                dados['matriz_fontes']
+            ))
+        
+            # Consolidar rollups da execução na mesma transação, do diagnóstico já em memória
+            self.gerar_rollups_execucao(conn, execucao_id, resultados)
+        
+            conn.commit()
+        
+        self.logger.info(f"Diagnóstico salvo no banco com ID {execucao_id}")
+        return execucao_id
+    
+    def obter_diagnostico_empacotado(self, execucao_id):
+        """Carregar o diagnóstico empacotado de uma execução (None para execuções antigas)"""
+        if self._diagnostico_em_cache is not None and self._diagnostico_em_cache[0] == execucao_id:
+            return self._diagnostico_em_cache[1]
+        
+        with conexao(self.db_path) as conn:
+            linha = conn.execute('''
+                SELECT gcpjs, colunas, tipos_colunas, fontes, mascaras, matriz_fontes
+                FROM diagnostico_empacotado WHERE execucao_id = ?
+            ''', (execucao_id,)).fetchone()
+        
+        if linha is None:
+            return None
+        
+        diagnostico = DiagnosticoEmpacotado.desserializar(*linha)
+        self._diagnostico_em_cache = (execucao_id, diagnostico)
+        return diagnostico
+    
+    def obter_faltantes_coluna(self, execucao_id, coluna):
+        """GCPJs sem dado em uma coluna (drill-down), montados sob demanda"""
+        diagnostico = self.obter_diagnostico_empacotado(execucao_id)
+        if diagnostico is not None:
+            return diagnostico.faltantes_coluna(coluna)
+        
+        # Execuções anteriores ao formato empacotado
+        with conexao(self.db_path) as conn:
+            return pd.read_sql_query('''
+                SELECT gcpj, disponivel, fonte, motivo_falta
+                FROM diagnostico_completude 
+                WHERE execucao_id = ? AND coluna_template = ? AND disponivel = 0
+                ORDER BY gcpj
+            ''', conn, params=(execucao_id, coluna))
+    
+    def iterar_faltantes_coluna(self, execucao_id, coluna):
+        """Gera (gcpj, fonte, motivo_falta) dos GCPJs sem dado na coluna, em ordem de GCPJ"""
+        diagnostico = self.obter_diagnostico_empacotado(execucao_id)
+        if diagnostico is not None:
+            yield from diagnostico.iterar_faltantes_coluna(coluna)
+            return
+        
+        # Execuções anteriores ao formato empacotado: direto do cursor
+        with conexao(self.db_path) as conn:
+            cursor = conn.execute('''
+                SELECT gcpj, fonte, motivo_falta
+                FROM diagnostico_completude 
+                WHERE execucao_id = ? AND coluna_template = ? AND disponivel = 0
+                ORDER BY gcpj
+            ''', (execucao_id, coluna))
+            try:
+                yield from cursor
+            finally:
+                cursor.close()
+    
+    def gerar_rollups_execucao(self, conn, execucao_id, diagnostico=None):
+        """Gerar as tabelas de rollup de uma execução a partir do diagnóstico detalhado
+        
+        diagnostico é o DiagnosticoEmpacotado recém-calculado; sem ele (execuções já
+        salvas) o diagnóstico é lido do banco.
+        """
         cursor = conn.cursor()
         
-        # Criar execução
-        timestamp = datetime.now().isoformat()
+        for tabela in ('rollup_colunas_fonte', 'rollup_histograma', 'rollup_categorias', 'rollup_execucoes'):
+            cursor.execute(f"DELETE FROM {tabela} WHERE execucao_id = ?", (execucao_id,))
+        
+        if diagnostico is None:
+            diagnostico = self.obter_diagnostico_empacotado(execucao_id)
+        if diagnostico is not None:
+            self.gerar_rollups_empacotado(cursor, execucao_id, diagnostico)
+            return
+        
+        # Preenchidos/faltantes por coluna e fonte
+        cursor.execute('''
+            INSERT INTO rollup_colunas_fonte
+            (execucao_id, coluna_template, fonte, registros_preenchidos, registros_faltantes)
+            SELECT execucao_id, coluna_template, COALESCE(fonte, 'Nenhuma'),
+                   SUM(CASE WHEN disponivel = 1 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN disponivel = 0 THEN 1 ELSE 0 END)
+            FROM diagnostico_completude
+            WHERE execucao_id = ?
+            GROUP BY coluna_template, COALESCE(fonte, 'Nenhuma')
+        ''', (execucao_id,))
+        
+        # Histograma de completude por GCPJ em faixas de 10%
         cursor.execute('''
-            INSERT INTO execucoes (timestamp, tipo, registros_processados, observacoes)
-            VALUES (?, ?, ?, ?)
-        ''', (timestamp, 'diagnostico_completude', len(resultados), 'Diagnóstico de completude por GCPJ'))
-        
-        execucao_id = cursor.lastrowid
-        
-        # Salvar detalhes por GCPJ/coluna
-        for resultado in resultados:
-            for coluna, detalhes in resultado['detalhes_por_coluna'].items():
-                cursor.execute('''
-                    INSERT INTO diagnostico_completude 
-                    (gcpj, coluna_template, disponivel, fonte, motivo_falta, execucao_id, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    resultado['gcpj'],
-                    coluna,
-                    detalhes['disponivel'],
-                    detalhes['fonte'],
-                    detalhes['motivo_falta'],
-                    execucao_id,
-                    timestamp
-                ))
-        
-        conn.commit()
-        conn.close()
+            INSERT INTO rollup_histograma (execucao_id, faixa, gcpjs)
+            SELECT ?, faixa, COUNT(*)
+            FROM (
+                SELECT CAST(AVG(CASE WHEN disponivel = 1 THEN 100.0 ELSE 0.0 END) / 10 AS INTEGER) as faixa
+                FROM diagnostico_completude
+                WHERE execucao_id = ?
+                GROUP BY gcpj
+            )
+            GROUP BY faixa
+        ''', (execucao_id, execucao_id))
         
-        self.logger.info(f"Diagnóstico salvo no banco com ID {execucao_id}")
-        return execucao_id
+        # Totais por categoria de coluna
+        cursor.execute('''
+            INSERT INTO rollup_categorias
+            (execucao_id, categoria, colunas, registros_preenchidos, registros_faltantes)
+            SELECT ?, categoria, COUNT(DISTINCT coluna_template),
+                   SUM(CASE WHEN disponivel = 1 THEN 1 ELSE 0 END),
+                   SUM(CASE WHEN disponivel = 0 THEN 1 ELSE 0 END)
+            FROM (
+                SELECT coluna_template, disponivel,
+                       CASE WHEN fonte = 'Constante' THEN 'constante'
+                            WHEN motivo_falta = 'Sem mapeamento definido' THEN 'sem_mapeamento'
+                            ELSE 'mapeada' END as categoria
+                FROM diagnostico_completude
+                WHERE execucao_id = ?
+            )
+            GROUP BY categoria
+        ''', (execucao_id, execucao_id))
+        
+        # Resumo da execução a partir dos rollups já gerados
+        cursor.execute('''
+            INSERT INTO rollup_execucoes
+            (execucao_id, total_gcpjs, total_colunas, celulas_preenchidas, celulas_faltantes, taxa_media)
+            SELECT ?,
+                   (SELECT COALESCE(SUM(gcpjs), 0) FROM rollup_histograma WHERE execucao_id = ?),
+                   COUNT(DISTINCT coluna_template),
+                   COALESCE(SUM(registros_preenchidos), 0),
+                   COALESCE(SUM(registros_faltantes), 0),
+                   COALESCE(100.0 * SUM(registros_preenchidos) / NULLIF(SUM(registros_preenchidos + registros_faltantes), 0), 0)
+            FROM rollup_colunas_fonte
+            WHERE execucao_id = ?
+        ''', (execucao_id, execucao_id, execucao_id))
+    
+    def gerar_rollups_empacotado(self, cursor, execucao_id, diagnostico):
+        """Gerar os rollups direto das máscaras (mesmos valores da versão em SQL)"""
+        total_gcpjs = len(diagnostico)
+        
+        cursor.executemany('''
+            INSERT INTO rollup_colunas_fonte
+            (execucao_id, coluna_template, fonte, registros_preenchidos, registros_faltantes)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(execucao_id, *contagem) for contagem in diagnostico.contagens_coluna_fonte()])
+        
+        # Faixas de 10% pela taxa de cada GCPJ (popcount)
+        faixas, quantidades = np.unique((diagnostico.taxas_completude() / 10).astype(int), return_counts=True)
+        cursor.executemany('''
+            INSERT INTO rollup_histograma (execucao_id, faixa, gcpjs) VALUES (?, ?, ?)
+        ''', [(execucao_id, int(faixa), int(quantidade)) for faixa, quantidade in zip(faixas, quantidades)])
+        
+        preenchidos_por_coluna = diagnostico.preenchidos_por_coluna()
+        totais_categoria = {}
+        for tipo, preenchidos in zip(diagnostico.tipos_colunas, preenchidos_por_coluna):
+            colunas, soma = totais_categoria.get(tipo, (0, 0))
+            totais_categoria[tipo] = (colunas + 1, soma + int(preenchidos))
+        
+        if total_gcpjs:
+            cursor.executemany('''
+                INSERT INTO rollup_categorias
+                (execucao_id, categoria, colunas, registros_preenchidos, registros_faltantes)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(execucao_id, categoria, colunas, preenchidos, colunas * total_gcpjs - preenchidos)
+                  for categoria, (colunas, preenchidos) in totais_categoria.items()])
+        
+        celulas_preenchidas = int(preenchidos_por_coluna.sum())
+        total_celulas = total_gcpjs * len(diagnostico.colunas)
+        cursor.execute('''
+            INSERT INTO rollup_execucoes
+            (execucao_id, total_gcpjs, total_colunas, celulas_preenchidas, celulas_faltantes, taxa_media)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            execucao_id,
+            total_gcpjs,
+            len(diagnostico.colunas) if total_gcpjs else 0,
+            celulas_preenchidas,
+            total_celulas - celulas_preenchidas,
+            100.0 * celulas_preenchidas / total_celulas if total_celulas else 0
+        ))
+    
+    def garantir_rollups(self, conn, execucao_id):
+        """Gerar os rollups de execuções salvas antes da existência das tabelas de rollup"""
+        existe = conn.execute(
+            "SELECT 1 FROM rollup_execucoes WHERE execucao_id = ?", (execucao_id,)
+        ).fetchone()
+        if existe is None:
+            self.logger.info(f"Gerando rollups da execução {execucao_id}")
+            self.gerar_rollups_execucao(conn, execucao_id)
+            conn.commit()
+    
+    def obter_resumo_execucao(self, execucao_id):
+        """Obter o resumo consolidado de uma execução"""
+        with conexao(self.db_path) as conn:
+            self.garantir_rollups(conn, execucao_id)
+            resumo = pd.read_sql_query(
+                "SELECT * FROM rollup_execucoes WHERE execucao_id = ?", conn, params=(execucao_id,)
+            )
+        return resumo.iloc[0].to_dict() if not resumo.empty else None
+    
+    def obter_completude_colunas(self, execucao_id, ordem='DESC', limite=None):
+        """Obter a completude por coluna de uma execução a partir dos rollups"""
+        ordem = 'ASC' if str(ordem).upper() == 'ASC' else 'DESC'
+        limite_sql = f"LIMIT {int(limite)}" if limite else ""
+        
+        with conexao(self.db_path) as conn:
+            self.garantir_rollups(conn, execucao_id)
+            df = pd.read_sql_query(f'''
+                SELECT coluna_template,
+                       SUM(registros_preenchidos + registros_faltantes) as total_registros,
+                       SUM(registros_preenchidos) as registros_preenchidos,
+                       SUM(registros_faltantes) as registros_faltantes,
+                       ROUND(100.0 * SUM(registros_preenchidos) / SUM(registros_preenchidos + registros_faltantes), 2) as taxa_completude
+                FROM rollup_colunas_fonte
+                WHERE execucao_id = ?
+                GROUP BY coluna_template
+                ORDER BY taxa_completude {ordem}
+                {limite_sql}
+            ''', conn, params=(execucao_id,))
+        return df
+    
+    def obter_histograma_completude(self, execucao_id):
+        """Obter a distribuição de GCPJs por faixa de completude"""
+        with conexao(self.db_path) as conn:
+            self.garantir_rollups(conn, execucao_id)
+            df = pd.read_sql_query('''
+                SELECT faixa, gcpjs FROM rollup_histograma
+                WHERE execucao_id = ?
+                ORDER BY faixa
+            ''', conn, params=(execucao_id,))
+        return df
+    
+    def obter_totais_categoria(self, execucao_id):
+        """Obter totais de preenchimento por categoria de coluna"""
+        with conexao(self.db_path) as conn:
+            self.garantir_rollups(conn, execucao_id)
+            df = pd.read_sql_query('''
+                SELECT categoria, colunas, registros_preenchidos, registros_faltantes
+                FROM rollup_categorias
+                WHERE execucao_id = ?
+                ORDER BY categoria
+            ''', conn, params=(execucao_id,))
+        return df
         
     def obter_amostra_gcpjs(self, limite=50):
-        """Obter amostra de GCPJs da fonte principal"""
+        """Obter amostra de GCPJs da fonte principal (lê só as primeiras linhas)"""
         fontes = self.obter_fontes()
         
         for _, fonte in fontes.iterrows():
             try:
                 caminho = os.path.join(self.base_path, fonte['caminho'])
                 if os.path.exists(caminho):
-                    if fonte['tipo'] == 'excel':
-                        df = pd.read_excel(caminho, sheet_name=fonte['aba'])
-                    else:
-                        df = pd.read_csv(caminho)
-                    
-                    if fonte['coluna_gcpj'] in df.columns:
-                        gcpjs = df[fonte['coluna_gcpj']].dropna().astype(str).head(limite).tolist()
+                    aba = fonte['aba'] if fonte['tipo'] == 'excel' else None
+                    gcpjs = amostrar_gcpjs(caminho, fonte['coluna_gcpj'], limite, aba=aba)
+                    if gcpjs:
                         self.logger.info(f"Obtidos {len(gcpjs)} GCPJs de amostra da fonte {fonte['nome']}")
                         return gcpjs
                         
@@ -502,7 +872,7 @@ self.logger.info(f"=== DIAGNÓSTICO CONCLUÍDO: {len(resultados)} GCPJs processa
         
     def obter_estatisticas_dashboard(self):
         """Obter estatísticas para dashboard - VERSÃO CORRIGIDA"""
-        conn = sqlite3.connect(self.db_path)
+        conn = obter_conexao(self.db_path)
         
         try:
             # Contar fontes ativas
@@ -526,18 +896,12 @@ self.logger.info(f"=== DIAGNÓSTICO CONCLUÍDO: {len(resultados)} GCPJs processa
             if ultima_execucao is not None:
                 execucao_id = ultima_execucao['id']
                 
-                # Taxa média de completude - COM PROTEÇÃO CONTRA None
+                # Taxa média de completude (rollup da execução) - COM PROTEÇÃO CONTRA None
                 try:
-                    taxa_result = pd.read_sql_query('''
-                        SELECT AVG(
-                            CASE WHEN disponivel = 1 THEN 100.0 ELSE 0.0 END
-                        ) as taxa_media
-                        FROM diagnostico_completude 
-                        WHERE execucao_id = ?
-                    ''', conn, params=(execucao_id,))
+                    resumo = self.obter_resumo_execucao(execucao_id)
                     
-                    if not taxa_result.empty and pd.notna(taxa_result.iloc[0]['taxa_media']):
-                        taxa_media = float(taxa_result.iloc[0]['taxa_media'])
+                    if resumo is not None and pd.notna(resumo['taxa_media']):
+                        taxa_media = float(resumo['taxa_media'])
                     else:
                         taxa_media = 0.0
                         
@@ -545,19 +909,9 @@ self.logger.info(f"=== DIAGNÓSTICO CONCLUÍDO: {len(resultados)} GCPJs processa
                     self.logger.warning(f"Erro ao calcular taxa média: {e}")
                     taxa_media = 0.0
                 
-                # Colunas mais problemáticas - COM PROTEÇÃO CONTRA ERRO
+                # Colunas mais problemáticas (rollup por coluna) - COM PROTEÇÃO CONTRA ERRO
                 try:
-                    colunas_problematicas = pd.read_sql_query('''
-                        SELECT coluna_template, 
-                               COUNT(*) as total_registros,
-                               SUM(CASE WHEN disponivel = 0 THEN 1 ELSE 0 END) as registros_faltantes,
-                               ROUND(AVG(CASE WHEN disponivel = 1 THEN 100.0 ELSE 0.0 END), 2) as taxa_completude
-                        FROM diagnostico_completude 
-                        WHERE execucao_id = ?
-                        GROUP BY coluna_template
-                        ORDER BY taxa_completude ASC
-                        LIMIT 10
-                    ''', conn, params=(execucao_id,))
+                    colunas_problematicas = self.obter_completude_colunas(execucao_id, ordem='ASC', limite=10)
                     
                     # Verificar se há dados válidos
                     if colunas_problematicas.empty:
@@ -576,9 +930,6 @@ self.logger.info(f"=== DIAGNÓSTICO CONCLUÍDO: {len(resultados)} GCPJs processa
             taxa_media = 0.0
             colunas_problematicas = pd.DataFrame()
         
-        finally:
-            conn.close()
-        
         return {
             'fontes_ativas': int(fontes_ativas) if pd.notna(fontes_ativas) else 0,
             'gcpjs_escopo': int(gcpjs_escopo) if pd.notna(gcpjs_escopo) else 0,
@@ -590,7 +941,26 @@ self.logger.info(f"=== DIAGNÓSTICO CONCLUÍDO: {len(resultados)} GCPJs processa
 # Instância global
 sistema = SistemaCompleto()
 
+# Cache das páginas, invalidado pelas versões de execução, fontes e escopo
+cache_paginas = CachePaginas(sistema.obter_versoes_dados)
+
+# Progresso das execuções longas (diagnóstico), publicado via SSE
+painel_progresso = PainelProgresso()
+
+# Diagnósticos rodam fora do worker do Flask, com deduplicação e limite de concorrência
+executor_diagnosticos = ExecutorTarefas(
+    sistema.db_path, painel_progresso,
+    max_concorrentes=MAX_DIAGNOSTICOS_CONCORRENTES,
+    orcamento_memoria_mb=ORCAMENTO_MEMORIA_DIAGNOSTICOS_MB
+)
+
+def pre_carregar_fontes():
+    """Carrega as fontes ativas no cache antes do fork dos workers (gunicorn.conf.py)"""
+    fontes = [fonte for _, fonte in sistema.obter_fontes().iterrows()]
+    return pre_carregar(sistema.fontes_carregadas, fontes, sistema.carregar_fonte)
+
 @app.route('/')
+@cache_paginas.pagina('execucao', 'fontes', 'escopo')
 def dashboard():
     """Dashboard principal com diagnóstico integrado - VERSÃO CORRIGIDA"""
     try:
@@ -697,7 +1067,17 @@ def dashboard():
                 <button class="btn btn-warning" onclick="executarMigracao()">🚀 Executar Migração</button>
             </div>
         </div>
-        
+
+        <div class="section" id="painel-progresso" style="display: none;">
+            <h3>⏳ Diagnóstico em Andamento</h3>
+            <p><strong id="progresso-fase">Iniciando</strong> <span id="progresso-contagem"></span></p>
+            <div class="progress-bar">
+                <div class="progress-fill" id="progresso-barra" style="width: 0%"></div>
+            </div>
+            <p id="progresso-taxa" class="stat-label"></p>
+            <button class="btn btn-danger" id="btn-cancelar" onclick="cancelarExecucao()">⛔ Cancelar</button>
+        </div>
+
         {f'''
         <div class="section">
             <h3>🔴 Colunas Mais Problemáticas (Última Execução)</h3>
@@ -736,18 +1116,81 @@ def dashboard():
     </div>
     
     <script>
+        let execucaoAtual = null;
+        let fluxoProgresso = null;
+
+        function formatarSegundos(segundos) {{
+            if (segundos === null || segundos === undefined) return '-';
+            const min = Math.floor(segundos / 60);
+            const seg = Math.round(segundos % 60);
+            return min > 0 ? `${{min}}min ${{seg}}s` : `${{seg}}s`;
+        }}
+
+        function mostrarProgresso(dados) {{
+            execucaoAtual = dados.id;
+            document.getElementById('progresso-fase').textContent = dados.fase;
+            document.getElementById('progresso-contagem').textContent = dados.total
+                ? `${{dados.feitos.toLocaleString()}} de ${{dados.total.toLocaleString()}} ${{dados.unidade}} (${{dados.percentual}}%)`
+                : '';
+            document.getElementById('progresso-barra').style.width = (dados.percentual || 0) + '%';
+            document.getElementById('progresso-taxa').textContent =
+                `${{dados.por_segundo.toLocaleString()}} ${{dados.unidade}}/s · ETA ${{formatarSegundos(dados.eta_segundos)}} · decorrido ${{formatarSegundos(dados.decorrido_segundos)}}`
+                + (dados.cancelamento_solicitado ? ' · cancelando...' : '');
+        }}
+
+        function acompanharTarefa(tarefaId) {{
+            const btn = document.querySelector('.btn-success');
+            btn.textContent = '⏳ Executando...';
+            btn.disabled = true;
+            document.getElementById('painel-progresso').style.display = 'block';
+
+            fluxoProgresso = new EventSource(`/api/progresso/${{tarefaId}}/eventos`);
+            fluxoProgresso.addEventListener('progresso', e => mostrarProgresso(JSON.parse(e.data)));
+            fluxoProgresso.addEventListener('fim', e => {{
+                fluxoProgresso.close();
+                // O resultado fica persistido na tarefa
+                fetch(`/api/tarefas/${{tarefaId}}`)
+                    .then(response => response.json())
+                    .then(data => {{
+                        const tarefa = data.tarefa || {{}};
+                        if (tarefa.estado === 'concluido') {{
+                            alert(`Diagnóstico concluído!\\n\\nGCPJs processados: ${{tarefa.resultado.gcpjs_processados}}\\nTaxa média: ${{tarefa.resultado.taxa_media}}%`);
+                            location.reload();
+                        }} else if (tarefa.estado === 'cancelado') {{
+                            alert('Diagnóstico cancelado.');
+                        }} else {{
+                            alert('Erro: ' + (tarefa.erro || data.error || 'tarefa não encontrada'));
+                        }}
+                    }})
+                    .finally(() => encerrarProgresso());
+            }});
+        }}
+
+        function encerrarProgresso() {{
+            if (fluxoProgresso) fluxoProgresso.close();
+            document.getElementById('painel-progresso').style.display = 'none';
+            document.getElementById('btn-cancelar').disabled = false;
+            const btn = document.querySelector('.btn-success');
+            btn.textContent = '🔍 Executar Diagnóstico';
+            btn.disabled = false;
+            execucaoAtual = null;
+        }}
+
+        function cancelarExecucao() {{
+            if (execucaoAtual && confirm('Cancelar a execução em andamento?')) {{
+                fetch(`/api/tarefas/${{execucaoAtual}}/cancelar`, {{ method: 'POST' }});
+                document.getElementById('btn-cancelar').disabled = true;
+            }}
+        }}
+
         function executarDiagnostico() {{
             if (confirm('Executar diagnóstico de completude? Isso pode demorar alguns minutos.')) {{
-                const btn = document.querySelector('.btn-success');
-                btn.textContent = '⏳ Executando...';
-                btn.disabled = true;
-                
                 fetch('/api/executar_diagnostico', {{ method: 'POST' }})
                     .then(response => response.json())
                     .then(data => {{
                         if (data.success) {{
-                            alert(`Diagnóstico concluído!\\n\\nGCPJs processados: ${{data.gcpjs_processados}}\\nTaxa média: ${{data.taxa_media}}%`);
-                            location.reload();
+                            execucaoAtual = data.tarefa_id;
+                            acompanharTarefa(data.tarefa_id);
                         }} else {{
                             alert('Erro: ' + data.error);
                         }}
@@ -755,13 +1198,20 @@ def dashboard():
                     .catch(error => {{
                         alert('Erro: ' + error);
                         console.error('Erro completo:', error);
-                    }})
-                    .finally(() => {{
-                        btn.textContent = '🔍 Executar Diagnóstico';
-                        btn.disabled = false;
                     }});
             }}
         }}
+
+        // Ao abrir a página, retoma o acompanhamento de um diagnóstico já em andamento
+        fetch('/api/tarefas?tipo=diagnostico')
+            .then(response => response.json())
+            .then(data => {{
+                const ativa = (data.tarefas || []).find(t => t.estado === 'na_fila' || t.estado === 'executando');
+                if (ativa) {{
+                    execucaoAtual = ativa.id;
+                    acompanharTarefa(ativa.id);
+                }}
+            }});
         
         function executarMigracao() {{
             alert('Funcionalidade de migração será implementada na próxima versão.');
@@ -795,9 +1245,10 @@ def dashboard():
         <pre style="background: #1a1a1a; color: #ff6b6b; padding: 20px; margin: 20px; overflow: auto;">
 {traceback.format_exc()}
         </pre>
-        """
+        """, 500
 
 @app.route('/fontes')
+@cache_paginas.pagina('fontes')
 def page_fontes():
     """Página de gestão de fontes"""
     try:
@@ -993,13 +1444,13 @@ def page_fontes():
         return html
         
     except Exception as e:
-        return f"<h1>Erro</h1><p>{str(e)}</p><pre>{traceback.format_exc()}</pre>"
+        return f"<h1>Erro</h1><p>{str(e)}</p><pre>{traceback.format_exc()}</pre>", 500
 
 @app.route('/escopo')
 def page_escopo():
     """Página de gestão de escopo"""
     try:
-        escopo = sistema.obter_escopo()
+        total_escopo = sistema.contar_escopo()
         
         html = f"""
 <!DOCTYPE html>
@@ -1058,7 +1509,7 @@ def page_escopo():
     <div class="container">
         <div class="cards">
             <div class="card">
-                <div class="stat-value">{len(escopo):,}</div>
+                <div class="stat-value">{total_escopo:,}</div>
                 <div>GCPJs no Escopo</div>
             </div>
             <div class="card">
@@ -1137,27 +1588,77 @@ def page_escopo():
         
         <div class="section">
             <h3>📋 GCPJs no Escopo</h3>
+            <div style="display: flex; gap: 10px; margin-bottom: 15px;">
+                <input type="text" id="busca_escopo" placeholder="Buscar GCPJ por prefixo..." oninput="recarregarEscopo()"
+                       style="flex: 1; padding: 8px; border: 1px solid #4a5568; border-radius: 4px; background: #1a1a1a; color: white;">
+                <select id="ordem_escopo" onchange="recarregarEscopo()" style="width: 200px;">
+                    <option value="recentes">Mais recentes</option>
+                    <option value="gcpj">GCPJ crescente</option>
+                </select>
+            </div>
+            <div id="total_filtrado_escopo" style="margin-bottom: 10px;"></div>
             <table>
                 <thead>
                     <tr><th>GCPJ</th><th>Motivo</th><th>Data</th></tr>
                 </thead>
-                <tbody>
-                    {"".join([f'''
-                    <tr>
-                        <td>{row["gcpj"]}</td>
-                        <td>{row["motivo"]}</td>
-                        <td>{row["data_inclusao"][:10] if row["data_inclusao"] else "N/A"}</td>
-                    </tr>
-                    ''' for _, row in escopo.head(20).iterrows()]) if not escopo.empty else '''
-                    <tr><td colspan="3" style="text-align: center;">Nenhum GCPJ no escopo</td></tr>
-                    '''}
-                    {f'<tr><td colspan="3" style="text-align: center;"><em>... e mais {len(escopo)-20} GCPJs</em></td></tr>' if len(escopo) > 20 else ''}
+                <tbody id="tabela_escopo">
                 </tbody>
             </table>
+            <div style="text-align: center; margin-top: 15px;">
+                <button class="btn" id="mais_escopo" onclick="carregarEscopo()" style="display: none;">Carregar mais</button>
+            </div>
         </div>
     </div>
     
     <script>
+        // === LISTAGEM PAGINADA DO ESCOPO ===
+        let cursorEscopo = null;
+        let requisicaoEscopo = 0;
+        
+        function recarregarEscopo() {{
+            cursorEscopo = null;
+            document.getElementById('tabela_escopo').innerHTML = '';
+            carregarEscopo();
+        }}
+        
+        function carregarEscopo() {{
+            const params = new URLSearchParams({{
+                busca: document.getElementById('busca_escopo').value.trim(),
+                ordem: document.getElementById('ordem_escopo').value
+            }});
+            if (cursorEscopo !== null) params.set('apos', cursorEscopo);
+            
+            // Respostas de buscas já substituídas são descartadas
+            const requisicao = ++requisicaoEscopo;
+            fetch('/api/escopo?' + params)
+                .then(response => response.json())
+                .then(data => {{
+                    if (requisicao !== requisicaoEscopo) return;
+                    const tabela = document.getElementById('tabela_escopo');
+                    
+                    data.itens.forEach(item => {{
+                        const linha = tabela.insertRow();
+                        linha.insertCell().textContent = item.gcpj;
+                        linha.insertCell().textContent = item.motivo || '';
+                        linha.insertCell().textContent = item.data_inclusao ? item.data_inclusao.substring(0, 10) : 'N/A';
+                    }});
+                    if (!tabela.rows.length) {{
+                        tabela.innerHTML = '<tr><td colspan="3" style="text-align: center;">Nenhum GCPJ no escopo</td></tr>';
+                    }}
+                    
+                    // O total só vem na primeira página de cada busca
+                    if (data.total !== undefined) {{
+                        document.getElementById('total_filtrado_escopo').textContent =
+                            `${{data.total.toLocaleString()}} GCPJs encontrados`;
+                    }}
+                    cursorEscopo = data.proximo;
+                    document.getElementById('mais_escopo').style.display = data.proximo !== null ? 'inline-block' : 'none';
+                }})
+                .catch(error => alert('Erro ao carregar escopo: ' + error));
+        }}
+        
+        recarregarEscopo();
+        
         // === FUNÇÕES DE ABAS ===
         function switchTab(tabName) {{
             // Remover classe active de todas as abas
@@ -1329,7 +1830,7 @@ def page_escopo():
                 document.getElementById('progress_bar').style.width = '100%';
                 
                 if (data.success) {{
-                    alert(`Upload concluído!\\n\\nGCPJs processados: ${{data.processados}}\\nGCPJs adicionados: ${{data.adicionados}}\\nDuplicados ignorados: ${{data.duplicados}}`);
+                    alert(`Upload concluído!\\n\\nGCPJs processados: ${{data.processados}}\\nGCPJs adicionados: ${{data.adicionados}}\\nDuplicados ignorados: ${{data.duplicados}}\\nInválidos: ${{data.invalidos}}`);
                     location.reload();
                 }} else {{
                     alert('Erro no upload: ' + data.error);
@@ -1366,54 +1867,54 @@ def page_escopo():
         return f"<h1>Erro</h1><p>{str(e)}</p><pre>{traceback.format_exc()}</pre>"
 
 @app.route('/qualidade')
+@cache_paginas.pagina('execucao')
 def page_qualidade():
     """Página de controle de qualidade com análise por coluna"""
     try:
         # Obter última execução
-        conn = sqlite3.connect(sistema.db_path)
-        
-        ultima_execucao = pd.read_sql_query('''
-            SELECT id FROM execucoes WHERE tipo = 'diagnostico_completude' ORDER BY id DESC LIMIT 1
-        ''', conn)
-        
-        if ultima_execucao.empty:
-            conn.close()
-            return """
-            <h1>Controle de Qualidade</h1>
-            <p>Nenhum diagnóstico encontrado. <a href="/diagnostico">Execute um diagnóstico primeiro</a>.</p>
-            """
-        
-        execucao_id = ultima_execucao.iloc[0]['id']
-        
-        # Estatísticas por coluna
-        stats_colunas = pd.read_sql_query('''
-            SELECT 
-                coluna_template,
-                COUNT(*) as total_registros,
-                SUM(CASE WHEN disponivel = 1 THEN 1 ELSE 0 END) as registros_preenchidos,
-                SUM(CASE WHEN disponivel = 0 THEN 1 ELSE 0 END) as registros_faltantes,
-                ROUND(AVG(CASE WHEN disponivel = 1 THEN 100.0 ELSE 0.0 END), 2) as taxa_completude
-            FROM diagnostico_completude 
-            WHERE execucao_id = ?
-            GROUP BY coluna_template
-            ORDER BY taxa_completude DESC
-        ''', conn, params=(execucao_id,))
+        with conexao(sistema.db_path) as conn:
+        
+            ultima_execucao = pd.read_sql_query('''
+                SELECT id FROM execucoes WHERE tipo = 'diagnostico_completude' ORDER BY id DESC LIMIT 1
+            ''', conn)
+        
+            if ultima_execucao.empty:
+                return """
+                <h1>Controle de Qualidade</h1>
+                <p>Nenhum diagnóstico encontrado. <a href="/diagnostico">Execute um diagnóstico primeiro</a>.</p>
+                """
+        
+            execucao_id = int(ultima_execucao.iloc[0]['id'])
         
-        conn.close()
+        # Histograma e categorias (rollups da execução)
+        histograma = sistema.obter_histograma_completude(execucao_id)
+        categorias = sistema.obter_totais_categoria(execucao_id)
         
         # Obter coluna específica se solicitada
         coluna_filtro = request.args.get('coluna')
         detalhes_coluna = None
         
         if coluna_filtro:
-            conn = sqlite3.connect(sistema.db_path)
-            detalhes_coluna = pd.read_sql_query('''
-                SELECT gcpj, disponivel, fonte, motivo_falta
-                FROM diagnostico_completude 
-                WHERE execucao_id = ? AND coluna_template = ? AND disponivel = 0
-                ORDER BY gcpj
-            ''', conn, params=(execucao_id, coluna_filtro))
-            conn.close()
+            detalhes_coluna = sistema.obter_faltantes_coluna(execucao_id, coluna_filtro)
+        
+        # Tabela por coluna é a mesma para qualquer ?coluna= da execução
+        linhas_colunas = cache_paginas.fragmento(('qualidade_colunas', execucao_id), lambda: "".join([f'''
+                    <tr>
+                        <td><strong>{row["coluna_template"]}</strong></td>
+                        <td>
+                            <div class="progress-bar">
+                                <div class="progress-fill" style="width: {row["taxa_completude"] if pd.notna(row["taxa_completude"]) else 0}%; background: {'#48bb78' if (row["taxa_completude"] if pd.notna(row["taxa_completude"]) else 0) >= 80 else '#ed8936' if (row["taxa_completude"] if pd.notna(row["taxa_completude"]) else 0) >= 50 else '#f56565'}"></div>
+                            </div>
+                            {row["taxa_completude"] if pd.notna(row["taxa_completude"]) else 0:.1f}%
+                        </td>
+                        <td>{row["registros_preenchidos"] if pd.notna(row["registros_preenchidos"]) else 0:,}</td>
+                        <td>{row["registros_faltantes"] if pd.notna(row["registros_faltantes"]) else 0:,}</td>
+                        <td>
+                            <a href="/qualidade?coluna={row["coluna_template"]}" class="btn">Ver GCPJs</a>
+                            <a href="/api/exportar_gcpjs_coluna/{row["coluna_template"]}" class="btn" style="background: #ed8936;">📄 Exportar</a>
+                        </td>
+                    </tr>
+                    ''' for _, row in sistema.obter_completude_colunas(execucao_id, ordem='DESC').iterrows()]))
         
         html = f"""
 <!DOCTYPE html>
@@ -1466,24 +1967,52 @@ def page_qualidade():
                         <th>Ação</th>
                     </tr>
                 </thead>
+                <tbody>
+                    {linhas_colunas}
+                </tbody>
+            </table>
+        </div>
+        
+        <div class="section">
+            <h2>📊 Distribuição de Completude por GCPJ</h2>
+            <table>
+                <thead>
+                    <tr>
+                        <th>Faixa</th>
+                        <th>GCPJs</th>
+                    </tr>
+                </thead>
                 <tbody>
                     {"".join([f'''
                     <tr>
-                        <td><strong>{row["coluna_template"]}</strong></td>
-                        <td>
-                            <div class="progress-bar">
-                                <div class="progress-fill" style="width: {row["taxa_completude"] if pd.notna(row["taxa_completude"]) else 0}%; background: {'#48bb78' if (row["taxa_completude"] if pd.notna(row["taxa_completude"]) else 0) >= 80 else '#ed8936' if (row["taxa_completude"] if pd.notna(row["taxa_completude"]) else 0) >= 50 else '#f56565'}"></div>
-                            </div>
-                            {row["taxa_completude"] if pd.notna(row["taxa_completude"]) else 0:.1f}%
-                        </td>
-                        <td>{row["registros_preenchidos"] if pd.notna(row["registros_preenchidos"]) else 0:,}</td>
-                        <td>{row["registros_faltantes"] if pd.notna(row["registros_faltantes"]) else 0:,}</td>
-                        <td>
-                            <a href="/qualidade?coluna={row["coluna_template"]}" class="btn">Ver GCPJs</a>
-                            <a href="/api/exportar_gcpjs_coluna/{row["coluna_template"]}" class="btn" style="background: #ed8936;">📄 Exportar</a>
-                        </td>
+                        <td>{"100%" if row["faixa"] >= 10 else f"{row['faixa'] * 10}% - {row['faixa'] * 10 + 9}%"}</td>
+                        <td>{row["gcpjs"]:,}</td>
+                    </tr>
+                    ''' for _, row in histograma.iterrows()])}
+                </tbody>
+            </table>
+        </div>
+        
+        <div class="section">
+            <h2>🗂️ Totais por Categoria de Coluna</h2>
+            <table>
+                <thead>
+                    <tr>
+                        <th>Categoria</th>
+                        <th>Colunas</th>
+                        <th>Preenchidos</th>
+                        <th>Faltantes</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {"".join([f'''
+                    <tr>
+                        <td>{row["categoria"]}</td>
+                        <td>{row["colunas"]}</td>
+                        <td>{row["registros_preenchidos"]:,}</td>
+                        <td>{row["registros_faltantes"]:,}</td>
                     </tr>
-                    ''' for _, row in stats_colunas.iterrows()])}
+                    ''' for _, row in categorias.iterrows()])}
                 </tbody>
             </table>
         </div>
@@ -1507,36 +2036,77 @@ def page_qualidade():
         return html
         
     except Exception as e:
-        return f"<h1>Erro</h1><p>{str(e)}</p><pre>{traceback.format_exc()}</pre>"
+        return f"<h1>Erro</h1><p>{str(e)}</p><pre>{traceback.format_exc()}</pre>", 500
 
 # =================== APIs FUNCIONAIS ===================
 
+def tarefa_diagnostico(progresso):
+    """Tarefa do executor: roda o diagnóstico e devolve o resumo (persistido em JSON)"""
+    resultados = sistema.executar_diagnostico_completude(progresso)
+    if not resultados:
+        raise ValueError('Nenhum resultado gerado')
+    
+    total_gcpjs = len(resultados)
+    return {
+        'gcpjs_processados': total_gcpjs,
+        'taxa_media': round(resultados.taxa_media(), 2),
+        'message': f'Diagnóstico concluído para {total_gcpjs} GCPJs'
+    }
+
 @app.route('/api/executar_diagnostico', methods=['POST'])
 def api_executar_diagnostico():
-    """API para executar diagnóstico de completude"""
+    """API para enfileirar o diagnóstico de completude (responde na hora com o id da tarefa)"""
     try:
-        sistema.logger.info("API: Iniciando diagnóstico de completude")
-        
-        resultados = sistema.executar_diagnostico_completude()
-        
-        if not resultados:
-            return jsonify({'success': False, 'error': 'Nenhum resultado gerado'})
-        
-        # Calcular estatísticas
-        total_gcpjs = len(resultados)
-        taxa_media = sum(r['taxa_completude'] for r in resultados) / total_gcpjs
+        tarefa_id, reaproveitada = executor_diagnosticos.submeter(
+            'diagnostico', tarefa_diagnostico,
+            chave=sistema.chave_diagnostico(),
+            memoria_mb=sistema.estimar_memoria_diagnostico_mb()
+        )
+        sistema.logger.info(f"API: Diagnóstico {'já em andamento' if reaproveitada else 'enfileirado'} ({tarefa_id})")
         
         return jsonify({
             'success': True,
-            'gcpjs_processados': total_gcpjs,
-            'taxa_media': round(taxa_media, 2),
-            'message': f'Diagnóstico concluído para {total_gcpjs} GCPJs'
-        })
+            'tarefa_id': tarefa_id,
+            'reaproveitada': reaproveitada,
+            'tarefa': executor_diagnosticos.obter(tarefa_id)
+        }), 202
         
     except Exception as e:
         sistema.logger.error(f"Erro na API de diagnóstico: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/tarefas')
+def api_listar_tarefas():
+    """API com as tarefas recentes do executor (mais recentes primeiro)"""
+    return jsonify({'tarefas': executor_diagnosticos.listar(tipo=request.args.get('tipo'))})
+
+@app.route('/api/tarefas/<tarefa_id>')
+def api_obter_tarefa(tarefa_id):
+    """API com estado, resultado e progresso de uma tarefa (inclusive de antes de um reinício)"""
+    tarefa = executor_diagnosticos.obter(tarefa_id)
+    if tarefa is None:
+        return jsonify({'success': False, 'error': 'Tarefa não encontrada'}), 404
+    return jsonify({'success': True, 'tarefa': tarefa})
+
+@app.route('/api/progresso')
+def api_listar_progresso():
+    """API com o estado das execuções recentes (mais recentes primeiro)"""
+    return jsonify({'execucoes': executor_diagnosticos.listar_progresso()})
+
+@app.route('/api/progresso/eventos')
+@app.route('/api/progresso/<execucao_id>/eventos')
+def api_eventos_progresso(execucao_id=None):
+    """Fluxo SSE com fase, feitos/total, taxa e ETA da execução"""
+    return resposta_eventos(executor_diagnosticos, execucao_id=execucao_id, tipo=request.args.get('tipo'))
+
+@app.route('/api/tarefas/<tarefa_id>/cancelar', methods=['POST'])
+@app.route('/api/progresso/<tarefa_id>/cancelar', methods=['POST'])
+def api_cancelar_execucao(tarefa_id):
+    """API para cancelar uma tarefa na fila ou em execução"""
+    if not executor_diagnosticos.cancelar(tarefa_id):
+        return jsonify({'success': False, 'error': 'Tarefa não encontrada ou já encerrada'}), 404
+    return jsonify({'success': True})
+
 @app.route('/api/fontes/adicionar', methods=['POST'])
 def api_adicionar_fonte():
     """API para adicionar fonte"""
@@ -1560,15 +2130,38 @@ def api_testar_fonte(fonte_id):
 def api_remover_fonte(fonte_id):
     """API para remover fonte"""
     try:
-        conn = sqlite3.connect(sistema.db_path)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE fontes SET ativa = 0 WHERE id = ?", (fonte_id,))
-        conn.commit()
-        conn.close()
+        with conexao(sistema.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE fontes SET ativa = 0 WHERE id = ?", (fonte_id,))
+            sistema.registrar_alteracao(conn, 'fontes')
+            conn.commit()
+        sistema.fontes_carregadas.invalidar_fonte(fonte_id)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/escopo')
+def api_listar_escopo():
+    """API paginada do escopo: busca (prefixo), ordem ('recentes' ou 'gcpj'), apos (cursor) e limite
+    
+    O total (COUNT na faixa da busca) só é calculado na primeira página, sem cursor.
+    """
+    try:
+        busca = request.args.get('busca', '').strip()
+        apos = request.args.get('apos') or None
+        limite = min(max(request.args.get('limite', TAMANHO_PAGINA_ESCOPO, type=int), 1), LIMITE_PAGINA_ESCOPO)
+        pagina = sistema.obter_pagina_escopo(
+            busca=busca,
+            ordem=request.args.get('ordem', 'recentes'),
+            apos=apos,
+            limite=limite
+        )
+        if apos is None:
+            pagina['total'] = sistema.contar_escopo(busca)
+        return jsonify(pagina)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/escopo/adicionar', methods=['POST'])
 def api_adicionar_escopo():
     """API para adicionar GCPJs ao escopo"""
@@ -1644,49 +2237,24 @@ def api_upload_escopo():
             arquivo.save(temp_file.name)
             
             try:
-                # Ler arquivo
-                if arquivo.filename.endswith('.xlsx'):
-                    # Para Excel, usar a aba especificada
-                    try:
-                        df = pd.read_excel(temp_file.name, sheet_name=aba)
-                    except Exception:
-                        # Se falhar, tentar primeira aba
-                        df = pd.read_excel(temp_file.name, sheet_name=0)
-                elif arquivo.filename.endswith('.csv'):
-                    df = pd.read_csv(temp_file.name)
-                else:
-                    return jsonify({'success': False, 'error': 'Formato não suportado'})
-                
-                # Verificar se coluna existe
-                if coluna_gcpj not in df.columns:
-                    return jsonify({'success': False, 'error': f'Coluna "{coluna_gcpj}" não encontrada no arquivo'})
-                
-                # Extrair GCPJs
-                gcpjs_raw = df[coluna_gcpj].dropna().astype(str).tolist()
-                gcpjs_limpos = []
-                
-                for gcpj in gcpjs_raw:
-                    gcpj_limpo = str(gcpj).strip()
-                    # Remover pontos, traços, espaços
-                    gcpj_limpo = ''.join(filter(str.isdigit, gcpj_limpo))
-                    
-                    if gcpj_limpo and len(gcpj_limpo) >= 6:  # Validação básica
-                        gcpjs_limpos.append(gcpj_limpo)
+                # Ler só a coluna de GCPJ em blocos e carregar no escopo em massa
+                try:
+                    resumo = sistema.importar_escopo_arquivo(
+                        temp_file.name, coluna_gcpj, aba=aba,
+                        motivo=f"{motivo} ({arquivo.filename})"
+                    )
+                except ValueError as e:
+                    return jsonify({'success': False, 'error': str(e)})
                 
-                if not gcpjs_limpos:
+                if resumo['processados'] == 0:
                     return jsonify({'success': False, 'error': 'Nenhum GCPJ válido encontrado no arquivo'})
                 
-                # Adicionar ao escopo
-                adicionados = sistema.adicionar_gcpjs_escopo(
-                    gcpjs_limpos, 
-                    f"{motivo} ({arquivo.filename})"
-                )
-                
                 return jsonify({
                     'success': True,
-                    'processados': len(gcpjs_limpos),
-                    'adicionados': adicionados,
-                    'duplicados': len(gcpjs_limpos) - adicionados,
+                    'processados': resumo['processados'],
+                    'adicionados': resumo['adicionados'],
+                    'duplicados': resumo['duplicados'],
+                    'invalidos': resumo['invalidos'],
                     'arquivo': arquivo.filename
                 })
                 
@@ -1702,73 +2270,55 @@ def api_upload_escopo():
 def api_limpar_escopo():
     """API para limpar escopo"""
     try:
-        conn = sqlite3.connect(sistema.db_path)
-        cursor = conn.cursor()
-        cursor.execute("UPDATE escopo_gcpj SET ativo = 0")
-        conn.commit()
-        conn.close()
+        with conexao(sistema.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("UPDATE escopo_gcpj SET ativo = 0")
+            sistema.registrar_alteracao(conn, 'escopo')
+            conn.commit()
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/escopo/exportar')
 def api_exportar_escopo():
-    """API para exportar escopo"""
+    """API para exportar escopo (?formato=xlsx ou csv) em streaming"""
     try:
-        escopo = sistema.obter_escopo()
-        
-        output = BytesIO()
-        escopo[['gcpj', 'motivo', 'data_inclusao']].to_excel(output, index=False, sheet_name='Escopo_GCPJ')
-        output.seek(0)
-        
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=f'escopo_gcpj_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return resposta_exportacao(
+            sistema.iterar_escopo(),
+            ['gcpj', 'motivo', 'data_inclusao'],
+            'escopo_gcpj',
+            formato=request.args.get('formato', 'xlsx'),
+            nome_aba='Escopo_GCPJ'
         )
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/exportar_gcpjs_coluna/<coluna>')
 def api_exportar_gcpjs_coluna(coluna):
-    """API para exportar GCPJs sem dados para uma coluna específica"""
+    """API para exportar GCPJs sem dados para uma coluna específica (?formato=xlsx ou csv)"""
     try:
-        conn = sqlite3.connect(sistema.db_path)
+        with conexao(sistema.db_path) as conn:
         
-        # Obter última execução
-        ultima_execucao = pd.read_sql_query('''
-            SELECT id FROM execucoes WHERE tipo = 'diagnostico_completude' ORDER BY id DESC LIMIT 1
-        ''', conn)
+            # Obter última execução
+            ultima_execucao = conn.execute('''
+                SELECT id FROM execucoes WHERE tipo = 'diagnostico_completude' ORDER BY id DESC LIMIT 1
+            ''').fetchone()
         
-        if ultima_execucao.empty:
-            conn.close()
+        if ultima_execucao is None:
             return jsonify({'success': False, 'error': 'Nenhum diagnóstico encontrado'})
         
-        execucao_id = ultima_execucao.iloc[0]['id']
-        
-        # Obter GCPJs faltantes para a coluna
-        gcpjs_faltantes = pd.read_sql_query('''
-            SELECT gcpj, fonte, motivo_falta
-            FROM diagnostico_completude 
-            WHERE execucao_id = ? AND coluna_template = ? AND disponivel = 0
-            ORDER BY gcpj
-        ''', conn, params=(execucao_id, coluna))
+        # GCPJs faltantes para a coluna, lidos sob demanda
+        tem_linhas, gcpjs_faltantes = espiar_linhas(sistema.iterar_faltantes_coluna(ultima_execucao[0], coluna))
         
-        conn.close()
-        
-        if gcpjs_faltantes.empty:
+        if not tem_linhas:
             return jsonify({'success': False, 'error': 'Nenhum GCPJ faltante para esta coluna'})
         
-        output = BytesIO()
-        gcpjs_faltantes.to_excel(output, index=False, sheet_name=f'GCPJs_Faltantes_{coluna[:20]}')
-        output.seek(0)
-        
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=f'gcpjs_faltantes_{coluna}_{datetime.now().strftime("%Y%m%d_%H%M")}.xlsx',
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        return resposta_exportacao(
+            gcpjs_faltantes,
+            ['gcpj', 'fonte', 'motivo_falta'],
+            f'gcpjs_faltantes_{coluna}',
+            formato=request.args.get('formato', 'xlsx'),
+            nome_aba=f'GCPJs_Faltantes_{coluna[:20]}'
         )
         
     except Exception as e:
@@ -23,7 +23,14 @@ import pandas as pd
 import os
 import json
 from datetime import datetime
-import sqlite3
+from conexao_sqlite import conexao
+from migracoes_schema import aplicar_migracoes
+from importacao_escopo import carregar_gcpjs_escopo, importar_arquivo_escopo
+from progresso_execucao import PainelProgresso, ExecucaoCancelada, PROGRESSO_NULO, resposta_eventos
+from executor_tarefas import ExecutorTarefas
+from cache_fontes_memoria import CacheFontesMemoria, LIMITE_MEMORIA_FONTES_MB, chave_fonte
+from pre_carregamento_fontes import pre_carregar
+from amostragem_fontes import amostrar_gcpjs, indexar_por_gcpj
 from io import BytesIO
 from collections import defaultdict
 import logging
@@ -41,219 +48,216 @@ class MasterDatabaseManager:
     
     def init_master_database(self):
         """Inicializa banco master com todas as tabelas necessárias"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 1. Tabela de escopo de GCPJs
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS gcpj_escopo (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                gcpj TEXT UNIQUE NOT NULL,
-                ativo BOOLEAN DEFAULT 1,
-                motivo_inclusao TEXT,
-                data_inclusao TEXT,
-                observacoes TEXT
-            )
-        ''')
-        
-        # 2. Tabela de fontes de dados
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fontes_dados (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome_fonte TEXT UNIQUE NOT NULL,
-                tipo_fonte TEXT NOT NULL,
-                caminho_arquivo TEXT,
-                aba_planilha TEXT,
-                coluna_gcpj TEXT NOT NULL,
-                ativa BOOLEAN DEFAULT 1,
-                prioridade INTEGER DEFAULT 10,
-                descricao TEXT,
-                data_criacao TEXT
-            )
-        ''')
-        
-        # 3. Tabela de mapeamento por coluna
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS mapeamento_colunas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                coluna_template TEXT NOT NULL,
-                fonte_id INTEGER,
-                coluna_origem TEXT NOT NULL,
-                prioridade INTEGER DEFAULT 10,
-                ativa BOOLEAN DEFAULT 1,
-                tipo_mapeamento TEXT DEFAULT 'direto',
-                valor_constante TEXT,
-                observacoes TEXT,
-                FOREIGN KEY (fonte_id) REFERENCES fontes_dados (id)
-            )
-        ''')
-        
-        # 4. Tabela da estrutura do template
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS template_colunas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                coluna_nome TEXT UNIQUE NOT NULL,
-                posicao INTEGER,
-                tipo_dados TEXT,
-                obrigatoria BOOLEAN DEFAULT 0,
-                descricao TEXT,
-                categoria TEXT
-            )
-        ''')
-        
-        # 5. Tabela de histórico de execuções
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS execucoes_master (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                tipo_execucao TEXT NOT NULL,
-                configuracao_fontes TEXT,
-                escopo_gcpjs INTEGER,
-                registros_processados INTEGER,
-                registros_exportados INTEGER,
-                taxa_sucesso REAL,
-                observacoes TEXT,
-                arquivo_resultado TEXT
-            )
-        ''')
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
+        
+            # 1. Tabela de escopo de GCPJs
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS gcpj_escopo (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    gcpj TEXT UNIQUE NOT NULL,
+                    ativo BOOLEAN DEFAULT 1,
+                    motivo_inclusao TEXT,
+                    data_inclusao TEXT,
+                    observacoes TEXT
+                )
+            ''')
+        
+            # 2. Tabela de fontes de dados
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fontes_dados (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome_fonte TEXT UNIQUE NOT NULL,
+                    tipo_fonte TEXT NOT NULL,
+                    caminho_arquivo TEXT,
+                    aba_planilha TEXT,
+                    coluna_gcpj TEXT NOT NULL,
+                    ativa BOOLEAN DEFAULT 1,
+                    prioridade INTEGER DEFAULT 10,
+                    descricao TEXT,
+                    data_criacao TEXT
+                )
+            ''')
+        
+            # 3. Tabela de mapeamento por coluna
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS mapeamento_colunas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    coluna_template TEXT NOT NULL,
+                    fonte_id INTEGER,
+                    coluna_origem TEXT NOT NULL,
+                    prioridade INTEGER DEFAULT 10,
+                    ativa BOOLEAN DEFAULT 1,
+                    tipo_mapeamento TEXT DEFAULT 'direto',
+                    valor_constante TEXT,
+                    observacoes TEXT,
+                    FOREIGN KEY (fonte_id) REFERENCES fontes_dados (id)
+                )
+            ''')
+        
+            # 4. Tabela da estrutura do template
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS template_colunas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    coluna_nome TEXT UNIQUE NOT NULL,
+                    posicao INTEGER,
+                    tipo_dados TEXT,
+                    obrigatoria BOOLEAN DEFAULT 0,
+                    descricao TEXT,
+                    categoria TEXT
+                )
+            ''')
+        
+            # 5. Tabela de histórico de execuções
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS execucoes_master (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    tipo_execucao TEXT NOT NULL,
+                    configuracao_fontes TEXT,
+                    escopo_gcpjs INTEGER,
+                    registros_processados INTEGER,
+                    registros_exportados INTEGER,
+                    taxa_sucesso REAL,
+                    observacoes TEXT,
+                    arquivo_resultado TEXT
+                )
+            ''')
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+
+            # Aplicar migrações de schema pendentes (índices etc.)
+            aplicar_migracoes(conn, 'master_database')
         
         # Inicializar dados básicos se necessário
         self.inicializar_dados_basicos()
     
     def inicializar_dados_basicos(self):
         """Inicializa dados básicos se o banco estiver vazio"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
         
-        # Verificar se já existem dados
-        cursor.execute("SELECT COUNT(*) FROM fontes_dados")
-        if cursor.fetchone()[0] == 0:
-            print("Inicializando dados básicos do master database...")
+            # Verificar se já existem dados
+            cursor.execute("SELECT COUNT(*) FROM fontes_dados")
+            if cursor.fetchone()[0] == 0:
+                print("Inicializando dados básicos do master database...")
             
-            # Fontes padrão baseadas no projeto existente
-            fontes_padrao = [
-                ("Fonte Principal GCPJ", "excel", "cópia-MOYA E LARA_BASE GCPJ ATIVOS - 07_04_2025.xlsx", "Sheet1", "GCPJ", 1, 2, "Fonte principal com dados jurídicos"),
-                ("Base Ativa Escritório", "excel", "4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx", "Sheet1", "GCPJ", 1, 3, "Base secundária via GCPJ"),
-                ("Template Bradesco", "excel", "template-banco-bradesco-sa.xlsx", "Sheet", "CÓD. INTERNO", 1, 1, "Template de destino")
-            ]
+                # Fontes padrão baseadas no projeto existente
+                fontes_padrao = [
+                    ("Fonte Principal GCPJ", "excel", "cópia-MOYA E LARA_BASE GCPJ ATIVOS - 07_04_2025.xlsx", "Sheet1", "GCPJ", 1, 2, "Fonte principal com dados jurídicos"),
+                    ("Base Ativa Escritório", "excel", "4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx", "Sheet1", "GCPJ", 1, 3, "Base secundária via GCPJ"),
+                    ("Template Bradesco", "excel", "template-banco-bradesco-sa.xlsx", "Sheet", "CÓD. INTERNO", 1, 1, "Template de destino")
+                ]
             
-            cursor.executemany('''
-                INSERT INTO fontes_dados (nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj, ativa, prioridade, descricao)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', fontes_padrao)
+                cursor.executemany('''
+                    INSERT INTO fontes_dados (nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj, ativa, prioridade, descricao)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', fontes_padrao)
             
-            # Template colunas básicas baseadas no config.py
-            colunas_template = [
-                ("CÓD. INTERNO", 1, "texto", 1, "Código interno GCPJ", "identificacao"),
-                ("PROCESSO", 2, "texto", 1, "Número do processo", "juridico"),
-                ("PROCEDIMENTO", 3, "texto", 0, "Tipo de ação/procedimento", "juridico"),
-                ("NOME PARTE CONTRÁRIA PRINCIPAL", 4, "texto", 1, "Nome da parte contrária", "identificacao"),
-                ("CPF/CNPJ", 5, "texto", 1, "Documento da parte", "identificacao"),
-                ("ORGANIZAÇÃO CLIENTE", 6, "texto", 0, "Organização cliente", "organizacional"),
-                ("TIPO DE OPERAÇÃO/CARTEIRA", 7, "texto", 0, "Tipo de operação", "financeiro"),
-                ("AGÊNCIA", 8, "texto", 0, "Agência", "financeiro"),
-                ("CONTA", 9, "texto", 0, "Conta", "financeiro"),
-                ("VARA", 10, "texto", 0, "Vara", "juridico"),
-                ("COMARCA", 11, "texto", 0, "Comarca", "juridico"),
-                ("UF", 12, "texto", 0, "UF", "geografico"),
-                ("ESCRITÓRIO", 13, "texto", 0, "Escritório", "organizacional"),
-                ("MONITORAMENTO", 14, "texto", 0, "Monitoramento", "controle"),
-                ("SEGMENTO DO CONTRATO", 15, "texto", 0, "Segmento do contrato", "financeiro"),
-                ("OPERAÇÃO", 16, "texto", 0, "Operação", "financeiro")
-            ]
+                # Template colunas básicas baseadas no config.py
+                colunas_template = [
+                    ("CÓD. INTERNO", 1, "texto", 1, "Código interno GCPJ", "identificacao"),
+                    ("PROCESSO", 2, "texto", 1, "Número do processo", "juridico"),
+                    ("PROCEDIMENTO", 3, "texto", 0, "Tipo de ação/procedimento", "juridico"),
+                    ("NOME PARTE CONTRÁRIA PRINCIPAL", 4, "texto", 1, "Nome da parte contrária", "identificacao"),
+                    ("CPF/CNPJ", 5, "texto", 1, "Documento da parte", "identificacao"),
+                    ("ORGANIZAÇÃO CLIENTE", 6, "texto", 0, "Organização cliente", "organizacional"),
+                    ("TIPO DE OPERAÇÃO/CARTEIRA", 7, "texto", 0, "Tipo de operação", "financeiro"),
+                    ("AGÊNCIA", 8, "texto", 0, "Agência", "financeiro"),
+                    ("CONTA", 9, "texto", 0, "Conta", "financeiro"),
+                    ("VARA", 10, "texto", 0, "Vara", "juridico"),
+                    ("COMARCA", 11, "texto", 0, "Comarca", "juridico"),
+                    ("UF", 12, "texto", 0, "UF", "geografico"),
+                    ("ESCRITÓRIO", 13, "texto", 0, "Escritório", "organizacional"),
+                    ("MONITORAMENTO", 14, "texto", 0, "Monitoramento", "controle"),
+                    ("SEGMENTO DO CONTRATO", 15, "texto", 0, "Segmento do contrato", "financeiro"),
+                    ("OPERAÇÃO", 16, "texto", 0, "Operação", "financeiro")
+                ]
             
-            cursor.executemany('''
-                INSERT INTO template_colunas (coluna_nome, posicao, tipo_dados, obrigatoria, descricao, categoria)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', colunas_template)
+                cursor.executemany('''
+                    INSERT INTO template_colunas (coluna_nome, posicao, tipo_dados, obrigatoria, descricao, categoria)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', colunas_template)
             
-            print("Dados básicos inicializados com sucesso!")
+                print("Dados básicos inicializados com sucesso!")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
     def adicionar_gcpjs_escopo(self, gcpjs, motivo="Inclusão manual"):
         """Adiciona GCPJs ao escopo de exportação"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        timestamp = datetime.now().isoformat()
-        sucesso = 0
-        
-        for gcpj in gcpjs:
-            try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO gcpj_escopo (gcpj, ativo, motivo_inclusao, data_inclusao)
-                    VALUES (?, 1, ?, ?)
-                ''', (str(gcpj).strip(), motivo, timestamp))
-                sucesso += cursor.rowcount
-            except Exception as e:
-                print(f"Erro ao adicionar GCPJ {gcpj}: {str(e)}")
-        
-        conn.commit()
-        conn.close()
+        with conexao(self.db_path) as conn:
+            sucesso = carregar_gcpjs_escopo(
+                conn, 'gcpj_escopo', 'motivo_inclusao', [str(gcpj).strip() for gcpj in gcpjs], motivo
+            )
+            conn.commit()
         
         print(f"Adicionados {sucesso} GCPJs ao escopo (de {len(gcpjs)} tentativas)")
         return sucesso
     
+    def importar_escopo_arquivo(self, caminho, coluna_gcpj, aba=None, motivo="Upload de arquivo"):
+        """Importa em massa a coluna de GCPJs de um arquivo (Excel/CSV) para o escopo"""
+        with conexao(self.db_path) as conn:
+            resumo = importar_arquivo_escopo(
+                conn, 'gcpj_escopo', 'motivo_inclusao', caminho, coluna_gcpj, aba=aba, motivo=motivo
+            )
+            conn.commit()
+        
+        print(f"Escopo importado: {resumo['adicionados']} adicionados, "
+              f"{resumo['duplicados']} duplicados, {resumo['invalidos']} inválidos")
+        return resumo
+    
     def obter_escopo_gcpjs(self, apenas_ativos=True):
         """Obtém lista de GCPJs no escopo"""
-        conn = sqlite3.connect(self.db_path)
+        with conexao(self.db_path) as conn:
         
-        where_clause = "WHERE ativo = 1" if apenas_ativos else ""
-        df = pd.read_sql_query(f"SELECT gcpj FROM gcpj_escopo {where_clause} ORDER BY gcpj", conn)
+            where_clause = "WHERE ativo = 1" if apenas_ativos else ""
+            df = pd.read_sql_query(f"SELECT gcpj FROM gcpj_escopo {where_clause} ORDER BY gcpj", conn)
         
-        conn.close()
         return df['gcpj'].tolist()
     
     def adicionar_fonte(self, nome, tipo, caminho, aba, coluna_gcpj, prioridade=10, descricao=""):
         """Adiciona nova fonte de dados"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO fontes_dados (nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj, prioridade, descricao, data_criacao)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (nome, tipo, caminho, aba, coluna_gcpj, prioridade, descricao, datetime.now().isoformat()))
+            cursor.execute('''
+                INSERT INTO fontes_dados (nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj, prioridade, descricao, data_criacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (nome, tipo, caminho, aba, coluna_gcpj, prioridade, descricao, datetime.now().isoformat()))
         
-        fonte_id = cursor.lastrowid
+            fonte_id = cursor.lastrowid
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
         print(f"Fonte '{nome}' adicionada com ID {fonte_id}")
         return fonte_id
     
     def obter_fontes_ativas(self):
         """Obtém todas as fontes ativas ordenadas por prioridade"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query('''
-            SELECT * FROM fontes_dados 
-            WHERE ativa = 1 
-            ORDER BY prioridade ASC
-        ''', conn)
-        conn.close()
+        with conexao(self.db_path) as conn:
+            df = pd.read_sql_query('''
+                SELECT * FROM fontes_dados 
+                WHERE ativa = 1 
+                ORDER BY prioridade ASC
+            ''', conn)
         return df
     
     def obter_fonte_por_id(self, fonte_id):
         """Obtém fonte específica por ID"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query('''
-            SELECT * FROM fontes_dados WHERE id = ?
-        ''', conn, params=(fonte_id,))
-        conn.close()
+        with conexao(self.db_path) as conn:
+            df = pd.read_sql_query('''
+                SELECT * FROM fontes_dados WHERE id = ?
+            ''', conn, params=(fonte_id,))
         return df
 
 class ProcessadorMultiplasFontes:
     """Processador que utiliza múltiplas fontes"""
     
-    def __init__(self, base_path="C:/desenvolvimento/migration_app"):
+    def __init__(self, base_path="C:/desenvolvimento/migration_app", limite_memoria_fontes_mb=LIMITE_MEMORIA_FONTES_MB):
         self.base_path = base_path
         self.master_db = MasterDatabaseManager(base_path)
-        self.fontes_carregadas = {}
+        # Fontes por id, validadas pelo arquivo a cada acesso e limitadas em memória
+        self.fontes_carregadas = CacheFontesMemoria(limite_memoria_fontes_mb)
         
         # Mapeamentos baseados no config.py original
         self.column_mappings = {
@@ -293,10 +297,6 @@ class ProcessadorMultiplasFontes:
         if fonte_id is None:
             return pd.DataFrame()
         
-        # Cache de fontes
-        if fonte_id in self.fontes_carregadas:
-            return self.fontes_carregadas[fonte_id]
-        
         try:
             caminho_completo = os.path.join(self.base_path, fonte_info['caminho_arquivo'])
             
@@ -304,31 +304,54 @@ class ProcessadorMultiplasFontes:
                 print(f"Arquivo não encontrado: {caminho_completo}")
                 return pd.DataFrame()
             
-            if fonte_info['tipo_fonte'] == 'excel':
-                df = pd.read_excel(caminho_completo, sheet_name=fonte_info['aba_planilha'])
-            elif fonte_info['tipo_fonte'] == 'csv':
-                df = pd.read_csv(caminho_completo)
-            else:
-                raise ValueError(f"Tipo de fonte não suportado: {fonte_info['tipo_fonte']}")
-            
-            # Normalizar coluna GCPJ se existir
-            if fonte_info['coluna_gcpj'] in df.columns:
-                df[fonte_info['coluna_gcpj']] = df[fonte_info['coluna_gcpj']].astype(str).str.strip()
-            
-            self.fontes_carregadas[fonte_id] = df
-            print(f"Fonte '{fonte_info['nome_fonte']}' carregada: {len(df)} registros, {len(df.columns)} colunas")
-            
-            return df
+            # Cache de fontes (relê se o arquivo mudou)
+            chave = chave_fonte(fonte_id, fonte_info['aba_planilha'], fonte_info['coluna_gcpj'])
+            return self.fontes_carregadas.obter(
+                chave, caminho_completo, lambda: self._ler_fonte(fonte_info, caminho_completo)
+            )
             
         except Exception as e:
             print(f"Erro ao carregar fonte {fonte_info['nome_fonte']}: {str(e)}")
             return pd.DataFrame()
     
-    def executar_migracao_completa(self):
-        """Executa migração completa usando configuração atual"""
+    def _ler_fonte(self, fonte_info, caminho_completo):
+        """Lê a fonte do arquivo e normaliza a coluna GCPJ"""
+        if fonte_info['tipo_fonte'] == 'excel':
+            df = pd.read_excel(caminho_completo, sheet_name=fonte_info['aba_planilha'])
+        elif fonte_info['tipo_fonte'] == 'csv':
+            df = pd.read_csv(caminho_completo)
+        else:
+            raise ValueError(f"Tipo de fonte não suportado: {fonte_info['tipo_fonte']}")
+        
+        # Normalizar coluna GCPJ se existir
+        if fonte_info['coluna_gcpj'] in df.columns:
+            df[fonte_info['coluna_gcpj']] = df[fonte_info['coluna_gcpj']].astype(str).str.strip()
+        
+        print(f"Fonte '{fonte_info['nome_fonte']}' carregada: {len(df)} registros, {len(df.columns)} colunas")
+        
+        return df
+    
+    def amostrar_gcpjs(self, fonte_info, limite=100):
+        """Primeiros GCPJs da fonte (forma canônica), lendo do arquivo só as linhas necessárias"""
+        caminho_completo = os.path.join(self.base_path, fonte_info['caminho_arquivo'])
+        aba = fonte_info['aba_planilha'] if fonte_info['tipo_fonte'] == 'excel' else None
+        try:
+            # A migração indexa a fonte principal pela coluna GCPJ (indexar_por_gcpj)
+            return amostrar_gcpjs(caminho_completo, 'GCPJ', limite, aba=aba)
+        except (OSError, ValueError) as e:
+            print(f"Erro ao amostrar fonte {fonte_info['nome_fonte']}: {str(e)}")
+            return []
+    
+    def executar_migracao_completa(self, progresso=PROGRESSO_NULO):
+        """Executa migração completa usando configuração atual
+        
+        progresso (ver progresso_execucao) recebe as fases e o avanço em células
+        (GCPJ x coluna) e permite cancelar entre as colunas.
+        """
         print("Iniciando migração completa...")
         
         # Obter escopo de GCPJs
+        progresso.fase('Carregando escopo')
         escopo_gcpjs = self.master_db.obter_escopo_gcpjs()
         
         if not escopo_gcpjs:
@@ -336,9 +359,8 @@ class ProcessadorMultiplasFontes:
             # Se não há escopo, pegar alguns GCPJs da fonte principal para demonstração
             fonte_principal = self.master_db.obter_fontes_ativas()
             if not fonte_principal.empty:
-                df_principal = self.carregar_fonte(fonte_principal.iloc[0])
-                if not df_principal.empty and 'GCPJ' in df_principal.columns:
-                    escopo_gcpjs = df_principal['GCPJ'].head(100).astype(str).tolist()
+                escopo_gcpjs = self.amostrar_gcpjs(fonte_principal.iloc[0], limite=100)
+                if escopo_gcpjs:
                     print(f"Usando amostra de {len(escopo_gcpjs)} GCPJs da fonte principal")
         
         if not escopo_gcpjs:
@@ -348,6 +370,7 @@ class ProcessadorMultiplasFontes:
         print(f"Processando {len(escopo_gcpjs)} GCPJs no escopo")
         
         # Obter template e suas colunas
+        progresso.fase('Carregando template e fontes')
         try:
             template_path = os.path.join(self.base_path, "template-banco-bradesco-sa.xlsx")
             template_df = pd.read_excel(template_path, sheet_name='Sheet')
@@ -376,12 +399,18 @@ class ProcessadorMultiplasFontes:
         resultado_df = pd.DataFrame(index=escopo_gcpjs, columns=colunas_template)
         
         print("Aplicando mapeamentos...")
+        mapeadas = [c for c, origem in self.column_mappings.items()
+                    if origem in df_principal.columns and c in colunas_template]
+        progresso.fase('Aplicando mapeamentos', total=len(mapeadas) * len(escopo_gcpjs), unidade='células')
+        
+        # GCPJ canônico nos dois lados: escopo/amostra e fonte lida inteira
+        principal_por_gcpj = indexar_por_gcpj(df_principal, 'GCPJ')
         
         # 1. Aplicar mapeamentos diretos da fonte principal
         for template_col, source_col in self.column_mappings.items():
             if source_col in df_principal.columns and template_col in colunas_template:
                 # Criar mapeamento GCPJ -> valor
-                mapa_valores = df_principal.set_index('GCPJ')[source_col].to_dict()
+                mapa_valores = principal_por_gcpj[source_col].to_dict()
                 
                 # Preencher valores para GCPJs no escopo
                 for gcpj in escopo_gcpjs:
@@ -390,6 +419,7 @@ class ProcessadorMultiplasFontes:
                 
                 preenchidos = resultado_df[template_col].notna().sum()
                 print(f"Coluna {template_col}: {preenchidos}/{len(escopo_gcpjs)} preenchidos ({preenchidos/len(escopo_gcpjs)*100:.1f}%)")
+                progresso.avancar(len(escopo_gcpjs))
         
         # 2. Aplicar valores constantes
         for template_col, valor_constante in self.constant_values.items():
@@ -404,11 +434,15 @@ class ProcessadorMultiplasFontes:
             
             if not df_secundaria.empty and 'GCPJ' in df_secundaria.columns:
                 print("Aplicando mapeamentos da fonte secundária...")
+                secundaria_por_gcpj = indexar_por_gcpj(df_secundaria, 'GCPJ')
+                secundarias = [c for c, origem in self.secondary_mappings.items()
+                               if origem in df_secundaria.columns and c in colunas_template]
+                progresso.fase('Aplicando fonte secundária', total=len(secundarias) * len(escopo_gcpjs), unidade='células')
                 
                 for template_col, source_col in self.secondary_mappings.items():
                     if source_col in df_secundaria.columns and template_col in colunas_template:
                         # Criar mapeamento GCPJ -> valor
-                        mapa_valores_sec = df_secundaria.set_index('GCPJ')[source_col].to_dict()
+                        mapa_valores_sec = secundaria_por_gcpj[source_col].to_dict()
                         
                         # Preencher apenas onde ainda não há dados
                         for gcpj in escopo_gcpjs:
@@ -417,8 +451,10 @@ class ProcessadorMultiplasFontes:
                         
                         preenchidos = resultado_df[template_col].notna().sum()
                         print(f"Coluna {template_col} (secundária): {preenchidos}/{len(escopo_gcpjs)} preenchidos")
+                        progresso.avancar(len(escopo_gcpjs))
         
         # Salvar execução no histórico
+        progresso.fase('Registrando execução')
         self.salvar_execucao_historico("migracao", len(escopo_gcpjs), len(resultado_df))
         
         print(f"Migração concluída: {len(resultado_df)} registros processados")
@@ -426,30 +462,29 @@ class ProcessadorMultiplasFontes:
     
     def salvar_execucao_historico(self, tipo, escopo, processados):
         """Salva execução no histórico"""
-        conn = sqlite3.connect(self.master_db.db_path)
-        cursor = conn.cursor()
+        with conexao(self.master_db.db_path) as conn:
+            cursor = conn.cursor()
         
-        configuracao = {
-            'fontes_ativas': len(self.master_db.obter_fontes_ativas()),
-            'escopo_usado': escopo
-        }
+            configuracao = {
+                'fontes_ativas': len(self.master_db.obter_fontes_ativas()),
+                'escopo_usado': escopo
+            }
         
-        cursor.execute('''
-            INSERT INTO execucoes_master 
-            (timestamp, tipo_execucao, configuracao_fontes, escopo_gcpjs, registros_processados, registros_exportados, taxa_sucesso)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            datetime.now().isoformat(),
-            tipo,
-            json.dumps(configuracao),
-            escopo,
-            processados,
-            processados,
-            100.0 if processados > 0 else 0.0
-        ))
-        
-        conn.commit()
-        conn.close()
+            cursor.execute('''
+                INSERT INTO execucoes_master 
+                (timestamp, tipo_execucao, configuracao_fontes, escopo_gcpjs, registros_processados, registros_exportados, taxa_sucesso)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                datetime.now().isoformat(),
+                tipo,
+                json.dumps(configuracao),
+                escopo,
+                processados,
+                processados,
+                100.0 if processados > 0 else 0.0
+            ))
+        
+            conn.commit()
 
 class InterfaceGestao:
     def __init__(self, base_path="C:/desenvolvimento/migration_app"):
@@ -459,67 +494,77 @@ class InterfaceGestao:
         
     def obter_estatisticas_dashboard(self):
         """Obtém estatísticas para o dashboard"""
-        conn = sqlite3.connect(self.master_db.db_path)
+        with conexao(self.master_db.db_path) as conn:
         
-        stats = {}
+            stats = {}
         
-        try:
-            # Fontes ativas
-            stats['fontes_ativas'] = pd.read_sql_query(
-                "SELECT COUNT(*) as count FROM fontes_dados WHERE ativa = 1", conn
-            ).iloc[0]['count']
+            try:
+                # Fontes ativas
+                stats['fontes_ativas'] = pd.read_sql_query(
+                    "SELECT COUNT(*) as count FROM fontes_dados WHERE ativa = 1", conn
+                ).iloc[0]['count']
             
-            # GCPJs no escopo
-            stats['gcpjs_escopo'] = pd.read_sql_query(
-                "SELECT COUNT(*) as count FROM gcpj_escopo WHERE ativo = 1", conn
-            ).iloc[0]['count']
+                # GCPJs no escopo
+                stats['gcpjs_escopo'] = pd.read_sql_query(
+                    "SELECT COUNT(*) as count FROM gcpj_escopo WHERE ativo = 1", conn
+                ).iloc[0]['count']
             
-            # Template colunas
-            stats['template_colunas'] = pd.read_sql_query(
-                "SELECT COUNT(*) as count FROM template_colunas", conn
-            ).iloc[0]['count']
+                # Template colunas
+                stats['template_colunas'] = pd.read_sql_query(
+                    "SELECT COUNT(*) as count FROM template_colunas", conn
+                ).iloc[0]['count']
             
-            # Última execução
-            ultima_execucao = pd.read_sql_query(
-                "SELECT * FROM execucoes_master ORDER BY id DESC LIMIT 1", conn
-            )
+                # Última execução
+                ultima_execucao = pd.read_sql_query(
+                    "SELECT * FROM execucoes_master ORDER BY id DESC LIMIT 1", conn
+                )
             
-            if not ultima_execucao.empty:
-                stats['ultima_execucao'] = {
-                    'timestamp': ultima_execucao.iloc[0]['timestamp'],
-                    'tipo': ultima_execucao.iloc[0]['tipo_execucao'],
-                    'registros': ultima_execucao.iloc[0]['registros_processados'],
-                    'taxa_sucesso': ultima_execucao.iloc[0]['taxa_sucesso']
-                }
-            else:
-                stats['ultima_execucao'] = None
+                if not ultima_execucao.empty:
+                    stats['ultima_execucao'] = {
+                        'timestamp': ultima_execucao.iloc[0]['timestamp'],
+                        'tipo': ultima_execucao.iloc[0]['tipo_execucao'],
+                        'registros': ultima_execucao.iloc[0]['registros_processados'],
+                        'taxa_sucesso': ultima_execucao.iloc[0]['taxa_sucesso']
+                    }
+                else:
+                    stats['ultima_execucao'] = None
             
-            # Completude por categoria
-            try:
-                colunas_template = pd.read_sql_query(
-                    "SELECT categoria, COUNT(*) as total FROM template_colunas GROUP BY categoria", conn
-                )
-                stats['completude_categorias'] = colunas_template
-            except:
-                stats['completude_categorias'] = pd.DataFrame({'categoria': ['juridico', 'financeiro'], 'total': [8, 8]})
+                # Completude por categoria
+                try:
+                    colunas_template = pd.read_sql_query(
+                        "SELECT categoria, COUNT(*) as total FROM template_colunas GROUP BY categoria", conn
+                    )
+                    stats['completude_categorias'] = colunas_template
+                except:
+                    stats['completude_categorias'] = pd.DataFrame({'categoria': ['juridico', 'financeiro'], 'total': [8, 8]})
             
-        except Exception as e:
-            print(f"Erro ao obter estatísticas: {e}")
-            # Valores padrão em caso de erro
-            stats = {
-                'fontes_ativas': 0,
-                'gcpjs_escopo': 0,
-                'template_colunas': 16,
-                'ultima_execucao': None,
-                'completude_categorias': pd.DataFrame({'categoria': ['juridico', 'financeiro'], 'total': [8, 8]})
-            }
+            except Exception as e:
+                print(f"Erro ao obter estatísticas: {e}")
+                # Valores padrão em caso de erro
+                stats = {
+                    'fontes_ativas': 0,
+                    'gcpjs_escopo': 0,
+                    'template_colunas': 16,
+                    'ultima_execucao': None,
+                    'completude_categorias': pd.DataFrame({'categoria': ['juridico', 'financeiro'], 'total': [8, 8]})
+                }
         
-        conn.close()
         return stats
 
 # Instância global
 gestao = InterfaceGestao()
 
+# Progresso das execuções longas (migração), publicado via SSE
+painel_progresso = PainelProgresso()
+
+# A migração roda na requisição, registrada no banco: progresso e cancelamento valem em qualquer worker
+executor_migracoes = ExecutorTarefas(gestao.master_db.db_path, painel_progresso)
+
+def pre_carregar_fontes():
+    """Carrega as fontes ativas no cache antes do fork dos workers (gunicorn.conf.py)"""
+    fontes = [fonte for _, fonte in gestao.master_db.obter_fontes_ativas().iterrows()]
+    return pre_carregar(gestao.processador.fontes_carregadas, fontes, gestao.processador.carregar_fonte)
+
 # ================== ROTAS PRINCIPAIS ==================
 
 @app.route('/')
@@ -659,59 +704,119 @@ def dashboard():
         </div>
     </div>
     
+    <div class="progress-section" id="painel-progresso" style="display: none; margin: 20px;">
+        <h3>⏳ Migração em Andamento</h3>
+        <p><strong id="progresso-fase">Iniciando</strong> <span id="progresso-contagem"></span></p>
+        <div class="progress-bar">
+            <div class="progress-fill" id="progresso-barra" style="width: 0%"></div>
+        </div>
+        <p id="progresso-taxa" class="timestamp"></p>
+        <button class="btn btn-warning" id="btn-cancelar" onclick="cancelarExecucao()">⛔ Cancelar</button>
+    </div>
+
     <script>
-        function executarMigracao() {{
-            if (confirm('Executar migração completa? Isso pode levar alguns minutos.')) {{
+        let execucaoAtual = null;
+        let fluxoProgresso = null;
+
+        function formatarSegundos(segundos) {
+            if (segundos === null || segundos === undefined) return '-';
+            const min = Math.floor(segundos / 60);
+            const seg = Math.round(segundos % 60);
+            return min > 0 ? `${min}min ${seg}s` : `${seg}s`;
+        }
+
+        function mostrarProgresso(dados) {
+            execucaoAtual = dados.id;
+            document.getElementById('progresso-fase').textContent = dados.fase;
+            document.getElementById('progresso-contagem').textContent = dados.total
+                ? `${dados.feitos.toLocaleString()} de ${dados.total.toLocaleString()} ${dados.unidade} (${dados.percentual}%)`
+                : '';
+            document.getElementById('progresso-barra').style.width = (dados.percentual || 0) + '%';
+            document.getElementById('progresso-taxa').textContent =
+                `${dados.por_segundo.toLocaleString()} ${dados.unidade}/s · ETA ${formatarSegundos(dados.eta_segundos)} · decorrido ${formatarSegundos(dados.decorrido_segundos)}`
+                + (dados.cancelamento_solicitado ? ' · cancelando...' : '');
+        }
+
+        function acompanharProgresso(tipo) {
+            // Aberto antes do POST: o fluxo espera a execução começar
+            document.getElementById('painel-progresso').style.display = 'block';
+            fluxoProgresso = new EventSource(`/api/progresso/eventos?tipo=${tipo}`);
+            fluxoProgresso.addEventListener('progresso', e => mostrarProgresso(JSON.parse(e.data)));
+            fluxoProgresso.addEventListener('fim', e => {
+                mostrarProgresso(JSON.parse(e.data));
+                fluxoProgresso.close();
+            });
+        }
+
+        function encerrarProgresso() {
+            if (fluxoProgresso) fluxoProgresso.close();
+            document.getElementById('painel-progresso').style.display = 'none';
+            document.getElementById('btn-cancelar').disabled = false;
+            execucaoAtual = null;
+        }
+
+        function cancelarExecucao() {
+            if (execucaoAtual && confirm('Cancelar a execução em andamento?')) {
+                fetch(`/api/progresso/${execucaoAtual}/cancelar`, { method: 'POST' });
+                document.getElementById('btn-cancelar').disabled = true;
+            }
+        }
+
+        function executarMigracao() {
+            if (confirm('Executar migração completa? Isso pode levar alguns minutos.')) {
                 document.querySelector('.btn-success').textContent = '⏳ Executando...';
                 document.querySelector('.btn-success').disabled = true;
+                acompanharProgresso('migracao');
                 
-                fetch('/api/executar_migracao', {{ method: 'POST' }})
+                fetch('/api/executar_migracao', { method: 'POST' })
                     .then(response => response.json())
-                    .then(data => {{
-                        if (data.success) {{
-                            alert(`Migração concluída!\\n\\nRegistros: ${{data.registros_processados}}\\nColunas: ${{data.colunas}}\\nArquivo: ${{data.arquivo}}`);
+                    .then(data => {
+                        if (data.success) {
+                            alert(`Migração concluída!\\n\\nRegistros: ${data.registros_processados}\\nColunas: ${data.colunas}\\nArquivo: ${data.arquivo}`);
                             location.reload();
-                        }} else {{
-                            alert('Erro: ' + data.error);
+                        } else {
+                            alert(data.cancelado ? 'Migração cancelada.' : 'Erro: ' + data.error);
+                            encerrarProgresso();
                             document.querySelector('.btn-success').textContent = '🚀 Executar Migração';
                             document.querySelector('.btn-success').disabled = false;
-                        }}
-                    }})
-                    .catch(error => {{
+                        }
+                    })
+                    .catch(error => {
                         alert('Erro de conexão: ' + error);
+                        encerrarProgresso();
                         document.querySelector('.btn-success').textContent = '🚀 Executar Migração';
                         document.querySelector('.btn-success').disabled = false;
-                    }});
-            }}
-        }}
+                    });
+            }
+        }
         
-        function testarFontes() {{
+        function testarFontes() {
             fetch('/api/testar_todas_fontes')
                 .then(response => response.json())
-                .then(data => {{
-                    if (data.success) {{
+                .then(data => {
+                    if (data.success) {
                         let msg = 'Teste de Fontes:\\n\\n';
-                        data.resultados.forEach(r => {{
-                            msg += `${{r.nome}}: ${{r.status}} (${{r.registros || 0}} registros)\\n`;
-                        }});
+                        data.resultados.forEach(r => {
+                            msg += `${r.nome}: ${r.status} (${r.registros || 0} registros)\\n`;
+                        });
                         alert(msg);
-                    }} else {{
+                    } else {
                         alert('Erro: ' + data.error);
-                    }}
-                }});
-        }}
+                    }
+                });
+        }
         
-        function verificarTemplate() {{
+        function verificarTemplate() {
             fetch('/api/verificar_template')
                 .then(response => response.json())
-                .then(data => {{
-                    if (data.success) {{
-                        alert(`Template verificado!\\n\\nArquivo: ${{data.arquivo}}\\nColunas: ${{data.colunas}}\\nLinhas: ${{data.linhas}}`);
-                    }} else {{
+                .then(data => {
+                    if (data.success) {
+                        alert(`Template verificado!\\n\\nArquivo: ${data.arquivo}\\nColunas: ${data.colunas}\\nLinhas: ${data.linhas}`);
+                    } else {
                         alert('Erro: ' + data.error);
-                    }}
-                }});
-        }}
+                    }
+                });
+        }
     </script>
 </body>
 </html>
@@ -945,17 +1050,16 @@ def gerenciar_fontes():
 def gerenciar_escopo():
     """Interface para gestão de escopo GCPJ"""
     try:
-        conn = sqlite3.connect(gestao.master_db.db_path)
+        with conexao(gestao.master_db.db_path) as conn:
         
-        total_escopo = pd.read_sql_query(
-            "SELECT COUNT(*) as count FROM gcpj_escopo WHERE ativo = 1", conn
-        ).iloc[0]['count']
+            total_escopo = pd.read_sql_query(
+                "SELECT COUNT(*) as count FROM gcpj_escopo WHERE ativo = 1", conn
+            ).iloc[0]['count']
         
-        ultimos_gcpjs = pd.read_sql_query(
-            "SELECT gcpj, motivo_inclusao, data_inclusao FROM gcpj_escopo WHERE ativo = 1 ORDER BY id DESC LIMIT 10", conn
-        )
+            ultimos_gcpjs = pd.read_sql_query(
+                "SELECT gcpj, motivo_inclusao, data_inclusao FROM gcpj_escopo WHERE ativo = 1 ORDER BY id DESC LIMIT 10", conn
+            )
         
-        conn.close()
         
         template_html = f'''
 <!DOCTYPE html>
@@ -1239,13 +1343,13 @@ def api_testar_fonte(fonte_id):
 def api_remover_fonte(fonte_id):
     """API para remover uma fonte"""
     try:
-        conn = sqlite3.connect(gestao.master_db.db_path)
-        cursor = conn.cursor()
+        with conexao(gestao.master_db.db_path) as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("UPDATE fontes_dados SET ativa = 0 WHERE id = ?", (fonte_id,))
+            cursor.execute("UPDATE fontes_dados SET ativa = 0 WHERE id = ?", (fonte_id,))
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+        gestao.processador.fontes_carregadas.invalidar_fonte(fonte_id)
         
         return jsonify({'success': True})
         
@@ -1293,13 +1397,12 @@ def api_exportar_escopo():
 def api_limpar_escopo():
     """API para limpar escopo"""
     try:
-        conn = sqlite3.connect(gestao.master_db.db_path)
-        cursor = conn.cursor()
+        with conexao(gestao.master_db.db_path) as conn:
+            cursor = conn.cursor()
         
-        cursor.execute("UPDATE gcpj_escopo SET ativo = 0")
+            cursor.execute("UPDATE gcpj_escopo SET ativo = 0")
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
         return jsonify({'success': True})
         
@@ -1311,7 +1414,7 @@ def api_executar_migracao():
     """API para executar migração completa"""
     try:
         print("Iniciando execução de migração via API...")
-        resultado = gestao.processador.executar_migracao_completa()
+        resultado = executor_migracoes.executar('migracao', gestao.processador.executar_migracao_completa)
         
         if resultado.empty:
             return jsonify({'success': False, 'error': 'Nenhum resultado gerado. Verifique escopo e fontes.'})
@@ -1337,10 +1440,36 @@ def api_executar_migracao():
             'message': f'Migração concluída! {len(resultado)} registros processados.'
         })
         
+    except ExecucaoCancelada as e:
+        print(f"Migração cancelada: {str(e)}")
+        return jsonify({'success': False, 'cancelado': True, 'error': str(e)}), 409
     except Exception as e:
         print(f"Erro na migração: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/progresso')
+def api_listar_progresso():
+    """API com o estado das execuções recentes (mais recentes primeiro)"""
+    return jsonify({'execucoes': executor_migracoes.listar_progresso()})
+
+@app.route('/api/progresso/eventos')
+@app.route('/api/progresso/<execucao_id>/eventos')
+def api_eventos_progresso(execucao_id=None):
+    """Fluxo SSE com fase, feitos/total, taxa e ETA da execução"""
+    return resposta_eventos(executor_migracoes, execucao_id=execucao_id, tipo=request.args.get('tipo'))
+
+@app.route('/api/progresso/<execucao_id>/cancelar', methods=['POST'])
+def api_cancelar_execucao(execucao_id):
+    """API para cancelar uma execução em andamento"""
+    if not executor_migracoes.cancelar(execucao_id):
+        return jsonify({'success': False, 'error': 'Execução não encontrada ou já encerrada'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/cache_fontes')
+def api_cache_fontes():
+    """API com acertos, faltas, descartes e ocupação do cache de fontes em memória"""
+    return jsonify({'success': True, 'cache': gestao.processador.fontes_carregadas.estatisticas()})
+
 @app.route('/api/testar_todas_fontes')
 def api_testar_todas_fontes():
     """API para testar todas as fontes"""
@@ -0,0 +1,282 @@
+"""
+Migrações Versionadas de Schema dos Bancos SQLite
+
+Cada banco (sistema_completo.db, master_database.db e qualidade.db) tem uma lista
+ordenada de migrações. A versão aplicada fica registrada na tabela schema_migracoes
+do próprio banco, então cada migração roda uma única vez.
+
+Para alterar um schema, adicione uma nova entrada ao final da lista do banco com a
+próxima versão; nunca edite uma migração já publicada.
+
+USO:
+    with conexao(self.db_path) as conn:
+        aplicar_migracoes(conn, 'sistema_completo')
+"""
+
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (versão, descrição, comandos SQL)
+MIGRACOES = {
+    'sistema_completo': [
+        (1, "Índices cobrindo consultas de diagnóstico, escopo e execuções", [
+            # Dashboard, /qualidade e exportação filtram por execução, agrupam por
+            # coluna e filtram por disponível; gcpj ao final atende o ORDER BY gcpj
+            '''CREATE INDEX IF NOT EXISTS idx_diagnostico_execucao_coluna
+               ON diagnostico_completude (execucao_id, coluna_template, disponivel, gcpj)''',
+            # Contagem e listagem do escopo ativo (o rowid atende o ORDER BY id)
+            '''CREATE INDEX IF NOT EXISTS idx_escopo_gcpj_ativo
+               ON escopo_gcpj (ativo)''',
+            # Busca da última execução de um tipo
+            '''CREATE INDEX IF NOT EXISTS idx_execucoes_tipo
+               ON execucoes (tipo)''',
+        ]),
+        (2, "Tabelas de rollup por execução do diagnóstico", [
+            '''CREATE TABLE IF NOT EXISTS rollup_execucoes (
+                   execucao_id INTEGER PRIMARY KEY,
+                   total_gcpjs INTEGER,
+                   total_colunas INTEGER,
+                   celulas_preenchidas INTEGER,
+                   celulas_faltantes INTEGER,
+                   taxa_media REAL
+               )''',
+            # Contagens coluna x fonte (fonte 'Nenhuma' concentra os faltantes)
+            '''CREATE TABLE IF NOT EXISTS rollup_colunas_fonte (
+                   execucao_id INTEGER NOT NULL,
+                   coluna_template TEXT NOT NULL,
+                   fonte TEXT NOT NULL,
+                   registros_preenchidos INTEGER,
+                   registros_faltantes INTEGER,
+                   PRIMARY KEY (execucao_id, coluna_template, fonte)
+               )''',
+            # Quantidade de GCPJs por faixa de completude (0 = 0-9%, ..., 10 = 100%)
+            '''CREATE TABLE IF NOT EXISTS rollup_histograma (
+                   execucao_id INTEGER NOT NULL,
+                   faixa INTEGER NOT NULL,
+                   gcpjs INTEGER,
+                   PRIMARY KEY (execucao_id, faixa)
+               )''',
+            # Totais por categoria de coluna ('constante', 'mapeada', 'sem_mapeamento')
+            '''CREATE TABLE IF NOT EXISTS rollup_categorias (
+                   execucao_id INTEGER NOT NULL,
+                   categoria TEXT NOT NULL,
+                   colunas INTEGER,
+                   registros_preenchidos INTEGER,
+                   registros_faltantes INTEGER,
+                   PRIMARY KEY (execucao_id, categoria)
+               )''',
+        ]),
+        (3, "Diagnóstico empacotado (máscaras de disponibilidade por GCPJ)", [
+            # Disponibilidade em bits por GCPJ e índice da fonte vencedora por célula;
+            # substitui as linhas por célula de diagnostico_completude nas novas execuções
+            '''CREATE TABLE IF NOT EXISTS diagnostico_empacotado (
+                   execucao_id INTEGER PRIMARY KEY,
+                   timestamp TEXT,
+                   gcpjs TEXT NOT NULL,
+                   colunas TEXT NOT NULL,
+                   tipos_colunas TEXT NOT NULL,
+                   fontes TEXT NOT NULL,
+                   mascaras BLOB NOT NULL,
+                   matriz_fontes BLOB NOT NULL
+               )''',
+        ]),
+        (4, "Índice do escopo ativo por GCPJ para paginação e busca por prefixo", [
+            '''CREATE INDEX IF NOT EXISTS idx_escopo_gcpj_ativo_gcpj
+               ON escopo_gcpj (ativo, gcpj)''',
+        ]),
+        (5, "Versões de fontes e escopo para o cache das páginas", [
+            # Incrementadas por quem altera os dados; compõem a chave e o ETag das páginas
+            '''CREATE TABLE IF NOT EXISTS versoes_dados (
+                   nome TEXT PRIMARY KEY,
+                   versao INTEGER NOT NULL DEFAULT 0,
+                   atualizado_em TEXT
+               )''',
+            "INSERT OR IGNORE INTO versoes_dados (nome, versao) VALUES ('fontes', 0), ('escopo', 0)",
+        ]),
+        (6, "Estado persistido das tarefas do executor de diagnósticos", [
+            # Uma linha por tarefa submetida; o resultado (JSON) sobrevive a reinícios
+            '''CREATE TABLE IF NOT EXISTS tarefas_execucao (
+                   id TEXT PRIMARY KEY,
+                   tipo TEXT NOT NULL,
+                   chave TEXT,
+                   estado TEXT NOT NULL,
+                   criada_em TEXT,
+                   iniciada_em TEXT,
+                   finalizada_em TEXT,
+                   resultado TEXT,
+                   erro TEXT
+               )''',
+            # Deduplicação: tarefa ativa com a mesma chave
+            '''CREATE INDEX IF NOT EXISTS idx_tarefas_chave_estado
+               ON tarefas_execucao (chave, estado)''',
+        ]),
+        (7, "Remove o índice do escopo por ativo, prefixo de (ativo, gcpj)", [
+            # O filtro ativo = 1 é atendido por idx_escopo_gcpj_ativo_gcpj (versão 4)
+            "DROP INDEX IF EXISTS idx_escopo_gcpj_ativo",
+        ]),
+        (8, "Tarefas compartilhadas entre os workers do gunicorn", [
+            # Com vários workers o estado vive no banco: a vaga (memória estimada), o
+            # pedido de cancelamento, o último progresso e o sinal de vida do processo
+            "ALTER TABLE tarefas_execucao ADD COLUMN memoria_mb INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE tarefas_execucao ADD COLUMN cancelamento_solicitado INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE tarefas_execucao ADD COLUMN progresso TEXT",
+            "ALTER TABLE tarefas_execucao ADD COLUMN atualizada_em TEXT",
+            '''CREATE INDEX IF NOT EXISTS idx_tarefas_estado
+               ON tarefas_execucao (estado)''',
+        ]),
+    ],
+    'master_database': [
+        (1, "Índices cobrindo escopo ativo e mapeamentos por coluna", [
+            '''CREATE INDEX IF NOT EXISTS idx_gcpj_escopo_ativo_gcpj
+               ON gcpj_escopo (ativo, gcpj)''',
+            '''CREATE INDEX IF NOT EXISTS idx_mapeamento_coluna_ativa
+               ON mapeamento_colunas (coluna_template, ativa, prioridade)''',
+        ]),
+        (2, "Resultados em cache da execução dos critérios de escopo", [
+            # GCPJs que satisfizeram o critério na última execução; a assinatura
+            # combina arquivo da fonte, coluna GCPJ e condição
+            '''CREATE TABLE IF NOT EXISTS resultados_criterios (
+                   criterio_id INTEGER PRIMARY KEY,
+                   assinatura TEXT NOT NULL,
+                   gcpjs TEXT NOT NULL,
+                   total INTEGER,
+                   data_execucao TEXT
+               )''',
+        ]),
+        (3, "Estado persistido das execuções longas (migração)", [
+            '''CREATE TABLE IF NOT EXISTS tarefas_execucao (
+                   id TEXT PRIMARY KEY,
+                   tipo TEXT NOT NULL,
+                   chave TEXT,
+                   estado TEXT NOT NULL,
+                   criada_em TEXT,
+                   iniciada_em TEXT,
+                   finalizada_em TEXT,
+                   resultado TEXT,
+                   erro TEXT,
+                   memoria_mb INTEGER NOT NULL DEFAULT 0,
+                   cancelamento_solicitado INTEGER NOT NULL DEFAULT 0,
+                   progresso TEXT,
+                   atualizada_em TEXT
+               )''',
+            '''CREATE INDEX IF NOT EXISTS idx_tarefas_chave_estado
+               ON tarefas_execucao (chave, estado)''',
+            '''CREATE INDEX IF NOT EXISTS idx_tarefas_estado
+               ON tarefas_execucao (estado)''',
+        ]),
+    ],
+    'qualidade': [
+        (1, "Índices de completude e GCPJs problemáticos por execução", [
+            '''CREATE INDEX IF NOT EXISTS idx_completude_execucao_coluna
+               ON completude_colunas (execucao_id, coluna)''',
+            '''CREATE INDEX IF NOT EXISTS idx_problematicos_execucao
+               ON gcpjs_problematicos (execucao_id)''',
+        ]),
+        (2, "Dicionário estável de GCPJs e bitmaps de ausentes por execução", [
+            # Índice inteiro de cada GCPJ, igual em todas as execuções
+            '''CREATE TABLE IF NOT EXISTS dicionario_gcpj (
+                   indice INTEGER PRIMARY KEY,
+                   gcpj TEXT NOT NULL UNIQUE
+               )''',
+            # Conjunto de GCPJs avaliados em cada execução
+            '''CREATE TABLE IF NOT EXISTS bitmap_execucoes (
+                   execucao_id INTEGER PRIMARY KEY,
+                   cardinalidade INTEGER,
+                   bitmap BLOB
+               )''',
+            # GCPJs ausentes por execução e coluna (lista completa, sem truncamento)
+            '''CREATE TABLE IF NOT EXISTS bitmap_ausentes (
+                   execucao_id INTEGER NOT NULL,
+                   coluna TEXT NOT NULL,
+                   cardinalidade INTEGER,
+                   bitmap BLOB,
+                   PRIMARY KEY (execucao_id, coluna)
+               )''',
+        ]),
+        (3, "Estado persistido das tarefas do executor de diagnósticos", [
+            '''CREATE TABLE IF NOT EXISTS tarefas_execucao (
+                   id TEXT PRIMARY KEY,
+                   tipo TEXT NOT NULL,
+                   chave TEXT,
+                   estado TEXT NOT NULL,
+                   criada_em TEXT,
+                   iniciada_em TEXT,
+                   finalizada_em TEXT,
+                   resultado TEXT,
+                   erro TEXT
+               )''',
+            # Deduplicação: tarefa ativa com a mesma chave
+            '''CREATE INDEX IF NOT EXISTS idx_tarefas_chave_estado
+               ON tarefas_execucao (chave, estado)''',
+        ]),
+        (4, "Tarefas compartilhadas entre os workers do gunicorn", [
+            # Com vários workers o estado vive no banco: a vaga (memória estimada), o
+            # pedido de cancelamento, o último progresso e o sinal de vida do processo
+            "ALTER TABLE tarefas_execucao ADD COLUMN memoria_mb INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE tarefas_execucao ADD COLUMN cancelamento_solicitado INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE tarefas_execucao ADD COLUMN progresso TEXT",
+            "ALTER TABLE tarefas_execucao ADD COLUMN atualizada_em TEXT",
+            '''CREATE INDEX IF NOT EXISTS idx_tarefas_estado
+               ON tarefas_execucao (estado)''',
+        ]),
+    ],
+}
+
+
+def versao_atual(conn):
+    """Retorna a maior versão de migração aplicada ao banco (0 se nenhuma)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migracoes (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT,
+            aplicada_em TEXT
+        )
+    ''')
+    versao = conn.execute("SELECT MAX(versao) FROM schema_migracoes").fetchone()[0]
+    return versao or 0
+
+
+def aplicar_migracoes(conn, banco):
+    """Aplica, em ordem, as migrações pendentes do banco informado.
+
+    Cada migração roda em sua própria transação junto com o registro da versão.
+    A transação reserva a escrita (BEGIN IMMEDIATE) e relê a versão dentro dela:
+    outro processo subindo ao mesmo tempo (workers do gunicorn) espera e pula as
+    versões que o primeiro já aplicou. Retorna a versão final do schema.
+    """
+    if conn.in_transaction:
+        conn.commit()
+
+    versao = versao_atual(conn)
+    pendentes = [m for m in MIGRACOES.get(banco, []) if m[0] > versao]
+    aplicadas = 0
+
+    for numero, descricao, comandos in pendentes:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            versao = conn.execute("SELECT COALESCE(MAX(versao), 0) FROM schema_migracoes").fetchone()[0]
+            if numero <= versao:
+                conn.commit()
+                continue
+
+            logger.info(f"Aplicando migração {numero} em '{banco}': {descricao}")
+            for comando in comandos:
+                conn.execute(comando)
+            conn.execute('''
+                INSERT INTO schema_migracoes (versao, descricao, aplicada_em)
+                VALUES (?, ?, ?)
+            ''', (numero, descricao, datetime.now().isoformat()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        versao = numero
+        aplicadas += 1
+
+    if aplicadas:
+        # Atualiza as estatísticas do planner para os novos índices
+        conn.execute("PRAGMA optimize")
+
+    return versao
@@ -5,6 +5,9 @@ import json
 import logging
 from datetime import datetime
 import warnings
+from motor_analise_completude import (
+    MAPEAMENTO_COLUNAS, AgregadosFonte, completude_por_gcpj, completude_por_coluna
+)
 warnings.filterwarnings('ignore')
 
 # Configuração de logging com codificação UTF-8
@@ -32,33 +35,10 @@ class MigrationCompletenessAnalyzer:
         self.completeness_report = {}
         self.weights = weights or {'primary': 0.4, 'secondary': 0.2, 'juridico': 0.4}
         
-        # Mapeamento de colunas do template para as fontes
-        self.column_mapping = {
-            # Dados de contrato (base primária)
-            'CÓD. INTERNO': ('primary', 'GCPJ'),
-            'TIPO DE OPERAÇÃO/CARTEIRA': ('primary', 'CARTEIRA'),
-            'AGÊNCIA': ('primary', 'AGENCIA'),
-            'CONTA': ('primary', 'CONTA'),
-            'GESTOR': ('primary', 'GESTOR'),
-            # Dados de contrato (base secundária)
-            'SEGMENTO DO CONTRATO': ('secondary', 'TIPO'),
-            # Dados de processo (base jurídica) - Ajustado com base no arquivo
-            'PROCESSO': ('juridico', 'N DO PROCESSO'),
-            'PROCEDIMENTO': ('juridico', 'AÇÃO'),
-            'NOME PARTE CONTRÁRIA PRINCIPAL': ('juridico', 'REU'),
-            'CPF/CNPJ': ('juridico', 'CPF/CNPJ REU'),
-            'DEVEDOR SOLIDÁRIO 1': ('juridico', 'AVALISTA 1'),
-            'CPF 1': ('juridico', 'CPF/CNPJ Avalista 1'),
-            'DEVEDOR SOLIDÁRIO 2': ('juridico', 'AVALISTA 2'),
-            'CPF 2': ('juridico', 'CPF/CNPJ Avalista 2'),
-            'VARA': ('juridico', 'JUI.Descrição'),
-            'COMARCA': ('juridico', 'JUI.Cidade'),
-            'UF': ('juridico', 'JUI.Sigla'),
-            'RESPONSÁVEL PROCESSO [ESCRITÓRIO]': ('constant', 'MOYA E LARA'),  # Ajustado como constante
-            # Constantes
-            'ORGANIZAÇÃO CLIENTE': ('constant', 'BANCO BRADESCO S.A'),
-            'ESCRITÓRIO': ('constant', 'MOYA E LARA'),
-        }
+        # Mapeamento de colunas do template para as fontes (compartilhado com o motor de análise)
+        self.column_mapping = dict(MAPEAMENTO_COLUNAS)
+        # Agregados das bases (motor_analise_completude), recalculados a cada carga
+        self._aggregates = None
         
         # Colunas obrigatórias por base
         self.required_columns = {
@@ -119,12 +99,27 @@ class MigrationCompletenessAnalyzer:
         self.juridico_df = pd.read_excel(juridico_file).set_index('GCPJ')
         self.juridico_df.index = self.juridico_df.index.astype(str)
         logger.info(f"OK Base jurídica: {len(self.juridico_df)} registros")
+        self._aggregates = None
+    
+    def _source_aggregates(self):
+        """Agregados de cada base, calculados uma vez e usados por todas as análises."""
+        if self._aggregates is None:
+            self._aggregates = {
+                'primary': AgregadosFonte('primary', self.primary_df),
+                'secondary': AgregadosFonte('secondary', self.secondary_df),
+                'juridico': AgregadosFonte('juridico', self.juridico_df)
+            }
+        return self._aggregates
         
     def analyze_gcpj_completeness(self):
-        """Analisa a completude dos dados por GCPJ."""
+        """Analisa a completude dos dados por GCPJ.
+        
+        Vetorizado no motor_analise_completude: registros por GCPJ e preenchimento
+        de cada coluna (groupby-any) vêm dos agregados de cada base, alinhados à
+        lista de GCPJs, em vez de um .loc por GCPJ.
+        """
         logger.info("Analisando completude por GCPJ...")
         
-        gcpj_analysis = []
         total_columns = len([c for c, (s, _) in self.column_mapping.items() if s != 'constant'])
         logger.info(f"Total de colunas não constantes: {total_columns}")
         
@@ -132,66 +127,9 @@ class MigrationCompletenessAnalyzer:
             logger.error("Nenhuma coluna não constante encontrada no mapeamento!")
             raise ValueError("Nenhuma coluna não constante encontrada no mapeamento!")
         
-        for gcpj in self.gcpj_list:
-            analysis = {
-                'GCPJ': gcpj,
-                'in_primary': False,
-                'in_secondary': False,
-                'in_juridico': False,
-                'primary_records': 0,
-                'secondary_records': 0,
-                'juridico_records': 0,
-                'primary_has_duplicates': False,
-                'secondary_has_duplicates': False,
-                'juridico_has_duplicates': False,
-                'completeness_score': 0.0,
-                'missing_columns': [],
-                'column_completeness': {}
-            }
-            
-            # Verificar presença usando índices (sem limitar a uma linha)
-            primary_data = self.primary_df.loc[[gcpj]] if gcpj in self.primary_df.index else pd.DataFrame()
-            secondary_data = self.secondary_df.loc[[gcpj]] if gcpj in self.secondary_df.index else pd.DataFrame()
-            juridico_data = self.juridico_df.loc[[gcpj]] if gcpj in self.juridico_df.index else pd.DataFrame()
-            
-            analysis['in_primary'] = len(primary_data) > 0
-            analysis['in_secondary'] = len(secondary_data) > 0
-            analysis['in_juridico'] = len(juridico_data) > 0
-            
-            analysis['primary_records'] = len(primary_data)
-            analysis['secondary_records'] = len(secondary_data)
-            analysis['juridico_records'] = len(juridico_data)
-            
-            analysis['primary_has_duplicates'] = analysis['primary_records'] > 1
-            analysis['secondary_has_duplicates'] = analysis['secondary_records'] > 1
-            analysis['juridico_has_duplicates'] = analysis['juridico_records'] > 1
-            
-            # Verificar completude por coluna (somente colunas não constantes)
-            filled_columns = 0
-            for col, (source, field) in self.column_mapping.items():
-                if source == 'constant':
-                    analysis['column_completeness'][col] = True
-                else:
-                    df = {'primary': primary_data, 'secondary': secondary_data, 'juridico': juridico_data}.get(source)
-                    if df is not None and len(df) > 0 and field and field in df.columns:
-                        has_data = df[field].notna().any()
-                        analysis['column_completeness'][col] = has_data
-                        if not has_data:
-                            analysis['missing_columns'].append(col)
-                        else:
-                            filled_columns += 1
-                    else:
-                        analysis['column_completeness'][col] = False
-                        analysis['missing_columns'].append(col)
-            
-            # Calcular score como porcentagem
-            analysis['completeness_score'] = (filled_columns / total_columns) * 100
-            analysis['completeness_score'] = round(min(max(analysis['completeness_score'], 0), 100), 2)
-            logger.debug(f"GCPJ {gcpj}: filled_columns={filled_columns}, total_columns={total_columns}, score={analysis['completeness_score']}%")
-            
-            gcpj_analysis.append(analysis)
-        
-        self.gcpj_completeness_df = pd.DataFrame(gcpj_analysis)
+        self.gcpj_completeness_df = completude_por_gcpj(
+            self.gcpj_list, self.column_mapping, self._source_aggregates()
+        )
         logger.info(f"OK Análise por GCPJ concluída: {len(self.gcpj_completeness_df)} registros")
         return self.gcpj_completeness_df
     
@@ -199,35 +137,9 @@ class MigrationCompletenessAnalyzer:
         """Analisa a completude por coluna do template."""
         logger.info("Analisando completude por coluna...")
         
-        column_analysis = []
-        for template_col, (source, field) in self.column_mapping.items():
-            analysis = {
-                'template_column': template_col,
-                'source': source,
-                'source_field': field,
-                'gcpj_with_data': 0,
-                'gcpj_without_data': 0,
-                'completeness_rate': 0
-            }
-            
-            if source == 'constant':
-                analysis['gcpj_with_data'] = len(self.gcpj_list)
-                analysis['completeness_rate'] = 100
-            else:
-                gcpj_with_data = set()
-                df = {'primary': self.primary_df, 'secondary': self.secondary_df, 
-                      'juridico': self.juridico_df}.get(source)
-                if df is not None and field and field in df.columns:
-                    df_filtered = df[df.index.isin(self.gcpj_list)]
-                    gcpj_with_data = set(df_filtered[df_filtered[field].notna()].index.unique())
-                
-                analysis['gcpj_with_data'] = len(gcpj_with_data)
-                analysis['gcpj_without_data'] = len(self.gcpj_list) - len(gcpj_with_data)
-                analysis['completeness_rate'] = (len(gcpj_with_data) / len(self.gcpj_list)) * 100
-            
-            column_analysis.append(analysis)
-        
-        self.column_completeness_df = pd.DataFrame(column_analysis)
+        self.column_completeness_df = completude_por_coluna(
+            self.gcpj_list, self.column_mapping, self._source_aggregates()
+        )
         logger.info(f"OK Análise por coluna concluída: {len(self.column_completeness_df)} colunas")
         return self.column_completeness_df
     
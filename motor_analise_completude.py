@@ -0,0 +1,396 @@
+"""
+Motor Único de Análise de Completude
+
+Substitui as releituras das análises avulsas (migration_completeness_analysis*,
+diagnostico_completude*, analyze_*), que abriam as mesmas planilhas e
+recalculavam estatísticas parecidas cada uma por conta própria.
+
+FUNCIONAMENTO:
+- Cada fonte é lida uma única vez (indexada pelo GCPJ, como no analisador v6) e
+  reduzida a um AgregadosFonte; o DataFrame original pode ser descartado em seguida
+- Agregados compartilhados por fonte, todos de uma passada sobre a matriz notna():
+  registros por GCPJ (duplicados), preenchimento GCPJ x coluna (groupby-any),
+  preenchidos/distintos/vazios por coluna e padrões da chave GCPJ (comprimento,
+  prefixos e formato, calculados sobre os valores distintos)
+- Os relatórios são escritores plugáveis: funções escritor(motor, destino)
+  registradas com @escritor_relatorio('nome'); leem só os agregados e os
+  resultados derivados que o motor guarda (completude por GCPJ e por coluna)
+- Gerar todos os relatórios custa uma leitura de cada fonte, não uma por relatório
+
+USO:
+    motor = MotorAnaliseCompletude(
+        {'primary': 'base_ativos.xlsx', 'secondary': 'previa.xlsx', 'juridico': 'juridico.xlsx'},
+        gcpjs=carregar_lista_gcpjs('lista_gcpj.csv')
+    )
+    motor.carregar()
+    motor.gerar_relatorios('relatorios')            # todos os escritores registrados
+    motor.gerar_relatorios('relatorios', ['padroes_gcpj'])
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Mapeamento coluna do template -> (fonte, campo) usado pelo analisador v6
+MAPEAMENTO_COLUNAS = {
+    # Dados de contrato (base primária)
+    'CÓD. INTERNO': ('primary', 'GCPJ'),
+    'TIPO DE OPERAÇÃO/CARTEIRA': ('primary', 'CARTEIRA'),
+    'AGÊNCIA': ('primary', 'AGENCIA'),
+    'CONTA': ('primary', 'CONTA'),
+    'GESTOR': ('primary', 'GESTOR'),
+    # Dados de contrato (base secundária)
+    'SEGMENTO DO CONTRATO': ('secondary', 'TIPO'),
+    # Dados de processo (base jurídica)
+    'PROCESSO': ('juridico', 'N DO PROCESSO'),
+    'PROCEDIMENTO': ('juridico', 'AÇÃO'),
+    'NOME PARTE CONTRÁRIA PRINCIPAL': ('juridico', 'REU'),
+    'CPF/CNPJ': ('juridico', 'CPF/CNPJ REU'),
+    'DEVEDOR SOLIDÁRIO 1': ('juridico', 'AVALISTA 1'),
+    'CPF 1': ('juridico', 'CPF/CNPJ Avalista 1'),
+    'DEVEDOR SOLIDÁRIO 2': ('juridico', 'AVALISTA 2'),
+    'CPF 2': ('juridico', 'CPF/CNPJ Avalista 2'),
+    'VARA': ('juridico', 'JUI.Descrição'),
+    'COMARCA': ('juridico', 'JUI.Cidade'),
+    'UF': ('juridico', 'JUI.Sigla'),
+    'RESPONSÁVEL PROCESSO [ESCRITÓRIO]': ('constant', 'MOYA E LARA'),
+    # Constantes
+    'ORGANIZAÇÃO CLIENTE': ('constant', 'BANCO BRADESCO S.A'),
+    'ESCRITÓRIO': ('constant', 'MOYA E LARA'),
+}
+
+# Tamanhos de prefixo e quantidade de prefixos mais comuns nos padrões de GCPJ
+TAMANHOS_PREFIXO = (2, 3, 4)
+LIMITE_PREFIXOS = 10
+
+# Chave que astype(str) produz para GCPJ vazio
+CHAVE_NULA = 'nan'
+
+
+def ler_fonte_indexada(caminho, aba=None, coluna_gcpj='GCPJ'):
+    """Lê a fonte inteira indexada pelo GCPJ como texto (sem remover duplicatas)"""
+    if os.path.splitext(caminho)[1].lower() == '.csv':
+        df = pd.read_csv(caminho)
+    else:
+        df = pd.read_excel(caminho, sheet_name=aba or 0)
+    df = df.set_index(coluna_gcpj)
+    df.index = df.index.astype(str)
+    return df
+
+
+def carregar_lista_gcpjs(caminho, coluna_gcpj='GCPJ'):
+    """Lista de GCPJs a analisar (CSV), na ordem do arquivo"""
+    return pd.read_csv(caminho)[coluna_gcpj].astype(str).tolist()
+
+
+class AgregadosFonte:
+    """Agregados de uma fonte indexada pelo GCPJ, calculados em uma passada"""
+
+    def __init__(self, nome, df):
+        self.nome = nome
+        self.total_registros = len(df)
+        self.colunas = list(df.columns)
+
+        preenchidos = df.notna()
+        self.registros_por_gcpj = df.index.value_counts()
+        self.preenchimento_por_gcpj = preenchidos.groupby(df.index.to_numpy()).any()
+        self.preenchidos_por_coluna = preenchidos.sum()
+        self.distintos_por_coluna = df.nunique()
+
+    def preenchimento(self, campo, gcpjs):
+        """Para cada GCPJ: algum registro da fonte tem o campo preenchido?"""
+        if not campo or campo not in self.preenchimento_por_gcpj.columns:
+            return np.zeros(len(gcpjs), dtype=bool)
+        return self.preenchimento_por_gcpj[campo].reindex(gcpjs, fill_value=False).to_numpy(dtype=bool)
+
+    def padroes_chave(self, tamanhos_prefixo=TAMANHOS_PREFIXO, limite_prefixos=LIMITE_PREFIXOS):
+        """Comprimento, prefixos e formato das chaves GCPJ, contados por registro"""
+        contagens = self.registros_por_gcpj.drop(CHAVE_NULA, errors='ignore')
+        chaves = contagens.index.to_series(index=range(len(contagens)))
+        pesos = pd.Series(contagens.to_numpy(), index=chaves.index)
+
+        prefixos = {}
+        for tamanho in tamanhos_prefixo:
+            com_tamanho = chaves.str.len() >= tamanho
+            por_prefixo = pesos[com_tamanho].groupby(chaves[com_tamanho].str[:tamanho]).sum()
+            prefixos[tamanho] = {
+                prefixo: int(quantidade)
+                for prefixo, quantidade in por_prefixo.sort_values(ascending=False, kind='stable').head(limite_prefixos).items()
+            }
+
+        formatos = np.select(
+            [
+                chaves.str.contains('-', regex=False),
+                chaves.str.contains('.', regex=False) & ~chaves.str.endswith('.0'),
+                chaves.str.endswith('.0'),
+                chaves.str.isdigit()
+            ],
+            ['Com hífen', 'Com ponto (não decimal)', 'Decimal .0', 'Apenas dígitos'],
+            default='Outro formato'
+        )
+
+        return {
+            'registros': int(pesos.sum()),
+            'gcpjs_nulos': int(self.registros_por_gcpj.get(CHAVE_NULA, 0)),
+            'gcpjs_unicos': len(chaves),
+            'registros_duplicados': int((pesos[pesos > 1] - 1).sum()),
+            'comprimentos': {int(k): int(v) for k, v in pesos.groupby(chaves.str.strip().str.len()).sum().items()},
+            'prefixos': prefixos,
+            'formatos': {k: int(v) for k, v in pesos.groupby(formatos).sum().items()}
+        }
+
+    def chaves_normalizadas(self):
+        """GCPJs distintos, com o '.0' que o Excel acrescenta a números removido"""
+        chaves = self.registros_por_gcpj.index.drop(CHAVE_NULA, errors='ignore').to_series()
+        return set(chaves.str.replace(r'^(\d+)\.0+$', r'\1', regex=True))
+
+
+def completude_por_gcpj(gcpjs, mapeamento, agregados):
+    """Presença, duplicados, completude por coluna e score de cada GCPJ da lista
+
+    Mesmo formato do gcpj_completeness_df do analisador v6: o score é a fração de
+    colunas não constantes com dado, arredondada com round() do Python.
+    """
+    total_colunas = len([c for c, (fonte, _) in mapeamento.items() if fonte != 'constant'])
+    if total_colunas == 0:
+        raise ValueError("Nenhuma coluna não constante encontrada no mapeamento!")
+
+    chaves = pd.Index(gcpjs, dtype=object)
+    fontes = ('primary', 'secondary', 'juridico')
+    registros = {}
+    for fonte in fontes:
+        agregado = agregados.get(fonte)
+        if agregado is None:
+            registros[fonte] = np.zeros(len(chaves), dtype=np.int64)
+        else:
+            registros[fonte] = agregado.registros_por_gcpj.reindex(chaves, fill_value=0).to_numpy(dtype=np.int64)
+
+    # Matriz GCPJ x coluna do template: True se algum registro do GCPJ tem o dado
+    colunas = list(mapeamento)
+    preenchidas = np.zeros((len(chaves), len(colunas)), dtype=bool)
+    nao_constantes = np.zeros(len(colunas), dtype=bool)
+    for j, (fonte, campo) in enumerate(mapeamento.values()):
+        if fonte == 'constant':
+            preenchidas[:, j] = True
+            continue
+        nao_constantes[j] = True
+        agregado = agregados.get(fonte)
+        if agregado is not None:
+            preenchidas[:, j] = agregado.preenchimento(campo, chaves)
+
+    tabela_score = np.array([
+        round(min(max(k / total_colunas * 100, 0), 100), 2) for k in range(total_colunas + 1)
+    ])
+    scores = tabela_score[preenchidas[:, nao_constantes].sum(axis=1)]
+
+    # Dicionário de completude e lista de faltantes montados uma vez por padrão distinto
+    if len(chaves):
+        padroes, inverso = np.unique(preenchidas, axis=0, return_inverse=True)
+    else:
+        padroes, inverso = preenchidas, np.zeros(0, dtype=np.int64)
+    completude_padroes = [dict(zip(colunas, padrao.tolist())) for padrao in padroes]
+    faltantes_padroes = [
+        [coluna for coluna, ok, conta in zip(colunas, padrao, nao_constantes) if conta and not ok]
+        for padrao in padroes
+    ]
+
+    return pd.DataFrame({
+        'GCPJ': list(chaves),
+        **{f'in_{fonte}': registros[fonte] > 0 for fonte in fontes},
+        **{f'{fonte}_records': registros[fonte] for fonte in fontes},
+        **{f'{fonte}_has_duplicates': registros[fonte] > 1 for fonte in fontes},
+        'completeness_score': scores,
+        'missing_columns': [list(faltantes_padroes[i]) for i in inverso],
+        'column_completeness': [dict(completude_padroes[i]) for i in inverso]
+    })
+
+
+def completude_por_coluna(gcpjs, mapeamento, agregados):
+    """GCPJs da lista com e sem dado em cada coluna do template (column_completeness_df do v6)"""
+    unicos = pd.Index(pd.unique(pd.Series(gcpjs, dtype=object)))
+    linhas = []
+    for coluna_template, (fonte, campo) in mapeamento.items():
+        linha = {
+            'template_column': coluna_template,
+            'source': fonte,
+            'source_field': campo,
+            'gcpj_with_data': 0,
+            'gcpj_without_data': 0,
+            'completeness_rate': 0
+        }
+
+        if fonte == 'constant':
+            linha['gcpj_with_data'] = len(gcpjs)
+            linha['completeness_rate'] = 100
+        else:
+            agregado = agregados.get(fonte)
+            com_dado = int(agregado.preenchimento(campo, unicos).sum()) if agregado is not None else 0
+            linha['gcpj_with_data'] = com_dado
+            linha['gcpj_without_data'] = len(gcpjs) - com_dado
+            linha['completeness_rate'] = (com_dado / len(gcpjs)) * 100
+
+        linhas.append(linha)
+    return pd.DataFrame(linhas)
+
+
+class MotorAnaliseCompletude:
+    """Carrega as fontes uma vez e alimenta todos os relatórios a partir dos agregados"""
+
+    def __init__(self, fontes, gcpjs=None, mapeamento=None):
+        # fontes: nome -> caminho ou (caminho, aba); a primeira é a fonte principal
+        self.fontes = fontes
+        self.gcpjs = gcpjs
+        self.mapeamento = dict(MAPEAMENTO_COLUNAS if mapeamento is None else mapeamento)
+        self.agregados = {}
+        self._resultados = {}
+
+    def carregar(self):
+        """Lê cada arquivo uma única vez e guarda apenas os agregados"""
+        lidos = {}
+        for nome, fonte in self.fontes.items():
+            caminho, aba = fonte if isinstance(fonte, tuple) else (fonte, None)
+            chave_arquivo = (os.path.abspath(caminho), aba)
+            if chave_arquivo not in lidos:
+                df = ler_fonte_indexada(caminho, aba)
+                lidos[chave_arquivo] = AgregadosFonte(nome, df)
+                logger.info(f"OK {nome}: {len(df)} registros agregados")
+            self.agregados[nome] = lidos[chave_arquivo]
+
+        if self.gcpjs is None and self.agregados:
+            # Sem lista informada: GCPJs distintos da fonte principal
+            principal = next(iter(self.agregados.values()))
+            self.gcpjs = principal.registros_por_gcpj.index.drop(CHAVE_NULA, errors='ignore').tolist()
+        self._resultados.clear()
+        return self.agregados
+
+    def _resultado(self, nome, calcular):
+        # Resultados derivados são calculados uma vez e reaproveitados entre relatórios
+        if nome not in self._resultados:
+            self._resultados[nome] = calcular()
+        return self._resultados[nome]
+
+    def completude_por_gcpj(self):
+        return self._resultado('completude_gcpj', lambda: completude_por_gcpj(self.gcpjs, self.mapeamento, self.agregados))
+
+    def completude_por_coluna(self):
+        return self._resultado('completude_coluna', lambda: completude_por_coluna(self.gcpjs, self.mapeamento, self.agregados))
+
+    def gerar_relatorios(self, destino, nomes=None):
+        """Executa os escritores (todos os registrados, sem nomes); retorna nome -> arquivo"""
+        os.makedirs(destino, exist_ok=True)
+        gerados = {}
+        for nome in (nomes or list(ESCRITORES_RELATORIO)):
+            gerados[nome] = ESCRITORES_RELATORIO[nome](self, destino)
+            logger.info(f"OK Relatório {nome}: {gerados[nome]}")
+        return gerados
+
+
+# ================== ESCRITORES DE RELATÓRIO ==================
+
+ESCRITORES_RELATORIO = {}
+
+
+def escritor_relatorio(nome):
+    """Registra escritor(motor, destino) -> caminho do arquivo gerado"""
+    def registrar(escritor):
+        ESCRITORES_RELATORIO[nome] = escritor
+        return escritor
+    return registrar
+
+
+@escritor_relatorio('completude_gcpj')
+def escrever_completude_gcpj(motor, destino):
+    caminho = os.path.join(destino, 'relatorio_completude_gcpj.csv')
+    motor.completude_por_gcpj().to_csv(caminho, index=False)
+    return caminho
+
+
+@escritor_relatorio('completude_coluna')
+def escrever_completude_coluna(motor, destino):
+    caminho = os.path.join(destino, 'relatorio_completude_coluna.csv')
+    motor.completude_por_coluna().to_csv(caminho, index=False)
+    return caminho
+
+
+@escritor_relatorio('faltantes_gcpj')
+def escrever_faltantes_gcpj(motor, destino):
+    """Colunas faltantes por GCPJ com prioridade de saneamento (export_gcpj_details do v6)"""
+    completude = motor.completude_por_gcpj()
+    scores = completude['completeness_score']
+    detalhes = pd.DataFrame({
+        'GCPJ': completude['GCPJ'],
+        'completeness_score': scores,
+        'missing_columns': [';'.join(faltantes) if faltantes else 'Nenhuma' for faltantes in completude['missing_columns']],
+        'priority': np.select([scores < 30, scores < 70], ['Alta', 'Média'], default='Baixa')
+    })
+    caminho = os.path.join(destino, 'gcpj_missing_columns.csv')
+    detalhes.sort_values(by='completeness_score', ascending=True).to_csv(caminho, index=False)
+    return caminho
+
+
+@escritor_relatorio('preenchimento_fontes')
+def escrever_preenchimento_fontes(motor, destino):
+    """Preenchimento, distintos e vazios de cada coluna de cada fonte"""
+    linhas = []
+    for nome, agregado in motor.agregados.items():
+        for coluna in agregado.colunas:
+            preenchidos = int(agregado.preenchidos_por_coluna[coluna])
+            linhas.append({
+                'fonte': nome,
+                'coluna': coluna,
+                'total_registros': agregado.total_registros,
+                'registros_preenchidos': preenchidos,
+                'taxa_completude': round(preenchidos / agregado.total_registros * 100, 2) if agregado.total_registros else 0.0,
+                'valores_unicos': int(agregado.distintos_por_coluna[coluna]),
+                'valores_vazios': agregado.total_registros - preenchidos
+            })
+    caminho = os.path.join(destino, 'relatorio_preenchimento_fontes.csv')
+    pd.DataFrame(linhas).to_csv(caminho, index=False)
+    return caminho
+
+
+@escritor_relatorio('padroes_gcpj')
+def escrever_padroes_gcpj(motor, destino):
+    """Formato das chaves por fonte e sobreposição de GCPJs entre as fontes"""
+    normalizadas = {nome: agregado.chaves_normalizadas() for nome, agregado in motor.agregados.items()}
+    nomes = list(normalizadas)
+    sobreposicao = []
+    for i, nome_a in enumerate(nomes):
+        for nome_b in nomes[i + 1:]:
+            a, b = normalizadas[nome_a], normalizadas[nome_b]
+            sobreposicao.append({
+                'fontes': [nome_a, nome_b],
+                'em_ambas': len(a & b),
+                f'apenas_{nome_a}': len(a - b),
+                f'apenas_{nome_b}': len(b - a)
+            })
+
+    relatorio = {
+        'padroes': {nome: agregado.padroes_chave() for nome, agregado in motor.agregados.items()},
+        'sobreposicao': sobreposicao
+    }
+    caminho = os.path.join(destino, 'relatorio_padroes_gcpj.json')
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    return caminho
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    motor = MotorAnaliseCompletude(
+        {
+            'primary': 'cópiaMOYA E LARA_BASE GCPJ ATIVOS  07_04_2025.xlsx',
+            'secondary': '4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx',
+            'juridico': 'BASE JURIDICO_CPJ3C  07_04_2025_dados avalistas.xlsx'
+        },
+        gcpjs=carregar_lista_gcpjs('listagcpjnão_encontrados_octopus.csv')
+    )
+    motor.carregar()
+    for nome, arquivo in motor.gerar_relatorios('relatorios_completude').items():
+        print(f"{nome}: {arquivo}")
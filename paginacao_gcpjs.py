@@ -0,0 +1,53 @@
+"""
+Paginação por Cursor de Listas Ordenadas de GCPJs
+
+Usado pelo ControleQualidade na API /api/gcpjs_ausentes, sobre as listas
+ordenadas de GCPJs ausentes mantidas em cache.
+
+FUNCIONAMENTO:
+- A lista é um array numpy de strings já ordenado
+- A busca por prefixo vira a faixa [busca, busca + '\\uffff') da lista
+- O cursor ('apos') é o último GCPJ da página anterior, localizado por busca
+  binária: cada página custa duas buscas, independente do tamanho da lista
+
+USO:
+    pagina = paginar_lista_ordenada(lista, busca='16', apos=pagina['proximo'], limite=100)
+    pagina['gcpjs'], pagina['total'], pagina['proximo']
+"""
+
+import numpy as np
+
+# Tamanho padrão e máximo das páginas das listas de GCPJs
+TAMANHO_PAGINA_GCPJS = 100
+LIMITE_PAGINA_GCPJS = 1000
+
+
+def paginar_lista_ordenada(lista, busca=None, apos=None, limite=TAMANHO_PAGINA_GCPJS, decrescente=False):
+    """Página de uma lista ordenada de GCPJs por cursor (keyset)
+
+    'apos' é o último GCPJ da página anterior; 'busca' restringe a um prefixo.
+    'total' é a quantidade de GCPJs na faixa da busca.
+    """
+    inicio, fim = 0, len(lista)
+    if busca:
+        inicio = int(np.searchsorted(lista, busca, side='left'))
+        fim = int(np.searchsorted(lista, busca + '\uffff', side='left'))
+    total = fim - inicio
+
+    if decrescente:
+        if apos:
+            fim = max(inicio, min(fim, int(np.searchsorted(lista, apos, side='left'))))
+        pagina = lista[max(inicio, fim - limite):fim][::-1]
+        tem_mais = fim - limite > inicio
+    else:
+        if apos:
+            inicio = min(fim, max(inicio, int(np.searchsorted(lista, apos, side='right'))))
+        pagina = lista[inicio:inicio + limite]
+        tem_mais = inicio + limite < fim
+
+    pagina = pagina.tolist()
+    return {
+        'gcpjs': pagina,
+        'total': total,
+        'proximo': pagina[-1] if tem_mais and pagina else None
+    }
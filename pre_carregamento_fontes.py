@@ -0,0 +1,69 @@
+"""
+Pré-carregamento das Fontes Antes do Fork (gunicorn --preload)
+
+Usado pelo gunicorn.conf.py: sem ele cada worker lia e indexava sozinho as mesmas
+planilhas (GCPJ ATIVOS, BASE ATIVA), multiplicando o tempo de subida e a memória
+pelo número de workers.
+
+FUNCIONAMENTO:
+- O processo mestre importa a aplicação (preload_app) e chama pre_carregar(): as
+  fontes ativas entram no CacheFontesMemoria antes do fork, e os workers herdam as
+  páginas por copy-on-write
+- Os DataFrames são os mesmos de uma leitura normal (mesmos dtypes que rodando
+  python app.py): as colunas numéricas ficam em arrays numpy, que o worker só lê e
+  por isso continuam compartilhadas; as páginas das strings de colunas object são
+  copiadas para o worker à medida que ele as toca
+- preparar_fork() roda no mestre logo antes do fork (when_ready): gc.freeze() move
+  os objetos para a geração permanente, então as coletas dos workers não percorrem
+  (nem sujam) as páginas herdadas; as conexões SQLite abertas pelo mestre na
+  importação são fechadas e cada worker abre as suas no primeiro acesso
+- Fontes trocadas depois do fork continuam sendo detectadas pela assinatura do
+  arquivo e relidas pelo worker
+
+USO:
+    # módulo da interface (chamado pelo gunicorn.conf.py)
+    def pre_carregar_fontes():
+        fontes = [fonte for _, fonte in master_db.obter_fontes_ativas().iterrows()]
+        return pre_carregar(processador.fontes_carregadas, fontes, processador.carregar_fonte)
+"""
+
+import gc
+import logging
+import time
+
+from conexao_sqlite import fechar_conexoes
+
+logger = logging.getLogger(__name__)
+
+
+def congelar_heap():
+    """Coleta o lixo e congela os objetos sobreviventes (não são mais varridos pelo gc)"""
+    gc.collect()
+    gc.freeze()
+
+
+def pre_carregar(cache, fontes, carregar):
+    """Carrega as fontes no cache do processo mestre
+
+    carregar(fonte) deve passar a fonte pelo cache (ex.: carregar_fonte); uma fonte
+    com erro fica para o primeiro acesso do worker. Retorna as estatísticas do cache.
+    """
+    inicio = time.monotonic()
+    for fonte in fontes:
+        try:
+            carregar(fonte)
+        except Exception as e:
+            logger.warning(f"Fonte não pré-carregada: {e}")
+    estatisticas = cache.estatisticas()
+    logger.info(
+        f"Fontes pré-carregadas: {estatisticas['entradas']} em "
+        f"{time.monotonic() - inicio:.1f}s ({estatisticas['memoria_mb']} MB)"
+    )
+    return estatisticas
+
+
+def preparar_fork():
+    """Último passo no mestre antes do fork dos workers"""
+    # Conexões SQLite não podem atravessar o fork
+    fechar_conexoes()
+    congelar_heap()
@@ -0,0 +1,304 @@
+"""
+Progresso de Execuções Longas (Server-Sent Events)
+
+Usado pelos diagnósticos de completude e pela migração, que rodam por minutos e
+antes só registravam progresso no log.
+
+FUNCIONAMENTO:
+- Cada execução recebe um Progresso: fase atual, feitos/total da fase, registros
+  por segundo e ETA (estimado pela taxa média desde o início da fase)
+- O motor chama progresso.fase(...) e progresso.avancar(...); as notificações aos
+  ouvintes são limitadas a uma a cada INTERVALO_MINIMO_NOTIFICACAO segundos, então
+  avançar registro a registro não pesa no laço
+- avancar() também verifica o cancelamento: depois de progresso.cancelar() (rota
+  /api/progresso/<id>/cancelar), a próxima chamada levanta ExecucaoCancelada
+- Execuções enfileiradas (executor_tarefas) nascem no estado 'na_fila' e passam a
+  'executando' em progresso.comecar()
+- O PainelProgresso guarda as execuções do processo e gera o fluxo text/event-stream
+  consumido pelo EventSource do dashboard (evento 'progresso' a cada mudança,
+  'fim' quando a execução termina e comentários de keep-alive enquanto ociosa)
+
+USO:
+    painel = PainelProgresso()
+
+    with painel.execucao('diagnostico') as progresso:
+        progresso.fase('Calculando', total=len(gcpjs), unidade='GCPJs')
+        for gcpj in gcpjs:
+            ...
+            progresso.avancar()
+
+    @app.route('/api/progresso/eventos')
+    def api_eventos_progresso():
+        return resposta_eventos(painel, tipo=request.args.get('tipo'))
+"""
+
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Intervalo mínimo entre duas notificações de avanço da mesma execução (segundos)
+INTERVALO_MINIMO_NOTIFICACAO = 0.25
+
+# Sem mudanças, o fluxo SSE envia um comentário a cada N segundos (mantém proxies abertos)
+INTERVALO_KEEP_ALIVE = 15
+
+# Execuções encerradas mantidas para consulta
+LIMITE_EXECUCOES_ENCERRADAS = 20
+
+ESTADO_NA_FILA = 'na_fila'
+ESTADO_EXECUTANDO = 'executando'
+ESTADO_CONCLUIDO = 'concluido'
+ESTADO_CANCELADO = 'cancelado'
+ESTADO_ERRO = 'erro'
+ESTADOS_ATIVOS = (ESTADO_NA_FILA, ESTADO_EXECUTANDO)
+
+
+class ExecucaoCancelada(Exception):
+    """Levantada no motor quando o operador cancela a execução"""
+
+
+class Progresso:
+    """Estado de progresso de uma execução, atualizado pelo motor"""
+
+    def __init__(self, painel, tipo, na_fila=False):
+        self.painel = painel
+        self.id = uuid.uuid4().hex[:12]
+        self.tipo = tipo
+        self.estado = ESTADO_NA_FILA if na_fila else ESTADO_EXECUTANDO
+        self.nome_fase = 'Na fila' if na_fila else 'Iniciando'
+        self.unidade = 'registros'
+        self.feitos = 0
+        self.total = None
+        self.mensagem = ''
+        self.inicio = time.monotonic()
+        self.inicio_fase = self.inicio
+        self.fim = None
+        # Incrementada a cada notificação; os ouvintes comparam para saber se há novidade
+        self.versao = 0
+        self._ultima_notificacao = 0.0
+        self._cancelamento = threading.Event()
+
+    @property
+    def cancelado(self):
+        return self._cancelamento.is_set()
+
+    @property
+    def ativo(self):
+        return self.estado in ESTADOS_ATIVOS
+
+    def comecar(self):
+        """Sai da fila: o tempo decorrido e a taxa passam a contar daqui"""
+        self.verificar_cancelamento()
+        self.estado = ESTADO_EXECUTANDO
+        self.nome_fase = 'Iniciando'
+        self.inicio = self.inicio_fase = time.monotonic()
+        self.painel.notificar(self, forcar=True)
+
+    def fase(self, nome, total=None, unidade='registros'):
+        """Inicia uma nova fase; feitos e taxa recomeçam do zero"""
+        self.verificar_cancelamento()
+        self.nome_fase = nome
+        self.total = total
+        self.unidade = unidade
+        self.feitos = 0
+        self.inicio_fase = time.monotonic()
+        self.painel.notificar(self, forcar=True)
+
+    def avancar(self, quantidade=1):
+        """Registra quantidade feita na fase atual e verifica o cancelamento"""
+        self.verificar_cancelamento()
+        self.feitos += quantidade
+        self.painel.notificar(self)
+
+    def verificar_cancelamento(self):
+        if self._cancelamento.is_set():
+            raise ExecucaoCancelada(f"Execução {self.id} cancelada pelo operador")
+
+    def cancelar(self):
+        """Pede o cancelamento; o motor para no próximo avancar()/fase()"""
+        if self.ativo:
+            self._cancelamento.set()
+            self.mensagem = 'Cancelamento solicitado'
+            self.painel.notificar(self, forcar=True)
+
+    def encerrar(self, estado, mensagem=''):
+        self.estado = estado
+        self.mensagem = mensagem
+        self.fim = time.monotonic()
+        self.painel.notificar(self, forcar=True)
+
+    def instantaneo(self):
+        """Estado atual serializável (o que vai em cada evento SSE)"""
+        agora = self.fim if self.fim is not None else time.monotonic()
+        duracao_fase = max(agora - self.inicio_fase, 1e-9)
+        taxa = self.feitos / duracao_fase if self.feitos else 0.0
+
+        percentual = None
+        eta = None
+        if self.total:
+            percentual = min(100.0, self.feitos / self.total * 100)
+            if taxa > 0 and self.estado == ESTADO_EXECUTANDO:
+                eta = max(self.total - self.feitos, 0) / taxa
+
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'fase': self.nome_fase,
+            'unidade': self.unidade,
+            'feitos': self.feitos,
+            'total': self.total,
+            'percentual': round(percentual, 1) if percentual is not None else None,
+            'por_segundo': round(taxa, 1),
+            'eta_segundos': round(eta, 1) if eta is not None else None,
+            'decorrido_segundos': round(agora - self.inicio, 1),
+            'cancelamento_solicitado': self.cancelado,
+            'mensagem': self.mensagem
+        }
+
+
+class ProgressoNulo:
+    """Progresso que não publica nada (motor chamado fora da interface web)"""
+
+    cancelado = False
+
+    def fase(self, nome, total=None, unidade='registros'):
+        pass
+
+    def avancar(self, quantidade=1):
+        pass
+
+    def verificar_cancelamento(self):
+        pass
+
+
+PROGRESSO_NULO = ProgressoNulo()
+
+
+class PainelProgresso:
+    """Registro das execuções do processo e distribuição dos eventos aos ouvintes"""
+
+    def __init__(self, limite_encerradas=LIMITE_EXECUCOES_ENCERRADAS):
+        self.limite_encerradas = limite_encerradas
+        self._execucoes = OrderedDict()
+        self._condicao = threading.Condition()
+
+    def iniciar(self, tipo, na_fila=False):
+        """Registra uma nova execução do tipo informado (na fila, se ainda não começou)"""
+        progresso = Progresso(self, tipo, na_fila=na_fila)
+        with self._condicao:
+            self._execucoes[progresso.id] = progresso
+            self._descartar_antigas()
+            self._condicao.notify_all()
+        return progresso
+
+    @contextmanager
+    def execucao(self, tipo):
+        """Execução com encerramento automático (concluída, cancelada ou com erro)"""
+        progresso = self.iniciar(tipo)
+        try:
+            yield progresso
+        except ExecucaoCancelada:
+            progresso.encerrar(ESTADO_CANCELADO, 'Execução cancelada pelo operador')
+            raise
+        except Exception as e:
+            progresso.encerrar(ESTADO_ERRO, str(e))
+            raise
+        else:
+            progresso.encerrar(ESTADO_CONCLUIDO, 'Execução concluída')
+
+    def _descartar_antigas(self):
+        encerradas = [id_ for id_, p in self._execucoes.items() if not p.ativo]
+        for id_ in encerradas[:max(len(encerradas) - self.limite_encerradas, 0)]:
+            del self._execucoes[id_]
+
+    def notificar(self, progresso, forcar=False):
+        agora = time.monotonic()
+        if not forcar and agora - progresso._ultima_notificacao < INTERVALO_MINIMO_NOTIFICACAO:
+            return
+        progresso._ultima_notificacao = agora
+        with self._condicao:
+            progresso.versao += 1
+            self._condicao.notify_all()
+
+    def obter(self, execucao_id):
+        with self._condicao:
+            return self._execucoes.get(execucao_id)
+
+    def ativa(self, tipo=None):
+        """Execução em andamento (ou na fila) mais recente do tipo, se informado"""
+        with self._condicao:
+            for progresso in reversed(self._execucoes.values()):
+                if progresso.ativo and tipo in (None, progresso.tipo):
+                    return progresso
+        return None
+
+    def listar(self):
+        with self._condicao:
+            return [p.instantaneo() for p in reversed(self._execucoes.values())]
+
+    def cancelar(self, execucao_id):
+        """Pede o cancelamento; retorna False se a execução não existe ou já terminou"""
+        progresso = self.obter(execucao_id)
+        if progresso is None or not progresso.ativo:
+            return False
+        progresso.cancelar()
+        return True
+
+    def eventos(self, execucao_id=None, tipo=None, keep_alive=INTERVALO_KEEP_ALIVE):
+        """Gera o fluxo SSE de uma execução
+
+        Sem execucao_id, acompanha a execução ativa do tipo ou espera a próxima a
+        começar (o dashboard abre o fluxo antes de disparar a execução).
+        """
+        progresso = None
+        versao_enviada = -1
+
+        while True:
+            evento = None
+            with self._condicao:
+                if progresso is None:
+                    progresso = self.obter(execucao_id) if execucao_id else self.ativa(tipo)
+                if progresso is None and execucao_id:
+                    evento = formatar_evento('fim', {'id': execucao_id, 'estado': 'desconhecido'})
+                elif progresso is not None and progresso.versao != versao_enviada:
+                    versao_enviada = progresso.versao
+                    dados = progresso.instantaneo()
+                    nome = 'progresso' if dados['estado'] in ESTADOS_ATIVOS else 'fim'
+                    evento = formatar_evento(nome, dados)
+                elif not self._condicao.wait(timeout=keep_alive):
+                    evento = ': keep-alive\n\n'
+
+            # O yield fica fora da trava: o cliente pode demorar a consumir
+            if evento is not None:
+                yield evento
+                if evento.startswith('event: fim'):
+                    return
+
+
+def formatar_evento(evento, dados):
+    """Mensagem no formato text/event-stream"""
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+
+def resposta_eventos(painel, execucao_id=None, tipo=None):
+    """Resposta Flask com o fluxo SSE de progresso
+
+    painel pode ser o PainelProgresso (execuções do processo) ou um ExecutorTarefas
+    (tarefas de qualquer worker).
+    """
+    # Import local: os motores usam este módulo fora da interface web
+    from flask import Response
+
+    return Response(
+        painel.eventos(execucao_id=execucao_id, tipo=tipo),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            # Impede o buffering do proxy reverso (nginx)
+            'X-Accel-Buffering': 'no'
+        }
+    )
@@ -17,10 +17,17 @@ master_database.db
 └── execucoes_historico (log de execuções)
 """
 
-import sqlite3
+from conexao_sqlite import conexao
+from migracoes_schema import aplicar_migracoes
+from importacao_escopo import carregar_gcpjs_escopo, importar_arquivo_escopo, atualizar_escopo_gcpjs
+from cache_colunar_fontes import CacheColunarFontes
+from staging_fontes import StagingFontes, citar_coluna, colunas_citadas
+from progresso_execucao import PROGRESSO_NULO
 import pandas as pd
 import os
 import json
+import hashlib
+import sqlite3
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import logging
@@ -33,275 +40,472 @@ class MasterDatabaseManager:
     def __init__(self, base_path="C:/desenvolvimento/migration_app"):
         self.base_path = base_path
         self.db_path = os.path.join(base_path, "master_database.db")
+        self.cache_fontes = CacheColunarFontes(base_path)
+        self.staging = StagingFontes(base_path, self.cache_fontes)
         self.init_master_database()
     
     def init_master_database(self):
         """Inicializa banco master com todas as tabelas necessárias"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # 1. Tabela de escopo de GCPJs (controla quais GCPJs exportar)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS gcpj_escopo (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                gcpj TEXT UNIQUE NOT NULL,
-                ativo BOOLEAN DEFAULT 1,
-                motivo_inclusao TEXT,
-                data_inclusao TEXT,
-                criterios_filtro TEXT,
-                observacoes TEXT
-            )
-        ''')
-        
-        # 2. Tabela de fontes de dados disponíveis
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fontes_dados (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome_fonte TEXT UNIQUE NOT NULL,
-                tipo_fonte TEXT NOT NULL, -- 'excel', 'csv', 'database'
-                caminho_arquivo TEXT,
-                aba_planilha TEXT,
-                coluna_gcpj TEXT NOT NULL,
-                ativa BOOLEAN DEFAULT 1,
-                prioridade INTEGER DEFAULT 10, -- menor = maior prioridade
-                descricao TEXT,
-                data_criacao TEXT
-            )
-        ''')
-        
-        # 3. Tabela de mapeamento por coluna (qual fonte usar para cada coluna)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS mapeamento_colunas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                coluna_template TEXT NOT NULL,
-                fonte_id INTEGER,
-                coluna_origem TEXT NOT NULL,
-                prioridade INTEGER DEFAULT 10,
-                ativa BOOLEAN DEFAULT 1,
-                tipo_mapeamento TEXT DEFAULT 'direto', -- 'direto', 'constante', 'calculado'
-                valor_constante TEXT,
-                formula_calculo TEXT,
-                observacoes TEXT,
-                FOREIGN KEY (fonte_id) REFERENCES fontes_dados (id)
-            )
-        ''')
-        
-        # 4. Tabela da estrutura do template
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS template_colunas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                coluna_nome TEXT UNIQUE NOT NULL,
-                posicao INTEGER,
-                tipo_dados TEXT,
-                obrigatoria BOOLEAN DEFAULT 0,
-                descricao TEXT,
-                categoria TEXT -- 'identificacao', 'financeiro', 'juridico', etc.
-            )
-        ''')
-        
-        # 5. Tabela de critérios de escopo (regras para inclusão automática)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS criterios_escopo (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome_criterio TEXT NOT NULL,
-                fonte_verificacao TEXT NOT NULL,
-                condicao_sql TEXT NOT NULL,
-                ativo BOOLEAN DEFAULT 1,
-                descricao TEXT,
-                data_criacao TEXT
-            )
-        ''')
-        
-        # 6. Tabela de histórico de execuções detalhadas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS execucoes_master (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                tipo_execucao TEXT NOT NULL, -- 'diagnostico', 'migracao', 'validacao'
-                configuracao_fontes TEXT, -- JSON com config usada
-                escopo_gcpjs INTEGER, -- quantidade de GCPJs no escopo
-                registros_processados INTEGER,
-                registros_exportados INTEGER,
-                taxa_sucesso REAL,
-                observacoes TEXT,
-                arquivo_resultado TEXT
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
+        
+            # 1. Tabela de escopo de GCPJs (controla quais GCPJs exportar)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS gcpj_escopo (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    gcpj TEXT UNIQUE NOT NULL,
+                    ativo BOOLEAN DEFAULT 1,
+                    motivo_inclusao TEXT,
+                    data_inclusao TEXT,
+                    criterios_filtro TEXT,
+                    observacoes TEXT
+                )
+            ''')
+        
+            # 2. Tabela de fontes de dados disponíveis
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS fontes_dados (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome_fonte TEXT UNIQUE NOT NULL,
+                    tipo_fonte TEXT NOT NULL, -- 'excel', 'csv', 'database'
+                    caminho_arquivo TEXT,
+                    aba_planilha TEXT,
+                    coluna_gcpj TEXT NOT NULL,
+                    ativa BOOLEAN DEFAULT 1,
+                    prioridade INTEGER DEFAULT 10, -- menor = maior prioridade
+                    descricao TEXT,
+                    data_criacao TEXT
+                )
+            ''')
+        
+            # 3. Tabela de mapeamento por coluna (qual fonte usar para cada coluna)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS mapeamento_colunas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    coluna_template TEXT NOT NULL,
+                    fonte_id INTEGER,
+                    coluna_origem TEXT NOT NULL,
+                    prioridade INTEGER DEFAULT 10,
+                    ativa BOOLEAN DEFAULT 1,
+                    tipo_mapeamento TEXT DEFAULT 'direto', -- 'direto', 'constante', 'calculado'
+                    valor_constante TEXT,
+                    formula_calculo TEXT,
+                    observacoes TEXT,
+                    FOREIGN KEY (fonte_id) REFERENCES fontes_dados (id)
+                )
+            ''')
+        
+            # 4. Tabela da estrutura do template
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS template_colunas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    coluna_nome TEXT UNIQUE NOT NULL,
+                    posicao INTEGER,
+                    tipo_dados TEXT,
+                    obrigatoria BOOLEAN DEFAULT 0,
+                    descricao TEXT,
+                    categoria TEXT -- 'identificacao', 'financeiro', 'juridico', etc.
+                )
+            ''')
+        
+            # 5. Tabela de critérios de escopo (regras para inclusão automática)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS criterios_escopo (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    nome_criterio TEXT NOT NULL,
+                    fonte_verificacao TEXT NOT NULL,
+                    condicao_sql TEXT NOT NULL,
+                    ativo BOOLEAN DEFAULT 1,
+                    descricao TEXT,
+                    data_criacao TEXT
+                )
+            ''')
+        
+            # 6. Tabela de histórico de execuções detalhadas
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS execucoes_master (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    tipo_execucao TEXT NOT NULL, -- 'diagnostico', 'migracao', 'validacao'
+                    configuracao_fontes TEXT, -- JSON com config usada
+                    escopo_gcpjs INTEGER, -- quantidade de GCPJs no escopo
+                    registros_processados INTEGER,
+                    registros_exportados INTEGER,
+                    taxa_sucesso REAL,
+                    observacoes TEXT,
+                    arquivo_resultado TEXT
+                )
+            ''')
+        
+            conn.commit()
+
+            # Aplicar migrações de schema pendentes (índices etc.)
+            aplicar_migracoes(conn, 'master_database')
         
         # Inicializar dados básicos se não existirem
         self.inicializar_dados_basicos()
     
     def inicializar_dados_basicos(self):
         """Inicializa dados básicos se o banco estiver vazio"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
         
-        # Verificar se já existem dados
-        cursor.execute("SELECT COUNT(*) FROM fontes_dados")
-        if cursor.fetchone()[0] == 0:
-            logger.info("Inicializando dados básicos do master database...")
+            # Verificar se já existem dados
+            cursor.execute("SELECT COUNT(*) FROM fontes_dados")
+            if cursor.fetchone()[0] == 0:
+                logger.info("Inicializando dados básicos do master database...")
             
-            # Fontes padrão
-            fontes_padrao = [
-                ("Fonte Principal GCPJ", "excel", "cópia-MOYA E LARA_BASE GCPJ ATIVOS - 07_04_2025.xlsx", "Sheet1", "GCPJ", 1, 1, "Fonte principal com dados jurídicos"),
-                ("Base Ativa Escritório", "excel", "4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx", "Sheet1", "GCPJ", 1, 2, "Base secundária via GCPJ"),
-                ("Contratos Específicos", "excel", "", "Sheet1", "GCPJ", 0, 3, "Fonte futura para dados de contratos"),
-                ("Dados Financeiros", "excel", "", "Sheet1", "GCPJ", 0, 4, "Fonte futura para informações financeiras")
-            ]
+                # Fontes padrão
+                fontes_padrao = [
+                    ("Fonte Principal GCPJ", "excel", "cópia-MOYA E LARA_BASE GCPJ ATIVOS - 07_04_2025.xlsx", "Sheet1", "GCPJ", 1, 1, "Fonte principal com dados jurídicos"),
+                    ("Base Ativa Escritório", "excel", "4.MOYA E LARA SOCIEDADE DE ADVOGADOS_PRÉVIA BASE ATIVA _ABRIL_disp_24_04_2025.xlsx", "Sheet1", "GCPJ", 1, 2, "Base secundária via GCPJ"),
+                    ("Contratos Específicos", "excel", "", "Sheet1", "GCPJ", 0, 3, "Fonte futura para dados de contratos"),
+                    ("Dados Financeiros", "excel", "", "Sheet1", "GCPJ", 0, 4, "Fonte futura para informações financeiras")
+                ]
             
-            cursor.executemany('''
-                INSERT INTO fontes_dados (nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj, ativa, prioridade, descricao)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', fontes_padrao)
+                cursor.executemany('''
+                    INSERT INTO fontes_dados (nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj, ativa, prioridade, descricao)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', fontes_padrao)
             
-            # Template colunas básicas
-            colunas_template = [
-                ("CÓD. INTERNO", 1, "texto", 1, "Código interno GCPJ", "identificacao"),
-                ("PROCESSO", 2, "texto", 1, "Número do processo", "juridico"),
-                ("PROCEDIMENTO", 3, "texto", 0, "Tipo de ação/procedimento", "juridico"),
-                ("CPF/CNPJ", 4, "texto", 1, "Documento da parte", "identificacao"),
-                ("SEGMENTO DO CONTRATO", 5, "texto", 0, "Segmento do contrato", "financeiro"),
-                ("OPERAÇÃO", 6, "texto", 0, "Tipo de operação", "financeiro")
-            ]
+                # Template colunas básicas
+                colunas_template = [
+                    ("CÓD. INTERNO", 1, "texto", 1, "Código interno GCPJ", "identificacao"),
+                    ("PROCESSO", 2, "texto", 1, "Número do processo", "juridico"),
+                    ("PROCEDIMENTO", 3, "texto", 0, "Tipo de ação/procedimento", "juridico"),
+                    ("CPF/CNPJ", 4, "texto", 1, "Documento da parte", "identificacao"),
+                    ("SEGMENTO DO CONTRATO", 5, "texto", 0, "Segmento do contrato", "financeiro"),
+                    ("OPERAÇÃO", 6, "texto", 0, "Tipo de operação", "financeiro")
+                ]
             
-            cursor.executemany('''
-                INSERT INTO template_colunas (coluna_nome, posicao, tipo_dados, obrigatoria, descricao, categoria)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', colunas_template)
+                cursor.executemany('''
+                    INSERT INTO template_colunas (coluna_nome, posicao, tipo_dados, obrigatoria, descricao, categoria)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', colunas_template)
         
-        conn.commit()
-        conn.close()
+            conn.commit()
     
     # ======= GESTÃO DE ESCOPO DE GCPJs =======
     
     def adicionar_gcpjs_escopo(self, gcpjs: List[str], motivo: str = "Inclusão manual"):
         """Adiciona GCPJs ao escopo de exportação"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        timestamp = datetime.now().isoformat()
-        sucesso = 0
-        
-        for gcpj in gcpjs:
-            try:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO gcpj_escopo (gcpj, ativo, motivo_inclusao, data_inclusao)
-                    VALUES (?, 1, ?, ?)
-                ''', (str(gcpj).strip(), motivo, timestamp))
-                sucesso += cursor.rowcount
-            except Exception as e:
-                logger.warning(f"Erro ao adicionar GCPJ {gcpj}: {str(e)}")
-        
-        conn.commit()
-        conn.close()
+        with conexao(self.db_path) as conn:
+            sucesso = carregar_gcpjs_escopo(
+                conn, 'gcpj_escopo', 'motivo_inclusao', [str(gcpj).strip() for gcpj in gcpjs], motivo
+            )
+            conn.commit()
         
         logger.info(f"Adicionados {sucesso} GCPJs ao escopo (de {len(gcpjs)} tentativas)")
         return sucesso
     
+    def importar_escopo_arquivo(self, caminho: str, coluna_gcpj: str, aba: Optional[str] = None,
+                                motivo: str = "Upload de arquivo") -> Dict:
+        """Importa em massa a coluna de GCPJs de um arquivo (Excel/CSV) para o escopo"""
+        with conexao(self.db_path) as conn:
+            resumo = importar_arquivo_escopo(
+                conn, 'gcpj_escopo', 'motivo_inclusao', caminho, coluna_gcpj, aba=aba, motivo=motivo
+            )
+            conn.commit()
+        
+        logger.info(f"Escopo importado: {resumo['adicionados']} adicionados, "
+                    f"{resumo['duplicados']} duplicados, {resumo['invalidos']} inválidos")
+        return resumo
+    
     def obter_escopo_gcpjs(self, apenas_ativos=True) -> List[str]:
         """Obtém lista de GCPJs no escopo"""
-        conn = sqlite3.connect(self.db_path)
+        with conexao(self.db_path) as conn:
         
-        where_clause = "WHERE ativo = 1" if apenas_ativos else ""
-        df = pd.read_sql_query(f"SELECT gcpj FROM gcpj_escopo {where_clause} ORDER BY gcpj", conn)
+            where_clause = "WHERE ativo = 1" if apenas_ativos else ""
+            df = pd.read_sql_query(f"SELECT gcpj FROM gcpj_escopo {where_clause} ORDER BY gcpj", conn)
         
-        conn.close()
         return df['gcpj'].tolist()
     
-    def aplicar_criterio_escopo(self, nome_criterio: str, fonte_dados: str, condicao_sql: str):
-        """Aplica critério para inclusão automática de GCPJs"""
+    def aplicar_criterio_escopo(self, nome_criterio: str, fonte_dados: str, condicao_sql: str) -> Dict:
+        """Salva e aplica critério para inclusão automática de GCPJs
+        
+        A condição é validada na tabela de staging da fonte antes de ser salva:
+        um critério inválido levanta ValueError e não fica gravado.
+        """
         # Por exemplo: incluir todos os GCPJs da fonte principal que tenham PROCESSO preenchido
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        self.validar_criterio_escopo(fonte_dados, condicao_sql)
         
-        # Salvar critério
-        cursor.execute('''
-            INSERT OR REPLACE INTO criterios_escopo (nome_criterio, fonte_verificacao, condicao_sql, data_criacao)
-            VALUES (?, ?, ?, ?)
-        ''', (nome_criterio, fonte_dados, condicao_sql, datetime.now().isoformat()))
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
         
-        # TODO: Implementar execução do critério SQL na fonte
+            # Salvar critério
+            cursor.execute('''
+                INSERT OR REPLACE INTO criterios_escopo (nome_criterio, fonte_verificacao, condicao_sql, data_criacao)
+                VALUES (?, ?, ?, ?)
+            ''', (nome_criterio, fonte_dados, condicao_sql, datetime.now().isoformat()))
         
-        conn.commit()
-        conn.close()
+            conn.commit()
+        
+        return self.executar_criterio_escopo(nome_criterio)
+    
+    def validar_criterio_escopo(self, fonte_dados: str, condicao_sql: str):
+        """Compila a condição SQL sobre a tabela de staging da fonte (ValueError se inválida)"""
+        with conexao(self.db_path) as conn:
+            fonte = conn.execute(
+                "SELECT id FROM fontes_dados WHERE nome_fonte = ?", (fonte_dados,)
+            ).fetchone()
+        
+        if fonte is None:
+            raise ValueError(f"Fonte '{fonte_dados}' não encontrada")
+        
+        catalogo = self.materializar_fonte(fonte[0], condicoes=[condicao_sql])
+        leitura = self.staging.conexao_leitura()
+        try:
+            leitura.execute(f"SELECT gcpj_canonico FROM {catalogo['tabela']} WHERE ({condicao_sql}) LIMIT 0")
+        except sqlite3.Error as e:
+            raise ValueError(f"Condição inválida para a fonte '{fonte_dados}': {e}") from e
+        finally:
+            leitura.close()
+    
+    def executar_criterio_escopo(self, nome_criterio: str) -> Dict:
+        """Executa um critério salvo e inclui no escopo os GCPJs que o satisfazem
+        
+        A condição é avaliada sobre a tabela de staging da fonte, que projeta as
+        colunas citadas nos critérios. Se nem a fonte nem o critério mudaram desde a
+        última execução, o resultado salvo é reaproveitado.
+        """
+        with conexao(self.db_path) as conn:
+            criterio = conn.execute('''
+                SELECT id, fonte_verificacao, condicao_sql FROM criterios_escopo
+                WHERE nome_criterio = ? AND ativo = 1
+                ORDER BY id DESC LIMIT 1
+            ''', (nome_criterio,)).fetchone()
+            
+            if criterio is None:
+                raise ValueError(f"Critério '{nome_criterio}' não encontrado")
+            criterio_id, nome_fonte, condicao_sql = criterio
+            
+            fonte = conn.execute(
+                "SELECT id FROM fontes_dados WHERE nome_fonte = ?", (nome_fonte,)
+            ).fetchone()
+        
+        if fonte is None:
+            raise ValueError(f"Fonte '{nome_fonte}' do critério '{nome_criterio}' não encontrada")
+        
+        catalogo = self.materializar_fonte(fonte[0])
+        assinatura = hashlib.sha1(
+            f"{catalogo['assinatura']}|{catalogo['coluna_gcpj']}|{condicao_sql}".encode('utf-8')
+        ).hexdigest()
+        
+        with conexao(self.db_path) as conn:
+            salvo = conn.execute(
+                "SELECT assinatura, gcpjs FROM resultados_criterios WHERE criterio_id = ?", (criterio_id,)
+            ).fetchone()
+        
+        reaproveitado = salvo is not None and salvo[0] == assinatura
+        if reaproveitado:
+            gcpjs = json.loads(salvo[1])
+        else:
+            gcpjs = self.filtrar_gcpjs_fonte(catalogo['tabela'], condicao_sql)
+        
+        with conexao(self.db_path) as conn:
+            if not reaproveitado:
+                conn.execute('''
+                    INSERT OR REPLACE INTO resultados_criterios (criterio_id, assinatura, gcpjs, total, data_execucao)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (criterio_id, assinatura, json.dumps(gcpjs), len(gcpjs), datetime.now().isoformat()))
+            
+            inseridos, atualizados = atualizar_escopo_gcpjs(
+                conn, 'gcpj_escopo', 'motivo_inclusao', gcpjs,
+                f"Critério: {nome_criterio}", extras={'criterios_filtro': nome_criterio}
+            )
+            conn.commit()
+        
+        logger.info(
+            f"Critério '{nome_criterio}': {len(gcpjs)} GCPJs ({inseridos} novos, {atualizados} já no escopo)"
+            f"{' - resultado reaproveitado' if reaproveitado else ''}"
+        )
+        return {
+            'criterio': nome_criterio,
+            'gcpjs_encontrados': len(gcpjs),
+            'inseridos': inseridos,
+            'atualizados': atualizados,
+            'reaproveitado': reaproveitado
+        }
+    
+    def executar_criterios_escopo(self) -> List[Dict]:
+        """Executa todos os critérios de escopo ativos"""
+        with conexao(self.db_path) as conn:
+            nomes = [linha[0] for linha in conn.execute(
+                "SELECT DISTINCT nome_criterio FROM criterios_escopo WHERE ativo = 1 ORDER BY nome_criterio"
+            )]
+        
+        resultados = []
+        for nome in nomes:
+            try:
+                resultados.append(self.executar_criterio_escopo(nome))
+            except Exception as e:
+                logger.error(f"Erro ao executar critério '{nome}': {str(e)}")
+                resultados.append({'criterio': nome, 'erro': str(e)})
+        return resultados
+    
+    def filtrar_gcpjs_fonte(self, tabela: str, condicao_sql: str) -> List[str]:
+        """Avalia a condição SQL sobre a tabela de staging da fonte e retorna os GCPJs"""
+        # Conexão somente leitura ao staging: a condição não alcança o master database
+        leitura = self.staging.conexao_leitura()
+        try:
+            linhas = leitura.execute(
+                f"SELECT DISTINCT gcpj_canonico FROM {tabela} WHERE ({condicao_sql})"
+            ).fetchall()
+        finally:
+            leitura.close()
+        
+        return [linha[0] for linha in linhas]
+    
+    # ======= STAGING DAS FONTES =======
+    
+    def materializar_fonte(self, fonte_id: int, colunas: Optional[List[str]] = None,
+                           condicoes: Optional[List[str]] = None) -> Dict:
+        """Garante a tabela de staging da fonte com as colunas de mapeamentos e critérios
+        
+        condicoes são condições SQL ainda não salvas (validação de um critério novo)
+        cujas colunas citadas também devem ser projetadas. Retorna o catálogo do staging (tabela, assinatura, colunas projetadas...).
+        """
+        with conexao(self.db_path) as conn:
+            fonte = conn.execute('''
+                SELECT nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj
+                FROM fontes_dados WHERE id = ?
+            ''', (fonte_id,)).fetchone()
+            
+            if fonte is None:
+                raise ValueError(f"Fonte {fonte_id} não encontrada")
+            nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj = fonte
+            
+            mapeadas = [linha[0] for linha in conn.execute(
+                "SELECT DISTINCT coluna_origem FROM mapeamento_colunas WHERE fonte_id = ? AND ativa = 1",
+                (fonte_id,)
+            )]
+            condicoes = list(condicoes or ()) + [linha[0] for linha in conn.execute(
+                "SELECT condicao_sql FROM criterios_escopo WHERE fonte_verificacao = ? AND ativo = 1",
+                (nome_fonte,)
+            )]
+        
+        caminho = os.path.join(self.base_path, caminho_arquivo)
+        aba = aba_planilha if tipo_fonte == 'excel' else None
+        
+        projetadas = set(mapeadas) | set(colunas or ())
+        if condicoes:
+            colunas_fonte = self.cache_fontes.obter_manifesto(caminho, tipo_fonte, aba)['colunas']
+            for condicao in condicoes:
+                projetadas.update(colunas_citadas(condicao, colunas_fonte))
+        
+        return self.staging.materializar(fonte_id, caminho, tipo_fonte, aba, coluna_gcpj, projetadas)
+    
+    def materializar_fontes(self) -> List[Dict]:
+        """Materializa todas as fontes ativas nas tabelas de staging"""
+        with conexao(self.db_path) as conn:
+            fontes = conn.execute(
+                "SELECT id, nome_fonte FROM fontes_dados WHERE ativa = 1 ORDER BY prioridade"
+            ).fetchall()
+        
+        catalogos = []
+        for fonte_id, nome_fonte in fontes:
+            try:
+                catalogos.append(self.materializar_fonte(fonte_id))
+            except Exception as e:
+                logger.error(f"Erro ao materializar fonte '{nome_fonte}': {str(e)}")
+                catalogos.append({'fonte_id': fonte_id, 'erro': str(e)})
+        return catalogos
+    
+    def obter_valores_fonte_escopo(self, fonte_id: int, coluna_origem: str) -> pd.Series:
+        """Valores não nulos de uma coluna da fonte para os GCPJs do escopo ativo
+        
+        Como no dicionário GCPJ → valor montado a partir da planilha, vale a última
+        linha de cada GCPJ na fonte.
+        """
+        catalogo = self.materializar_fonte(fonte_id, [coluna_origem])
+        if coluna_origem not in catalogo['colunas']:
+            return pd.Series(dtype=object)
+        
+        tabela = catalogo['tabela']
+        coluna = citar_coluna(coluna_origem)
+        with conexao(self.db_path) as conn:
+            staging = self.staging.anexar(conn)
+            df = pd.read_sql_query(f'''
+                SELECT s.gcpj_canonico AS gcpj, s.{coluna} AS valor
+                FROM gcpj_escopo e
+                JOIN {staging}.{tabela} s ON s.gcpj_canonico = e.gcpj
+                WHERE e.ativo = 1 AND s.{coluna} IS NOT NULL
+                  AND s.linha_origem = (
+                      SELECT MAX(u.linha_origem) FROM {staging}.{tabela} u
+                      WHERE u.gcpj_canonico = s.gcpj_canonico
+                  )
+            ''', conn)
+        return df.set_index('gcpj')['valor']
     
     # ======= GESTÃO DE FONTES =======
     
     def adicionar_fonte(self, nome: str, tipo: str, caminho: str, aba: str, coluna_gcpj: str, prioridade: int = 10):
         """Adiciona nova fonte de dados"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT INTO fontes_dados (nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj, prioridade, data_criacao)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (nome, tipo, caminho, aba, coluna_gcpj, prioridade, datetime.now().isoformat()))
+            cursor.execute('''
+                INSERT INTO fontes_dados (nome_fonte, tipo_fonte, caminho_arquivo, aba_planilha, coluna_gcpj, prioridade, data_criacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (nome, tipo, caminho, aba, coluna_gcpj, prioridade, datetime.now().isoformat()))
         
-        fonte_id = cursor.lastrowid
+            fonte_id = cursor.lastrowid
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
         logger.info(f"Fonte '{nome}' adicionada com ID {fonte_id}")
         return fonte_id
     
     def obter_fontes_ativas(self) -> pd.DataFrame:
         """Obtém todas as fontes ativas ordenadas por prioridade"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query('''
-            SELECT * FROM fontes_dados 
-            WHERE ativa = 1 
-            ORDER BY prioridade ASC
-        ''', conn)
-        conn.close()
+        with conexao(self.db_path) as conn:
+            df = pd.read_sql_query('''
+                SELECT * FROM fontes_dados 
+                WHERE ativa = 1 
+                ORDER BY prioridade ASC
+            ''', conn)
         return df
     
     # ======= GESTÃO DE MAPEAMENTOS =======
     
     def configurar_mapeamento_coluna(self, coluna_template: str, fonte_id: int, coluna_origem: str, prioridade: int = 10):
         """Configura de onde vem cada coluna do template"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with conexao(self.db_path) as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            INSERT OR REPLACE INTO mapeamento_colunas 
-            (coluna_template, fonte_id, coluna_origem, prioridade)
-            VALUES (?, ?, ?, ?)
-        ''', (coluna_template, fonte_id, coluna_origem, prioridade))
+            cursor.execute('''
+                INSERT OR REPLACE INTO mapeamento_colunas 
+                (coluna_template, fonte_id, coluna_origem, prioridade)
+                VALUES (?, ?, ?, ?)
+            ''', (coluna_template, fonte_id, coluna_origem, prioridade))
         
-        conn.commit()
-        conn.close()
+            conn.commit()
         
         logger.info(f"Mapeamento configurado: {coluna_template} ← {coluna_origem} (fonte {fonte_id})")
     
     def obter_mapeamentos_coluna(self, coluna_template: str) -> pd.DataFrame:
         """Obtém mapeamentos para uma coluna específica, ordenados por prioridade"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query('''
-            SELECT m.*, f.nome_fonte, f.caminho_arquivo, f.coluna_gcpj
-            FROM mapeamento_colunas m
-            JOIN fontes_dados f ON m.fonte_id = f.id
-            WHERE m.coluna_template = ? AND m.ativa = 1 AND f.ativa = 1
-            ORDER BY m.prioridade ASC
-        ''', conn, params=(coluna_template,))
-        conn.close()
+        with conexao(self.db_path) as conn:
+            df = pd.read_sql_query('''
+                SELECT m.*, f.nome_fonte, f.caminho_arquivo, f.coluna_gcpj
+                FROM mapeamento_colunas m
+                JOIN fontes_dados f ON m.fonte_id = f.id
+                WHERE m.coluna_template = ? AND m.ativa = 1 AND f.ativa = 1
+                ORDER BY m.prioridade ASC
+            ''', conn, params=(coluna_template,))
         return df
     
     def obter_todos_mapeamentos(self) -> pd.DataFrame:
         """Obtém todos os mapeamentos ativos"""
-        conn = sqlite3.connect(self.db_path)
-        df = pd.read_sql_query('''
-            SELECT m.coluna_template, m.coluna_origem, m.prioridade, 
-                   f.nome_fonte, f.tipo_fonte, f.caminho_arquivo
-            FROM mapeamento_colunas m
-            JOIN fontes_dados f ON m.fonte_id = f.id
-            WHERE m.ativa = 1 AND f.ativa = 1
-            ORDER BY m.coluna_template, m.prioridade ASC
-        ''', conn)
-        conn.close()
+        with conexao(self.db_path) as conn:
+            df = pd.read_sql_query('''
+                SELECT m.coluna_template, m.coluna_origem, m.prioridade, 
+                       f.nome_fonte, f.tipo_fonte, f.caminho_arquivo
+                FROM mapeamento_colunas m
+                JOIN fontes_dados f ON m.fonte_id = f.id
+                WHERE m.ativa = 1 AND f.ativa = 1
+                ORDER BY m.coluna_template, m.prioridade ASC
+            ''', conn)
         return df
 
 
@@ -311,38 +515,6 @@ class ProcessadorMultiplasFontes:
     def __init__(self, base_path="C:/desenvolvimento/migration_app"):
         self.base_path = base_path
         self.master_db = MasterDatabaseManager(base_path)
-        self.fontes_carregadas = {}
-    
-    def carregar_fonte(self, fonte_info: pd.Series) -> pd.DataFrame:
-        """Carrega uma fonte específica"""
-        fonte_id = fonte_info['id']
-        
-        # Cache de fontes
-        if fonte_id in self.fontes_carregadas:
-            return self.fontes_carregadas[fonte_id]
-        
-        try:
-            caminho_completo = os.path.join(self.base_path, fonte_info['caminho_arquivo'])
-            
-            if fonte_info['tipo_fonte'] == 'excel':
-                df = pd.read_excel(caminho_completo, sheet_name=fonte_info['aba_planilha'])
-            elif fonte_info['tipo_fonte'] == 'csv':
-                df = pd.read_csv(caminho_completo)
-            else:
-                raise ValueError(f"Tipo de fonte não suportado: {fonte_info['tipo_fonte']}")
-            
-            # Normalizar coluna GCPJ
-            if fonte_info['coluna_gcpj'] in df.columns:
-                df[fonte_info['coluna_gcpj']] = df[fonte_info['coluna_gcpj']].astype(str).str.strip()
-            
-            self.fontes_carregadas[fonte_id] = df
-            logger.info(f"Fonte '{fonte_info['nome_fonte']}' carregada: {len(df)} registros")
-            
-            return df
-            
-        except Exception as e:
-            logger.error(f"Erro ao carregar fonte {fonte_info['nome_fonte']}: {str(e)}")
-            return pd.DataFrame()
     
     def processar_coluna_multiplas_fontes(self, coluna_template: str, escopo_gcpjs: List[str]) -> pd.Series:
         """Processa uma coluna usando múltiplas fontes com fallback"""
@@ -355,31 +527,31 @@ class ProcessadorMultiplasFontes:
         # Resultado final
         resultado = pd.Series(index=escopo_gcpjs, dtype=object)
         
-        # Processar fontes por ordem de prioridade
+        # Processar fontes por ordem de prioridade (join indexado com o staging da fonte)
         for _, mapeamento in mapeamentos.iterrows():
-            fonte_info = mapeamento
-            df_fonte = self.carregar_fonte(fonte_info)
-            
-            if df_fonte.empty:
+            try:
+                valores = self.master_db.obter_valores_fonte_escopo(mapeamento['fonte_id'], mapeamento['coluna_origem'])
+            except Exception as e:
+                logger.error(f"Erro ao consultar fonte {mapeamento['nome_fonte']}: {str(e)}")
                 continue
             
-            # Criar mapeamento GCPJ → valor
-            if fonte_info['coluna_gcpj'] in df_fonte.columns and mapeamento['coluna_origem'] in df_fonte.columns:
-                mapa_valores = df_fonte.set_index(fonte_info['coluna_gcpj'])[mapeamento['coluna_origem']].to_dict()
-                
-                # Preencher valores faltantes
-                for gcpj in escopo_gcpjs:
-                    if pd.isna(resultado[gcpj]) and gcpj in mapa_valores and pd.notna(mapa_valores[gcpj]):
-                        resultado[gcpj] = mapa_valores[gcpj]
+            # Preencher valores faltantes
+            faltantes = resultado.index[resultado.isna()]
+            resultado[faltantes] = valores.reindex(faltantes)
         
         preenchidos = resultado.notna().sum()
         logger.info(f"Coluna {coluna_template}: {preenchidos}/{len(escopo_gcpjs)} preenchidos ({preenchidos/len(escopo_gcpjs)*100:.1f}%)")
         
         return resultado
     
-    def executar_migracao_completa(self, incluir_todos_template=True) -> pd.DataFrame:
-        """Executa migração completa usando configuração do master database"""
+    def executar_migracao_completa(self, incluir_todos_template=True, progresso=PROGRESSO_NULO) -> pd.DataFrame:
+        """Executa migração completa usando configuração do master database
+        
+        progresso (ver progresso_execucao) recebe as fases e o avanço em células
+        (GCPJ x coluna) e permite cancelar entre as colunas.
+        """
         # Obter escopo de GCPJs
+        progresso.fase('Carregando escopo')
         escopo_gcpjs = self.master_db.obter_escopo_gcpjs()
         
         if not escopo_gcpjs:
@@ -388,55 +560,60 @@ class ProcessadorMultiplasFontes:
         
         logger.info(f"Processando {len(escopo_gcpjs)} GCPJs no escopo")
         
+        # Atualiza as tabelas de staging das fontes que mudaram
+        progresso.fase('Materializando fontes')
+        self.master_db.materializar_fontes()
+        
         # Obter colunas do template
-        conn = sqlite3.connect(self.master_db.db_path)
-        colunas_template = pd.read_sql_query('''
-            SELECT coluna_nome FROM template_colunas ORDER BY posicao
-        ''', conn)['coluna_nome'].tolist()
-        conn.close()
+        with conexao(self.master_db.db_path) as conn:
+            colunas_template = pd.read_sql_query('''
+                SELECT coluna_nome FROM template_colunas ORDER BY posicao
+            ''', conn)['coluna_nome'].tolist()
         
         # Resultado final
         resultado_df = pd.DataFrame(index=escopo_gcpjs, columns=colunas_template)
         
         # Processar cada coluna
+        progresso.fase('Processando colunas', total=len(colunas_template) * len(escopo_gcpjs), unidade='células')
         for coluna in colunas_template:
             try:
                 resultado_df[coluna] = self.processar_coluna_multiplas_fontes(coluna, escopo_gcpjs)
             except Exception as e:
                 logger.error(f"Erro ao processar coluna {coluna}: {str(e)}")
                 resultado_df[coluna] = None
+            progresso.avancar(len(escopo_gcpjs))
         
         # Salvar execução no histórico
+        progresso.fase('Registrando execução')
         self.salvar_execucao_historico("migracao", len(escopo_gcpjs), len(resultado_df))
         
         return resultado_df
     
     def salvar_execucao_historico(self, tipo: str, escopo: int, processados: int):
         """Salva execução no histórico do master database"""
-        conn = sqlite3.connect(self.master_db.db_path)
-        cursor = conn.cursor()
-        
-        configuracao = {
-            'fontes_ativas': len(self.master_db.obter_fontes_ativas()),
-            'mapeamentos_ativos': len(self.master_db.obter_todos_mapeamentos())
-        }
-        
-        cursor.execute('''
-            INSERT INTO execucoes_master 
-            (timestamp, tipo_execucao, configuracao_fontes, escopo_gcpjs, registros_processados, registros_exportados, taxa_sucesso)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            datetime.now().isoformat(),
-            tipo,
-            json.dumps(configuracao),
-            escopo,
-            processados,
-            processados,  # assumindo que todos foram exportados
-            100.0 if processados > 0 else 0.0
-        ))
-        
-        conn.commit()
-        conn.close()
+        with conexao(self.master_db.db_path) as conn:
+            cursor = conn.cursor()
+        
+            configuracao = {
+                'fontes_ativas': len(self.master_db.obter_fontes_ativas()),
+                'mapeamentos_ativos': len(self.master_db.obter_todos_mapeamentos())
+            }
+        
+            cursor.execute('''
+                INSERT INTO execucoes_master 
+                (timestamp, tipo_execucao, configuracao_fontes, escopo_gcpjs, registros_processados, registros_exportados, taxa_sucesso)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                datetime.now().isoformat(),
+                tipo,
+                json.dumps(configuracao),
+                escopo,
+                processados,
+                processados,  # assumindo que todos foram exportados
+                100.0 if processados > 0 else 0.0
+            ))
+        
+            conn.commit()
 
 
 # ======= EXEMPLO DE USO =======
@@ -0,0 +1,184 @@
+"""
+Tabelas de Staging das Fontes de Dados
+
+Usado pelo MasterDatabaseManager para que mapeamentos e critérios de escopo
+consultem as fontes com SQL indexado em vez de reler as planilhas.
+
+FUNCIONAMENTO:
+- Cada fonte ativa de fontes_dados é materializada em staging_fontes.db como a
+  tabela fonte_<id>, com a chave GCPJ canônica (gcpj_canonico), a posição da linha
+  no arquivo (linha_origem), um hash da linha (hash_linha) e só as colunas
+  projetadas: a coluna GCPJ original da fonte (critérios podem citá-la) e as
+  usadas em mapeamentos e critérios
+- O índice (gcpj_canonico, linha_origem) atende joins com o escopo e a busca da
+  última linha de cada GCPJ
+- O catálogo staging_catalogo guarda a assinatura do arquivo e as colunas
+  projetadas; a fonte só é reingerida quando o arquivo muda ou quando uma coluna
+  nova é pedida (a leitura vem do cache colunar, sem reprocessar a planilha)
+- Para joins com o master database, o banco de staging é anexado como 'staging'
+
+USO:
+    staging = StagingFontes(base_path)
+    staging.materializar(fonte_id, caminho, 'excel', 'Sheet1', 'GCPJ', ['UF', 'VALOR'])
+    with conexao(master_db_path) as conn:
+        staging.anexar(conn)
+        conn.execute("SELECT ... FROM gcpj_escopo e JOIN staging.fonte_1 s ON s.gcpj_canonico = e.gcpj")
+"""
+
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache_colunar_fontes import CacheColunarFontes
+from conexao_sqlite import conexao
+from importacao_escopo import canonizar_gcpjs
+
+ALIAS_STAGING = 'staging'
+TAMANHO_LOTE_STAGING = 50_000
+
+
+def tabela_staging(fonte_id):
+    """Nome da tabela de staging de uma fonte"""
+    return f"fonte_{int(fonte_id)}"
+
+
+def citar_coluna(coluna):
+    """Identificador SQL entre aspas (colunas das planilhas têm espaços e acentos)"""
+    return '"' + str(coluna).replace('"', '""') + '"'
+
+
+def colunas_citadas(condicao_sql, colunas):
+    """Colunas da fonte citadas em uma condição SQL (comparação sem maiúsculas)"""
+    return [
+        coluna for coluna in colunas
+        if re.search(r'(?<!\w)' + re.escape(str(coluna)) + r'(?!\w)', condicao_sql, flags=re.IGNORECASE)
+    ]
+
+
+class StagingFontes:
+    """Materializa as fontes de dados em tabelas SQLite indexadas por GCPJ"""
+
+    def __init__(self, base_path, cache_fontes=None):
+        self.db_path = os.path.join(base_path, "staging_fontes.db")
+        self.cache_fontes = cache_fontes or CacheColunarFontes(base_path)
+        self.init_staging()
+
+    def init_staging(self):
+        with conexao(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS staging_catalogo (
+                    fonte_id INTEGER PRIMARY KEY,
+                    tabela TEXT NOT NULL,
+                    assinatura TEXT NOT NULL,
+                    coluna_gcpj TEXT NOT NULL,
+                    colunas TEXT NOT NULL,
+                    registros INTEGER,
+                    registros_sem_gcpj INTEGER,
+                    data_ingestao TEXT
+                )
+            ''')
+            conn.commit()
+
+    def obter_catalogo(self, fonte_id):
+        """Linha do catálogo da fonte (dict) ou None se ainda não materializada"""
+        with conexao(self.db_path) as conn:
+            linha = conn.execute('''
+                SELECT tabela, assinatura, coluna_gcpj, colunas, registros, registros_sem_gcpj, data_ingestao
+                FROM staging_catalogo WHERE fonte_id = ?
+            ''', (fonte_id,)).fetchone()
+
+        if linha is None:
+            return None
+        tabela, assinatura, coluna_gcpj, colunas, registros, sem_gcpj, data_ingestao = linha
+        return {
+            'fonte_id': fonte_id,
+            'tabela': tabela,
+            'assinatura': assinatura,
+            'coluna_gcpj': coluna_gcpj,
+            'colunas': json.loads(colunas),
+            'registros': registros,
+            'registros_sem_gcpj': sem_gcpj,
+            'data_ingestao': data_ingestao
+        }
+
+    def materializar(self, fonte_id, caminho, tipo, aba, coluna_gcpj, colunas):
+        """Garante a tabela de staging atualizada com pelo menos as colunas pedidas
+
+        Colunas que não existem na fonte são ignoradas. Retorna o catálogo da fonte.
+        """
+        manifesto = self.cache_fontes.obter_manifesto(caminho, tipo, aba)
+        if coluna_gcpj not in manifesto['colunas']:
+            raise ValueError(f"Coluna GCPJ '{coluna_gcpj}' não encontrada na fonte")
+
+        pedidas = set(colunas) | {coluna_gcpj}
+        catalogo = self.obter_catalogo(fonte_id)
+        if (catalogo is not None
+                and catalogo['assinatura'] == manifesto['assinatura']
+                and catalogo['coluna_gcpj'] == coluna_gcpj
+                and pedidas & set(manifesto['colunas']) <= set(catalogo['colunas'])):
+            return catalogo
+
+        # Mantém as colunas já projetadas para não perder as de outros consumidores
+        projetadas = pedidas | set(catalogo['colunas'] if catalogo else ())
+        projetadas = [c for c in manifesto['colunas'] if c in projetadas]
+        return self._ingerir(fonte_id, caminho, tipo, aba, coluna_gcpj, projetadas, manifesto['assinatura'])
+
+    def _ingerir(self, fonte_id, caminho, tipo, aba, coluna_gcpj, colunas, assinatura):
+        df = self.cache_fontes.carregar_colunas(caminho, tipo, aba, [coluna_gcpj] + colunas)
+
+        staging = df[colunas].copy()
+        staging.insert(0, 'gcpj_canonico', canonizar_gcpjs(df[coluna_gcpj]))
+        staging.insert(1, 'linha_origem', np.arange(len(df), dtype=np.int64))
+        if colunas:
+            hashes = pd.util.hash_pandas_object(df[colunas], index=False).to_numpy().view(np.int64)
+        else:
+            # Sem colunas projetadas não há conteúdo a comparar entre as linhas
+            hashes = np.zeros(len(df), dtype=np.int64)
+        staging.insert(2, 'hash_linha', hashes)
+
+        # Linhas sem GCPJ válido não participam de nenhum join
+        sem_gcpj = int(staging['gcpj_canonico'].isna().sum())
+        staging = staging[staging['gcpj_canonico'].notna()]
+
+        tabela = tabela_staging(fonte_id)
+        with conexao(self.db_path) as conn:
+            # O catálogo sai antes da tabela: uma ingestão interrompida força a próxima
+            conn.execute("DELETE FROM staging_catalogo WHERE fonte_id = ?", (fonte_id,))
+            conn.commit()
+
+            conn.execute(f"DROP TABLE IF EXISTS {tabela}")
+            staging.to_sql(tabela, conn, index=False, chunksize=TAMANHO_LOTE_STAGING)
+            conn.execute(f"CREATE INDEX idx_{tabela}_gcpj ON {tabela} (gcpj_canonico, linha_origem)")
+
+            conn.execute('''
+                INSERT INTO staging_catalogo
+                (fonte_id, tabela, assinatura, coluna_gcpj, colunas, registros, registros_sem_gcpj, data_ingestao)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (fonte_id, tabela, assinatura, coluna_gcpj, json.dumps(colunas, ensure_ascii=False),
+                  len(staging), sem_gcpj, datetime.now().isoformat()))
+            conn.commit()
+
+        return self.obter_catalogo(fonte_id)
+
+    def anexar(self, conn, alias=ALIAS_STAGING):
+        """Anexa o banco de staging à conexão (uma vez por conexão persistente)
+        
+        O SQLite não anexa bancos dentro de uma transação; em vez de confirmar a
+        transação aberta de quem chamou, a primeira anexação exige a conexão livre.
+        """
+        anexados = {linha[1] for linha in conn.execute("PRAGMA database_list")}
+        if alias not in anexados:
+            if conn.in_transaction:
+                raise RuntimeError("Não é possível anexar o staging com uma transação aberta na conexão")
+            conn.execute("ATTACH DATABASE ? AS " + alias, (self.db_path,))
+        return alias
+
+    def conexao_leitura(self):
+        """Conexão nova e somente leitura ao staging (para condições vindas do usuário)"""
+        return sqlite3.connect(Path(self.db_path).resolve().as_uri() + "?mode=ro", uri=True)
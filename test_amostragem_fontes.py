@@ -0,0 +1,83 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from amostragem_fontes import amostrar_gcpjs, contar_registros, indexar_por_gcpj, ler_cabecalho
+from importacao_escopo import canonizar_gcpjs
+
+
+class TestAmostragemFontes(unittest.TestCase):
+    """A amostra limitada deve ter as mesmas chaves que a leitura completa da fonte"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def chaves_leitura_completa(self, caminho, limite):
+        if caminho.endswith('.csv'):
+            coluna = pd.read_csv(caminho)['GCPJ']
+        else:
+            coluna = pd.read_excel(caminho)['GCPJ']
+        return [gcpj for gcpj in canonizar_gcpjs(coluna) if gcpj is not None][:limite]
+
+    def conferir(self, caminho, limite=3):
+        amostra = amostrar_gcpjs(caminho, 'GCPJ', limite, tamanho_bloco=2)
+        self.assertEqual(amostra, self.chaves_leitura_completa(caminho, limite))
+        return amostra
+
+    def test_coluna_inteira_excel(self):
+        caminho = os.path.join(self.temp_dir, 'inteiros.xlsx')
+        pd.DataFrame({'GCPJ': [1600000001, 1600000002, 2200000003, 2400000004]}).to_excel(caminho, index=False)
+
+        self.assertEqual(self.conferir(caminho), ['1600000001', '1600000002', '2200000003'])
+
+    def test_coluna_float_com_vazio_excel(self):
+        """Com uma célula vazia o pandas lê a coluna como float (1600000001.0)"""
+        caminho = os.path.join(self.temp_dir, 'com_vazio.xlsx')
+        pd.DataFrame({'GCPJ': [1600000001, np.nan, 1600000002, 1600000003]}).to_excel(caminho, index=False)
+
+        self.assertEqual(self.conferir(caminho), ['1600000001', '1600000002', '1600000003'])
+
+    def test_coluna_csv_com_zeros_a_esquerda(self):
+        """CSV é lido com a mesma inferência de tipos da leitura completa"""
+        caminho = os.path.join(self.temp_dir, 'fonte.csv')
+        with open(caminho, 'w', encoding='utf-8') as f:
+            f.write('GCPJ,UF\n0001600001,SP\n,RJ\n0002200002,MG\n2400000003,BA\n')
+
+        self.assertEqual(self.conferir(caminho), ['1600001', '2200002', '2400000003'])
+
+    def test_amostra_encontrada_na_fonte_indexada(self):
+        """Migração sem escopo: a amostra acha as linhas da fonte lida como texto (astype(str))"""
+        caminho = os.path.join(self.temp_dir, 'principal.xlsx')
+        pd.DataFrame({
+            'GCPJ': [1600000001, np.nan, 1600000002, 1600000003],
+            'UF': ['SP', 'RJ', 'MG', 'BA']
+        }).to_excel(caminho, index=False)
+
+        # Como interface_gestao_fontes.ProcessadorMultiplasFontes._ler_fonte: '1600000001.0', 'nan', ...
+        df = pd.read_excel(caminho)
+        df['GCPJ'] = df['GCPJ'].astype(str).str.strip()
+        self.assertEqual(df['GCPJ'].iloc[0], '1600000001.0')
+
+        amostra = amostrar_gcpjs(caminho, 'GCPJ', 3, tamanho_bloco=2)
+        por_gcpj = indexar_por_gcpj(df, 'GCPJ')
+        self.assertEqual(list(por_gcpj.index), amostra)
+        self.assertEqual(por_gcpj['UF'].reindex(amostra).tolist(), ['SP', 'MG', 'BA'])
+
+    def test_cabecalho_e_contagem(self):
+        caminho = os.path.join(self.temp_dir, 'fonte.csv')
+        with open(caminho, 'w', encoding='utf-8') as f:
+            f.write('GCPJ,UF\n1600000001,SP\n1600000002,RJ')
+
+        self.assertEqual(ler_cabecalho(caminho), ['GCPJ', 'UF'])
+        self.assertEqual(contar_registros(caminho), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from bitmap_gcpjs import BitmapGcpjs, DicionarioGcpj, LIMITE_CONTAINER_ARRAY
+from conexao_sqlite import conexao, fechar_conexoes
+
+
+class TestBitmapGcpjs(unittest.TestCase):
+    """Serialização em containers e operações de conjunto"""
+
+    def conferir_ida_e_volta(self, indices):
+        bitmap = BitmapGcpjs(indices)
+        dados = bitmap.serializar()
+
+        self.assertEqual(BitmapGcpjs.desserializar(dados), bitmap)
+        tamanho = int(bitmap.indices.max()) + 1 if len(bitmap) else 10
+        np.testing.assert_array_equal(BitmapGcpjs.desserializar_denso(dados, tamanho), bitmap.para_denso(tamanho))
+        return dados
+
+    def test_vazio(self):
+        self.assertEqual(BitmapGcpjs.desserializar(b''), BitmapGcpjs())
+        self.conferir_ida_e_volta([])
+
+    def test_container_array(self):
+        self.conferir_ida_e_volta([5, 3, 3, 70000, 65535, 65536])
+
+    def test_container_bitmap(self):
+        """Acima do limite o grupo vira um bitmap de 8 KB"""
+        indices = np.arange(0, 2 * (LIMITE_CONTAINER_ARRAY + 1), 2) + (3 << 16)
+        dados = self.conferir_ida_e_volta(np.append(indices, [1, 2]))
+        self.assertLess(len(dados), 9 * 1024)
+
+    def test_indices_grandes(self):
+        rng = np.random.default_rng(7)
+        self.conferir_ida_e_volta(rng.integers(0, 1 << 22, size=20000))
+
+    def test_operacoes_de_conjunto(self):
+        a = BitmapGcpjs([1, 2, 3, 70000])
+        b = BitmapGcpjs([3, 4, 70000, 80000])
+
+        self.assertEqual(list(a | b), [1, 2, 3, 4, 70000, 80000])
+        self.assertEqual(list(a & b), [3, 70000])
+        self.assertEqual(list(a - b), [1, 2])
+        self.assertEqual(list(a ^ b), [1, 2, 4, 80000])
+        self.assertEqual(BitmapGcpjs.uniao([a, b]), a | b)
+        self.assertIn(70000, a)
+        self.assertNotIn(4, a)
+
+    def test_comparacao_densa_por_xor(self):
+        """Ganhos e perdas pelo XOR dos vetores densos são as diferenças dos conjuntos"""
+        rng = np.random.default_rng(11)
+        tamanho = 200_000
+        escopo1, escopo2, ausentes1, ausentes2 = (
+            BitmapGcpjs(rng.choice(tamanho, size=tamanho // 3, replace=False)) for _ in range(4)
+        )
+        ausentes1 = ausentes1 & escopo1
+        ausentes2 = ausentes2 & escopo2
+
+        densos = [BitmapGcpjs.desserializar_denso(b.serializar(), tamanho)
+                  for b in (escopo1, escopo2, ausentes1, ausentes2)]
+        comuns = densos[0] & densos[1]
+        mudancas = (densos[2] ^ densos[3]) & comuns
+
+        comuns_conjunto = escopo1 & escopo2
+        self.assertEqual(BitmapGcpjs.de_denso(mudancas & densos[2]), (ausentes1 - ausentes2) & comuns_conjunto)
+        self.assertEqual(BitmapGcpjs.de_denso(mudancas & densos[3]), (ausentes2 - ausentes1) & comuns_conjunto)
+        self.assertEqual(BitmapGcpjs.de_denso(mudancas), (ausentes1 ^ ausentes2) & comuns_conjunto)
+
+    def test_fatia(self):
+        bitmap = BitmapGcpjs(range(10, 20))
+        self.assertEqual(list(bitmap.fatia(2, 5)), [12, 13, 14])
+        self.assertEqual(len(bitmap.fatia(8, 50)), 2)
+
+
+class TestDicionarioGcpj(unittest.TestCase):
+    """Índices estáveis, inclusive com transações desfeitas e várias threads"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'qualidade.db')
+        with conexao(self.db_path) as conn:
+            conn.execute('''CREATE TABLE dicionario_gcpj (
+                               indice INTEGER PRIMARY KEY,
+                               gcpj TEXT NOT NULL UNIQUE
+                           )''')
+            conn.commit()
+        self.dicionario = DicionarioGcpj()
+
+    def tearDown(self):
+        fechar_conexoes()
+        shutil.rmtree(self.temp_dir)
+
+    def indexar(self, gcpjs):
+        with conexao(self.db_path) as conn:
+            indices = self.dicionario.indexar(conn, gcpjs)
+            conn.commit()
+        return indices.tolist()
+
+    def tabela(self):
+        with conexao(self.db_path) as conn:
+            return dict(conn.execute("SELECT gcpj, indice FROM dicionario_gcpj"))
+
+    def test_indices_estaveis(self):
+        self.assertEqual(self.indexar(['a', 'b', 'a']), [0, 1, 0])
+        self.assertEqual(self.indexar(['c', 'b']), [2, 1])
+
+        # Outra instância (outro processo) enxerga os mesmos índices
+        with conexao(self.db_path) as conn:
+            self.assertEqual(DicionarioGcpj().traduzir(conn, BitmapGcpjs([0, 2])), ['a', 'c'])
+
+    def test_transacao_desfeita(self):
+        self.indexar(['a'])
+        with conexao(self.db_path) as conn:
+            self.dicionario.indexar(conn, ['perdido'])
+            conn.rollback()
+
+        self.assertEqual(self.indexar(['b']), [1])
+        self.assertEqual(self.tabela(), {'a': 0, 'b': 1})
+
+    def test_threads_concorrentes(self):
+        """Threads com conexões próprias não repetem índices"""
+        erros = []
+
+        def trabalhar(t):
+            try:
+                for lote in range(10):
+                    self.indexar([f'comum{lote}'] + [f't{t}_{lote}_{i}' for i in range(20)])
+            except Exception as e:
+                erros.append(e)
+            finally:
+                fechar_conexoes()
+
+        threads = [threading.Thread(target=trabalhar, args=(t,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(erros, [])
+        tabela = self.tabela()
+        self.assertEqual(len(tabela), 10 + 4 * 10 * 20)
+        self.assertEqual(sorted(tabela.values()), list(range(len(tabela))))
+        self.assertEqual(self.indexar(list(tabela)), list(tabela.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from cache_fontes_memoria import CacheFontesMemoria, chave_fonte
+
+
+class TestCacheFontesMemoria(unittest.TestCase):
+    """Chave por fonte, aba e coluna GCPJ e invalidação pelo arquivo"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.temp_dir, 'fonte.xlsx')
+        with pd.ExcelWriter(self.caminho) as writer:
+            pd.DataFrame({'GCPJ': [1600000001]}).to_excel(writer, sheet_name='Ativos', index=False)
+            pd.DataFrame({'CODIGO': [2200000002, 2200000003]}).to_excel(writer, sheet_name='Baixados', index=False)
+        self.cache = CacheFontesMemoria(limite_memoria_mb=10)
+        self.leituras = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def obter(self, fonte_id, aba, coluna_gcpj):
+        def carregar():
+            self.leituras.append(aba)
+            return pd.read_excel(self.caminho, sheet_name=aba)
+        return self.cache.obter(chave_fonte(fonte_id, aba, coluna_gcpj), self.caminho, carregar)
+
+    def test_aba_e_coluna_fazem_parte_da_chave(self):
+        """Fonte recadastrada com outra aba não devolve o DataFrame da aba antiga"""
+        self.assertEqual(list(self.obter(1, 'Ativos', 'GCPJ').columns), ['GCPJ'])
+        self.assertEqual(list(self.obter(1, 'Baixados', 'CODIGO').columns), ['CODIGO'])
+        self.obter(1, 'Ativos', 'GCPJ')
+
+        self.assertEqual(self.leituras, ['Ativos', 'Baixados'])
+        self.assertNotEqual(chave_fonte(1, 'Ativos', 'GCPJ'), chave_fonte(1, 'Ativos', 'CODIGO'))
+
+    def test_aba_vazia_de_csv(self):
+        """NaN vindo do pandas (aba de fonte CSV) gera sempre a mesma chave"""
+        self.assertEqual(chave_fonte(3, float('nan'), 'GCPJ'), chave_fonte(3, float('nan'), 'GCPJ'))
+        self.assertEqual(chave_fonte(3, None, 'GCPJ'), (3, None, 'GCPJ'))
+
+    def test_invalidar_fonte(self):
+        self.obter(1, 'Ativos', 'GCPJ')
+        self.obter(1, 'Baixados', 'CODIGO')
+        self.obter(2, 'Ativos', 'GCPJ')
+
+        self.cache.invalidar_fonte(1)
+        self.assertEqual(len(self.cache), 1)
+        self.assertIn(chave_fonte(2, 'Ativos', 'GCPJ'), self.cache)
+
+    def test_arquivo_alterado_invalida(self):
+        self.obter(1, 'Ativos', 'GCPJ')
+        pd.DataFrame({'GCPJ': [1600000001, 1600000009]}).to_excel(self.caminho, sheet_name='Ativos', index=False)
+
+        self.assertEqual(len(self.obter(1, 'Ativos', 'GCPJ')), 2)
+        self.assertEqual(self.cache.estatisticas()['invalidacoes'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime
+
+from flask import Flask
+
+from cache_renderizacao import CachePaginas, geracao_codigo, ler_versoes_dados, registrar_alteracao
+from migracoes_schema import MIGRACOES
+
+
+class TestCachePaginas(unittest.TestCase):
+    """ETag das páginas em cache"""
+
+    def setUp(self):
+        self.versoes = {'execucao': 1, 'atualizado_em': None}
+
+    def montar(self, cache):
+        app = Flask(__name__)
+
+        @app.route('/')
+        @cache.pagina('execucao')
+        def pagina():
+            return '<h1>Dashboard</h1>'
+
+        return app.test_client()
+
+    def test_etag_igual_entre_processos(self):
+        """Duas instâncias (dois workers ou um reinício) geram o mesmo ETag"""
+        etags = [self.montar(CachePaginas(lambda: self.versoes)).get('/').headers['ETag'] for _ in range(2)]
+        self.assertEqual(etags[0], etags[1])
+
+    def test_geracao_muda_com_o_codigo(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        caminho = os.path.join(temp_dir, 'interface.py')
+        with open(caminho, 'w') as arquivo:
+            arquivo.write("HTML = '<h1>v1</h1>'\n")
+        antes = geracao_codigo(temp_dir)
+        self.assertEqual(geracao_codigo(temp_dir), antes)
+
+        with open(caminho, 'w') as arquivo:
+            arquivo.write("HTML = '<h1>v2</h1>'\n")
+        self.assertNotEqual(geracao_codigo(temp_dir), antes)
+
+
+
+class TestRevalidacaoPaginas(unittest.TestCase):
+    """304 enquanto os dados não mudam; página nova depois de registrar_alteracao"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.conn = sqlite3.connect(os.path.join(self.temp_dir, 'sistema_completo.db'))
+        self.conn.execute("CREATE TABLE execucoes (id INTEGER PRIMARY KEY, timestamp TEXT)")
+        comandos = {numero: comandos for numero, _, comandos in MIGRACOES['sistema_completo']}
+        for comando in comandos[5]:  # versoes_dados
+            self.conn.execute(comando)
+        self.conn.commit()
+
+        self.montagens = []
+        self.cache = CachePaginas(lambda: ler_versoes_dados(self.conn), geracao='teste')
+        app = Flask(__name__)
+
+        @app.route('/')
+        @self.cache.pagina('execucao', 'fontes', 'escopo')
+        def dashboard():
+            self.montagens.append('dashboard')
+            return f"<h1>Dashboard {len(self.montagens)}</h1>"
+
+        @app.route('/fontes')
+        @self.cache.pagina('fontes')
+        def fontes():
+            self.montagens.append('fontes')
+            return '<h1>Fontes</h1>'
+
+        self.cliente = app.test_client()
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.temp_dir)
+
+    def revalidar(self, rota, etag):
+        return self.cliente.get(rota, headers={'If-None-Match': etag})
+
+    def test_revalidacao_sem_alteracao(self):
+        resposta = self.cliente.get('/')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertTrue(resposta.cache_control.no_cache)
+        etag = resposta.headers['ETag']
+
+        self.assertEqual(self.revalidar('/', etag).status_code, 304)
+        # Sem o ETag no navegador a página vem do cache, sem ser montada de novo
+        self.assertEqual(self.cliente.get('/').data, resposta.data)
+        self.assertEqual(self.montagens, ['dashboard'])
+
+    def test_alteracao_invalida_paginas_dependentes(self):
+        etag_dashboard = self.cliente.get('/').headers['ETag']
+        etag_fontes = self.cliente.get('/fontes').headers['ETag']
+
+        registrar_alteracao(self.conn, 'escopo')
+        self.conn.commit()
+
+        resposta = self.revalidar('/', etag_dashboard)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data, b'<h1>Dashboard 3</h1>')
+        self.assertNotEqual(resposta.headers['ETag'], etag_dashboard)
+        self.assertIsNotNone(resposta.last_modified)
+        # /fontes não depende do escopo
+        self.assertEqual(self.revalidar('/fontes', etag_fontes).status_code, 304)
+
+        registrar_alteracao(self.conn, 'fontes')
+        self.conn.commit()
+        self.assertEqual(self.revalidar('/fontes', etag_fontes).status_code, 200)
+        self.assertEqual(self.montagens, ['dashboard', 'fontes', 'dashboard', 'fontes'])
+
+    def test_nova_execucao_invalida(self):
+        etag = self.cliente.get('/').headers['ETag']
+        self.conn.execute("INSERT INTO execucoes (timestamp) VALUES (?)", (datetime.now().isoformat(),))
+        self.conn.commit()
+
+        self.assertEqual(self.revalidar('/', etag).status_code, 200)
+        self.assertEqual(ler_versoes_dados(self.conn)['execucao'], 1)
+
+    def test_alteracao_desfeita_nao_invalida(self):
+        """A versão só muda quando a transação de quem alterou os dados é confirmada"""
+        etag = self.cliente.get('/').headers['ETag']
+        registrar_alteracao(self.conn, 'fontes')
+        self.conn.rollback()
+
+        self.assertEqual(self.revalidar('/', etag).status_code, 304)
+        self.assertEqual(ler_versoes_dados(self.conn), {'fontes': 0, 'escopo': 0, 'execucao': 0, 'atualizado_em': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
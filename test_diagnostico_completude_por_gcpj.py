@@ -0,0 +1,238 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import diagnostico_completude_por_gcpj as modulo
+from diagnostico_completude_por_gcpj import (
+    ARQUIVO_FONTE_PRIMARIA, ARQUIVO_FONTE_SECUNDARIA, ARQUIVO_TEMPLATE, DiagnosticoCompletudePorGCPJ
+)
+
+
+def previa(valor):
+    return str(valor)[:50] + "..." if len(str(valor)) > 50 else str(valor)
+
+
+def diagnostico_linha_a_linha(diagnostico):
+    """Implementação anterior do diagnóstico (iterrows e um dicionário por GCPJ), como referência"""
+    mapeamento_secundario = {}
+    for _, row in diagnostico.secondary_df.iterrows():
+        if 'GCPJ' in row and pd.notna(row['GCPJ']):
+            gcpj = diagnostico.normalizar_gcpj(row['GCPJ'])
+            dados = {template_col: row[source_col]
+                     for template_col, source_col in diagnostico.secondary_mappings.items()
+                     if source_col in row and pd.notna(row[source_col])}
+            for chave in diagnostico.gerar_chaves_gcpj(gcpj):
+                mapeamento_secundario[chave] = dados
+
+    colunas_mapeadas = (set(diagnostico.column_mappings) | set(diagnostico.secondary_mappings)
+                        | set(diagnostico.constant_values))
+    resultados = []
+    for idx, row in diagnostico.primary_df.iterrows():
+        gcpj = diagnostico.normalizar_gcpj(row.get('GCPJ'))
+        if not gcpj:
+            continue
+        detalhes = {}
+        preenchidas = set()
+        for template_col, source_col in diagnostico.column_mappings.items():
+            if source_col in row and pd.notna(row[source_col]):
+                preenchidas.add(template_col)
+                detalhes[template_col] = {'fonte': 'Primária', 'coluna_origem': source_col,
+                                          'valor': previa(row[source_col]), 'disponivel': True}
+            else:
+                detalhes[template_col] = {'fonte': 'Primária', 'coluna_origem': source_col, 'disponivel': False,
+                                          'motivo': 'Dado não encontrado ou vazio na fonte primária'}
+        for template_col, valor in diagnostico.constant_values.items():
+            preenchidas.add(template_col)
+            detalhes[template_col] = {'fonte': 'Constante', 'valor': valor, 'disponivel': True}
+
+        chaves = diagnostico.gerar_chaves_gcpj(gcpj)
+        dados = next((mapeamento_secundario[c] for c in chaves if c in mapeamento_secundario), None)
+        for template_col, source_col in diagnostico.secondary_mappings.items():
+            if dados and template_col in dados:
+                preenchidas.add(template_col)
+                detalhes[template_col] = {
+                    'fonte': 'Secundária (via GCPJ)', 'coluna_origem': source_col,
+                    'valor': previa(dados[template_col]),
+                    'chave_gcpj_usada': next((c for c in chaves if c in mapeamento_secundario), None),
+                    'disponivel': True
+                }
+            else:
+                detalhes[template_col] = {
+                    'fonte': 'Secundária (via GCPJ)', 'coluna_origem': source_col, 'disponivel': False,
+                    'motivo': 'GCPJ não encontrado na fonte secundária ou dado vazio', 'chaves_tentadas': chaves
+                }
+        for coluna in set(diagnostico.template_columns) - colunas_mapeadas:
+            detalhes[coluna] = {'fonte': 'Nenhuma', 'disponivel': False,
+                                'motivo': 'Sem mapeamento definido - reservada para fases futuras'}
+
+        resultados.append({
+            'GCPJ': gcpj,
+            'colunas_disponiveis': sorted(preenchidas),
+            'colunas_faltantes': sorted(c for c in diagnostico.template_columns if c not in preenchidas),
+            'detalhes_fonte': detalhes,
+            'taxa_completude': len(preenchidas) / len(diagnostico.template_columns) * 100,
+            'indice_original': idx
+        })
+    return resultados
+
+
+def completude_por_coluna_linha_a_linha(resultados):
+    """Agregação anterior (ControleQualidade.calcular_completude_por_coluna) sobre os dicionários"""
+    completude = {}
+    for coluna in resultados[0]['detalhes_fonte']:
+        ausentes = [r['GCPJ'] for r in resultados if not r['detalhes_fonte'][coluna].get('disponivel', False)]
+        preenchidos = len(resultados) - len(ausentes)
+        completude[coluna] = {
+            'fonte': resultados[0]['detalhes_fonte'][coluna]['fonte'],
+            'taxa_completude': round(preenchidos / len(resultados) * 100, 2),
+            'registros_preenchidos': preenchidos,
+            'registros_ausentes': len(ausentes),
+            'gcpjs_ausentes': ausentes
+        }
+    return completude
+
+
+class TestDiagnosticoCompletudePorGCPJ(unittest.TestCase):
+    """O resultado em colunas deve reproduzir o diagnóstico linha a linha"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.diagnostico = DiagnosticoCompletudePorGCPJ(self.temp_dir)
+        self.template = (list(self.diagnostico.column_mappings) + list(self.diagnostico.constant_values)
+                         + list(self.diagnostico.secondary_mappings) + ['EXTRA'])
+        pd.DataFrame(columns=self.template).to_excel(
+            os.path.join(self.temp_dir, ARQUIVO_TEMPLATE), sheet_name='Sheet', index=False
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def gravar_fontes(self, primaria, secundaria):
+        pd.DataFrame(primaria).to_excel(os.path.join(self.temp_dir, ARQUIVO_FONTE_PRIMARIA), index=False)
+        pd.DataFrame(secundaria).to_excel(os.path.join(self.temp_dir, ARQUIVO_FONTE_SECUNDARIA), index=False)
+
+    def gravar_fontes_grandes(self, total=40):
+        gcpjs = [1600000000 + i if i % 3 else 2200000000 + i for i in range(total)]
+        gcpjs[5] = None
+        self.gravar_fontes(
+            {'GCPJ': gcpjs,
+             'PROCESSO': [f'p{i}' if i % 2 else None for i in range(total)],
+             'UF': ['SP' if i % 4 else None for i in range(total)]},
+            {'GCPJ': [2200000000 + i for i in range(0, total, 2)],
+             'TIPO': ['A' if i % 4 else None for i in range(0, total, 2)],
+             'PROCADV_CONTRATO': ['x'] * len(range(0, total, 2))}
+        )
+
+    def test_formato_verboso(self):
+        self.gravar_fontes(
+            {'GCPJ': [1600000001, 2200000002, None, 1300000003],
+             'PROCESSO': ['p1', None, 'p3', 'p4'],
+             'UF': ['SP', 'RJ', None, None]},
+            {'GCPJ': [2200000001, 2200000002],
+             'TIPO': ['A', None],
+             'PROCADV_CONTRATO': ['x', 'y']}
+        )
+        resultados = self.diagnostico.gerar_diagnostico_completo()
+
+        self.assertEqual(list(resultados.gcpjs), ['1600000001', '2200000002', '1300000003'])
+
+        primeiro = resultados[0]
+        self.assertEqual(primeiro['colunas_disponiveis'], sorted([
+            'CÓD. INTERNO', 'PROCESSO', 'UF', 'ESCRITÓRIO', 'MONITORAMENTO', 'SEGMENTO DO CONTRATO', 'OPERAÇÃO'
+        ]))
+        self.assertAlmostEqual(primeiro['taxa_completude'], 7 / len(self.template) * 100)
+        self.assertEqual(primeiro['detalhes_fonte']['PROCESSO'],
+                         {'fonte': 'Primária', 'coluna_origem': 'PROCESSO', 'valor': 'p1', 'disponivel': True})
+        self.assertEqual(primeiro['detalhes_fonte']['SEGMENTO DO CONTRATO']['chave_gcpj_usada'], '1600000001')
+        self.assertEqual(primeiro['detalhes_fonte']['EXTRA']['fonte'], 'Nenhuma')
+
+        segundo = resultados[1]
+        self.assertFalse(segundo['detalhes_fonte']['SEGMENTO DO CONTRATO']['disponivel'])
+        self.assertEqual(segundo['detalhes_fonte']['OPERAÇÃO']['valor'], 'y')
+
+        ultimo = resultados[-1]
+        self.assertEqual(ultimo['indice_original'], 3)
+        self.assertEqual(ultimo['detalhes_fonte']['OPERAÇÃO']['chaves_tentadas'],
+                         ['1300000003', '00000003', '2200000003', '2400000003'])
+        self.assertIn('EXTRA', ultimo['colunas_faltantes'])
+
+        completude = resultados.completude_por_coluna()
+        self.assertEqual(completude['PROCESSO']['gcpjs_ausentes'], ['2200000002'])
+        self.assertEqual(completude['ESCRITÓRIO']['registros_preenchidos'], 3)
+
+    def test_agregados_iguais_aos_registros_verbosos(self):
+        """Taxas e completude por coluna saem das máscaras com os valores dos dicionários"""
+        self.gravar_fontes_grandes()
+        resultados = self.diagnostico.gerar_diagnostico_completo()
+        registros = list(resultados)
+
+        np.testing.assert_allclose(resultados.taxas_completude(), [r['taxa_completude'] for r in registros])
+        self.assertAlmostEqual(resultados.taxa_media(), np.mean([r['taxa_completude'] for r in registros]))
+
+        completude = resultados.completude_por_coluna()
+        for coluna in resultados.colunas:
+            ausentes = [r['GCPJ'] for r in registros if not r['detalhes_fonte'][coluna]['disponivel']]
+            self.assertEqual(completude[coluna]['gcpjs_ausentes'], ausentes)
+            self.assertEqual(completude[coluna]['registros_preenchidos'], len(registros) - len(ausentes))
+            self.assertEqual(completude[coluna]['fonte'], registros[0]['detalhes_fonte'][coluna]['fonte'])
+
+    def test_mesmo_resultado_do_diagnostico_linha_a_linha(self):
+        """Registros, agregados e resumo por coluna conferidos contra a implementação com iterrows"""
+        self.gravar_fontes_grandes()
+        resultados = self.diagnostico.gerar_diagnostico_completo()
+        referencia = diagnostico_linha_a_linha(self.diagnostico)
+
+        self.assertEqual(list(resultados), referencia)
+        np.testing.assert_allclose(resultados.taxas_completude(), [r['taxa_completude'] for r in referencia])
+
+        completude = completude_por_coluna_linha_a_linha(referencia)
+        self.assertEqual(resultados.completude_por_coluna(), completude)
+
+        resumo = list(resultados.resumo_por_coluna(limite_previa=4))
+        self.assertEqual([coluna for coluna, _, _ in resumo], list(resultados.colunas))
+        for coluna, dados, disponivel in resumo:
+            esperado = dict(completude[coluna], gcpjs_ausentes=completude[coluna]['gcpjs_ausentes'][:4])
+            self.assertEqual(dados, esperado)
+            self.assertEqual(list(resultados.gcpjs[~disponivel]), completude[coluna]['gcpjs_ausentes'])
+
+    def test_processos_nao_alteram_resultado(self):
+        """Pool de processos e execução sequencial produzem os mesmos arrays"""
+        if 'fork' not in modulo.multiprocessing.get_all_start_methods():
+            self.skipTest('fork indisponível')
+        self.gravar_fontes_grandes()
+
+        with mock.patch.object(modulo, 'TAMANHO_BLOCO_ANALISE', 7):
+            sequencial = self.diagnostico.gerar_diagnostico_completo(processos=1)
+            paralelo = DiagnosticoCompletudePorGCPJ(self.temp_dir).gerar_diagnostico_completo(processos=2)
+
+        np.testing.assert_array_equal(paralelo.gcpjs, sequencial.gcpjs)
+        np.testing.assert_array_equal(paralelo.posicoes, sequencial.posicoes)
+        np.testing.assert_array_equal(paralelo.mascaras, sequencial.mascaras)
+        np.testing.assert_array_equal(paralelo.chaves_usadas, sequencial.chaves_usadas)
+        self.assertEqual(list(paralelo), list(sequencial))
+
+    def test_fora_da_thread_principal_nao_usa_pool(self):
+        """Na thread do executor web a análise não faz fork"""
+        self.gravar_fontes_grandes()
+        saida = {}
+
+        def executar():
+            saida['resultados'] = self.diagnostico.gerar_diagnostico_completo(processos=2)
+
+        with mock.patch.object(modulo, 'TAMANHO_BLOCO_ANALISE', 7), \
+                mock.patch.object(modulo.multiprocessing, 'get_context', side_effect=AssertionError('fork')):
+            thread = threading.Thread(target=executar)
+            thread.start()
+            thread.join()
+
+        self.assertEqual(len(saida['resultados']), 39)
+
+
+if __name__ == '__main__':
+    unittest.main()
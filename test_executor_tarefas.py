@@ -0,0 +1,274 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from unittest import mock
+
+import executor_tarefas
+from conexao_sqlite import conexao, fechar_conexoes
+from executor_tarefas import ExecutorTarefas, ESTADO_INTERROMPIDO
+from migracoes_schema import MIGRACOES
+from progresso_execucao import (
+    PainelProgresso, ExecucaoCancelada, ESTADO_NA_FILA, ESTADO_EXECUTANDO, ESTADO_CONCLUIDO,
+    ESTADO_CANCELADO, ESTADO_ERRO
+)
+
+ESTADOS_FINAIS = (ESTADO_CONCLUIDO, ESTADO_CANCELADO, ESTADO_ERRO, ESTADO_INTERROMPIDO)
+
+
+class CasoExecutor(unittest.TestCase):
+    """Banco com tarefas_execucao e executor com sinal de vida rápido"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'qualidade.db')
+        with conexao(self.db_path) as conn:
+            for _, _, comandos in MIGRACOES['qualidade']:
+                for comando in comandos:
+                    if 'tarefas_execucao' in comando:
+                        conn.execute(comando)
+            conn.commit()
+
+        # Sinal de vida e espera por vaga mais curtos que os de produção
+        intervalo = mock.patch.object(executor_tarefas, 'INTERVALO_SINAL', 0.02)
+        intervalo.start()
+        self.addCleanup(intervalo.stop)
+
+        self.liberar = threading.Event()
+        self.executor = self.novo_executor()
+        self.executores = [self.executor]
+
+    def tearDown(self):
+        self.liberar.set()
+        for executor in self.executores:
+            executor._pool.shutdown(wait=True)
+        fechar_conexoes()
+        shutil.rmtree(self.temp_dir)
+
+    def novo_executor(self):
+        return ExecutorTarefas(self.db_path, PainelProgresso(), max_concorrentes=1)
+
+    def bloqueante(self, resultado=None):
+        iniciada = threading.Event()
+
+        def funcao(progresso):
+            iniciada.set()
+            while not self.liberar.wait(timeout=0.01):
+                progresso.avancar()
+            return resultado
+
+        return funcao, iniciada
+
+    def esperar(self, tarefa_id, executor=None, timeout=5, estados=ESTADOS_FINAIS):
+        executor = executor or self.executor
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            tarefa = executor.obter(tarefa_id)
+            if tarefa['estado'] in estados:
+                return tarefa
+            time.sleep(0.01)
+        self.fail(f"Tarefa {tarefa_id} não chegou a {estados}")
+
+    def outro_worker(self):
+        """Segundo executor no mesmo banco, como o de outro worker do gunicorn"""
+        # Sem marcar_interrompidas(): quem marca é o mestre, uma vez, antes do fork
+        with mock.patch.object(ExecutorTarefas, 'marcar_interrompidas'):
+            executor = ExecutorTarefas(self.db_path, PainelProgresso(), max_concorrentes=1)
+        self.executores.append(executor)
+        return executor
+
+
+class TestExecutorTarefas(CasoExecutor):
+    """Deduplicação, cancelamento e estado persistido das tarefas"""
+
+    def test_deduplicacao_por_chave(self):
+        funcao, iniciada = self.bloqueante({'total': 3})
+        primeira, reaproveitada = self.executor.submeter('diagnostico', funcao, chave='v1')
+        self.assertFalse(reaproveitada)
+        self.assertTrue(iniciada.wait(5))
+
+        self.assertEqual(self.executor.submeter('diagnostico', funcao, chave='v1'), (primeira, True))
+        outra, reaproveitada = self.executor.submeter('diagnostico', lambda progresso: None, chave='v2')
+        self.assertFalse(reaproveitada)
+        self.assertNotEqual(outra, primeira)
+
+        self.liberar.set()
+        tarefa = self.esperar(primeira)
+        self.assertEqual(tarefa['estado'], ESTADO_CONCLUIDO)
+        self.assertEqual(tarefa['resultado'], {'total': 3})
+
+        # Concluída, a chave volta a criar uma tarefa nova
+        nova, reaproveitada = self.executor.submeter('diagnostico', lambda progresso: None, chave='v1')
+        self.assertFalse(reaproveitada)
+        self.assertNotEqual(nova, primeira)
+        self.esperar(nova)
+
+    def test_cancelar_em_execucao(self):
+        funcao, iniciada = self.bloqueante()
+        tarefa_id, _ = self.executor.submeter('diagnostico', funcao, chave='v1')
+        self.assertTrue(iniciada.wait(5))
+
+        self.assertTrue(self.executor.cancelar(tarefa_id))
+        self.assertEqual(self.esperar(tarefa_id)['estado'], ESTADO_CANCELADO)
+        self.assertFalse(self.executor.cancelar(tarefa_id))
+        self.assertFalse(self.executor.submeter('diagnostico', lambda progresso: None, chave='v1')[1])
+
+    def test_cancelar_na_fila(self):
+        """Tarefa cancelada antes de começar sai da fila e nunca executa"""
+        funcao, iniciada = self.bloqueante()
+        primeira, _ = self.executor.submeter('diagnostico', funcao)
+        self.assertTrue(iniciada.wait(5))
+
+        executou = threading.Event()
+        na_fila, _ = self.executor.submeter('diagnostico', lambda progresso: executou.set(), chave='v2')
+        self.assertTrue(self.executor.cancelar(na_fila))
+        self.assertEqual(self.executor.obter(na_fila)['estado'], ESTADO_CANCELADO)
+
+        self.liberar.set()
+        self.esperar(primeira)
+        self.executor._pool.shutdown(wait=True)
+        self.assertFalse(executou.is_set())
+        self.assertEqual(self.executor.obter(na_fila)['estado'], ESTADO_CANCELADO)
+
+    def test_erro_na_tarefa(self):
+        def falhar(progresso):
+            raise RuntimeError('fonte indisponível')
+
+        tarefa = self.esperar(self.executor.submeter('diagnostico', falhar)[0])
+        self.assertEqual(tarefa['estado'], ESTADO_ERRO)
+        self.assertEqual(tarefa['erro'], 'fonte indisponível')
+
+    def test_estado_apos_reinicio(self):
+        """Resultados concluídos sobrevivem; tarefas ativas viram 'interrompido'"""
+        concluida = self.esperar(self.executor.submeter('diagnostico', lambda progresso: {'ok': True})[0])['id']
+        funcao, iniciada = self.bloqueante()
+        ativa, _ = self.executor.submeter('diagnostico', funcao, chave='v1')
+        self.assertTrue(iniciada.wait(5))
+
+        reiniciado = self.novo_executor()
+        try:
+            self.assertEqual(reiniciado.obter(concluida)['resultado'], {'ok': True})
+            tarefa = reiniciado.obter(ativa)
+            self.assertEqual(tarefa['estado'], ESTADO_INTERROMPIDO)
+            self.assertIsNone(tarefa['progresso'])
+            self.assertFalse(reiniciado.submeter('diagnostico', lambda progresso: None, chave='v1')[1])
+        finally:
+            reiniciado._pool.shutdown(wait=True)
+
+
+class TestExecutorEntreWorkers(CasoExecutor):
+    """Dois executores no mesmo banco se comportam como um só (workers do gunicorn)"""
+
+    def test_deduplicacao_e_cancelamento_em_outro_worker(self):
+        outro = self.outro_worker()
+        funcao, iniciada = self.bloqueante()
+        tarefa_id, _ = self.executor.submeter('diagnostico', funcao, chave='v1')
+        self.assertTrue(iniciada.wait(5))
+
+        self.assertEqual(outro.submeter('diagnostico', funcao, chave='v1'), (tarefa_id, True))
+        self.assertEqual(outro.obter(tarefa_id)['estado'], ESTADO_EXECUTANDO)
+
+        # O progresso gravado pelo sinal de vida aparece no outro worker
+        limite = time.monotonic() + 5
+        while outro.obter(tarefa_id)['progresso'] is None and time.monotonic() < limite:
+            time.sleep(0.01)
+        self.assertEqual(outro.obter(tarefa_id)['progresso']['id'], tarefa_id)
+
+        self.assertTrue(outro.cancelar(tarefa_id))
+        self.assertEqual(self.esperar(tarefa_id)['estado'], ESTADO_CANCELADO)
+        self.assertEqual(outro.obter(tarefa_id)['estado'], ESTADO_CANCELADO)
+
+    def test_vaga_compartilhada(self):
+        """max_concorrentes vale para a soma dos workers"""
+        outro = self.outro_worker()
+        funcao, iniciada = self.bloqueante()
+        primeira, _ = self.executor.submeter('diagnostico', funcao, chave='v1')
+        self.assertTrue(iniciada.wait(5))
+
+        segunda, _ = outro.submeter('diagnostico', lambda progresso: {'ok': True}, chave='v2')
+        time.sleep(0.2)
+        self.assertEqual(outro.obter(segunda)['estado'], ESTADO_NA_FILA)
+
+        self.liberar.set()
+        self.esperar(primeira)
+        self.assertEqual(self.esperar(segunda, outro)['resultado'], {'ok': True})
+
+    def test_cancelar_na_fila_de_outro_worker(self):
+        outro = self.outro_worker()
+        funcao, iniciada = self.bloqueante()
+        primeira, _ = self.executor.submeter('diagnostico', funcao)
+        self.assertTrue(iniciada.wait(5))
+
+        executou = threading.Event()
+        na_fila, _ = outro.submeter('diagnostico', lambda progresso: executou.set(), chave='v2')
+        self.assertTrue(self.executor.cancelar(na_fila))
+
+        self.liberar.set()
+        self.esperar(primeira)
+        outro._pool.shutdown(wait=True)
+        self.assertFalse(executou.is_set())
+        self.assertEqual(outro.obter(na_fila)['estado'], ESTADO_CANCELADO)
+        self.assertFalse(outro.painel.obter(na_fila).ativo)
+
+    def test_eventos_de_outro_worker(self):
+        outro = self.outro_worker()
+        funcao, iniciada = self.bloqueante()
+        tarefa_id, _ = self.executor.submeter('diagnostico', funcao)
+        self.assertTrue(iniciada.wait(5))
+
+        eventos = outro.eventos(tipo='diagnostico')
+        self.assertTrue(next(eventos).startswith('event: progresso'))
+        self.liberar.set()
+        fim = [evento for evento in eventos if not evento.startswith(':')][-1]
+        self.assertTrue(fim.startswith('event: fim'))
+        self.assertIn(ESTADO_CONCLUIDO, fim)
+        self.assertIn(tarefa_id, fim)
+
+    def test_worker_sem_sinal_de_vida(self):
+        """Tarefa de um worker que morreu não segura a chave"""
+        agora = datetime.now().isoformat()
+        antigo = (datetime.now() - timedelta(seconds=executor_tarefas.LIMITE_SEM_SINAL + 1)).isoformat()
+        with conexao(self.db_path) as conn:
+            conn.execute('''
+                INSERT INTO tarefas_execucao (id, tipo, chave, estado, criada_em, atualizada_em)
+                VALUES ('morta', 'diagnostico', 'v1', ?, ?, ?)
+            ''', (ESTADO_EXECUTANDO, agora, antigo))
+            conn.commit()
+
+        self.assertEqual(self.executor.obter('morta')['estado'], ESTADO_INTERROMPIDO)
+        nova, reaproveitada = self.executor.submeter('diagnostico', lambda progresso: None, chave='v1')
+        self.assertFalse(reaproveitada)
+        self.esperar(nova)
+        self.assertFalse(self.executor.cancelar('morta'))
+
+    def test_executar_na_thread_atual(self):
+        """executar() devolve o retorno sem persistir e pode ser cancelada por outro worker"""
+        self.assertEqual(self.executor.executar('migracao', lambda progresso: [1, 2]), [1, 2])
+        self.assertIsNone(self.executor.listar(tipo='migracao')[0]['resultado'])
+
+        outro = self.outro_worker()
+        iniciada = threading.Event()
+
+        def cancelar_de_fora():
+            self.assertTrue(iniciada.wait(5))
+            outro.cancelar(self.executor.listar(tipo='migracao')[0]['id'])
+
+        def migrar(progresso):
+            iniciada.set()
+            while True:
+                progresso.avancar()
+                time.sleep(0.01)
+
+        thread = threading.Thread(target=cancelar_de_fora)
+        thread.start()
+        with self.assertRaises(ExecucaoCancelada):
+            self.executor.executar('migracao', migrar)
+        thread.join()
+        self.assertEqual(self.executor.listar(tipo='migracao')[0]['estado'], ESTADO_CANCELADO)
+
+
+if __name__ == '__main__':
+    unittest.main()
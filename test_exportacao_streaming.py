@@ -0,0 +1,90 @@
+import unittest
+import io
+from unittest import mock
+
+from flask import Flask
+from openpyxl import load_workbook
+
+import exportacao_streaming
+from exportacao_streaming import espiar_linhas, resposta_exportacao
+
+
+class TestRespostaExportacao(unittest.TestCase):
+    """CSV e XLSX gerados a partir de um iterador, sem materializar a lista"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.lidas = 0
+
+        def linhas(total):
+            for i in range(total):
+                self.lidas += 1
+                yield (f'16{i:08d}', f'Motivo ção {i}')
+
+        @self.app.route('/exportar/<formato>/<int:total>')
+        def exportar(formato, total):
+            return resposta_exportacao(linhas(total), ['gcpj', 'motivo'], 'gcpjs ausentes', formato=formato,
+                                       nome_aba='GCPJs ausentes de todas as colunas')
+
+        self.cliente = self.app.test_client()
+
+    def test_csv(self):
+        resposta = self.cliente.get('/exportar/csv/3')
+        self.assertEqual(resposta.mimetype, 'text/csv')
+        self.assertIn("filename*=UTF-8''gcpjs%20ausentes_", resposta.headers['Content-Disposition'])
+        self.assertEqual(
+            resposta.data.decode('utf-8'),
+            '\ufeffgcpj;motivo\r\n1600000000;Motivo ção 0\r\n1600000001;Motivo ção 1\r\n1600000002;Motivo ção 2\r\n'
+        )
+
+    def test_csv_enviado_em_blocos_enquanto_le(self):
+        """O primeiro bloco sai antes de o iterador ser consumido inteiro"""
+        with mock.patch.object(exportacao_streaming, 'TAMANHO_BLOCO_ENVIO', 256):
+            resposta = self.cliente.get('/exportar/csv/1000', buffered=False)
+            self.assertTrue(resposta.is_streamed)
+            blocos = iter(resposta.response)
+            primeiro = next(blocos)
+            self.assertLess(self.lidas, 1000)
+
+            corpo = primeiro + b''.join(blocos)
+            resposta.close()
+        self.assertEqual(self.lidas, 1000)
+        self.assertEqual(corpo.decode('utf-8').count('\r\n'), 1001)
+
+    def test_xlsx(self):
+        resposta = self.cliente.get('/exportar/xlsx/50')
+        self.assertEqual(resposta.mimetype, exportacao_streaming.MIMETYPES_EXPORTACAO['xlsx'])
+        self.assertEqual(int(resposta.headers['Content-Length']), len(resposta.data))
+
+        workbook = load_workbook(io.BytesIO(resposta.data), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['GCPJs ausentes de todas as colu'])
+        linhas = list(workbook.active.iter_rows(values_only=True))
+        workbook.close()
+        self.assertEqual(linhas[0], ('gcpj', 'motivo'))
+        self.assertEqual(linhas[1], ('1600000000', 'Motivo ção 0'))
+        self.assertEqual(len(linhas), 51)
+
+    def test_lista_vazia(self):
+        self.assertEqual(self.cliente.get('/exportar/csv/0').data.decode('utf-8'), '\ufeffgcpj;motivo\r\n')
+
+        workbook = load_workbook(io.BytesIO(self.cliente.get('/exportar/xlsx/0').data), read_only=True)
+        self.assertEqual(list(workbook.active.iter_rows(values_only=True)), [('gcpj', 'motivo')])
+        workbook.close()
+
+    def test_formato_invalido(self):
+        with self.app.test_request_context():
+            with self.assertRaises(ValueError):
+                resposta_exportacao(iter(()), ['gcpj'], 'escopo', formato='pdf')
+
+    def test_espiar_linhas(self):
+        tem_linhas, linhas = espiar_linhas(iter(()))
+        self.assertFalse(tem_linhas)
+        self.assertEqual(list(linhas), [])
+
+        tem_linhas, linhas = espiar_linhas(iter([1, 2]))
+        self.assertTrue(tem_linhas)
+        self.assertEqual(list(linhas), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import pandas as pd
+
+from importacao_escopo import canonizar_gcpjs, importar_arquivo_escopo, normalizar_gcpjs
+
+
+class TestNormalizacaoGcpjs(unittest.TestCase):
+    """Só dígitos, sem o '.0' do Excel, com no mínimo 6 dígitos"""
+
+    def test_formatos(self):
+        casos = {
+            '1600000001': '1600000001',
+            ' 1600000002 ': '1600000002',
+            '1600000003.0': '1600000003',
+            '1600000004.00': '1600000004',
+            1600000005: '1600000005',
+            1600000006.0: '1600000006',
+            # Separadores de milhar: os zeros finais fazem parte do número
+            '1.600.000.000': '1600000000',
+            '16.000.000': '16000000',
+            '1600-000-007': '1600000007',
+            'GCPJ 1600000008': '1600000008',
+            '12345': None,
+            '12.0': None,
+            'abc': None,
+            None: None,
+        }
+        self.assertEqual(list(canonizar_gcpjs(list(casos))), list(casos.values()))
+
+    def test_validos_e_invalidos_por_linha(self):
+        validos, invalidos = normalizar_gcpjs(['1600000001', '1600000001.0', '123', None, '1.600.000.000'])
+        self.assertEqual(list(validos), ['1600000001', '1600000001', '1600000000'])
+        self.assertEqual(invalidos, 1)
+
+
+class TestImportacaoEscopo(unittest.TestCase):
+    """Contagens do resumo da importação"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.conn = sqlite3.connect(os.path.join(self.temp_dir, 'escopo.db'))
+        self.conn.execute('''CREATE TABLE escopo_gcpj (
+                                 gcpj TEXT UNIQUE, motivo TEXT, data_inclusao TEXT)''')
+        self.conn.execute("INSERT INTO escopo_gcpj VALUES ('1600000001', 'manual', NULL)")
+        self.gcpjs = ['1600000001', '1600000002', '1600000002.0', '1.600.000.003', '123', None, '1600000004']
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.temp_dir)
+
+    def conferir(self, caminho, **kwargs):
+        resumo = importar_arquivo_escopo(self.conn, 'escopo_gcpj', 'motivo', caminho, 'GCPJ', **kwargs)
+        self.assertEqual(resumo, {
+            'lidos': 7,
+            'processados': 5,
+            'invalidos': 1,
+            'duplicados_arquivo': 1,
+            'ja_no_escopo': 1,
+            'duplicados': 2,
+            'adicionados': 3
+        })
+        escopo = [gcpj for (gcpj,) in self.conn.execute("SELECT gcpj FROM escopo_gcpj ORDER BY gcpj")]
+        self.assertEqual(escopo, ['1600000001', '1600000002', '1600000003', '1600000004'])
+
+    def test_csv(self):
+        caminho = os.path.join(self.temp_dir, 'escopo.csv')
+        pd.DataFrame({'GCPJ': self.gcpjs}).to_csv(caminho, index=False)
+        self.conferir(caminho)
+
+    def test_excel(self):
+        caminho = os.path.join(self.temp_dir, 'escopo.xlsx')
+        pd.DataFrame({'GCPJ': self.gcpjs}).to_excel(caminho, sheet_name='Escopo', index=False)
+        self.conferir(caminho, aba='Escopo')
+
+    def test_coluna_ausente(self):
+        caminho = os.path.join(self.temp_dir, 'escopo.csv')
+        pd.DataFrame({'CODIGO': self.gcpjs}).to_csv(caminho, index=False)
+        with self.assertRaises(ValueError):
+            importar_arquivo_escopo(self.conn, 'escopo_gcpj', 'motivo', caminho, 'GCPJ')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from unittest import mock
+
+import migracoes_schema
+from migracoes_schema import aplicar_migracoes, versao_atual
+
+# Migrações que falham se rodarem duas vezes (ADD COLUMN repetido)
+MIGRACOES_TESTE = [
+    (1, "Tabela", ["CREATE TABLE registros (id INTEGER PRIMARY KEY)"]),
+    (2, "Coluna nome", ["ALTER TABLE registros ADD COLUMN nome TEXT"]),
+    (3, "Coluna valor", ["ALTER TABLE registros ADD COLUMN valor REAL"]),
+]
+
+
+class TestAplicarMigracoes(unittest.TestCase):
+    """Processos subindo ao mesmo tempo aplicam cada migração uma única vez"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'banco.db')
+        patch = mock.patch.dict(migracoes_schema.MIGRACOES, {'teste': MIGRACOES_TESTE})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def conectar(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        self.addCleanup(conn.close)
+        return conn
+
+    def versoes(self):
+        return [v for (v,) in self.conectar().execute("SELECT versao FROM schema_migracoes ORDER BY versao")]
+
+    def test_aplica_em_ordem_uma_vez(self):
+        conn = self.conectar()
+        self.assertEqual(aplicar_migracoes(conn, 'teste'), 3)
+        self.assertEqual(aplicar_migracoes(conn, 'teste'), 3)
+        self.assertEqual(self.versoes(), [1, 2, 3])
+
+    def test_versao_lida_antes_de_outro_processo_aplicar(self):
+        """A leitura fora da transação ficou velha: as versões já aplicadas são puladas"""
+        aplicar_migracoes(self.conectar(), 'teste')
+
+        with mock.patch.object(migracoes_schema, 'versao_atual', return_value=1):
+            self.assertEqual(aplicar_migracoes(self.conectar(), 'teste'), 3)
+        self.assertEqual(self.versoes(), [1, 2, 3])
+
+    def test_processos_concorrentes(self):
+        erros = []
+        barreira = threading.Barrier(4)
+
+        def subir():
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=10)
+                versao_atual(conn)
+                conn.commit()
+                barreira.wait()
+                aplicar_migracoes(conn, 'teste')
+                conn.close()
+            except Exception as e:
+                erros.append(e)
+
+        threads = [threading.Thread(target=subir) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(erros, [])
+        self.assertEqual(self.versoes(), [1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+import motor_analise_completude
+from motor_analise_completude import (
+    AgregadosFonte, ESCRITORES_RELATORIO, MAPEAMENTO_COLUNAS, MotorAnaliseCompletude, completude_por_gcpj
+)
+
+
+def completude_por_gcpj_linha_a_linha(gcpjs, mapeamento, fontes):
+    """Implementação anterior do analisador v6 (um .loc por GCPJ), como referência"""
+    total_colunas = len([c for c, (s, _) in mapeamento.items() if s != 'constant'])
+    analises = []
+    for gcpj in gcpjs:
+        dados = {
+            nome: df.loc[[gcpj]] if gcpj in df.index else pd.DataFrame()
+            for nome, df in fontes.items()
+        }
+        analise = {'GCPJ': gcpj}
+        for nome in ('primary', 'secondary', 'juridico'):
+            analise[f'in_{nome}'] = len(dados[nome]) > 0
+        for nome in ('primary', 'secondary', 'juridico'):
+            analise[f'{nome}_records'] = len(dados[nome])
+        for nome in ('primary', 'secondary', 'juridico'):
+            analise[f'{nome}_has_duplicates'] = len(dados[nome]) > 1
+
+        preenchidas = 0
+        faltantes = []
+        completude = {}
+        for coluna, (fonte, campo) in mapeamento.items():
+            if fonte == 'constant':
+                completude[coluna] = True
+                continue
+            df = dados.get(fonte)
+            if df is not None and len(df) > 0 and campo and campo in df.columns:
+                tem_dado = df[campo].notna().any()
+                completude[coluna] = tem_dado
+                if tem_dado:
+                    preenchidas += 1
+                else:
+                    faltantes.append(coluna)
+            else:
+                completude[coluna] = False
+                faltantes.append(coluna)
+
+        analise['completeness_score'] = round(min(max((preenchidas / total_colunas) * 100, 0), 100), 2)
+        analise['missing_columns'] = faltantes
+        analise['column_completeness'] = completude
+        analises.append(analise)
+    return pd.DataFrame(analises)
+
+
+class TestCompletudePorGcpj(unittest.TestCase):
+    """A versão vetorizada deve reproduzir a análise GCPJ a GCPJ"""
+
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        universo = [str(1600000000 + i) for i in range(60)]
+
+        def fonte(campos, registros):
+            gcpjs = rng.choice(universo[:45], size=registros)
+            dados = {
+                campo: np.where(rng.random(registros) < 0.3, None, rng.integers(0, 100, size=registros).astype(str))
+                for campo in campos
+            }
+            return pd.DataFrame(dados, index=pd.Index(gcpjs, name='GCPJ'))
+
+        campos = {fonte_: [] for fonte_ in ('primary', 'secondary', 'juridico')}
+        for fonte_, campo in MAPEAMENTO_COLUNAS.values():
+            if fonte_ in campos and campo != 'GCPJ':
+                campos[fonte_].append(campo)
+        campos['juridico'].remove('AVALISTA 2')  # campo mapeado ausente da fonte
+
+        self.fontes = {
+            'primary': fonte(campos['primary'], 80).reset_index().set_index('GCPJ', drop=False),
+            'secondary': fonte(campos['secondary'], 30),
+            'juridico': fonte(campos['juridico'], 70)
+        }
+        # GCPJs sem nenhum registro e GCPJ repetido na lista
+        self.gcpjs = universo + universo[:3]
+
+    def test_mesmo_resultado_da_analise_linha_a_linha(self):
+        agregados = {nome: AgregadosFonte(nome, df) for nome, df in self.fontes.items()}
+        vetorizado = completude_por_gcpj(self.gcpjs, MAPEAMENTO_COLUNAS, agregados)
+        referencia = completude_por_gcpj_linha_a_linha(self.gcpjs, MAPEAMENTO_COLUNAS, self.fontes)
+
+        self.assertEqual(list(vetorizado.columns), list(referencia.columns))
+        self.assertEqual(vetorizado.to_dict('records'), referencia.to_dict('records'))
+        self.assertEqual(vetorizado.to_csv(index=False), referencia.to_csv(index=False))
+        self.assertTrue(vetorizado['primary_has_duplicates'].any())
+        self.assertTrue((vetorizado['primary_records'] == 0).any())
+
+    def test_lista_vazia(self):
+        agregados = {nome: AgregadosFonte(nome, df) for nome, df in self.fontes.items()}
+        self.assertEqual(len(completude_por_gcpj([], MAPEAMENTO_COLUNAS, agregados)), 0)
+
+    def test_mapeamento_so_de_constantes(self):
+        with self.assertRaises(ValueError):
+            completude_por_gcpj(self.gcpjs, {'ESCRITÓRIO': ('constant', 'MOYA E LARA')}, {})
+
+
+
+class TestEscritoresRelatorio(unittest.TestCase):
+    """Relatórios gerados a partir dos agregados, conferidos contra valores calculados à mão"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.principal = os.path.join(self.temp_dir, 'principal.csv')
+        pd.DataFrame({
+            'GCPJ': [1600000001, 1600000001, 1600000002, 1600000003],
+            'CARTEIRA': ['A', None, 'B', 'C'],
+            'AGENCIA': [10, None, None, 30]
+        }).to_csv(self.principal, index=False)
+        # GCPJ vazio faz o pandas ler a coluna como float: '1600000001.0', 'nan'
+        self.juridico = os.path.join(self.temp_dir, 'juridico.csv')
+        pd.DataFrame({
+            'GCPJ': [1600000001, 1600000004, None],
+            'N DO PROCESSO': ['P1', 'P2', 'P3']
+        }).to_csv(self.juridico, index=False)
+
+        self.motor = MotorAnaliseCompletude(
+            {'primary': self.principal, 'juridico': self.juridico},
+            gcpjs=['1600000001', '1600000002', '1600000005'],
+            mapeamento={
+                'TIPO DE OPERAÇÃO/CARTEIRA': ('primary', 'CARTEIRA'),
+                'AGÊNCIA': ('primary', 'AGENCIA'),
+                'PROCESSO': ('juridico', 'N DO PROCESSO'),
+                'ESCRITÓRIO': ('constant', 'MOYA E LARA')
+            }
+        )
+        self.motor.carregar()
+        self.destino = os.path.join(self.temp_dir, 'relatorios')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def gerar(self, nome):
+        return self.motor.gerar_relatorios(self.destino, [nome])[nome]
+
+    def test_todos_os_escritores(self):
+        gerados = self.motor.gerar_relatorios(self.destino)
+        self.assertEqual(list(gerados), list(ESCRITORES_RELATORIO))
+        for caminho in gerados.values():
+            self.assertTrue(os.path.getsize(caminho) > 0)
+
+    def test_fonte_lida_uma_vez(self):
+        """Mesmo arquivo em dois nomes e todos os relatórios: uma leitura por arquivo"""
+        motor = MotorAnaliseCompletude({'primary': self.principal, 'secondary': self.principal,
+                                        'juridico': self.juridico})
+        with mock.patch.object(motor_analise_completude, 'ler_fonte_indexada',
+                               wraps=motor_analise_completude.ler_fonte_indexada) as ler:
+            motor.carregar()
+            motor.gerar_relatorios(self.destino)
+        self.assertEqual(ler.call_count, 2)
+        self.assertIs(motor.agregados['primary'], motor.agregados['secondary'])
+
+    def test_completude_coluna(self):
+        relatorio = pd.read_csv(self.gerar('completude_coluna'))
+        self.assertEqual(relatorio['gcpj_with_data'].tolist(), [2, 1, 0, 3])
+        self.assertEqual(relatorio['gcpj_without_data'].tolist(), [1, 2, 3, 0])
+        np.testing.assert_allclose(relatorio['completeness_rate'], [200 / 3, 100 / 3, 0, 100])
+
+    def test_faltantes_gcpj(self):
+        relatorio = pd.read_csv(self.gerar('faltantes_gcpj'), dtype={'GCPJ': str})
+        self.assertEqual(relatorio.to_dict('records'), [
+            {'GCPJ': '1600000005', 'completeness_score': 0.0,
+             'missing_columns': 'TIPO DE OPERAÇÃO/CARTEIRA;AGÊNCIA;PROCESSO', 'priority': 'Alta'},
+            {'GCPJ': '1600000002', 'completeness_score': 33.33,
+             'missing_columns': 'AGÊNCIA;PROCESSO', 'priority': 'Média'},
+            {'GCPJ': '1600000001', 'completeness_score': 66.67,
+             'missing_columns': 'PROCESSO', 'priority': 'Média'}
+        ])
+
+    def test_preenchimento_fontes(self):
+        relatorio = pd.read_csv(self.gerar('preenchimento_fontes'))
+        self.assertEqual(relatorio.to_dict('records'), [
+            {'fonte': 'primary', 'coluna': 'CARTEIRA', 'total_registros': 4, 'registros_preenchidos': 3,
+             'taxa_completude': 75.0, 'valores_unicos': 3, 'valores_vazios': 1},
+            {'fonte': 'primary', 'coluna': 'AGENCIA', 'total_registros': 4, 'registros_preenchidos': 2,
+             'taxa_completude': 50.0, 'valores_unicos': 2, 'valores_vazios': 2},
+            {'fonte': 'juridico', 'coluna': 'N DO PROCESSO', 'total_registros': 3, 'registros_preenchidos': 3,
+             'taxa_completude': 100.0, 'valores_unicos': 3, 'valores_vazios': 0}
+        ])
+
+    def test_padroes_gcpj(self):
+        with open(self.gerar('padroes_gcpj'), encoding='utf-8') as f:
+            relatorio = json.load(f)
+
+        principal = relatorio['padroes']['primary']
+        self.assertEqual(
+            {k: principal[k] for k in ('registros', 'gcpjs_nulos', 'gcpjs_unicos', 'registros_duplicados')},
+            {'registros': 4, 'gcpjs_nulos': 0, 'gcpjs_unicos': 3, 'registros_duplicados': 1}
+        )
+        self.assertEqual(principal['comprimentos'], {'10': 4})
+        self.assertEqual(principal['prefixos']['4'], {'1600': 4})
+        self.assertEqual(principal['formatos'], {'Apenas dígitos': 4})
+
+        juridico = relatorio['padroes']['juridico']
+        self.assertEqual((juridico['registros'], juridico['gcpjs_nulos']), (2, 1))
+        self.assertEqual(juridico['formatos'], {'Decimal .0': 2})
+
+        # O '.0' do Excel não impede o cruzamento entre as fontes
+        self.assertEqual(relatorio['sobreposicao'], [
+            {'fontes': ['primary', 'juridico'], 'em_ambas': 1, 'apenas_primary': 2, 'apenas_juridico': 1}
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
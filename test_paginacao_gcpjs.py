@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+
+from paginacao_gcpjs import paginar_lista_ordenada
+
+
+class TestPaginacaoGcpjs(unittest.TestCase):
+    """Percorrer as páginas pelo cursor deve devolver a lista inteira, sem repetições"""
+
+    def setUp(self):
+        self.lista = np.sort(np.array(
+            [f'16{i:08d}' for i in range(25)] + [f'22{i:08d}' for i in range(10)], dtype=str
+        ))
+
+    def percorrer(self, **kwargs):
+        gcpjs, apos = [], None
+        while True:
+            pagina = paginar_lista_ordenada(self.lista, apos=apos, limite=4, **kwargs)
+            gcpjs += pagina['gcpjs']
+            apos = pagina['proximo']
+            if apos is None:
+                return gcpjs, pagina['total']
+
+    def test_crescente(self):
+        gcpjs, total = self.percorrer()
+        self.assertEqual(gcpjs, self.lista.tolist())
+        self.assertEqual(total, 35)
+
+    def test_decrescente(self):
+        gcpjs, _ = self.percorrer(decrescente=True)
+        self.assertEqual(gcpjs, self.lista.tolist()[::-1])
+
+    def test_busca_por_prefixo(self):
+        gcpjs, total = self.percorrer(busca='22')
+        self.assertEqual(gcpjs, [f'22{i:08d}' for i in range(10)])
+        self.assertEqual(total, 10)
+
+        gcpjs, total = self.percorrer(busca='22', decrescente=True)
+        self.assertEqual(gcpjs, [f'22{i:08d}' for i in range(10)][::-1])
+
+    def test_pagina_exata_nao_tem_proximo(self):
+        pagina = paginar_lista_ordenada(self.lista, busca='22', limite=10)
+        self.assertEqual(len(pagina['gcpjs']), 10)
+        self.assertIsNone(pagina['proximo'])
+
+    def test_busca_sem_resultado_e_lista_vazia(self):
+        self.assertEqual(paginar_lista_ordenada(self.lista, busca='99'),
+                         {'gcpjs': [], 'total': 0, 'proximo': None})
+        self.assertEqual(paginar_lista_ordenada(np.array([], dtype=str)),
+                         {'gcpjs': [], 'total': 0, 'proximo': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import gc
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from cache_fontes_memoria import CacheFontesMemoria, chave_fonte
+from pre_carregamento_fontes import pre_carregar, preparar_fork
+
+
+class TestPreCarregamentoFontes(unittest.TestCase):
+    """Fontes carregadas no mestre iguais às de uma leitura normal"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.temp_dir, 'fonte.csv')
+        pd.DataFrame({
+            'GCPJ': [1600000001, 1600000002, 1600000003, 1600000004],
+            'UF': ['SP', 'SP', 'RJ', 'SP'],
+            'VALOR': [1.5, 2.0, None, 4.0]
+        }).to_csv(self.caminho, index=False)
+        self.fontes = [
+            {'id': 1, 'caminho': self.caminho},
+            {'id': 2, 'caminho': os.path.join(self.temp_dir, 'ausente.csv')}
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def carregar_em(self, cache):
+        def carregar(fonte):
+            return cache.obter(chave_fonte(fonte['id'], None, 'GCPJ'), fonte['caminho'],
+                               lambda: pd.read_csv(fonte['caminho']))
+        return carregar
+
+    def test_mesmos_dtypes_da_leitura_normal(self):
+        """Pré-carregado (gunicorn) ou lido no primeiro acesso (python app.py), o DataFrame é o mesmo"""
+        cache = CacheFontesMemoria(limite_memoria_mb=10)
+        estatisticas = pre_carregar(cache, self.fontes[:1], self.carregar_em(cache))
+        self.assertEqual(estatisticas['entradas'], 1)
+
+        pre_carregado = self.carregar_em(cache)(self.fontes[0])
+        normal = self.carregar_em(CacheFontesMemoria(limite_memoria_mb=10))(self.fontes[0])
+        pd.testing.assert_frame_equal(pre_carregado, normal)
+        self.assertEqual(cache.estatisticas()['acertos'], 1)
+
+    def test_fonte_com_erro_fica_para_o_worker(self):
+        cache = CacheFontesMemoria(limite_memoria_mb=10)
+        estatisticas = pre_carregar(cache, self.fontes, self.carregar_em(cache))
+        self.assertEqual(estatisticas['entradas'], 1)
+        self.assertIn(chave_fonte(1, None, 'GCPJ'), cache)
+
+    def test_preparar_fork_congela_o_heap(self):
+        self.addCleanup(gc.unfreeze)
+        preparar_fork()
+        self.assertGreater(gc.get_freeze_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
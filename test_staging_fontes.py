@@ -0,0 +1,124 @@
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import pandas as pd
+
+from conexao_sqlite import conexao, fechar_conexoes
+from sistema_multiplas_fontes import MasterDatabaseManager
+
+
+class TestStagingFontes(unittest.TestCase):
+    """Testes das tabelas de staging e dos critérios de escopo sobre elas"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.caminho = os.path.join(self.temp_dir, 'fonte_teste.xlsx')
+        pd.DataFrame({
+            'GCPJ': [1000001, 2500000, 3000000],
+            'UF': ['SP', None, 'RJ']
+        }).to_excel(self.caminho, sheet_name='Sheet1', index=False)
+
+        self.master = MasterDatabaseManager(self.temp_dir)
+        self.fonte_id = self.master.adicionar_fonte('Fonte Teste', 'excel', 'fonte_teste.xlsx', 'Sheet1', 'GCPJ')
+
+    def tearDown(self):
+        fechar_conexoes()
+        shutil.rmtree(self.temp_dir)
+
+    def criterios_salvos(self, nome):
+        with conexao(self.master.db_path) as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM criterios_escopo WHERE nome_criterio = ?", (nome,)
+            ).fetchone()[0]
+
+    def test_criterio_sobre_coluna_gcpj_da_fonte(self):
+        """A coluna GCPJ original fica no staging e pode ser usada nos critérios"""
+        resultado = self.master.aplicar_criterio_escopo('c2', 'Fonte Teste', 'GCPJ > 2000000')
+
+        self.assertEqual(resultado['gcpjs_encontrados'], 2)
+        self.assertEqual(self.master.obter_escopo_gcpjs(), ['2500000', '3000000'])
+
+    def test_criterio_sobre_coluna_projetada(self):
+        resultado = self.master.aplicar_criterio_escopo('uf', 'Fonte Teste', 'UF IS NOT NULL')
+        self.assertEqual(resultado['gcpjs_encontrados'], 2)
+
+    def test_reexecucao_reaproveita_resultado(self):
+        """Fonte e critério inalterados: o resultado salvo é usado sem reavaliar a condição"""
+        self.master.aplicar_criterio_escopo('uf', 'Fonte Teste', 'UF IS NOT NULL')
+
+        with mock.patch.object(self.master, 'filtrar_gcpjs_fonte', wraps=self.master.filtrar_gcpjs_fonte) as filtrar:
+            resultado = self.master.executar_criterio_escopo('uf')
+            self.assertTrue(resultado['reaproveitado'])
+            self.assertEqual(resultado['gcpjs_encontrados'], 2)
+            filtrar.assert_not_called()
+
+            # Critério alterado: nova avaliação
+            resultado = self.master.aplicar_criterio_escopo('uf', 'Fonte Teste', "UF = 'SP'")
+            self.assertFalse(resultado['reaproveitado'])
+            self.assertEqual(resultado['gcpjs_encontrados'], 1)
+            self.assertEqual(filtrar.call_count, 1)
+
+    def test_reexecucao_com_fonte_alterada(self):
+        """Arquivo da fonte trocado invalida o resultado salvo"""
+        self.master.aplicar_criterio_escopo('uf', 'Fonte Teste', 'UF IS NOT NULL')
+        pd.DataFrame({
+            'GCPJ': [1000001, 2500000, 3000000, 3500000],
+            'UF': ['SP', 'MG', 'RJ', None]
+        }).to_excel(self.caminho, sheet_name='Sheet1', index=False)
+
+        resultado = self.master.executar_criterio_escopo('uf')
+        self.assertFalse(resultado['reaproveitado'])
+        self.assertEqual(resultado['gcpjs_encontrados'], 3)
+
+    def test_criterio_invalido_nao_e_salvo(self):
+        """Condição que não compila levanta ValueError e não fica gravada"""
+        with self.assertRaises(ValueError):
+            self.master.aplicar_criterio_escopo('ruim', 'Fonte Teste', 'COLUNA_INEXISTENTE > 1')
+
+        self.assertEqual(self.criterios_salvos('ruim'), 0)
+        self.assertEqual(self.master.executar_criterios_escopo(), [])
+
+    def test_fonte_sem_mapeamentos(self):
+        """Fonte sem mapeamentos nem catálogo é materializada só com a coluna GCPJ"""
+        catalogo = self.master.materializar_fonte(self.fonte_id)
+        self.assertEqual(catalogo['colunas'], ['GCPJ'])
+
+        resultado = self.master.aplicar_criterio_escopo('todos', 'Fonte Teste', '1=1')
+        self.assertEqual(resultado['gcpjs_encontrados'], 3)
+
+    def test_anexar_nao_confirma_transacao_aberta(self):
+        """Escritas pendentes de quem chamou não são confirmadas pela anexação"""
+        with conexao(self.master.db_path) as conn:
+            conn.execute("UPDATE fontes_dados SET prioridade = 99 WHERE id = ?", (self.fonte_id,))
+            with self.assertRaises(RuntimeError):
+                self.master.staging.anexar(conn)
+            conn.rollback()
+
+            alias = self.master.staging.anexar(conn)
+            # Já anexado: chamar de novo dentro de uma transação não falha
+            conn.execute("UPDATE fontes_dados SET prioridade = 98 WHERE id = ?", (self.fonte_id,))
+            self.assertEqual(self.master.staging.anexar(conn), alias)
+            conn.rollback()
+
+            prioridade = conn.execute(
+                "SELECT prioridade FROM fontes_dados WHERE id = ?", (self.fonte_id,)
+            ).fetchone()[0]
+        self.assertEqual(prioridade, 10)
+
+    def test_ingestao_sem_colunas_projetadas(self):
+        """Projeção vazia gera hash constante em vez de falhar"""
+        staging = self.master.staging
+        catalogo = staging._ingerir(99, self.caminho, 'excel', 'Sheet1', 'GCPJ', [], 'assinatura')
+
+        self.assertEqual(catalogo['colunas'], [])
+        self.assertEqual(catalogo['registros'], 3)
+        with conexao(staging.db_path) as conn:
+            hashes = {linha[0] for linha in conn.execute("SELECT hash_linha FROM fonte_99")}
+        self.assertEqual(hashes, {0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,16 +7,33 @@ from difflib import get_close_matches
 import os
 from datetime import datetime
 import re
+import hashlib
+import pickle
+import sqlite3
+import time
+from collections import Counter, deque
 import numpy as np
 
 DEBUG = True
 
+# Limites do log: memória, volume por categoria na interface e frequência de atualização
+LOG_MAX_MENSAGENS = 2000
+LOG_LIMITE_UI_POR_CATEGORIA = 200
+LOG_INTERVALO_UI_MS = 250
+LOG_MAX_LINHAS_UI = 5000
+
 # Variáveis globais para armazenar resultados das validações
 correcoes_documentos = []
 correcoes_uf = []
 valores_invalidos = []
-log_mensagens = []
+correcoes_memorizadas = []
+memoria_correcoes = {}
+log_mensagens = deque(maxlen=LOG_MAX_MENSAGENS)
+log_contadores = Counter()
 app_log_area = None
+_log_pendentes_ui = []
+_log_ultima_descarga = 0.0
+_log_arquivo = None
 
 # Mapeamentos globais para validação e revalidação
 mapa_validacoes = {
@@ -40,14 +57,70 @@ colunas_adicionais = {
     'RESPONSÁVEL PROCESSO [ESCRITÓRIO]': 'RESPONSAVEL_PROCESSO_ESCRITORIO'
 }
 
-def log(msg):
-    """Registra mensagens no log e na interface gráfica."""
+# Cache em disco das regras compiladas a partir do template
+DIRETORIO_CACHE_REGRAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_regras")
+VERSAO_REGRAS = 1
+CUTOFF_SUGESTAO = 0.6
+
+# Banco SQLite com as correções aceitas pelos operadores em lotes anteriores
+CAMINHO_MEMORIA_CORRECOES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memoria_correcoes.db")
+
+def log(msg, categoria="geral"):
+    """Registra mensagens no log e na interface gráfica.
+    
+    Toda mensagem vai para o arquivo de log aberto, mas só as últimas LOG_MAX_MENSAGENS
+    ficam em memória. Mensagens de uma mesma categoria (exceto "geral") deixam de ir para
+    a interface após LOG_LIMITE_UI_POR_CATEGORIA ocorrências e são resumidas em resumir_log()."""
+    log_contadores[categoria] += 1
     log_mensagens.append(msg)
+    if _log_arquivo:
+        _log_arquivo.write(f"{msg}\n")
+    
+    if categoria != "geral" and log_contadores[categoria] > LOG_LIMITE_UI_POR_CATEGORIA:
+        return
+    
     if DEBUG:
         print("[DEBUG]", msg)
     if app_log_area:
-        app_log_area.insert(tk.END, f"{msg}\n")
-        app_log_area.yview(tk.END)
+        _log_pendentes_ui.append(msg)
+        if (time.monotonic() - _log_ultima_descarga) * 1000 >= LOG_INTERVALO_UI_MS:
+            descarregar_log_interface()
+
+def descarregar_log_interface():
+    """Envia as mensagens pendentes para a interface em um único bloco."""
+    global _log_ultima_descarga
+    _log_ultima_descarga = time.monotonic()
+    if not app_log_area or not _log_pendentes_ui:
+        return
+    
+    bloco = "\n".join(_log_pendentes_ui) + "\n"
+    _log_pendentes_ui.clear()
+    app_log_area.insert(tk.END, bloco)
+    
+    # Manter a área de log com tamanho limitado
+    total_linhas = int(app_log_area.index('end-1c').split('.')[0])
+    if total_linhas > LOG_MAX_LINHAS_UI:
+        app_log_area.delete("1.0", f"{total_linhas - LOG_MAX_LINHAS_UI + 1}.0")
+    
+    app_log_area.yview(tk.END)
+    app_log_area.update_idletasks()
+
+def agendar_descarga_log(root):
+    """Descarrega periodicamente as mensagens pendentes enquanto a interface está ociosa."""
+    descarregar_log_interface()
+    root.after(LOG_INTERVALO_UI_MS, agendar_descarga_log, root)
+
+def reiniciar_contadores_log():
+    """Zera os contadores por categoria (chamado no início de cada lote)."""
+    log_contadores.clear()
+
+def resumir_log():
+    """Registra um resumo das categorias cujas mensagens foram omitidas na interface."""
+    for categoria, total in sorted(log_contadores.items()):
+        if categoria != "geral" and total > LOG_LIMITE_UI_POR_CATEGORIA:
+            omitidas = total - LOG_LIMITE_UI_POR_CATEGORIA
+            log(f"Categoria '{categoria}': {total} mensagens ({omitidas} omitidas na interface, "
+                f"ver arquivo de log)")
 
 def normalizar(val):
     """Normaliza um valor para comparação."""
@@ -65,26 +138,36 @@ def selecionar_arquivos(titulo, multiplos=False):
         return filedialog.askopenfilenames(title=titulo, filetypes=[("Excel Files", "*.xlsx"), ("All Files", "*.*")])
     return filedialog.askopenfilename(title=titulo, filetypes=[("Excel Files", "*.xlsx"), ("All Files", "*.*")])
 
-def salvar_log_txt(nome_base, timestamp, diretorio):
-    """Salva o log completo em um arquivo TXT."""
+def abrir_log_txt(nome_base, timestamp, diretorio):
+    """Abre o arquivo TXT que recebe o log completo do lote conforme é gerado."""
+    global _log_arquivo
     try:
         nome_log = nome_base + f"_Log_{timestamp}.txt"
         caminho_log = os.path.join(diretorio, nome_log)
         
-        with open(caminho_log, 'w', encoding='utf-8') as f:
-            f.write(f"LOG DE VALIDAÇÃO - {nome_base}\n")
-            f.write(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
-            f.write(f"{'='*50}\n\n")
-            
-            for msg in log_mensagens:
-                f.write(f"{msg}\n")
-        
-        log(f"Arquivo de log salvo: {caminho_log}")
+        _log_arquivo = open(caminho_log, 'w', encoding='utf-8')
+        _log_arquivo.write(f"LOG DE VALIDAÇÃO - {nome_base}\n")
+        _log_arquivo.write(f"Data/Hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
+        _log_arquivo.write(f"{'='*50}\n\n")
         return caminho_log
     except Exception as e:
-        log(f"Erro ao salvar arquivo de log: {str(e)}")
+        _log_arquivo = None
+        log(f"Erro ao criar arquivo de log: {str(e)}")
         return None
 
+def fechar_log_txt(caminho_log):
+    """Fecha o arquivo de log do lote."""
+    global _log_arquivo
+    if not _log_arquivo:
+        return
+    try:
+        log(f"Arquivo de log salvo: {caminho_log}")
+        _log_arquivo.close()
+    except Exception as e:
+        log(f"Erro ao salvar arquivo de log: {str(e)}")
+    finally:
+        _log_arquivo = None
+
 def remover_colunas_duplicadas_vazias(df):
     """Remove colunas duplicadas que estão vazias."""
     colunas_originais = list(df.columns)
@@ -120,7 +203,7 @@ def remover_colunas_duplicadas_vazias(df):
     
     return df
 
-def verificar_valor_na_lista(valor, lista_valida, coluna, idx, padding=0):
+def verificar_valor_na_lista(valor, lista_valida, coluna, idx, padding=0, indice_sugestoes=None):
     """Verifica se um valor está na lista de valores válidos. 
     Não faz correções automáticas, apenas identifica valores inválidos."""
     if pd.isna(valor) or valor == '':
@@ -132,24 +215,27 @@ def verificar_valor_na_lista(valor, lista_valida, coluna, idx, padding=0):
         val_normalizado = val_normalizado.zfill(padding)
     
     # Normalizar lista se não for um conjunto
-    if not isinstance(lista_valida, set):
+    if not isinstance(lista_valida, (set, frozenset)):
         lista_normalizada = normalizar_lista(lista_valida, padding)
     else:
         lista_normalizada = lista_valida
     
     if val_normalizado not in lista_normalizada:
         # Tentar achar uma correspondência aproximada
-        sugestao = get_close_matches(val_normalizado, lista_normalizada, n=1, cutoff=0.6)
+        if indice_sugestoes is not None:
+            sugestao = sugerir_valor(val_normalizado, indice_sugestoes)
+        else:
+            sugestao = get_close_matches(val_normalizado, lista_normalizada, n=1, cutoff=CUTOFF_SUGESTAO)
         
         if sugestao:
             # Registrar a sugestão, mas não aplicar correção automática
             msg = f"Valor inválido encontrado na linha {idx+2}, coluna '{coluna}': '{valor}'. Sugestão: '{sugestao[0]}'"
-            log(msg)
+            log(msg, "valor_invalido")
             valores_invalidos.append((coluna, idx+2, valor, sugestao[0]))
         else:
             # Registrar valor inválido sem sugestão
             msg = f"Valor inválido encontrado na linha {idx+2}, coluna '{coluna}': '{valor}' (sem sugestão)"
-            log(msg)
+            log(msg, "valor_invalido")
             valores_invalidos.append((coluna, idx+2, valor, None))
         
         # Marcar como inválido
@@ -158,6 +244,96 @@ def verificar_valor_na_lista(valor, lista_valida, coluna, idx, padding=0):
         # Valor está correto, retornar como está
         return valor
 
+def calcular_hash_template(caminho_template):
+    """Calcula o hash do template e dos mapeamentos usados para compilar as regras."""
+    h = hashlib.sha256()
+    h.update(f"v{VERSAO_REGRAS}|{sorted(mapa_validacoes.items())}|{sorted(colunas_adicionais.items())}".encode('utf-8'))
+    with open(caminho_template, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def montar_indice_sugestoes(validos):
+    """Agrupa os valores válidos por tamanho para limitar a busca de sugestões.
+    
+    Como a razão do SequenceMatcher nunca passa de 2*min(a,b)/(a+b), valores
+    com tamanho muito diferente não podem atingir o cutoff e são descartados."""
+    indice = {}
+    for v in sorted(validos):
+        indice.setdefault(len(v), []).append(v)
+    return {tamanho: tuple(valores) for tamanho, valores in indice.items()}
+
+def sugerir_valor(val_normalizado, indice_sugestoes, cutoff=CUTOFF_SUGESTAO):
+    """Busca a sugestão mais próxima apenas entre os candidatos de tamanho compatível."""
+    tamanho = len(val_normalizado)
+    minimo = tamanho * cutoff / (2 - cutoff)
+    maximo = tamanho * (2 - cutoff) / cutoff if cutoff > 0 else float('inf')
+    candidatos = [v for t, valores in indice_sugestoes.items() if minimo <= t <= maximo for v in valores]
+    return get_close_matches(val_normalizado, candidatos, n=1, cutoff=cutoff)
+
+def compilar_regras(caminho_template, hash_template):
+    """Compila as listas de validação do template em um conjunto de regras."""
+    wb = load_workbook(caminho_template, read_only=True)
+    try:
+        colunas_template = list(pd.read_excel(caminho_template, sheet_name=0, nrows=0).columns)
+        
+        definicoes = [(coluna, aba, padding) for coluna, (aba, padding) in mapa_validacoes.items()]
+        definicoes += [(coluna, aba, 0) for coluna, aba in colunas_adicionais.items()]
+        
+        colunas = {}
+        listas_por_aba = {}
+        for coluna, aba, padding in definicoes:
+            if aba not in wb.sheetnames:
+                continue
+            if aba not in listas_por_aba:
+                ws = wb[aba]
+                listas_por_aba[aba] = [linha[0] for linha in ws.iter_rows(min_col=1, max_col=1, values_only=True)
+                                       if linha and linha[0] is not None]
+            validos = frozenset(normalizar_lista(listas_por_aba[aba], padding))
+            colunas[coluna] = {
+                "aba": aba,
+                "padding": padding,
+                "validos": validos,
+                "indice_sugestoes": montar_indice_sugestoes(validos)
+            }
+    finally:
+        wb.close()
+    
+    return {
+        "versao": VERSAO_REGRAS,
+        "hash": hash_template,
+        "colunas_template": colunas_template,
+        "colunas": colunas
+    }
+
+def carregar_regras(caminho_template):
+    """Carrega as regras compiladas do cache em disco, compilando-as se necessário."""
+    hash_template = calcular_hash_template(caminho_template)
+    caminho_cache = os.path.join(DIRETORIO_CACHE_REGRAS, f"regras_{hash_template}.pkl")
+    
+    if os.path.exists(caminho_cache):
+        try:
+            with open(caminho_cache, 'rb') as f:
+                regras = pickle.load(f)
+            if regras.get("versao") == VERSAO_REGRAS and regras.get("hash") == hash_template:
+                log(f"Regras de validação carregadas do cache: {caminho_cache}")
+                return regras
+        except Exception as e:
+            log(f"Cache de regras inválido, recompilando: {str(e)}")
+    
+    regras = compilar_regras(caminho_template, hash_template)
+    try:
+        os.makedirs(DIRETORIO_CACHE_REGRAS, exist_ok=True)
+        caminho_tmp = caminho_cache + f".{os.getpid()}.tmp"
+        with open(caminho_tmp, 'wb') as f:
+            pickle.dump(regras, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(caminho_tmp, caminho_cache)
+        log(f"Regras de validação compiladas e salvas em cache: {caminho_cache}")
+    except Exception as e:
+        log(f"Não foi possível salvar o cache de regras: {str(e)}")
+    
+    return regras
+
 def calcular_digito_cpf(cpf_base):
     """Calcula os dígitos verificadores de um CPF."""
     soma1 = sum(int(cpf_base[i]) * (10 - i) for i in range(9))
@@ -230,51 +406,173 @@ def validar_documentos(df):
                 doc_corrigido = calcular_digito_cpf(doc[:9])
                 correcoes_documentos.append((col, i + 2, original, doc_corrigido))
                 df.at[i, col] = doc_corrigido
-                log(f"CPF corrigido na linha {i+2}: de '{original}' para '{doc_corrigido}'")
+                log(f"CPF corrigido na linha {i+2}: de '{original}' para '{doc_corrigido}'", "documento_corrigido")
             elif len(doc) == 14 and not validar_cnpj(doc):
                 doc_corrigido = calcular_digito_cnpj(doc[:12])
                 correcoes_documentos.append((col, i + 2, original, doc_corrigido))
                 df.at[i, col] = doc_corrigido
-                log(f"CNPJ corrigido na linha {i+2}: de '{original}' para '{doc_corrigido}'")
+                log(f"CNPJ corrigido na linha {i+2}: de '{original}' para '{doc_corrigido}'", "documento_corrigido")
             elif len(doc) not in [0, 11, 14]:
-                log(f"Documento inválido na linha {i+2}: '{original}' (tamanho incorreto)")
+                log(f"Documento inválido na linha {i+2}: '{original}' (tamanho incorreto)", "documento_invalido")
                 df.at[i, col] = f"INVALIDO:{original}"
 
+def normalizar_serie_texto(serie, padding=0):
+    """Converte uma coluna para texto sem espaços nas pontas e em maiúsculas.
+    
+    As operações de texto são feitas apenas sobre os valores distintos e depois
+    expandidas pelos códigos do factorize, já que os lotes repetem muito os valores."""
+    codigos, unicos = pd.factorize(serie.astype(str))
+    unicos = pd.Series(unicos, dtype=object).str.strip().str.upper()
+    if padding > 0:
+        unicos = unicos.str.zfill(padding)
+    return pd.Series(unicos.to_numpy()[codigos], index=serie.index)
+
+def iniciar_memoria_correcoes(caminho=CAMINHO_MEMORIA_CORRECOES):
+    """Cria a tabela de correções aprendidas, se necessário."""
+    conn = sqlite3.connect(caminho)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS correcoes_aprendidas (
+            coluna TEXT NOT NULL,
+            valor_original TEXT NOT NULL,
+            valor_corrigido TEXT NOT NULL,
+            aceites INTEGER NOT NULL DEFAULT 0,
+            ultima_aceitacao TEXT,
+            PRIMARY KEY (coluna, valor_original, valor_corrigido)
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+def carregar_memoria_correcoes(caminho=CAMINHO_MEMORIA_CORRECOES):
+    """Carrega as correções aprendidas como {coluna: {valor_normalizado: valor_corrigido}}.
+    
+    Quando um mesmo valor teve correções diferentes aceitas, prevalece a mais aceita."""
+    memoria = {}
+    try:
+        iniciar_memoria_correcoes(caminho)
+        conn = sqlite3.connect(caminho)
+        cursor = conn.execute('''
+            SELECT coluna, valor_original, valor_corrigido
+            FROM correcoes_aprendidas
+            ORDER BY coluna, valor_original, aceites ASC, ultima_aceitacao ASC
+        ''')
+        for coluna, original, corrigido in cursor:
+            memoria.setdefault(coluna, {})[original] = corrigido
+        conn.close()
+    except Exception as e:
+        log(f"Não foi possível carregar a memória de correções: {str(e)}")
+    return memoria
+
+def registrar_correcoes_aceitas(correcoes, regras, caminho=CAMINHO_MEMORIA_CORRECOES):
+    """Grava na memória as correções aceitas (coluna, valor original, valor corrigido)."""
+    registros = []
+    agora = datetime.now().isoformat()
+    for coluna, original, corrigido in correcoes:
+        regra = regras["colunas"].get(coluna)
+        if regra is None or pd.isna(original) or not str(corrigido).strip():
+            continue
+        original_norm = str(original).strip().upper()
+        if regra["padding"] > 0:
+            original_norm = original_norm.zfill(regra["padding"])
+        registros.append((coluna, original_norm, str(corrigido).strip(), agora))
+    
+    if not registros:
+        return 0
+    
+    try:
+        iniciar_memoria_correcoes(caminho)
+        conn = sqlite3.connect(caminho)
+        conn.executemany('''
+            INSERT INTO correcoes_aprendidas (coluna, valor_original, valor_corrigido, aceites, ultima_aceitacao)
+            VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (coluna, valor_original, valor_corrigido)
+            DO UPDATE SET aceites = aceites + 1, ultima_aceitacao = excluded.ultima_aceitacao
+        ''', registros)
+        conn.commit()
+        conn.close()
+        log(f"Memória de correções atualizada com {len(registros)} correções aceitas")
+    except Exception as e:
+        log(f"Erro ao gravar a memória de correções: {str(e)}")
+        return 0
+    return len(registros)
+
+def aplicar_correcoes_memorizadas(df, coluna, regra):
+    """Aplica, com um único map, as correções já aceitas anteriormente para a coluna.
+    
+    Só são usadas correções cujo valor corrigido ainda é válido no template."""
+    memoria = memoria_correcoes.get(coluna)
+    if not memoria:
+        return 0
+    
+    padding = regra["padding"]
+    validos = regra["validos"]
+    memoria_valida = {}
+    for original, corrigido in memoria.items():
+        corrigido_norm = str(corrigido).strip().upper()
+        if padding > 0:
+            corrigido_norm = corrigido_norm.zfill(padding)
+        if original not in validos and corrigido_norm in validos:
+            memoria_valida[original] = corrigido
+    if not memoria_valida:
+        return 0
+    
+    serie = df[coluna]
+    preenchidos = serie.notna() & (serie.astype(str) != '')
+    corrigidos = normalizar_serie_texto(serie, padding).map(memoria_valida)
+    mascara = preenchidos & corrigidos.notna()
+    if not mascara.any():
+        return 0
+    
+    antigos = serie[mascara]
+    novos = corrigidos[mascara]
+    df[coluna] = serie.astype(object)
+    df.loc[mascara, coluna] = novos
+    for idx, antigo, novo in zip(antigos.index, antigos.to_numpy(), novos.to_numpy()):
+        correcoes_memorizadas.append((coluna, idx + 2, antigo, novo))
+        log(f"Correção memorizada aplicada na linha {idx + 2}, coluna '{coluna}': '{antigo}' -> '{novo}'",
+            "correcao_memorizada")
+    
+    log(f"Correções memorizadas aplicadas na coluna '{coluna}': {int(mascara.sum())}")
+    return int(mascara.sum())
+
 def validar_coerencia_comarca_uf(df):
     """Valida e corrige a coerência entre COMARCA e UF."""
     correcoes = []
     
     if 'COMARCA' in df.columns and 'UF' in df.columns:
-        for idx, row in df.iterrows():
-            comarca = str(row['COMARCA']).strip().upper()
-            
-            # Se a COMARCA estiver vazia, não temos como validar
-            if not comarca:
-                continue
-                
-            uf_atual = str(row['UF']).strip().upper()
+        comarca = normalizar_serie_texto(df['COMARCA'])
+        uf_atual = normalizar_serie_texto(df['UF'])
+        
+        # Extrair UF do final da COMARCA (formato "CIDADE-UF"), uma vez por COMARCA distinta
+        codigos, comarcas_unicas = pd.factorize(comarca)
+        ufs_unicas = pd.Series(comarcas_unicas, dtype=object).str.extract(r"-([A-Z]{2})$", expand=False)
+        uf_correta = pd.Series(ufs_unicas.to_numpy()[codigos], index=df.index)
+        
+        # Corrigir apenas quando há UF preenchida e divergente da COMARCA
+        divergentes = uf_correta.notna() & (uf_atual != '') & (uf_atual != uf_correta)
+        if divergentes.any():
+            indices = df.index[divergentes]
+            linhas = indices + 2  # +2 para ajustar ao número da linha na planilha
+            antigos = uf_atual[divergentes].to_numpy()
+            novos = uf_correta[divergentes].to_numpy()
+            comarcas = comarca[divergentes].to_numpy()
             
-            # Tentar extrair UF do final da COMARCA (formato "CIDADE-UF")
-            match = re.search(r"-([A-Z]{2})$", comarca)
-            if match:
-                uf_correta = match.group(1)
-                
-                # Se a UF atual não corresponder à UF correta, corrigir
-                if uf_atual and uf_atual != uf_correta:
-                    log(f"Corrigida UF na linha {idx + 2}: de '{uf_atual}' para '{uf_correta}' (COMARCA: {comarca})")
-                    correcoes.append((idx + 2, uf_atual, uf_correta))  # +2 para ajustar ao número da linha na planilha
-                    df.at[idx, 'UF'] = uf_correta
+            df.loc[indices, 'UF'] = novos
+            correcoes = list(zip(linhas.tolist(), antigos.tolist(), novos.tolist()))
+            for (linha, antigo, novo), com in zip(correcoes, comarcas):
+                log(f"Corrigida UF na linha {linha}: de '{antigo}' para '{novo}' (COMARCA: {com})", "uf_corrigida")
     
     return correcoes
 
-def validar_coluna_padrao(df, coluna, wb_template, aba, padding=0):
-    """Valida uma coluna contra uma lista de valores em uma aba do template."""
+def validar_coluna_padrao(df, coluna, regra):
+    """Valida uma coluna contra a lista compilada de valores de uma aba do template."""
     log(f"Validando coluna: {coluna}")
     try:
-        # Obter lista de valores válidos da aba correspondente
-        ws = wb_template[aba]
-        lista_valida = [cell.value for cell in ws['A'] if cell.value is not None]
-        lista_normalizada = normalizar_lista(lista_valida, padding)
+        lista_normalizada = regra["validos"]
+        padding = regra["padding"]
+        
+        # Aplicar correções já conhecidas antes da busca de sugestões
+        aplicar_correcoes_memorizadas(df, coluna, regra)
         
         # Validar cada valor da coluna
         for idx, valor in df[coluna].items():
@@ -282,34 +580,35 @@ def validar_coluna_padrao(df, coluna, wb_template, aba, padding=0):
                 continue
             
             # Verificar se o valor está na lista e marcar se inválido
-            resultado = verificar_valor_na_lista(valor, lista_normalizada, coluna, idx, padding)
+            resultado = verificar_valor_na_lista(valor, lista_normalizada, coluna, idx, padding,
+                                                 regra["indice_sugestoes"])
             if resultado != valor:
                 df.at[idx, coluna] = resultado
     except Exception as e:
         log(f"Erro ao validar coluna {coluna}: {str(e)}")
 
-def validar_todas_colunas_padrao(df, wb_template):
+def validar_todas_colunas_padrao(df, regras):
     """Valida todas as colunas padrão contra suas respectivas abas no template."""
     global mapa_validacoes
     
     # Validar cada coluna do mapeamento
-    for coluna, (aba, padding) in mapa_validacoes.items():
-        if coluna in df.columns and aba in wb_template.sheetnames:
-            validar_coluna_padrao(df, coluna, wb_template, aba, padding)
+    for coluna in mapa_validacoes:
+        if coluna in df.columns and coluna in regras["colunas"]:
+            validar_coluna_padrao(df, coluna, regras["colunas"][coluna])
 
-def validar_colunas_adicionais(df, wb_template):
+def validar_colunas_adicionais(df, regras):
     """Valida colunas adicionais contra suas listas de referência."""
     global colunas_adicionais
     
-    for coluna, aba in colunas_adicionais.items():
-        if coluna in df.columns and aba in wb_template.sheetnames:
-            validar_coluna_padrao(df, coluna, wb_template, aba)
+    for coluna in colunas_adicionais:
+        if coluna in df.columns and coluna in regras["colunas"]:
+            validar_coluna_padrao(df, coluna, regras["colunas"][coluna])
     
     return df
 
-def preservar_nomenclatura_exata(df_lote, df_template):
+def preservar_nomenclatura_exata(df_lote, colunas_template):
     """Garante que as colunas do lote sigam exatamente a nomenclatura do template."""
-    colunas_template = list(df_template.columns)
+    colunas_template = list(colunas_template)
     colunas_lote = list(df_lote.columns)
     
     # Criar mapeamento de nomes semelhantes (ignorando case, espaços extras, etc.)
@@ -354,19 +653,33 @@ def validar_campos_obrigatorios(df):
     
     campos_vazios = {}
     
-    for campo in campos_obrigatorios:
-        if campo in df.columns:
-            # Conta valores vazios (NaN, None, string vazia)
-            vazios = df[campo].apply(lambda x: pd.isna(x) or str(x).strip() == '').sum()
-            if vazios > 0:
-                campos_vazios[campo] = vazios
-                # Marcar células vazias como inválidas
-                df.loc[df[campo].apply(lambda x: pd.isna(x) or str(x).strip() == ''), campo] = "INVALIDO:CAMPO_OBRIGATORIO"
-                log(f"Campo obrigatório '{campo}' não preenchido em {vazios} linhas")
+    presentes = [campo for campo in campos_obrigatorios if campo in df.columns]
+    if not presentes:
+        return campos_vazios
+    
+    # Máscara de vazios (NaN, None, string vazia) para todos os campos de uma vez
+    bloco = df[presentes]
+    mascara_vazios = bloco.isna()
+    for campo in presentes:
+        # Só colunas de texto podem ter valores em branco além de NaN
+        if bloco[campo].dtype == object:
+            codigos, unicos = pd.factorize(bloco[campo])
+            brancos = np.array([isinstance(u, str) and u.strip() == '' for u in unicos] + [False])
+            mascara_vazios[campo] |= brancos[codigos]
+    contagens = mascara_vazios.sum()
+    
+    colunas_com_vazios = [campo for campo in presentes if contagens[campo] > 0]
+    if colunas_com_vazios:
+        # Marcar células vazias como inválidas
+        df[colunas_com_vazios] = bloco[colunas_com_vazios].astype(object).mask(
+            mascara_vazios[colunas_com_vazios], "INVALIDO:CAMPO_OBRIGATORIO")
+        for campo in colunas_com_vazios:
+            campos_vazios[campo] = int(contagens[campo])
+            log(f"Campo obrigatório '{campo}' não preenchido em {campos_vazios[campo]} linhas")
     
     return campos_vazios
 
-def aplicar_correcoes(df, valores_invalidos, wb_template):
+def aplicar_correcoes(df, valores_invalidos, regras):
     """Permite ao usuário corrigir valores inválidos identificados durante a validação."""
     if not valores_invalidos:
         log("Não há valores inválidos para corrigir.")
@@ -379,6 +692,7 @@ def aplicar_correcoes(df, valores_invalidos, wb_template):
     
     # Variáveis para controlar o estado
     correcoes_aplicadas = False
+    correcoes_aceitas = []
     df_corrigido = df.copy()
     
     # Criar frame principal
@@ -537,8 +851,9 @@ def aplicar_correcoes(df, valores_invalidos, wb_template):
                     
                     if isinstance(valor_atual, str) and valor_atual.startswith("INVALIDO:"):
                         df_corrigido.at[idx_df, coluna] = sugestao
+                        correcoes_aceitas.append((coluna, valor_atual[9:], sugestao))
                         aplicadas += 1
-                        log(f"Auto-correção aplicada: Linha {linha}, Coluna '{coluna}': '{valor_atual[9:]}' -> '{sugestao}'")
+                        log(f"Auto-correção aplicada: Linha {linha}, Coluna '{coluna}': '{valor_atual[9:]}' -> '{sugestao}'", "correcao")
         
         if aplicadas > 0:
             messagebox.showinfo("Auto-correção", f"{aplicadas} correções de alta confiança foram aplicadas automaticamente.")
@@ -569,8 +884,9 @@ def aplicar_correcoes(df, valores_invalidos, wb_template):
                     # Se a correção não estiver vazia, aplicá-la
                     if novo_valor:
                         df_corrigido.at[idx_df, coluna] = novo_valor
+                        correcoes_aceitas.append((coluna, valor_atual[9:], novo_valor))
                         correcoes_count += 1
-                        log(f"Valor corrigido: Linha {linha}, Coluna '{coluna}': '{valor_atual[9:]}' -> '{novo_valor}'")
+                        log(f"Valor corrigido: Linha {linha}, Coluna '{coluna}': '{valor_atual[9:]}' -> '{novo_valor}'", "correcao")
         
         log(f"Total de correções aplicadas: {correcoes_count}")
         correcoes_aplicadas = correcoes_count > 0
@@ -590,28 +906,17 @@ def aplicar_correcoes(df, valores_invalidos, wb_template):
     # Aguardar que a janela seja fechada
     janela_correcao.wait_window()
     
+    # Memorizar as correções aceitas para os próximos lotes
+    registrar_correcoes_aceitas(correcoes_aceitas, regras)
+    
     # Se opção de revalidação estiver ativada e correções foram aplicadas
     revalidar = revalidar_var.get() if 'revalidar_var' in locals() else False
     if revalidar and correcoes_aplicadas:
         log("Revalidando valores corrigidos...")
         # Revalidar colunas relevantes
         for coluna in valores_por_coluna.keys():
-            # Determinar a aba correspondente à coluna
-            aba = None
-            # Verificar em mapa_validacoes
-            for col, (tab, padding) in mapa_validacoes.items():
-                if col == coluna:
-                    aba, padding = tab, padding
-                    validar_coluna_padrao(df_corrigido, coluna, wb_template, aba, padding)
-                    break
-            
-            # Verificar em colunas_adicionais se não encontrado
-            if not aba:
-                for col, tab in colunas_adicionais.items():
-                    if col == coluna:
-                        aba = tab
-                        validar_coluna_padrao(df_corrigido, coluna, wb_template, aba)
-                        break
+            if coluna in regras["colunas"]:
+                validar_coluna_padrao(df_corrigido, coluna, regras["colunas"][coluna])
     
     return df_corrigido, correcoes_aplicadas
 
@@ -625,7 +930,7 @@ def gerar_estatisticas(df):
     if correcoes_documentos:
         log(f"Total de documentos corrigidos: {len(correcoes_documentos)}")
         for col, linha, antigo, novo in correcoes_documentos:
-            log(f"  - Linha {linha}, Coluna {col}: {antigo} -> {novo}")
+            log(f"  - Linha {linha}, Coluna {col}: {antigo} -> {novo}", "estatistica_detalhe")
     else:
         log("Não foram necessárias correções de documentos.")
     
@@ -633,10 +938,14 @@ def gerar_estatisticas(df):
     if correcoes_uf:
         log(f"Total de correções de UF: {len(correcoes_uf)}")
         for linha, antigo, novo in correcoes_uf:
-            log(f"  - Linha {linha}: {antigo} -> {novo}")
+            log(f"  - Linha {linha}: {antigo} -> {novo}", "estatistica_detalhe")
     else:
         log("Não foram necessárias correções de UF por inconsistência com COMARCA.")
     
+    # Estatísticas de correções reaproveitadas da memória
+    if correcoes_memorizadas:
+        log(f"Total de correções memorizadas aplicadas: {len(correcoes_memorizadas)}")
+    
     # Estatísticas de valores inválidos
     if valores_invalidos:
         log(f"\nTotal de valores inválidos encontrados: {len(valores_invalidos)}")
@@ -678,43 +987,51 @@ def gerar_estatisticas(df):
 
 def processar_lote(caminho_template, caminho_lote):
     """Processa um lote de dados, validando-o contra o template."""
-    global correcoes_documentos, correcoes_uf, valores_invalidos
+    global correcoes_documentos, correcoes_uf, valores_invalidos, correcoes_memorizadas, memoria_correcoes
     correcoes_documentos = []
     correcoes_uf = []
     valores_invalidos = []
+    correcoes_memorizadas = []
+    reiniciar_contadores_log()
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    nome_base = os.path.splitext(os.path.basename(caminho_lote))[0]
+    log_path = abrir_log_txt(nome_base, timestamp, os.path.dirname(caminho_lote))
 
     log(f"Processando lote: {caminho_lote}")
     
     try:
-        wb_template = load_workbook(caminho_template)
+        regras = carregar_regras(caminho_template)
         log(f"Template carregado: {caminho_template}")
         
+        memoria_correcoes = carregar_memoria_correcoes()
+        log(f"Memória de correções carregada: {sum(len(m) for m in memoria_correcoes.values())} valores conhecidos")
+        
         df_lote = pd.read_excel(caminho_lote, sheet_name=0)
         log(f"Lote carregado: {caminho_lote} com {len(df_lote)} linhas")
         
-        df_template = pd.read_excel(caminho_template, sheet_name=0)
-        log(f"Template base carregado com {len(df_template.columns)} colunas")
+        colunas_template = regras["colunas_template"]
+        log(f"Template base carregado com {len(colunas_template)} colunas")
 
         # Remover colunas duplicadas vazias
         df_lote = remover_colunas_duplicadas_vazias(df_lote)
         log("Verificação de colunas duplicadas concluída")
 
         # Preservar nomenclatura exata e adicionar colunas faltantes
-        df_lote = preservar_nomenclatura_exata(df_lote, df_template)
+        df_lote = preservar_nomenclatura_exata(df_lote, colunas_template)
         log("Verificação e ajuste de nomenclatura de colunas concluído")
         
         # Reordenar colunas conforme o template
-        colunas_template = list(df_template.columns)
         df_lote = df_lote[colunas_template]
         log("Reorganização de colunas concluída")
 
         # Validar todas as colunas padrão
         log("Iniciando validação de colunas padrão...")
-        validar_todas_colunas_padrao(df_lote, wb_template)
+        validar_todas_colunas_padrao(df_lote, regras)
 
         # Validar colunas adicionais
         log("Iniciando validação de colunas adicionais...")
-        df_lote = validar_colunas_adicionais(df_lote, wb_template)
+        df_lote = validar_colunas_adicionais(df_lote, regras)
 
         # Validar coerência entre COMARCA e UF
         log("Iniciando validação de coerência entre COMARCA e UF...")
@@ -731,7 +1048,7 @@ def processar_lote(caminho_template, caminho_lote):
         # Verificar se há valores inválidos e oferecer correção
         if valores_invalidos:
             log("Iniciando fase de correções interativas...")
-            df_lote, correcoes_feitas = aplicar_correcoes(df_lote, valores_invalidos, wb_template)
+            df_lote, correcoes_feitas = aplicar_correcoes(df_lote, valores_invalidos, regras)
             if correcoes_feitas:
                 log("Correções aplicadas com sucesso!")
                 # Atualizar valores_invalidos após correções
@@ -745,27 +1062,27 @@ def processar_lote(caminho_template, caminho_lote):
 
         # Salvar resultados
         log("Salvando resultado...")
+        wb_template = load_workbook(caminho_template)
         ws_principal = wb_template[wb_template.sheetnames[0]]
         ws_principal.delete_rows(2, ws_principal.max_row)
         for row in dataframe_to_rows(df_lote, index=False, header=False):
             ws_principal.append(row)
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nome_base = os.path.splitext(os.path.basename(caminho_lote))[0]
         nome_saida = nome_base + f"_Validado_{timestamp}.xlsx"
         output_path = os.path.join(os.path.dirname(caminho_lote), nome_saida)
         wb_template.save(output_path)
         log(f"Arquivo salvo: {output_path}")
         
-        # Salvar relatório em formato TXT
-        log_path = salvar_log_txt(nome_base, timestamp, os.path.dirname(caminho_lote))
-        
         return output_path, log_path
     except Exception as e:
         log(f"ERRO CRÍTICO: {str(e)}")
         import traceback
         log(traceback.format_exc())
         raise
+    finally:
+        # Resumir mensagens omitidas e fechar o log em formato TXT
+        resumir_log()
+        fechar_log_txt(log_path)
 
 def iniciar_interface():
     """Inicia a interface gráfica do aplicativo."""
@@ -807,6 +1124,7 @@ def iniciar_interface():
         """Executa o processamento de lotes."""
         try:
             app_log_area.delete(1.0, tk.END)
+            _log_pendentes_ui.clear()
             log("Iniciando processo de validação...")
             
             caminho_template = selecionar_arquivos("Selecione o arquivo Template")
@@ -884,6 +1202,7 @@ def iniciar_interface():
     # Versão e créditos
     tk.Label(root, text="Validador de Lotes - v2.0 | Maio/2025", fg="gray").pack(side=tk.BOTTOM, pady=5)
 
+    agendar_descarga_log(root)
     root.mainloop()
 
 if __name__ == "__main__":